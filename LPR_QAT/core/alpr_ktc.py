@@ -3,14 +3,12 @@ import numpy as np
 from shapely import geometry
 
 from LPR_QAT.core.object_detector import ObjectDetector
-from LPR_QAT.core.helpers import draw_box, crop_image, remove_elements_by_indices_from_list
-from LPR_QAT.core.custom_anpr_result import CustomANPRResult
+from LPR_QAT.core.helpers import draw_box, crop_image, remove_elements_by_indices_from_list, intersection_over_area
+from LPR_QAT.core.custom_anpr_result import CustomANPRResult, DecodedLabel, PlateStates, PlateField, PlateChars, frozen_array
 from LPR_QAT.core.preprocess import PreprocessVehicleLicensePlate
 
 from easydict import EasyDict as edict
 
-from copy import deepcopy
-
 import math
 from shapely import affinity
 import traceback
@@ -63,28 +61,19 @@ class alpr_ktc(object):
                'state-qat-english', 'state-qat-arabic', 'state-qat-logo',
                'state-ksa-english', 'state-ksa-arabic', 'state-ksa-logo']
 
-        # result should be a queue with license plate image
-        # should we maintain the queue or let application do that?        
-        self.result = CustomANPRResult()
-        
+        # every call builds its own result (CustomANPRResult, immutable): no state is kept between calls, process() and
+        # process_batch() can be called from several threads (ObjectDetector keeps its input buffers per thread)
         self.license_plate_img = None # for debugging we need it across this class
         
         self.preprocess_lpr = PreprocessVehicleLicensePlate()
+
+        # class groups of lpr_class_name, indexed by class id (see __decode)
+        self.is_state_class = np.array([name in self.state_class_names for name in self.lpr_class_name])
+        self.is_char_class = np.array([name.isalnum() and len(name) == 1 for name in self.lpr_class_name])
+        self.platenum_class = self.lpr_class_name.index('plate_number')
+        self.prefix_class = self.lpr_class_name.index('prefix')
     
-    def reset(self):
-        self.result.reset()
-        
     def process(self, plate_img):
-        # self.result = {"state_info": {"poly":[], "state":[], "score":[]},
-        #                 "prefix": {"poly":None, "score":0, "char": [], "char_score":[], "char_poly":[]},
-        #                 "platenum": {"poly":None, "score":0, "char": [], "char_score":[], "char_poly":[]},
-        #                 "single_char": {"char_id": [], "char_score":[], "char_poly":[]},
-        #                 "aux": None,
-        #                 "decoded_label": {"full_label":"", "state_label":"", "prefix_label":"", "platenum_label":""}}
-        
-        # reset previous result
-        self.reset()
-        
         # check if it has some valid img height before processing
         # do this here, or else we are getting cv2 divide by 0 issue during letterbox in dataset.py
         if plate_img.shape[1] < 5:
@@ -103,152 +92,159 @@ class alpr_ktc(object):
         #    model_pred = self.ocr_detector.detect_objects(license_plate_img, "video")
         model_pred = self.ocr_detector.detect_objects(license_plate_img, "video")
         
+        return self.__decode(model_pred)
+    
+    # OCR of several plate images (e.g. the crops of all the streams read by anpr_ivms.py) with one
+    # forward pass of the detector (ObjectDetector.detect_objects_batch); returns the result of every image
+    # as process() does (None if not read)
+    def process_batch(self, plate_imgs):
+        results = [None] * len(plate_imgs)
+        
+        # same check as process(): no valid img height -> cv2 divide by 0 issue during letterbox
+        valid = [i for i, plate_img in enumerate(plate_imgs) if plate_img.shape[1] >= 5]
+        
+        model_preds = self.ocr_detector.detect_objects_batch([plate_imgs[i] for i in valid])
+        for i, model_pred in zip(valid, model_preds):
+            results[i] = self.__decode(model_pred)
+        return results
+    
+    # post processing of the detections of a plate image -> decoded result (None if not read)
+    # -> the detections are axis aligned boxes: they are kept as arrays of (x1, y1, x2, y2) and every overlap, order,
+    #    spacing and area check runs on the arrays
+    def __decode(self, model_pred):
         # No ocr detections made for this plate? - may be wrong plate?
         if model_pred is None:
             return None
-            
-        # result will be populated - converts model_pred into a data format which will be easy to post process
-        # Example: bbox as array in model_pred will be converted to shapely.geometry.Polygon 
-        # this mainly populates prefix/state/single_char/platenum global position poly
-        self.__populate_pred_data_into_results(model_pred)
-        
-        if self.result.info_platenum.polygon is None:
+
+        # detections as arrays (int coordinates, as the polygons were built), the ones below the score threshold dropped
+        pred = model_pred.cpu().numpy() if hasattr(model_pred, 'cpu') else np.asarray(model_pred)
+        pred = pred.reshape(-1, 6)
+        scores = pred[:, 4].astype(np.float64)
+        keep = scores >= self.DETECTION_CONFIDENCE_SCORE_THRESHOLD
+        boxes = pred[keep, :4].astype(np.int64)
+        scores = scores[keep]
+        classes = pred[keep, 5].astype(np.int64)
+
+        # 2, 'PLATENUM' and 3, 'PREFIX': one each, the (first) best conf one
+        platenum = self.__best(classes == self.platenum_class, scores)
+        if platenum is None:
             #print("No platenum polygon")
             return None
+        prefix = self.__best(classes == self.prefix_class, scores)
 
-        pop_indices = edict({"info_prefix": set(), "info_platenum": set(), "info_ocr": set()})
-        self.__populate_prefix_and_platenum_characters(pop_indices)
-        
-        # TODO: shall we move this to the last part after all unwated elements removed
-        self.__rearrange_chars_based_on_xaxis(self.result.info_platenum)
-        
-        self.__rearrange_chars_based_on_xaxis(self.result.info_prefix)
-        
-        # find and remove if there are multiple ocr detections made for 1 char
-        self.__find_overlapping_chars_indices(self.result.info_platenum, pop_indices.info_platenum)
-        self.__find_overlapping_chars_indices(self.result.info_prefix, pop_indices.info_prefix)
+        # 1, 'STATE' detections (all of them, to remember both arabic and english logo of state sometimes), the (first)
+        # best conf one moved to the front
+        states = np.flatnonzero(self.is_state_class[classes])
+        if len(states) > 1:
+            best = int(np.argmax(scores[states]))
+            states[[0, best]] = states[[best, 0]]
 
-        self.__remove_all_unwanted_elements(pop_indices) # remove from result
+        # 4, 'SINGLE CHARS' 0-9, a-z: a char belongs to the prefix if most of it is inside the prefix box, else to the
+        # platenum if most of it is inside the platenum box, else it is dropped
+        chars = np.flatnonzero(self.is_char_class[classes])
+        in_prefix = np.zeros(len(chars), dtype=bool)
+        if prefix is not None:
+            in_prefix = intersection_over_area(boxes[chars], boxes[prefix:prefix + 1])[:, 0] > self.MIN_PREFIX_AND_CHAR_OVERLAP_THRESH
+        in_platenum = ~in_prefix & (intersection_over_area(boxes[chars], boxes[platenum:platenum + 1])[:, 0] > self.MIN_PLATENUM_AND_CHAR_OVERLAP_THRESH)
+        ocr_chars = chars[in_prefix | in_platenum]
+
+        # chars left to right, one detection per char
+        prefix_chars = self.__field_chars(chars[in_prefix], boxes, scores, classes)
+        platenum_chars = self.__field_chars(chars[in_platenum], boxes, scores, classes)
+
+        decoded_label = self.__decoded_label(classes[states[:1]], classes[prefix_chars], classes[platenum_chars])
 
-        self.result.populate_final_number_plate_decoded_data()
-        
         # check this first, as this will work in most scenerio
+        platenum_box = boxes[platenum]
+        prefix_box = boxes[prefix] if prefix is not None else None
         try:
-            if len(self.result.info_platenum.char_poly) > 2 and (not (self.__is_equally_spaced(self.result.info_platenum))):
-                print("Not __is_equally_spaced", self.result.decoded_label.full_label)
-                return None
-            
-            if not (self.__is_complete_area_recognised(self.result.info_platenum)):
-                print("Not __is_complete_platenum", self.result.decoded_label.full_label)
+            if len(platenum_chars) > 2 and (not (self.__is_equally_spaced(boxes[platenum_chars]))):
+                print("Not __is_equally_spaced", decoded_label.full_label)
                 return None
-            
-            if ((self.result.info_prefix.polygon is not None) and (len(self.result.info_prefix.char_poly) > 0) and (not (self.__is_complete_area_recognised(self.result.info_prefix)))):
-                print("Not __is_complete_prefix", self.result.decoded_label.full_label)
+
+            platenum_box = self.__area_box(platenum_box, boxes[platenum_chars])
+            if not (self.__is_complete_area_recognised(platenum_box, boxes[platenum_chars])):
+                print("Not __is_complete_platenum", decoded_label.full_label)
                 return None
+
+            if (prefix is not None) and (len(prefix_chars) > 0):
+                prefix_box = self.__area_box(prefix_box, boxes[prefix_chars])
+                if not (self.__is_complete_area_recognised(prefix_box, boxes[prefix_chars])):
+                    print("Not __is_complete_prefix", decoded_label.full_label)
+                    return None
         except Exception as e:
             print("[ALPR_KTC] Exception raised.", e, traceback.format_exc())
-        
-        return deepcopy(self.result)
-    
-    def __populate_prefix_and_platenum_characters(self, pop_indices):
-    
-        # populate ocr detections data in platenum dict
-        for i, lpoly in enumerate(self.result.info_ocr.char_poly):
-            non_platenum = True
-            non_prefix = True
-            
-            #print(self.lpr_class_name[self.result.info_ocr.char_id[i]])
-            
-            # find if the char belongs to prefix - direct method
-            if self.result.info_prefix.score > 0: # by default it is set to 0 - ('0.001 > 0' is 'True' in python) or check for "polygon" which is set to None by default
-                #iou =  (lpoly.intersection(self.result.info_prefix.polygon).area / lpoly.union(self.result.info_prefix.polygon).area)
-                intersection_percent =  (lpoly.intersection(self.result.info_prefix.polygon).area / lpoly.area) 
-                if(intersection_percent > self.MIN_PREFIX_AND_CHAR_OVERLAP_THRESH):
-                    #print(self.lpr_class_name[self.result.info_ocr.char_id[i]])
-                    self.result.info_prefix.char.append(self.lpr_class_name[self.result.info_ocr.char_id[i]])
-                    self.result.info_prefix.char_score.append(self.result.info_ocr.char_score[i])
-                    self.result.info_prefix.char_poly.append(lpoly)
-                    non_prefix = False
-                    
-            # find if the char belongs to platenum - direct method
-            if ((non_prefix) and (self.result.info_platenum.score > 0)): # by default it is set to 0 - ('0.001 > 0' is 'True' in python) or check for "polygon" which is set to None by default
-                #iou =  (lpoly.intersection(self.result.info_platenum.polygon).area / lpoly.union(self.result.info_platenum.polygon).area)
-                intersection_percent =  (lpoly.intersection(self.result.info_platenum.polygon).area / lpoly.area) 
-                #print(self.result.info_platenum.polygon.contains(lpoly), lpoly.intersection(self.result.info_platenum.polygon).area)
-                
-                if(intersection_percent > self.MIN_PLATENUM_AND_CHAR_OVERLAP_THRESH):
-                    self.result.info_platenum.char.append(self.lpr_class_name[self.result.info_ocr.char_id[i]])
-                    self.result.info_platenum.char_score.append(self.result.info_ocr.char_score[i])
-                    self.result.info_platenum.char_poly.append(lpoly)
-                    non_platenum = False
-                
-            if non_prefix and non_platenum:
-                pop_indices.info_ocr.add(i)
-                
-                # Grace Threshold
-                '''
-                is_state_poly = self.__is_lpoly_belong_to_state_poly(lpoly, self.result.info_logo.state.polygon)
 
-                #if this character belongs to state_poly, shall we remove from info_ocr.char*? - dont use popup indices for this
+        return CustomANPRResult(
+            decoded_label=decoded_label,
+            state=PlateStates(tuple(self.lpr_class_name[c] for c in classes[states].tolist()),
+                              frozen_array(scores[states], np.float64), frozen_array(boxes[states], np.int64)),
+            prefix=self.__field(prefix_box, scores, prefix, prefix_chars, boxes, classes),
+            platenum=self.__field(platenum_box, scores, platenum, platenum_chars, boxes, classes),
+            ocr=PlateChars(frozen_array(classes[ocr_chars], np.int64), frozen_array(scores[ocr_chars], np.float64),
+                           frozen_array(boxes[ocr_chars], np.int64)))
 
-                if is_state_poly:
-                    pop_indices.info_ocr.add(i)
-                    
-                # find if the char belongs to platenum - indirect method
-                # what if all ocr detected but there is no platenum detected? - in this case, if its numeric with good score, consider it
-                # but this may give more false data as we dont know position to look for platenum
-                #elif ((self.result.info_ocr.char_id[i].isnumeric()) and (self.result.info_ocr.char_score[i] > MIN_PLATENUM_ASSUMPTION_CHAR_SCORE_GRACE_THRESH_IF_NUMERIC)):
-                # self.result.info_ocr.char_id[i] is converted to int by default, so no need to do isnumeric()
-                
-                elif ((self.result.info_ocr.char_score[i] > self.MIN_PLATENUM_ASSUMPTION_CHAR_SCORE_GRACE_THRESH_IF_NUMERIC)):
-                    #TODO: check if all are neatly spaced and in a specific pattern
-                    print("Assuming platenum")
-                    self.result.info_platenum.char.append(self.lpr_class_name[self.result.info_ocr.char_id[i]])
-                    self.result.info_platenum.char_score.append(self.result.info_ocr.char_score[i])
-                    self.result.info_platenum.char_poly.append(lpoly)
-                
-                #elif(not is_state_poly):
-                    # sometimes iou (lpoly and prefix poly) is zero - so it can be nearer char of prefix
-                    # print("dont know still")
-                    #pop_indices.info_ocr.add(i) # remove this if we are not using this character anywhere
-                '''
-        
-    def __find_overlapping_chars_indices(self, lpr_obj, pop_indices):
-        for i in range(0,len(lpr_obj.char_poly)):
-            if i in pop_indices:
+    # "STATE,PREFIX,PLATENUM" labels of the class ids of the best state (if any) and of the prefix / platenum chars
+    def __decoded_label(self, state_classes, prefix_classes, platenum_classes):
+        state_label, prefix_label, platenum_label = (''.join(self.lpr_class_name[c] for c in field_classes.tolist()).upper()
+                                                     for field_classes in (state_classes, prefix_classes, platenum_classes))
+        full_label = (state_label + "," if state_label else "") + (prefix_label + "," if prefix_label else "") + platenum_label
+        return DecodedLabel(full_label, state_label, prefix_label, platenum_label)
+
+    # prefix / platenum of the result: field is the detection index of its box (None if not detected)
+    def __field(self, box, scores, field, field_chars, boxes, classes):
+        if field is None:
+            return PlateField()
+        return PlateField(box=frozen_array(box, np.int64), score=scores[field].item(),
+                          char=tuple(self.lpr_class_name[c] for c in classes[field_chars].tolist()),
+                          char_score=frozen_array(scores[field_chars], np.float64),
+                          char_box=frozen_array(boxes[field_chars], np.int64))
+
+    # index of the first detection with the best score among mask, None if there is none
+    def __best(self, mask, scores):
+        idx = np.flatnonzero(mask)
+        if len(idx) == 0:
+            return None
+        return int(idx[np.argmax(scores[idx])])
+
+    # chars (detection indices) of the prefix / platenum sorted left to right, without the extra detections of a char
+    def __field_chars(self, idx, boxes, scores, classes):
+        idx = idx[self.__order_by_x(boxes[idx, 0])]
+        return idx[~self.__overlapping_chars(boxes[idx], scores[idx], classes[idx])]
+
+    # order of the chars by minx (left to right in the image)
+    # -> ties keep the order the former exchange sort gave them (it decides which detection of a char is kept)
+    def __order_by_x(self, minx):
+        if len(np.unique(minx)) == len(minx):
+            return np.argsort(minx)
+        order = list(range(len(minx)))
+        keys = minx.tolist()
+        for i in range(len(order)):
+            for j in range(i+1, len(order)):
+                if keys[order[j]] < keys[order[i]]:
+                    order[i], order[j] = order[j], order[i]
+        return np.array(order, dtype=np.int64)
+
+    # mask of the chars to remove: a char mostly covered (MIN_OVERLAPPING_CHARS_IOU_THRESH of its area) by a later char
+    # is the same char detected twice -> the same char: drop the first one, different chars: drop the lower score one
+    # -> the pairs are decided in order (i, then j), skipping the chars already removed
+    def __overlapping_chars(self, char_boxes, char_scores, char_classes):
+        n = len(char_boxes)
+        pop = np.zeros(n, dtype=bool)
+        if n < 2:
+            return pop
+        overlapping = np.triu(intersection_over_area(char_boxes, char_boxes) > self.MIN_OVERLAPPING_CHARS_IOU_THRESH, 1)
+        row, skip_row = -1, False
+        for i, j in zip(*np.nonzero(overlapping)):
+            if i != row:
+                row, skip_row = i, pop[i]
+            if skip_row or pop[j]:
                 continue
-            for j in range(i+1,len(lpr_obj.char_poly)):
-                if j in pop_indices:
-                    continue
-                
-                lpoly = lpr_obj.char_poly[i]
-                #iou =  lpoly.intersection(lpr_obj.char_poly[j]).area / lpoly.union(lpr_obj.char_poly[j]).area
-                intersection_percent =  (lpoly.intersection(lpr_obj.char_poly[j]).area / lpoly.area) 
-
-                if intersection_percent > self.MIN_OVERLAPPING_CHARS_IOU_THRESH: # okay, now we have to remove either i or j
-                    # check if same or diff character
-                    if lpr_obj.char[i] == lpr_obj.char[j]:
-                        pop_indices.add(i) # or j - no issues
-                    # check what to remove based on score
-                    else:
-                        pop_indices.add(i if (lpr_obj.char_score[j] > lpr_obj.char_score[i]) else j)
-    
-    def __remove_all_unwanted_elements(self, pop_indices):
-        for key in pop_indices.keys():
-            if key == "info_platenum" and len(pop_indices[key]) > 0:
-                remove_elements_by_indices_from_list(self.result.info_platenum.char, pop_indices[key])
-                remove_elements_by_indices_from_list(self.result.info_platenum.char_poly, pop_indices[key])
-                remove_elements_by_indices_from_list(self.result.info_platenum.char_score, pop_indices[key])
-            
-            elif key == "info_prefix" and len(pop_indices[key]) > 0:
-                remove_elements_by_indices_from_list(self.result.info_prefix.char, pop_indices[key])
-                remove_elements_by_indices_from_list(self.result.info_prefix.char_poly, pop_indices[key])
-                remove_elements_by_indices_from_list(self.result.info_prefix.char_score, pop_indices[key])
-
-            elif key == "info_ocr" and len(pop_indices[key]) > 0:
-                remove_elements_by_indices_from_list(self.result.info_ocr.char_id, pop_indices[key])
-                remove_elements_by_indices_from_list(self.result.info_ocr.char_poly, pop_indices[key])
-                remove_elements_by_indices_from_list(self.result.info_ocr.char_score, pop_indices[key])
+            if char_classes[i] == char_classes[j]:
+                pop[i] = True # or j - no issues
+            else:
+                pop[i if (char_scores[j] > char_scores[i]) else j] = True
+        return pop
 
     def __is_lpoly_belong_to_state_poly(self, lpoly, state_poly):
         ret_val = False
@@ -287,27 +283,13 @@ class alpr_ktc(object):
                     lp_obj.char_score[i], lp_obj.char_score[j] = lp_obj.char_score[j], lp_obj.char_score[i]
     '''                
     
-    def __is_equally_spaced(self, lp_obj):
-        spaces = []
-        #print("char_poly", lp_obj.char_poly)
-        for idx in range(1, len(lp_obj.char_poly)):
-            i_minx = lp_obj.char_poly[idx].bounds[0]
-            j_minx = lp_obj.char_poly[idx-1].bounds[0]
-            space = i_minx - j_minx
-            #print(space, lp_obj.char[idx], lp_obj.char[idx-1])
-            spaces.append(space)
-        
-        # find if there is any outlier
-        l = np.array(spaces)
-        #print("arr", l)
-        l = l/np.median(l)
-        #print("divide by median", l)
-        if True in (l>1.5):
-           #print(spaces, l, np.median(l))
-           return False
-        else:
-           return True
-    
+    # no outlier among the gaps between the minx of consecutive chars (gap > 1.5 x median gap)
+    def __is_equally_spaced(self, char_boxes):
+        spaces = np.diff(char_boxes[:, 0].astype(np.float64))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            l = spaces/np.median(spaces)
+        return not (l>1.5).any()
+
     def __is_equally_spaced_1(self, lp_obj):
         spaces = []
         for idx in range(1, len(lp_obj.char_poly)):
@@ -338,101 +320,40 @@ class alpr_ktc(object):
         
         return angle_degrees
         
-    def __is_complete_area_recognised(self, lp_obj):
-        
-        if len(lp_obj.char_poly) > 1:
-            start_pt = lp_obj.char_poly[0].bounds
-            end_pt = lp_obj.char_poly[-1].bounds        
+    # box of the prefix / platenum to compare the area of its chars (char_boxes, left to right) with
+    # -> a plate rotated more than the thresh: the box keeps the top and the width, its height is the one of the first char
+    def __area_box(self, box, char_boxes):
+
+        if len(char_boxes) > 1:
+            start_pt = char_boxes[0].tolist()
+            end_pt = char_boxes[-1].tolist()
             angle_rotated = self.calculate_angle(start_pt[0], start_pt[1], end_pt[0], end_pt[1])
-            
+
             # correct bounding box if license plate is rotated more than the thresh
             if abs(angle_rotated) > self.ANGLE_ROTATION_THRESH_FOR_AREA_COMPARE: # this algo wont work for this much rotated plates
                 # highly rotated plate
                 print("highly rotated plate", angle_rotated)
-                #lp_obj.polygon = affinity.rotate(lp_obj.polygon, angle_rotated)
-                minx, miny, maxx, maxy = lp_obj.polygon.bounds
-                c_minx, c_miny, c_maxx, c_maxy = lp_obj.char_poly[0].bounds
-                height = c_maxy - c_miny
-                
-                # corrected polygon
-                lp_obj.polygon = geometry.polygon.Polygon(((minx, miny),(maxx, miny),(maxx, miny+height),(minx, miny+height),(minx, miny)))
-                #print(lp_obj.polygon.area)
-        
-        ocr_cumulative_area = 0            
-        for poly in lp_obj.char_poly:
-            #print(poly.area)
-            ocr_cumulative_area += poly.area
-        #print("Licence-Plate area",lp_obj.polygon.area, ocr_cumulative_area)
-        #print(ocr_cumulative_area / lp_obj.polygon.area)
-        area_percent = ocr_cumulative_area / lp_obj.polygon.area
-        
+                minx, miny, maxx, maxy = box.tolist()
+                height = start_pt[3] - start_pt[1]
+
+                # corrected box
+                return np.array([minx, miny, maxx, miny + height], dtype=np.int64)
+        return box
+
+    # the chars cover more than MIN_THRESH_FOR_UNREC_PLATENUM_BASED_ON_AREA_COMPARE of the prefix / platenum box
+    def __is_complete_area_recognised(self, box, char_boxes):
+
+        minx, miny, maxx, maxy = box.tolist()
+        ocr_cumulative_area = float(((char_boxes[:, 2] - char_boxes[:, 0]) * (char_boxes[:, 3] - char_boxes[:, 1])).sum())
+        # no box area -> ZeroDivisionError, caught by __decode (the result is kept, as before)
+        area_percent = ocr_cumulative_area / float((maxx - minx) * (maxy - miny))
+
         if area_percent > self.MIN_THRESH_FOR_UNREC_PLATENUM_BASED_ON_AREA_COMPARE:
             return True
         else:
             #print("Incomplete platenum:", area_percent)
             return False
-            
-    def __rearrange_chars_based_on_xaxis(self, lp_obj):
-        # minx to maxx i.e., in an image it will be left to right repositioning of chars
-        for i, _ in enumerate(lp_obj.char_poly):
-            for j in range(i+1,len(lp_obj.char_poly)):
-                i_minx = lp_obj.char_poly[i].bounds[0]
-                j_minx = lp_obj.char_poly[j].bounds[0]
-                if j_minx < i_minx:
-                    # swapping
-                    lp_obj.char_poly[i], lp_obj.char_poly[j] = lp_obj.char_poly[j], lp_obj.char_poly[i]
-                    lp_obj.char[i], lp_obj.char[j] = lp_obj.char[j], lp_obj.char[i]
-                    lp_obj.char_score[i], lp_obj.char_score[j] = lp_obj.char_score[j], lp_obj.char_score[i]
-                    
-    def __populate_pred_data_into_results(self, model_pred): # ASSUMPTION: model_pred wont be None
-        for *xyxy, conf, cls in model_pred:
-            x1 = int(xyxy[0].item())
-            y1 = int(xyxy[1].item())        
-            x2 = int(xyxy[2].item())
-            y2 = int(xyxy[3].item())
-            obj_poly = geometry.Polygon([(x1, y1), (x1, y2), (x2,y2), (x2,y1)])
-
-            # parallel actions
-            class_name = self.lpr_class_name[int(cls.item())]
-            score = conf.item()
-            #print(class_name, score, self.result.info_platenum.score, score > self.result.info_platenum.score)
-
-            # TODO: uncomment this later
-            # Now our model is not so good for recognition, 
-            # so we are not able to eliminate any detections based on detection score currently
-            if score < self.DETECTION_CONFIDENCE_SCORE_THRESHOLD: 
-                continue
 
-            # if class_name not in ["prefix", "platenum"]:
-            #     draw_box(self.license_plate_img, obj_poly,color=(0,0,255))
-
-
-            # 1, populate 'STATE' detections
-            if class_name in self.state_class_names: # to remember both arabic and english logo of state sometimes. used append
-                self.result.info_logo.state.polygon.append(obj_poly)
-                self.result.info_logo.state.data_str.append(class_name)
-                self.result.info_logo.state.score.append(score)
-            # 2, populate 'PLATENUM' detections
-            elif class_name=="plate_number" and score > self.result.info_platenum.score: # should be one good plate-number bbox or choose best conf one
-                self.result.info_platenum.polygon = obj_poly
-                self.result.info_platenum.score = score
-            # 3, populate 'PREFIX' detections
-            elif class_name=="prefix"  and score > self.result.info_prefix.score: # should be one good prefix or choose best conf one
-                self.result.info_prefix.polygon = obj_poly # TODO: pad the poly to cover nearby prefix if any
-                self.result.info_prefix.score = score
-            # 4, populate 'SINGLE CHARS' detections - 0-9,a-z
-            elif class_name.isalnum() and len(class_name) == 1:
-                # draw_box(self.license_plate_img, obj_poly, color=(0,0,255))
-                self.result.info_ocr.char_poly.append(obj_poly)
-                self.result.info_ocr.char_score.append(conf.item())
-                self.result.info_ocr.char_id.append(int(cls.item()))
-            else: # misc - consulate, taxi, dubai police
-                # draw_box(self.license_plate_img, obj_poly, color=(0,0,255))
-                # print("other class detect :", class_name, score)
-                # cv2.imshow("weird character", self.license_plate_img)
-                # cv2.waitKey(2000)
-                pass
-    
     '''
     def __populate_prefix_and_platenum_characters(self, pop_indices):
         # populate ocr detections data in prefix or platenum dict
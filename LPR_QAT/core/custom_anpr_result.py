@@ -1,68 +1,84 @@
-# import easydict
-from easydict import EasyDict as edict
-
-class CustomANPRResult:
-    def __init__(self):
-        # self.result = {"state_info": {"poly":[], "state":[], "score":[]},
-        #                 "prefix": {"poly":None, "score":0, "char": [], "char_score":[], "char_poly":[]},
-        #                 "platenum": {"poly":None, "score":0, "char": [], "char_score":[], "char_poly":[]},
-        #                 "single_char": {"char_id": [], "char_score":[], "char_poly":[]},
-        #                 "aux": None,
-        #                 "decoded_label": {"full_label":"", "state_label":"", "prefix_label":"", "platenum_label":""}}
-
-        self.decoded_label = edict({"full_label":"", "state_label":"", "prefix_label":"", "platenum_label":""})
-
-        # "type" can be state, taxi, classic, consulate 
-        # "data_str" will populated today only if state
-        self.info_logo = edict({"state": {"polygon":[], "data_str":[], "score":[]}})
-
-        self.info_prefix = edict({"polygon":None, "score":0, "char": [], "char_score":[], "char_poly":[]})
-        self.info_platenum = edict({"polygon":None, "score":0, "char": [], "char_score":[], "char_poly":[]})
-
-        self.info_ocr = edict({"char_id": [], "char_score":[], "char_poly":[]})
-
-    def reset(self):
-        self.decoded_label = edict({"full_label":"", "state_label":"", "prefix_label":"", "platenum_label":""})
-
-        # "type" can be state, taxi, classic, consulate 
-        # "data_str" will populated today only if state
-        self.info_logo = edict({"state": {"polygon":[], "data_str":[], "score":[]}})
-
-        self.info_prefix = edict({"polygon":None, "score":0, "char": [], "char_score":[], "char_poly":[]})
-        self.info_platenum = edict({"polygon":None, "score":0, "char": [], "char_score":[], "char_poly":[]})
-
-        self.info_ocr = edict({"char_id": [], "char_score":[], "char_poly":[]})
-
-    # mandatory last step things here
-    def populate_final_number_plate_decoded_data(self):
-        self.decoded_label = edict({"full_label":"", "state_label":"", "prefix_label":"", "platenum_label":""})
-
-        if ("state" in self.info_logo.keys()) and (len(self.info_logo.state.data_str)>0):
-            # swap best conf index to 0th index
-            self.swap_best_conf_state_to_first()
-            
-            self.decoded_label.full_label += (self.info_logo.state.data_str[0]).upper()
-            self.decoded_label.state_label = (self.info_logo.state.data_str[0]).upper()
-            self.decoded_label.full_label += ","
-
-        if ("char" in self.info_prefix.keys()) and (len(self.info_prefix.char) > 0):
-            self.decoded_label.full_label += ("".join(self.info_prefix.char)).upper()
-            self.decoded_label.prefix_label = ("".join(self.info_prefix.char)).upper()
-            self.decoded_label.full_label += ","
-
-        if ("char" in self.info_platenum.keys()) and (len(self.info_platenum.char) > 0):
-            self.decoded_label.full_label += ("".join(self.info_platenum.char)).upper()
-            self.decoded_label.platenum_label = ("".join(self.info_platenum.char)).upper()
-
-    def swap_best_conf_state_to_first(self):
-        best_conf_idx = 0
-        if len(self.info_logo.state.data_str)>0:
-            for idx in range(1, len(self.info_logo.state.data_str)):
-                if self.info_logo.state.score[idx] > self.info_logo.state.score[best_conf_idx]:
-                    best_conf_idx = idx
-
-        # swap best conf state to 0th index if not already
-        if best_conf_idx != 0:
-            self.info_logo.state.data_str[best_conf_idx], self.info_logo.state.data_str[0] = self.info_logo.state.data_str[0], self.info_logo.state.data_str[best_conf_idx]
-            self.info_logo.state.polygon[best_conf_idx], self.info_logo.state.polygon[0] = self.info_logo.state.polygon[0], self.info_logo.state.polygon[best_conf_idx]
-            self.info_logo.state.score[best_conf_idx], self.info_logo.state.score[0] = self.info_logo.state.score[0], self.info_logo.state.score[best_conf_idx]
+from typing import NamedTuple
+
+import numpy as np
+import shapely
+
+
+# Result of the OCR of one plate image (alpr_ktc.process / process_batch)
+# -> immutable and compact: NamedTuples holding read-only arrays, built once per call by alpr_ktc (never reset or
+#    copied), so a result can be handed to other threads and kept (PlateConsensus) as it is
+# -> boxes are int (x1, y1, x2, y2) rows; the shapely polygons of the former result (draw_box etc.) are built on
+#    demand from them by the polygon / char_poly properties
+
+# read-only array, shared defaults and results can not be changed by their users
+def frozen_array(values, dtype, shape=None):
+    arr = np.array(values, dtype=dtype)
+    if shape is not None:
+        arr = arr.reshape(shape)
+    arr.flags.writeable = False
+    return arr
+
+
+_NO_SCORES = frozen_array([], np.float64)
+_NO_IDS = frozen_array([], np.int64)
+_NO_BOXES = frozen_array([], np.int64, (0, 4))
+
+
+def box_polygons(boxes):
+    # same point order as the polygons of the detections always had: (x1, y1), (x1, y2), (x2, y2), (x2, y1)
+    return shapely.box(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3], ccw=False)
+
+
+class DecodedLabel(NamedTuple):
+    full_label: str = ""        # "STATE,PREFIX,PLATENUM" of the fields read
+    state_label: str = ""
+    prefix_label: str = ""
+    platenum_label: str = ""
+
+
+# state detections, the best scored first ("data_str": state class names, e.g. 'state-dxb-english')
+class PlateStates(NamedTuple):
+    data_str: tuple = ()
+    score: np.ndarray = _NO_SCORES
+    box: np.ndarray = _NO_BOXES
+
+    @property
+    def polygon(self):
+        return list(box_polygons(self.box))
+
+
+# prefix / platenum: the box of the field (None if not detected) and its chars left to right
+# -> box is the one the area check used: for a highly rotated plate its height is the one of the first char
+class PlateField(NamedTuple):
+    box: np.ndarray = None
+    score: float = 0
+    char: tuple = ()
+    char_score: np.ndarray = _NO_SCORES
+    char_box: np.ndarray = _NO_BOXES
+
+    @property
+    def polygon(self):
+        return None if self.box is None else box_polygons(self.box[None])[0]
+
+    @property
+    def char_poly(self):
+        return list(box_polygons(self.char_box))
+
+
+# single char detections inside the prefix or the platenum, in detection order (char_id: class id)
+class PlateChars(NamedTuple):
+    char_id: np.ndarray = _NO_IDS
+    char_score: np.ndarray = _NO_SCORES
+    char_box: np.ndarray = _NO_BOXES
+
+    @property
+    def char_poly(self):
+        return list(box_polygons(self.char_box))
+
+
+class CustomANPRResult(NamedTuple):
+    decoded_label: DecodedLabel = DecodedLabel()
+    state: PlateStates = PlateStates()
+    prefix: PlateField = PlateField()
+    platenum: PlateField = PlateField()
+    ocr: PlateChars = PlateChars()
@@ -36,6 +36,17 @@ def remove_elements_by_indices_from_list(my_list, popup_indices):
             
         # for i, e in reversed(list(enumerate(a))):
 
+# area of the intersection of every box of a with every box of b over the area of the box of a
+# -> a: (n, 4), b: (m, 4) axis aligned boxes (x1, y1, x2, y2) -> (n, m), nan where the box of a has no area
+def intersection_over_area(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    area = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.clip(w, 0, None) * np.clip(h, 0, None) / area[:, None]
+
 def random_color():
     b = random.randint(0,255)
     g = random.randint(0,255)
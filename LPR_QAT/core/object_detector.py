@@ -1,3 +1,5 @@
+import threading
+
 import numpy as np
 import torch
 import cv2
@@ -7,6 +9,7 @@ from LPR_QAT.models.experimental import attempt_load
 from LPR_QAT.utils.torch_utils import select_device, time_sync
 # from utils.plots import plot_one_box
 from LPR_QAT.utils.datasets import letterbox
+from LPR_QAT.core.onnx_detector import OnnxDetector
 
 class ObjectDetector(object):
     """
@@ -14,6 +17,8 @@ class ObjectDetector(object):
         source: https://github.com/ultralytics/yolov5    
 
         Remarks: Added mode argument. 'default' is for pedestrian zone violations.
+                 'ocr' mode runs on the backend of DETECTIONS.OCR.BACKEND: 'torch' (WEIGHTS, default) or 'onnx'
+                 (ONNX_WEIGHTS exported by LPR_QAT.core.onnx_export, ONNX Runtime on CPU).
     """
 
     def __init__(self, cfg, mode = 'default'):
@@ -28,6 +33,7 @@ class ObjectDetector(object):
         self.iou_thres = cfg.DETECTIONS.IOU_THRES
         
         #weights
+        self.backend = 'torch'
         if mode == 'default':
             self.img_size = cfg.DETECTIONS.PED.IMG_SIZE
             weights = cfg.DETECTIONS.PED.WEIGHTS
@@ -40,6 +46,10 @@ class ObjectDetector(object):
         elif mode == 'ocr':
             self.img_size = cfg.DETECTIONS.OCR.IMG_SIZE
             weights = cfg.DETECTIONS.OCR.WEIGHTS
+            self.backend = cfg.DETECTIONS.OCR.get('BACKEND', 'torch')
+            if self.backend == 'onnx':
+                weights = cfg.DETECTIONS.OCR.ONNX_WEIGHTS
+                onnx_threads = int(cfg.DETECTIONS.OCR.get('ONNX_THREADS', 0))
         elif mode == 'ldms':
             self.img_size = cfg.DETECTIONS.LDMS.IMG_SIZE
             weights = cfg.DETECTIONS.LDMS.WEIGHTS
@@ -47,16 +57,25 @@ class ObjectDetector(object):
             self.img_size = cfg.DETECTIONS.NOENTRY.IMG_SIZE
             weights = cfg.DETECTIONS.NOENTRY.WEIGHTS
 
-        # Initialize
-        self.device = select_device(dev)
-        self.half = self.device.type != 'cpu'  # half precision only supported on CUDA
+        if self.backend == 'onnx':
+            # ONNX Runtime on CPU, the NMS and the post processing stay in torch (on CPU)
+            self.device = torch.device('cpu')
+            self.half = False
+            self.model = OnnxDetector(weights, onnx_threads)
+            self.stride = self.model.stride
+            # a static model has a fixed (square) input
+            self.img_size = self.model.input_size[0] if self.model.input_size else check_img_size(self.img_size, s=self.stride)
+        else:
+            # Initialize
+            self.device = select_device(dev)
+            self.half = self.device.type != 'cpu'  # half precision only supported on CUDA
 
-        # Load model
-        self.model = attempt_load(weights, device=self.device)  # load FP32 model        
-        self.stride = int(self.model.stride.max())  # model stride
-        self.img_size = check_img_size(self.img_size, s=self.stride)  # check img_size
-        if self.half:
-            self.model.half()  # to FP16
+            # Load model
+            self.model = attempt_load(weights, device=self.device)  # load FP32 model        
+            self.stride = int(self.model.stride.max())  # model stride
+            self.img_size = check_img_size(self.img_size, s=self.stride)  # check img_size
+            if self.half:
+                self.model.half()  # to FP16
 
         # Second-stage classifier
         self.classify = False
@@ -71,13 +90,25 @@ class ObjectDetector(object):
         self.colors = [[np.random.randint(0, 255) for _ in range(3)] for _ in self.class_names]
 
         # Run inference
-        if self.device.type != 'cpu':
+        if self.backend == 'torch' and self.device.type != 'cpu':
             self.model(torch.zeros(1, 3, self.img_size, self.img_size).to(self.device).type_as(next(self.model.parameters())))  # run once
 
+        # buffers of detect_objects_batch, allocated for the largest batch seen so far and reused; one set per
+        # calling thread, so that detect_objects / detect_objects_batch can run concurrently (e.g. alpr_ktc from
+        # a worker pool)
+        #   host:  letterboxed images, uint8 BGR (batch, h, w, 3)
+        #   input: model input on the device, RGB 0..1 (batch, 3, h, w), torch backend
+        self.batch_buffers = threading.local()
+
         # Print message from object detector
-        print (f'[ObjectDetector:init] Loaded model for weights: {weights}. Classes: {self.class_names}')
+        print (f'[ObjectDetector:init] Loaded {self.backend} model for weights: {weights}. Classes: {self.class_names}')
+
     def detect_objects(self, frame, mode):
 
+        if self.backend == 'onnx':
+            # a batch of one: same letterboxed input as 'video' / 'stream' mode (smallest stride multiple shape)
+            return self.detect_objects_batch([frame])[0]
+
         if mode == 'stream':
             # Letterbox
             img = [letterbox(frame, self.img_size, auto=True, stride=self.stride)[0]]
@@ -152,6 +183,84 @@ class ObjectDetector(object):
         # Print time (inference + NMS)
         #print(f'Done. ({t2 - t1:.3f}s) FPS: {1.0 / (t2 - t1)} ')
 
-     
+    def detect_objects_batch(self, frames):
+        """
+            Runs the detection on a list of images (e.g. plate crops of several streams) with one forward pass.
+            Every image is letterboxed to img_size straight into a preallocated buffer, padded to the smallest
+            stride multiple shape fitting all the images of the batch (for a single image: same input as
+            detect_objects 'video' mode), or to the fixed input of a static ONNX model; NMS runs once on the
+            whole batch output.
+            Returns the detections per image, as detect_objects (tensor or None).
+            Thread-safe: the buffers are per thread (batch_buffers).
+        """
+        n = len(frames)
+        if n == 0:
+            return []
+
+        # resized size of every image, batch shape = max of them rounded up to the stride
+        sizes = []
+        for frame in frames:
+            r = min(self.img_size / frame.shape[0], self.img_size / frame.shape[1])
+            sizes.append((int(round(frame.shape[1] * r)), int(round(frame.shape[0] * r))))
+        width = int(np.ceil(max(w for w, h in sizes) / self.stride) * self.stride)
+        height = int(np.ceil(max(h for w, h in sizes) / self.stride) * self.stride)
+        if self.backend == 'onnx' and self.model.input_size:
+            height, width = self.model.input_size
+
+        # (re)allocate the buffers if the batch is larger than the largest one so far; they are flat so that
+        # the batch is contiguous whatever its shape
+        buffers = self.batch_buffers
+        size = n * height * width * 3
+        if getattr(buffers, 'host', None) is None or len(buffers.host) < size:
+            capacity = n * self.img_size * self.img_size * 3
+            buffers.host = np.empty(capacity, dtype=np.uint8)
+            if self.backend == 'torch':
+                buffers.input = torch.empty(capacity, device=self.device,
+                                            dtype=torch.float16 if self.half else torch.float32)
+
+        # Letterbox
+        host = buffers.host[:size].reshape(n, height, width, 3)
+        for frame, new_unpad, dst in zip(frames, sizes, host):
+            self._letterbox_into(frame, new_unpad, dst)
+
+        if self.backend == 'onnx':
+            # Convert: BGR to RGB, bsx3xHxW, 0 - 255 to 0.0 - 1.0 (float32 division, as in torch) into the input buffer
+            img = self.model.input_buffer(n, height, width)
+            np.divide(host[..., ::-1].transpose(0, 3, 1, 2), 255.0, out=img[:n], dtype=np.float32)
+
+            # Inference
+            pred = torch.from_numpy(self.model(img, n))
+        else:
+            # Convert: BGR to RGB, bsx3xHxW, 0 - 255 to 0.0 - 1.0
+            img = buffers.input[:size].view(n, 3, height, width)
+            img.copy_(torch.from_numpy(host).to(self.device).permute(0, 3, 1, 2).flip(1))
+            img /= 255.0
+
+            # Inference
+            pred = self.model(img, augment=self.augment)[0]
 
+        # Apply NMS (list with the detections of every image)
+        pred = non_max_suppression(pred, self.conf_thres, self.iou_thres, classes=self.classes, agnostic=self.agnostic_nms)
 
+        dets = []
+        for frame, det in zip(frames, pred):
+            if det is not None and len(det):
+                # Rescale boxes from the batch shape to im0 size
+                det[:, :4] = scale_boxes(img.shape[2:], det[:, :4], frame.shape).round()
+                dets.append(det)
+            else:
+                dets.append(None)
+        return dets
+
+    def _letterbox_into(self, img, new_unpad, dst, color=114):
+        # letterbox(img) resized to new_unpad (w, h), centered in dst (h x w x 3, at least new_unpad) in place
+        dw, dh = (dst.shape[1] - new_unpad[0]) / 2, (dst.shape[0] - new_unpad[1]) / 2
+        top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+
+        dst[:] = color
+        region = dst[top:top + new_unpad[1], left:left + new_unpad[0]]
+        if img.shape[1::-1] != new_unpad:  # resize
+            cv2.resize(img, new_unpad, dst=region, interpolation=cv2.INTER_LINEAR)
+        else:
+            region[:] = img
+        return dst
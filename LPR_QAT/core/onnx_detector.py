@@ -0,0 +1,65 @@
+import ast
+import threading
+
+import numpy as np
+
+
+class OnnxDetector(object):
+    """
+        ONNX Runtime (CPU) inference of a YOLOv5 model exported by LPR_QAT.core.onnx_export, the model of
+        ObjectDetector with BACKEND: onnx.
+
+        The input is written by the caller into a float32 buffer kept across the calls (input_buffer(), grown for
+        the largest batch seen) and handed to ONNX Runtime without a copy. The output is the raw
+        (batch, anchors, 5 + nc) predictions, NMS is left to the caller (the same non_max_suppression as for the
+        PyTorch model).
+
+        There is one input buffer per calling thread: threads sharing the detector (and its InferenceSession, whose
+        run() is thread-safe) do not overwrite the input of each other. input_buffer() and __call__ of a batch
+        must run on the same thread.
+
+        Static models (fixed input shape) run larger batches in chunks of their batch size; their image size is
+        fixed (input_size).
+    """
+
+    def __init__(self, weights, threads=0):
+        import onnxruntime  # only needed for BACKEND: onnx
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(weights, options, providers=['CPUExecutionProvider'])
+
+        # input [batch, 3, height, width]: ints if static, names of the dynamic axes otherwise
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_names = [self.session.get_outputs()[0].name]
+        batch, _, height, width = model_input.shape
+        self.batch_size = batch if isinstance(batch, int) else None
+        self.input_size = (height, width) if isinstance(height, int) and isinstance(width, int) else None
+
+        # stride and class names written by onnx_export
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.stride = int(meta.get('stride', 32))
+        self.names = ast.literal_eval(meta['names']) if 'names' in meta else {}
+
+        self.buffers = threading.local()   # .input: flat float32 input buffer of the thread
+
+    # input of a batch of n (batch, 3, height, width), to be filled by the caller; a static model gets whole chunks
+    def input_buffer(self, n, height, width):
+        if self.batch_size is not None:
+            n = -(-n // self.batch_size) * self.batch_size
+        size = n * 3 * height * width
+        buffer = getattr(self.buffers, 'input', None)
+        if buffer is None or len(buffer) < size:
+            buffer = self.buffers.input = np.empty(size, dtype=np.float32)
+        return buffer[:size].reshape(n, 3, height, width)
+
+    # predictions of the first n images of img (an input_buffer)
+    def __call__(self, img, n):
+        if self.batch_size is None:
+            return self.session.run(self.output_names, {self.input_name: img[:n]})[0]
+        preds = [self.session.run(self.output_names, {self.input_name: img[i:i + self.batch_size]})[0]
+                 for i in range(0, n, self.batch_size)]
+        return np.concatenate(preds)[:n]
@@ -0,0 +1,68 @@
+# Export of a LPR_QAT YOLOv5 checkpoint (e.g. the KTC OCR weights) to ONNX, for ObjectDetector with BACKEND: onnx
+# -> the model is loaded as ObjectDetector loads it (attempt_load: FP32, Conv2d + BatchNorm2d fused) and exported in
+#    export mode: one output, the raw (batch, anchors, 5 + nc) predictions; NMS runs in ObjectDetector
+# -> --dynamic: batch, height and width dynamic -> the same letterboxed inputs as the PyTorch model (the smallest
+#    stride multiple shape fitting the batch), the same detections
+# -> static (default): input fixed to (--batch, 3, --img-size, --img-size) -> the images are padded to the square
+#    and larger batches run in chunks of --batch; ONNX Runtime can plan the whole graph ahead
+# -> stride and class names are stored in the metadata of the model (read by OnnxDetector)
+#
+# usage (from the repository root):
+#   python -m LPR_QAT.core.onnx_export --weights LPR_QAT/weights/ktclpr_v4_1L_v7_s_pretrained.pt --dynamic
+import os
+import argparse
+
+import torch
+
+from LPR_QAT.models.experimental import attempt_load
+from LPR_QAT.models.yolo import Detect
+from LPR_QAT.utils.general import check_img_size
+
+
+def export_onnx(weights, output='', img_size=640, batch_size=1, dynamic=False, opset=12):
+    import onnx  # only needed to export
+
+    model = attempt_load(weights, device=torch.device('cpu'), inplace=True, fuse=True)
+    stride = int(model.stride.max())
+    img_size = check_img_size(img_size, s=stride)
+    for m in model.modules():
+        if isinstance(m, Detect):
+            m.inplace = False       # no slice assignment in the graph
+            m.dynamic = dynamic     # grid built from the input shape
+            m.export = True         # predictions only
+
+    im = torch.zeros(batch_size, 3, img_size, img_size)
+    with torch.no_grad():
+        for _ in range(2):
+            model(im)  # dry runs (grids)
+
+        output = output or os.path.splitext(weights)[0] + '.onnx'
+        torch.onnx.export(model, im, output, verbose=False, opset_version=opset, do_constant_folding=True,
+                          input_names=['images'], output_names=['output0'],
+                          dynamic_axes={'images': {0: 'batch', 2: 'height', 3: 'width'},
+                                        'output0': {0: 'batch', 1: 'anchors'}} if dynamic else None)
+
+    # checks, metadata
+    model_onnx = onnx.load(output)
+    onnx.checker.check_model(model_onnx)
+    for key, value in {'stride': stride, 'names': model.names}.items():
+        meta = model_onnx.metadata_props.add()
+        meta.key, meta.value = key, str(value)
+    onnx.save(model_onnx, output)
+
+    shape = 'dynamic' if dynamic else f'({batch_size}, 3, {img_size}, {img_size})'
+    print(f'[onnx_export] {weights} -> {output}, input {shape}, opset {opset}')
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, required=True, help='PyTorch checkpoint (.pt)')
+    parser.add_argument('--output', type=str, default='', help='ONNX model (default = weights with .onnx suffix)')
+    parser.add_argument('--img-size', type=int, default=640, help='input size, as DETECTIONS.OCR.IMG_SIZE (default = 640)')
+    parser.add_argument('--batch', type=int, default=1, help='batch size of a static model (default = 1)')
+    parser.add_argument('--dynamic', action='store_true', help='dynamic batch and image size')
+    parser.add_argument('--opset', type=int, default=12, help='ONNX opset (default = 12)')
+    opt = parser.parse_args()
+
+    export_onnx(opt.weights, opt.output, opt.img_size, opt.batch, opt.dynamic, opt.opset)
@@ -0,0 +1,120 @@
+from easydict import EasyDict as edict
+
+from LPR_QAT.core.custom_anpr_result import CustomANPRResult, DecodedLabel
+
+
+class PlateConsensus(object):
+    """
+        Fuses the OCR reads (alpr_ktc results) of the plate crops of one track into one plate.
+
+        Every field is voted separately:
+        - state: the state label of every read, weighted by its score; the labels of one state (english / arabic /
+          logo) vote together, the fused label is the best scored of the winning state
+        - prefix / platenum: first the number of characters (weighted by the mean char_score of the read), then
+          every character position among the reads of the winning length, weighted by its char_score
+
+        The confidence of a field is the weight of its winner over the total weight of the field plus PRIOR (the
+        doubt before any read), the confidence of the plate the lowest of its fields: a single read never reaches
+        it alone, agreeing reads raise it, conflicting reads lower it. Once it passes threshold no more crops of the
+        track need to be read.
+    """
+
+    PRIOR = 0.5
+
+    def __init__(self, threshold=0.75):
+        self.threshold = threshold
+        self.reads = 0      # crops read (with or without result)
+        self.states = {}    # state label -> summed score
+        self.fields = {'prefix': {}, 'platenum': {}}    # field -> {length: [summed weight, [{char: summed score}]]}
+
+    # add the result of one crop (None if it could not be read)
+    def add(self, result: CustomANPRResult):
+        self.reads += 1
+        if result is None or not result.decoded_label.platenum_label:
+            return
+
+        label = result.decoded_label.state_label
+        if label:
+            self.states[label] = self.states.get(label, 0.0) + float(result.state.score[0])
+
+        for name, info in (('prefix', result.prefix), ('platenum', result.platenum)):
+            chars, scores = info.char, info.char_score
+            if not chars:
+                continue
+            length = self.fields[name].setdefault(len(chars), [0.0, [{} for c in chars]])
+            length[0] += float(scores.mean())
+            for position, char, score in zip(length[1], chars, scores):
+                position[char.upper()] = position.get(char.upper(), 0.0) + float(score)
+
+    # winner of a {value: weight} vote and its confidence
+    def _vote(self, votes):
+        winner = max(votes, key=votes.get)
+        return winner, votes[winner] / (sum(votes.values()) + self.PRIOR)
+
+    def _state(self):
+        groups = {}
+        for label, score in self.states.items():
+            key = label.rsplit('-', 1)[0]
+            groups[key] = groups.get(key, 0.0) + score
+        key, confidence = self._vote(groups)
+        label = max((label for label in self.states if label.rsplit('-', 1)[0] == key), key=self.states.get)
+        return label, confidence
+
+    def _field(self, name):
+        lengths = self.fields[name]
+        length, confidence = self._vote({length: votes[0] for length, votes in lengths.items()})
+        chars = []
+        for position in lengths[length][1]:
+            char, char_confidence = self._vote(position)
+            chars.append(char)
+            confidence = min(confidence, char_confidence)
+        return ''.join(chars), confidence
+
+    # fused plate as edict(state_label, prefix_label, platenum_label, confidence), None before any plate is read
+    # -> a field not read by any crop is empty and does not lower the confidence
+    def plate(self):
+        if not self.fields['platenum']:
+            return None
+        plate = edict(state_label='', prefix_label='', platenum_label='', confidence=1.0)
+        if self.states:
+            plate.state_label, confidence = self._state()
+            plate.confidence = min(plate.confidence, confidence)
+        for name in ('prefix', 'platenum'):
+            if self.fields[name]:
+                plate[name + '_label'], confidence = self._field(name)
+                plate.confidence = min(plate.confidence, confidence)
+        return plate
+
+    def confident(self):
+        plate = self.plate()
+        return plate is not None and plate.confidence >= self.threshold
+
+    # fused plate as an alpr_ktc result (decoded_label only), None before any plate is read
+    def result(self):
+        plate = self.plate()
+        if plate is None:
+            return None
+        full_label = ','.join(label for label in (plate.state_label, plate.prefix_label, plate.platenum_label) if label)
+        return CustomANPRResult(decoded_label=DecodedLabel(full_label, plate.state_label, plate.prefix_label, plate.platenum_label))
+
+
+class SingleRead(object):
+    """
+        Stand-in for PlateConsensus for reads that can not be fused (e.g. the TechnoStream OCR results: plate text
+        only, no char scores): the first crop read with a plate settles the track and is its result.
+    """
+
+    def __init__(self, threshold=None):
+        self.reads = 0      # crops read (with or without result)
+        self.read = None    # first result
+
+    def add(self, result):
+        self.reads += 1
+        if self.read is None:
+            self.read = result
+
+    def confident(self):
+        return self.read is not None
+
+    def result(self):
+        return self.read
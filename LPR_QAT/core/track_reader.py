@@ -0,0 +1,142 @@
+import abc
+import os
+import time
+import traceback
+from collections import deque
+
+from LPR_QAT.core.plate_consensus import PlateConsensus, SingleRead
+
+
+class TrackReader(abc.ABC):
+    """
+        OCR of the plate crops saved by PlateRecognition (the read loop of anpr_ivms.py), track by track.
+
+        The crops are grouped by track (group_by_track) and read in rounds: every round reads the next crop of every
+        track not settled yet, the crops of all the tracks (and streams) in batches of up to batch_size, one
+        read_batch call (one forward pass) each. A track is settled once the consensus of its reads is confident
+        (its remaining crops are not read) or all its crops have been read, then its fused plate is published once.
+
+        Reads that can not be fused (fuse False, e.g. TechnoStream OCR results) are not voted: the first crop read
+        with a plate settles the track (SingleRead).
+
+        With plates (a core.recent_plates.RecentPlates), a plate published within its window is not published
+        again (a car read by several jobs, or seen again a few seconds later): the crops of the track are discarded.
+
+        Subclasses must load the crops (load_image), read them (read_batch) and publish the plates (publish_track,
+        discard_track), and may name the plates (plate_label), see anpr_ivms.ANPR_IVMS.
+
+        The reads are counted in stats and batch_sizes (forward passes per number of crops); they are only written
+        by the thread running process_tracks.
+    """
+
+    def __init__(self, batch_size=8, consensus_threshold=0.75, plates=None, fuse=True):
+        self.batch_size = batch_size
+        # the crops of a track are read until the consensus of their reads reaches this confidence
+        self.consensus_threshold = consensus_threshold
+        self.plates = plates
+        self.consensus_class = PlateConsensus if fuse else SingleRead
+
+        self.stats = {'batches': 0, 'crops': 0, 'failures': 0, 'ocr_ns': 0, 'tracks': 0, 'duplicates': 0}
+        self.batch_sizes = [0] * (batch_size + 1)
+
+    # plate image of the crop, None if it can not be loaded
+    @abc.abstractmethod
+    def load_image(self, img_path):
+        raise NotImplementedError
+
+    # OCR of a batch of plate images -> result per image (None if the plate could not be read)
+    @abc.abstractmethod
+    def read_batch(self, imgs):
+        raise NotImplementedError
+
+    # plate published for the fused plate of a track (consensus), None if it can not be published
+    # (deduplicated by its label)
+    def plate_label(self, consensus):
+        result = consensus.result()
+        return result.decoded_label.full_label if result is not None else None
+
+    # publish the fused plate of a track (consensus), reads: [(img_path, img)] of the crops read, best first;
+    # unread: the img paths of the crops not read
+    @abc.abstractmethod
+    def publish_track(self, consensus, reads, unread):
+        raise NotImplementedError
+
+    # crops of a track whose plate has already been published (same arguments as publish_track)
+    @abc.abstractmethod
+    def discard_track(self, consensus, reads, unread):
+        raise NotImplementedError
+
+    # stream of a track (its folder), the scope of the dedupe
+    @staticmethod
+    def track_stream(key):
+        folder = key[0] if isinstance(key, tuple) else os.path.dirname(key)
+        return os.path.basename(folder)
+
+    # plate images grouped by track: {(folder, track id): [img paths]} in the order they were saved, i.e. best crop
+    # first (see PlateRecognition._lpr_job); an image not named {track id}_... is a track of its own
+    @staticmethod
+    def group_by_track(img_paths):
+        tracks = {}
+        for img_path in sorted(img_paths):
+            name = os.path.basename(img_path)
+            track_id = name.split('_', 1)[0]
+            key = (os.path.dirname(img_path), track_id) if ('_' in name and track_id.isdigit()) else img_path
+            tracks.setdefault(key, []).append(img_path)
+        return tracks
+
+    # read the plate images in rounds, publish every track once settled
+    def process_tracks(self, img_paths):
+        tracks = {key: deque(paths) for key, paths in self.group_by_track(img_paths).items()}
+        consensus = {key: self.consensus_class(self.consensus_threshold) for key in tracks}
+        reads = {key: [] for key in tracks}     # (img_path, img) of the crops read
+        crops = len(img_paths)
+        read = 0
+        batches, ocr_ns = self.stats['batches'], self.stats['ocr_ns']
+        while tracks:
+            round_paths = [(key, paths.popleft()) for key, paths in tracks.items()]
+            for start in range(0, len(round_paths), self.batch_size):
+                chunk = round_paths[start:start + self.batch_size]
+                for (key, img_path), (img, result) in zip(chunk, self.read_images([img_path for key, img_path in chunk])):
+                    if img is not None:
+                        consensus[key].add(result)
+                        reads[key].append((img_path, img))
+                        read += 1
+            for key in list(tracks):
+                if consensus[key].confident() or not tracks[key]:
+                    self.settle_track(key, consensus[key], reads.pop(key), tracks.pop(key))
+        if crops:
+            batches = self.stats['batches'] - batches
+            ocr_ms = (self.stats['ocr_ns'] - ocr_ns) / 1e6
+            print(f"[TrackReader] {len(consensus)} tracks: {read} of {crops} plate crops read in {batches} OCR batches, "
+                  f"{ocr_ms / max(read, 1):.1f} ms/crop")
+
+    # publish the plate of a settled track, unless it has been published within the dedupe window
+    # -> a track without any crop read is handed to publish_track (which cleans it up)
+    def settle_track(self, key, consensus, reads, unread):
+        self.stats['tracks'] += 1
+        label = self.plate_label(consensus) if (reads and self.plates is not None) else None
+        if label is not None and not self.plates.add(self.track_stream(key), label):
+            self.stats['duplicates'] += 1
+            self.discard_track(consensus, reads, unread)
+            return
+        self.publish_track(consensus, reads, unread)
+
+    # OCR of a batch of plate images (one read_batch call) -> (img, result) per image; img is None if the image
+    # could not be loaded, result None if the plate could not be read (or the batch failed)
+    def read_images(self, img_paths):
+        imgs = [self.load_image(img_path) for img_path in img_paths]
+        results = [None] * len(imgs)
+        valid = [i for i, img in enumerate(imgs) if img is not None]
+        if valid:
+            t0 = time.monotonic_ns()
+            try:
+                for i, result in zip(valid, self.read_batch([imgs[i] for i in valid])):
+                    results[i] = result
+            except Exception as e:
+                 self.stats['failures'] += 1
+                 print("[TrackReader] Exception raised.", e, traceback.format_exc())
+            self.stats['batches'] += 1
+            self.stats['crops'] += len(valid)
+            self.stats['ocr_ns'] += time.monotonic_ns() - t0
+            self.batch_sizes[len(valid)] += 1
+        return list(zip(imgs, results))
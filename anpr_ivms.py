@@ -5,6 +5,7 @@ import base64
 import requests
 import json
 import glob
+import io
 import shutil
 from datetime import datetime
 
@@ -12,15 +13,18 @@ import cv2
 from PIL import Image
 import pika
 
-from copy import deepcopy
-
 from LPR_QAT.core.object_detector import ObjectDetector
 from LPR_QAT.core.yaml_parser import YamlParser
 from LPR_QAT.core.alpr_ktc import alpr_ktc
+from LPR_QAT.core.track_reader import TrackReader
+from core.recent_plates import RecentPlates
+from utils.image_writer import get_image_writer
+from utils.metrics_server import Metric, MetricsServer
 
 import traceback
 
-class ANPR_IVMS(object):
+# plate images read track by track, in batches across the streams (see LPR_QAT.core.track_reader)
+class ANPR_IVMS(TrackReader):
     def __init__(self):
         self.url = 'http://192.168.10.111:4466/api/RecognizeImage/'
         self.lpr_dir_path = '/home/nvidia/ivms/.lpr'
@@ -34,8 +38,34 @@ class ANPR_IVMS(object):
         # Read YAML config file using YamlParser class 
         cfg = YamlParser(config_file="LPR_QAT/config/app_settings.yaml")
         
-        ocr_detector = ObjectDetector(cfg, mode='ocr')
-        self.lpr = alpr_ktc(ocr_detector)
+        ocr_cfg = cfg.DETECTIONS.OCR
+        # OCR engine: the KTC OCR model (ktc), or the TechnoStream OCR server (techno, simpleDetect)
+        self.technoocr = str(ocr_cfg.get('ENGINE', 'ktc')).lower() == 'techno'
+        if self.technoocr:
+            print("[ANPR_IVMS] ENGINE: techno -> the TechnoStream reads carry no char scores, they can not be fused: "
+                  "the first crop of a track read with a plate is published (no consensus)")
+        else:
+            ocr_detector = ObjectDetector(cfg, mode='ocr')
+            self.lpr = alpr_ktc(ocr_detector)
+        # plate images of all the streams are read in batches of up to BATCH_SIZE (one forward pass each), the
+        # crops of a track until the consensus of their reads reaches CONSENSUS_THRESHOLD
+        # -> a plate is published once within DEDUPE_WINDOW_S (at most DEDUPE_SIZE plates remembered), per stream
+        #    folder or for all the streams (DEDUPE_SCOPE), see core.recent_plates
+        plates = RecentPlates(float(ocr_cfg.get('DEDUPE_WINDOW_S', 60)), int(ocr_cfg.get('DEDUPE_SIZE', 1000)),
+                              str(ocr_cfg.get('DEDUPE_SCOPE', 'stream')).lower() == 'stream')
+        super().__init__(int(ocr_cfg.get('BATCH_SIZE', 8)), float(ocr_cfg.get('CONSENSUS_THRESHOLD', 0.75)), plates,
+                         fuse=not self.technoocr)
+
+        # recognized plate images are encoded (JPEG + EXIF) and written off the OCR loop
+        self.image_writer = get_image_writer()
+
+        # OCR counters of the track reader served on PERF.METRICS_PORT
+        self.metrics_server = None
+        perf_cfg = cfg.get('PERF') or {}
+        if int(perf_cfg.get('METRICS_PORT', 0)) > 0:
+            self.metrics_server = MetricsServer(self.collect_metrics, int(perf_cfg.METRICS_PORT),
+                                                str(perf_cfg.get('METRICS_HOST', '127.0.0.1')))
+            self.metrics_server.start()
 
         self.init_rabbitmq()
     
@@ -53,11 +83,17 @@ class ANPR_IVMS(object):
     def ktclpr_result_to_json(self,lpr_results):
        response_json = {"PlateText": "UnRec", "StateLong": "UnRec", "CountryLong": "UnRec"}
        if lpr_results is not None:
-           response_json["PlateText"] = f'{lpr_results.decoded_label["prefix_label"]}' if lpr_results.decoded_label["prefix_label"] else 'NA'
-           response_json["PlateText"] = f'{response_json["PlateText"]} {lpr_results.decoded_label["platenum_label"]}' if lpr_results.decoded_label["platenum_label"] else 'UnRec'
-           response_json["StateLong"] = f'{self._city_code(lpr_results.decoded_label["state_label"])}' if lpr_results.decoded_label["state_label"] else 'UnRec'
-           response_json["CountryLong"] = f'{self._country_code(lpr_results.decoded_label["state_label"])}' if lpr_results.decoded_label["state_label"] else 'UnRec'
+           response_json["PlateText"] = f'{lpr_results.decoded_label.prefix_label}' if lpr_results.decoded_label.prefix_label else 'NA'
+           response_json["PlateText"] = f'{response_json["PlateText"]} {lpr_results.decoded_label.platenum_label}' if lpr_results.decoded_label.platenum_label else 'UnRec'
+           response_json["StateLong"] = f'{self._city_code(lpr_results.decoded_label.state_label)}' if lpr_results.decoded_label.state_label else 'UnRec'
+           response_json["CountryLong"] = f'{self._country_code(lpr_results.decoded_label.state_label)}' if lpr_results.decoded_label.state_label else 'UnRec'
        return response_json       
+    
+    # plate fields of a result ("PlateText", "StateLong", "CountryLong"), as the TechnoStream OCR returns them
+    def result_to_json(self, lpr_results):
+        if self.technoocr:
+            return lpr_results if lpr_results is not None else {"PlateText": "UnRec", "StateLong": "UnRec", "CountryLong": "UnRec"}
+        return self.ktclpr_result_to_json(lpr_results)
             
     def run(self):
         while(1):
@@ -65,6 +101,8 @@ class ANPR_IVMS(object):
             self.images_dirs = [os.path.join(self.images_dir_path,i) for i in os.listdir(self.images_dir_path)]
             #print(self.images_dirs)
             
+            # plate images ready for OCR, across the folders of all the streams
+            img_paths = []
             for folder in self.images_dirs:
                     if 'unrec' in folder:
                         continue
@@ -78,57 +116,119 @@ class ANPR_IVMS(object):
                             
                             if (time_now-creation_time).seconds < 2:
                                 continue
-                            img = cv2.imread(img_path)
-                        
-                            # resize - recommended by Adeel(TechnoOCR)
-                            #(h, w) = img.shape[:2]
-                            #img = self.image_resize(img, height=(3*h))
-
-                            if img is not None:
-                                if 0: # TODO: make it configurable from app_settings.yaml to use technoocr
-                                    response_json = deepcopy(self.simpleDetect(img))
-                                else:
-                                    response = deepcopy(self.lpr.process(img))
-                                    response_json = self.ktclpr_result_to_json(response)
-                                    
-                                plate_details, dest_fname = self.postProcessDetails(response_json, img_path, img)
-                                if (plate_details is not None) and (dest_fname is not None):
-                                    # Publish a message
-                                    self.channel.basic_publish(exchange='', routing_key='anpr', body=plate_details)
-                                    #print("Message sent to UI via RabbitMQ!")
-                            else:
-                                os.remove(img_path)
-                            
+                            img_paths.append(img_path)
                         except Exception as e:
                              print("[ANPR_IVMS] Exception raised.", e, traceback.format_exc())
-                             #os.remove(img_path)
-                             #shutil.move(img_path, os.path.basename(os.path.dirname(img_path))+'_unrec')
                              self.moveToUnrecFolder(img_path)
+
+            self.process_tracks(img_paths)
             
             #print("Sleeping. Retry after 5 seconds...")        
             #time.sleep(5)
         
-    def postProcessDetails(self, response_json:dict, img_path:str, img:None):
-    
+    # plate image of a crop, None if it could not be loaded (removed / moved)
+    def load_image(self, img_path):
+        img = None
+        try:
+            img = cv2.imread(img_path)
+            
+            # resize - recommended by Adeel(TechnoOCR)
+            #(h, w) = img.shape[:2]
+            #img = self.image_resize(img, height=(3*h))
+            
+            if img is None:
+                os.remove(img_path)
+        except Exception as e:
+             print("[ANPR_IVMS] Exception raised.", e, traceback.format_exc())
+             self.moveToUnrecFolder(img_path)
+             img = None
+        return img
+
+    # OCR of a batch of plate images (one forward pass; one request per image for the TechnoStream OCR)
+    def read_batch(self, imgs):
+        if self.technoocr:
+            return [self.simpleDetect(img) for img in imgs]
+        return self.lpr.process_batch(imgs)
+
+    # OCR metrics of the process (metrics server thread; the counters are only written by the OCR loop)
+    def collect_metrics(self):
+        stats = dict(self.stats)
+        batch_sizes = Metric('ivms_ocr_batches_total', 'counter', 'OCR forward passes by batch size (plate crops)')
+        for size, count in enumerate(list(self.batch_sizes)):
+            if size > 0:
+                batch_sizes.add(count, size=size)
+        return [
+            Metric('ivms_ocr_calls_total', 'counter', 'OCR forward passes').add(stats['batches']),
+            Metric('ivms_ocr_crops_total', 'counter', 'Plate crops read').add(stats['crops']),
+            Metric('ivms_ocr_failures_total', 'counter', 'Failed OCR forward passes').add(stats['failures']),
+            Metric('ivms_ocr_seconds_total', 'counter', 'Time spent in OCR forward passes').add(stats['ocr_ns'] / 1e9),
+            Metric('ivms_ocr_tracks_total', 'counter', 'Tracks read').add(stats['tracks']),
+            Metric('ivms_ocr_duplicate_plates_total', 'counter', 'Tracks not published, their plate was published within the dedupe window').add(stats['duplicates']),
+            batch_sizes,
+        ]
+
+    # plate of a track as it is published ("COUNTRY STATE PLATE"), None if it is not recognized
+    def plate_label(self, consensus):
+        final_plate_details = self._plate_details(self.result_to_json(consensus.result()))
+        if ("UnRec" in final_plate_details) or ("None" in final_plate_details):
+            return None
+        return final_plate_details
+
+    # the plate of the track has already been published: its crops are removed
+    def discard_track(self, consensus, reads, unread):
+        for img_path in list(unread) + [img_path for img_path, img in reads]:
+            os.remove(img_path)
+
+    # publish the fused plate of a track with its best crop read; the other crops read are removed if the plate has
+    # been published (moved to the unrec folder otherwise), the crops not read are removed
+    def publish_track(self, consensus, reads, unread):
+        for img_path in unread:
+            os.remove(img_path)
+        if not reads:
+            return
+
+        response_json = self.result_to_json(consensus.result())
+        plate_details = None
+        img_path, img = reads[0]
+        try:
+            plate_details, dest_fname = self.postProcessDetails(response_json, img_path, img)
+            if (plate_details is not None) and (dest_fname is not None):
+                # Publish a message
+                self.channel.basic_publish(exchange='', routing_key='anpr', body=plate_details)
+                #print("Message sent to UI via RabbitMQ!")
+        except Exception as e:
+             print("[ANPR_IVMS] Exception raised.", e, traceback.format_exc())
+             #os.remove(img_path)
+             #shutil.move(img_path, os.path.basename(os.path.dirname(img_path))+'_unrec')
+             self.moveToUnrecFolder(img_path)
+
+        for img_path, img in reads[1:]:
+            if plate_details is not None:
+                os.remove(img_path)
+            else:
+                self.moveToUnrecFolder(img_path)
+
+    def _plate_details(self, response_json:dict):
         plate_num = f'{response_json["PlateText"]}'.strip()
         plate_state = f'{response_json["StateLong"]}'.strip()
         plate_country = f'{response_json["CountryLong"]}'.strip()
-        final_plate_details = f'{plate_country} {plate_state} {plate_num}'.strip()
+        return f'{plate_country} {plate_state} {plate_num}'.strip()
+
+    def postProcessDetails(self, response_json:dict, img_path:str, img:None):
+    
+        final_plate_details = self._plate_details(response_json)
         dest_fname = None
         #print("Response received from OCR system:", final_plate_details)
         #if (plate_num is not None) and (plate_num != "None") and (plate_num != "UnRec"):
         if ("UnRec" not in final_plate_details) and ("None" not in final_plate_details):
+            # folder created by the image writer
             dest_folder = os.path.join(self.lpr_dir, os.path.basename(os.path.dirname(img_path)))
-            if not os.path.exists(dest_folder):
-                os.makedirs(dest_folder)
             
             dest_fname = os.path.join(dest_folder, final_plate_details+".jpg")
-            if not os.path.exists(dest_fname):
-                color_coverted = cv2.cvtColor(img, cv2.COLOR_BGR2RGB) 
-                pil_image = Image.fromarray(color_coverted) 
-                exif = pil_image.getexif()
-                exif[0x010e] = f'{os.path.splitext(os.path.basename(img_path))[0]}'
-                pil_image.save(dest_fname, quality=95, exif=exif)
+            # a plate image queued for writing counts as existing
+            if not self.image_writer.exists(dest_fname):
+                description = f'{os.path.splitext(os.path.basename(img_path))[0]}'
+                self.image_writer.write(dest_fname, encode_fn=lambda: self._exif_jpeg(img, description))
                 os.remove(img_path)
                 
                 return final_plate_details, dest_fname
@@ -138,6 +238,16 @@ class ANPR_IVMS(object):
 
         return None, dest_fname
     
+    # JPEG of a plate image with the name of the source image as EXIF image description (image writer thread)
+    def _exif_jpeg(self, img, description):
+        color_coverted = cv2.cvtColor(img, cv2.COLOR_BGR2RGB) 
+        pil_image = Image.fromarray(color_coverted) 
+        exif = pil_image.getexif()
+        exif[0x010e] = description
+        buffer = io.BytesIO()
+        pil_image.save(buffer, format='JPEG', quality=95, exif=exif)
+        return buffer.getvalue()
+
     def moveToUnrecFolder(self, img_path, final_plate_details=""):
     
         dest_folder = os.path.join(self.images_dir_path, os.path.basename(os.path.dirname(img_path))+'_unrec' )
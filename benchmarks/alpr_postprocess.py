@@ -0,0 +1,92 @@
+# Benchmark of the post-processing of the KTC OCR detections (alpr_ktc.__decode): (x1, y1, x2, y2) arrays,
+# vectorized intersection over area, argsort by x, vectorized gap / area checks and an immutable CustomANPRResult
+# -> random plates: platenum / prefix / state boxes with their chars, duplicate detections of a char (same and
+#    different class, some with the same minx), chars partly outside their box, rotated plates, unequal gaps,
+#    low scores, stray chars; the detections are shuffled
+# -> the results are checked against the former (shapely polygon) post-processing by tests/test_alpr_ktc.py, on
+#    frozen plates of this generator
+#
+# usage (from the repository root):
+#   python benchmarks/alpr_postprocess.py --plates 2000
+import io
+import os
+import sys
+import time
+import contextlib
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from LPR_QAT.core.alpr_ktc import alpr_ktc
+
+
+# detections (x1, y1, x2, y2, conf, cls) of a random plate, float32 as returned by ObjectDetector
+def make_plate(lpr, rnd):
+    prefix_class, platenum_class = lpr.lpr_class_name.index('prefix'), lpr.lpr_class_name.index('plate_number')
+    state_classes = [i for i, name in enumerate(lpr.lpr_class_name) if name in lpr.state_class_names]
+    w, h = rnd.integers(80, 260), rnd.integers(30, 90)
+    rows = []
+    slope = rnd.choice([0.0, 0.0, 0.1, 0.4]) * rnd.choice([-1, 1])
+
+    def chars(x1, y1, x2, y2, count, classes):
+        cw = (x2 - x1) / count
+        for k in range(count):
+            cx1 = x1 + k * cw + rnd.uniform(-0.1, 0.1) * cw * (rnd.random() < 0.3)
+            if rnd.random() < 0.05:
+                cx1 += cw * rnd.uniform(0.6, 1.5)     # unequal gap / outside
+            cy1 = y1 + slope * (cx1 - x1) + rnd.uniform(-2, 2)
+            box = [int(cx1), int(cy1), int(cx1 + cw * rnd.uniform(0.85, 1.0)) + 1, int(cy1 + (y2 - y1) * rnd.uniform(0.9, 1.0)) + 1]
+            cls = int(rnd.choice(classes))
+            rows.append(box + [rnd.uniform(0.1, 1.0) if rnd.random() < 0.9 else rnd.uniform(0.0, 0.2), cls])
+            if rnd.random() < 0.2:                  # detected twice: same / other class, same or shifted minx
+                dx = 0 if rnd.random() < 0.5 else int(rnd.integers(-2, 3))
+                rows.append([box[0] + dx, box[1], box[2] + dx, box[3]] +
+                            [rnd.uniform(0.05, 1.0), cls if rnd.random() < 0.5 else int(rnd.integers(0, 36))])
+
+    px1 = int(w * rnd.uniform(0.3, 0.5))
+    if rnd.random() < 0.95:
+        for k in range(1 + (rnd.random() < 0.2)):
+            rows.append([px1, int(h * 0.2), int(w * 0.97), int(h * 0.9), rnd.uniform(0.1, 1.0), platenum_class])
+        chars(px1 + 2, int(h * 0.25), int(w * 0.95), int(h * 0.85), int(rnd.integers(1, 6)), range(0, 10))
+    if rnd.random() < 0.7:
+        rows.append([int(w * 0.05), int(h * 0.2), px1 - 4, int(h * 0.9), rnd.uniform(0.1, 1.0), prefix_class])
+        chars(int(w * 0.06), int(h * 0.25), px1 - 6, int(h * 0.85), int(rnd.integers(1, 3)), range(10, 36))
+    for k in range(int(rnd.integers(0, 3))):
+        rows.append([int(w * 0.05), 0, int(w * 0.4), int(h * 0.2), rnd.uniform(0.1, 1.0), int(rnd.choice(state_classes))])
+    for k in range(int(rnd.integers(0, 3))):
+        x, y = rnd.integers(0, w - 10), rnd.integers(0, h - 10)
+        rows.append([x, y, x + 8, y + 9, rnd.uniform(0.05, 1.0), int(rnd.integers(0, 36))])
+    if not rows:
+        return None
+    pred = np.asarray(rows, dtype=np.float32)
+    return pred[rnd.permutation(len(pred))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plates', type=int, default=2000, help='random plates (default = 2000)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs, the best is reported (default = 3)')
+    parser.add_argument('--seed', type=int, default=0)
+    opt = parser.parse_args()
+
+    rnd = np.random.default_rng(opt.seed)
+    lpr = alpr_ktc(None)
+    decode = lpr._alpr_ktc__decode
+    plates = [make_plate(lpr, rnd) for i in range(opt.plates)]
+
+    # best of --repeat runs; the rejected plates print why, as in alpr_ktc
+    best = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for r in range(opt.repeat):
+            t0 = time.perf_counter()
+            results = [decode(pred) for pred in plates]
+            elapsed = (time.perf_counter() - t0) / len(plates) * 1e6
+            best = elapsed if best is None else min(best, elapsed)
+
+    read = sum(1 for result in results if result is not None)
+    print(f'{len(plates)} plates, {read} read')
+    print(f'post-processing [us/plate]: {best:.1f}')
@@ -0,0 +1,100 @@
+# Benchmark of the per-frame detection extraction of the tiler probe
+# -> legacy: list of NvDsObjectMeta, one EasyDict + shapely box per object (legacy_detection, the former
+#    detection_object.get_detection_from_meta) and the class split list comprehensions of the probe
+# -> columnar: DetectionArrays filled in one pass, FrameDetections views + class rows
+# -> NvDsObjectMeta is replaced by a plain object with the same attributes (no DeepStream needed)
+#
+# usage (from the repository root):
+#   python -m benchmarks.detection_extraction --objects 40 --batch 3
+import time
+import random
+import argparse
+
+from easydict import EasyDict as edict
+
+import core.detection_object as do
+from utils.bbox import rect_params_to_box
+
+
+class RectParams(object):
+    def __init__(self, left, top, width, height):
+        self.left, self.top, self.width, self.height = left, top, width, height
+
+
+class ObjectMeta(object):
+    def __init__(self, object_id, class_id, confidence, rect_params):
+        self.object_id, self.class_id, self.confidence, self.rect_params = object_id, class_id, confidence, rect_params
+
+
+# random objects of one frame: cars with a plate and occupants inside, some st. wheels
+def make_frame(objects, rnd):
+    metas = []
+    for i in range(objects):
+        class_id = rnd.choice([do.CAR, do.CAR, do.PLATE, do.PLATE, do.STEERING_WHEEL, do.BELT, do.NO_BELT, do.MOBILE])
+        w, h = rnd.uniform(40, 400), rnd.uniform(30, 300)
+        rect = RectParams(rnd.uniform(0, 1920 - w), rnd.uniform(0, 1080 - h), w, h)
+        metas.append(ObjectMeta(i, class_id, rnd.random(), rect))
+    return metas
+
+
+# former per object record of a detection (detection_object.get_detection_from_meta)
+def legacy_detection(obj_meta):
+    bbox = rect_params_to_box(obj_meta.rect_params)
+    if obj_meta.class_id == do.CAR:
+        return do.VehicleTrack(obj_meta.object_id, bbox, obj_meta.class_id, obj_meta.confidence,
+                               obj_meta.rect_params.top + obj_meta.rect_params.height)
+    flag = 'assigned' if obj_meta.class_id == do.STEERING_WHEEL else 'processed'
+    return edict({'id': obj_meta.object_id, 'bbox': bbox, 'class_id': obj_meta.class_id,
+                  'score': obj_meta.confidence, flag: False})
+
+
+def run_legacy(batch):
+    for l_obj_meta in batch:
+        objs = [obj_meta for obj_meta in l_obj_meta]
+        detections = [legacy_detection(obj_meta) for obj_meta in objs]
+        plates = [plate for plate in detections if plate.class_id == do.PLATE]
+        cars = [car for car in detections if car.class_id == do.CAR]
+        viol_objs = [v for v in detections if v.class_id in [do.BELT, do.NO_BELT, do.MOBILE]]
+        st_wheels = [stw for stw in detections if stw.class_id == do.STEERING_WHEEL]
+
+
+def run_columnar(batch, dets):
+    dets.begin_batch()
+    for l_obj_meta in batch:
+        dets.begin_frame()
+        for obj_meta in l_obj_meta:
+            dets.add(obj_meta)
+        dets.end_frame()
+    for i in range(len(batch)):
+        detections = dets.frame(i)
+        plates = detections.rows(do.PLATE)
+        cars = detections.rows(do.CAR)
+        viol_objs = detections.rows(*do.VIOLATION_CLASSES)
+        st_wheels = detections.rows(do.STEERING_WHEEL)
+        boxes = detections.boxes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=str, default='10,40,100', help='comma separated objects per frame (default = 10,40,100)')
+    parser.add_argument('--batch', type=int, default=3, help='frames per batch, i.e. number of streams (default = 3)')
+    parser.add_argument('--iterations', type=int, default=2000)
+    opt = parser.parse_args()
+
+    rnd = random.Random(0)
+    dets = do.DetectionArrays()
+    print(f'{"objects":>8}{"legacy [us/frame]":>20}{"columnar [us/frame]":>22}')
+    for objects in [int(n) for n in opt.objects.split(',')]:
+        batch = [make_frame(objects, rnd) for i in range(opt.batch)]
+
+        t0 = time.perf_counter()
+        for i in range(opt.iterations):
+            run_legacy(batch)
+        legacy = (time.perf_counter() - t0) / (opt.iterations * opt.batch) * 1e6
+
+        t0 = time.perf_counter()
+        for i in range(opt.iterations):
+            run_columnar(batch, dets)
+        columnar = (time.perf_counter() - t0) / (opt.iterations * opt.batch) * 1e6
+
+        print(f'{objects:>8}{legacy:>20.1f}{columnar:>22.1f}')
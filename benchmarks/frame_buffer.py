@@ -0,0 +1,138 @@
+# Benchmark of the per-stream frame buffer used by ViolationRecorder
+# -> measures per-frame append cost and process RSS for 1 to N streams, comparing the
+#    preallocated ring (core.frame_buffer.FrameBuffer) with the former list of Frame objects
+# -> for the compressed modes (jpeg, png) it also reports encode / decode time and bytes per frame
+#
+# usage (from the repository root):
+#   python -m benchmarks.frame_buffer --streams 6 --duration 12 --frames 600
+#   python -m benchmarks.frame_buffer --impl jpeg,png --image /path/to/frame.png
+import time
+import argparse
+import numpy as np
+import cv2
+
+from core.frame import Frame
+from core.frame_buffer import FrameBuffer, CompressedFrameBuffer
+
+
+# former implementation: one new Frame per appended image + list.pop(0)
+class ListFrameBuffer(object):
+
+    def __init__(self, buffer_size, stream_count):
+        self.buffer_size = buffer_size
+        self.frame_buffer = [list() for i in range(stream_count)]
+
+    def append(self, img, stream_no, index):
+        if len(self.frame_buffer[stream_no]) == self.buffer_size:
+            self.frame_buffer[stream_no].pop(0)
+        self.frame_buffer[stream_no].append(Frame(img, index))
+
+
+# resident set size of the current process in MB
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * 4096 / (1024 * 1024)
+
+
+def run_ring(rgba, slots, streams, frames):
+    h, w = rgba.shape[:2]
+    buffer = FrameBuffer(slots, streams, w, h)
+    t0 = time.perf_counter()
+    for fi in range(frames):
+        for stream_no in range(streams):
+            slot = buffer.next_slot(stream_no)
+            cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR, dst=slot)
+            buffer.commit(stream_no, fi)
+    elapsed = time.perf_counter() - t0
+    return elapsed / (frames * streams), rss_mb()
+
+
+def run_compressed(rgba, slots, streams, frames, codec, workers):
+    h, w = rgba.shape[:2]
+    buffer = CompressedFrameBuffer(slots, streams, w, h, codec=codec, workers=workers)
+    t0 = time.perf_counter()
+    for fi in range(frames):
+        for stream_no in range(streams):
+            slot = buffer.next_slot(stream_no)
+            cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR, dst=slot)
+            buffer.commit(stream_no, fi)
+    elapsed = time.perf_counter() - t0
+
+    # wait for the encoder pool, then decode one violation window per stream
+    buffer.close()
+    for stream_no in range(streams):
+        for frame in buffer.get_frames(stream_no, frames - slots // 2, frames, slots // 2):
+            pass
+
+    stats = buffer.stats
+    extra = {
+        'encode_ms': stats['encode_ns'] / max(stats['encoded'], 1) / 1e6,
+        'decode_ms': stats['decode_ns'] / max(stats['decoded'], 1) / 1e6,
+        'bytes_per_frame': buffer.bytes_per_frame(),
+        'drops': stats['encode_drops'],
+    }
+    return elapsed / (frames * streams), rss_mb(), extra
+
+
+def run_list(rgba, slots, streams, frames):
+    buffer = ListFrameBuffer(slots, streams)
+    t0 = time.perf_counter()
+    for fi in range(frames):
+        for stream_no in range(streams):
+            frame_copy = np.array(rgba, copy=True, order='C')
+            frame_copy = cv2.cvtColor(frame_copy, cv2.COLOR_RGBA2BGR)
+            buffer.append(frame_copy, stream_no, fi)
+    elapsed = time.perf_counter() - t0
+    return elapsed / (frames * streams), rss_mb()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', type=int, default=6, help='max number of streams (default = 6)')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--duration', type=int, default=12, help='VIDEO_OUTPUT.DURATION (default = 12)')
+    parser.add_argument('--slots', type=int, default=None, help='ring slots per stream (default = derived from duration)')
+    parser.add_argument('--frames', type=int, default=None, help='frames appended per stream (default = 1.5 x slots)')
+    parser.add_argument('--impl', type=str, default='ring,list', help='comma separated list of ring, list, jpeg, png (default = ring,list)')
+    parser.add_argument('--workers', type=int, default=2, help='encoder threads of the compressed modes (default = 2)')
+    parser.add_argument('--image', type=str, default=None, help='BGR image used as frame (default = synthetic frame)')
+    opt = parser.parse_args()
+
+    # same formula as ViolationRecorder
+    thresh = int(opt.fps * (opt.duration - 1) / 2)
+    slots = opt.slots if opt.slots else 2 * thresh + 100
+    frames = opt.frames if opt.frames else int(1.5 * slots)
+
+    if opt.image:
+        bgr = cv2.resize(cv2.imread(opt.image), (opt.width, opt.height))
+    else:
+        # noise does not compress at all, so draw something closer to a road scene
+        bgr = np.zeros((opt.height, opt.width, 3), dtype=np.uint8)
+        bgr[:] = np.linspace(40, 200, opt.height, dtype=np.uint8)[:, None, None]
+        for i in range(12):
+            x, y = (i * 157) % opt.width, (i * 89) % opt.height
+            cv2.rectangle(bgr, (x, y), (x + opt.width // 8, y + opt.height // 10), (30 * i % 255, 90, 200), -1)
+        bgr = cv2.add(bgr, np.random.randint(0, 8, bgr.shape, dtype=np.uint8))
+    rgba = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGBA)
+
+    print(f'{opt.width}x{opt.height}, {slots} slots per stream, {frames} frames per stream')
+    print(f'{"impl":<6}{"streams":>8}{"append [ms]":>14}{"RSS [MB]":>12}{"encode [ms]":>14}{"decode [ms]":>14}{"bytes/frame":>14}{"dropped":>10}')
+    for impl in opt.impl.split(','):
+        for streams in range(1, opt.streams + 1):
+            extra = None
+            if impl == 'ring':
+                per_frame, rss = run_ring(rgba, slots, streams, frames)
+            elif impl == 'list':
+                per_frame, rss = run_list(rgba, slots, streams, frames)
+            else:
+                per_frame, rss, extra = run_compressed(rgba, slots, streams, frames, impl, opt.workers)
+
+            line = f'{impl:<6}{streams:>8}{per_frame * 1000:>14.3f}{rss:>12.0f}'
+            if extra:
+                line += f'{extra["encode_ms"]:>14.3f}{extra["decode_ms"]:>14.3f}{extra["bytes_per_frame"]:>14.0f}{extra["drops"]:>10}'
+            else:
+                line += f'{"-":>14}{"-":>14}{bgr.nbytes:>14}{"-":>10}'
+            print(line)
@@ -0,0 +1,80 @@
+# Microbenchmark of the violation window lookup of the frame buffer (FrameBuffer.get_frames / get_frame)
+# -> compares the bisection over the ring with the former list scan over Frame objects
+# -> frames are 1x1 pixels so only the lookup itself is measured
+#
+# usage (from the repository root):
+#   python -m benchmarks.frame_window --slots 430,1000,10000 --window 330
+import time
+import argparse
+import numpy as np
+
+from core.frame import Frame
+from core.frame_buffer import FrameBuffer
+
+
+# former implementation: list of Frame objects scanned with a list comprehension
+class ListFrameBuffer(object):
+
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+        self.frame_buffer = []
+
+    def append(self, img, index):
+        if len(self.frame_buffer) == self.buffer_size:
+            self.frame_buffer.pop(0)
+        self.frame_buffer.append(Frame(img, index))
+
+    def get_frames(self, violation_fi, length):
+        start_fi = violation_fi - length / 2
+        if self.frame_buffer[0].index <= start_fi:
+            return [frame for frame in self.frame_buffer if frame.index >= violation_fi - length / 2 and frame.index <= violation_fi + length / 2]
+        return self.frame_buffer[:length]
+
+    def get_frame(self, index):
+        return next((frame for frame in reversed(self.frame_buffer) if frame.index == index), None)
+
+
+# average time (us) of one call of fn over the given violation frame indices
+def time_calls(fn, vfis, repeat):
+    t0 = time.perf_counter()
+    for r in range(repeat):
+        for vfi in vfis:
+            fn(vfi)
+    return (time.perf_counter() - t0) / (repeat * len(vfis)) * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--slots', type=str, default='430,1000,10000', help='comma separated ring sizes (default = 430,1000,10000)')
+    parser.add_argument('--window', type=int, default=330, help='violation window length in frames (default = 330)')
+    parser.add_argument('--repeat', type=int, default=20)
+    opt = parser.parse_args()
+
+    img = np.zeros((1, 1, 3), dtype=np.uint8)
+    print(f'window = {opt.window} frames')
+    print(f'{"slots":>8}{"list get_frames [us]":>24}{"ring get_frames [us]":>24}{"list get_frame [us]":>22}{"ring get_frame [us]":>22}')
+    for slots in [int(s) for s in opt.slots.split(',')]:
+        ring = FrameBuffer(slots, 1, 1, 1)
+        legacy = ListFrameBuffer(slots)
+
+        # fill 1.5 x the ring so that it has wrapped around; every 7th frame is skipped like a dropped frame
+        total = int(1.5 * slots)
+        fi = 0
+        for i in range(total):
+            ring.append(img, 0, fi)
+            legacy.append(img, fi)
+            fi += 2 if i % 7 == 6 else 1
+
+        # violations spread over the buffered frames that still have half a window after them
+        first, last = legacy.frame_buffer[0].index, legacy.frame_buffer[-1].index
+        vfis = np.linspace(first + opt.window // 2, max(first + opt.window // 2, last - opt.window // 2), 50).astype(int).tolist()
+
+        # both implementations must pick the same frames
+        for vfi in vfis:
+            assert [f.index for f in ring.get_frames(0, vfi, last, opt.window)] == [f.index for f in legacy.get_frames(vfi, opt.window)]
+
+        list_window = time_calls(lambda vfi: legacy.get_frames(vfi, opt.window), vfis, opt.repeat)
+        ring_window = time_calls(lambda vfi: ring.get_frames(0, vfi, last, opt.window), vfis, opt.repeat)
+        list_frame = time_calls(legacy.get_frame, vfis, opt.repeat)
+        ring_frame = time_calls(lambda vfi: ring.get_frame(0, vfi), vfis, opt.repeat)
+        print(f'{slots:>8}{list_window:>24.1f}{ring_window:>24.1f}{list_frame:>22.1f}{ring_frame:>22.1f}')
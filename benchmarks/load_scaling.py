@@ -0,0 +1,224 @@
+# Scaling benchmark of the per frame analytics path (FrameProcessor, as called by the tiler probe) for N cameras
+# -> synthesizes the detections of N streams: cars entering / leaving the view with random track lifetimes,
+#    most with a plate, a steering wheel, belt / no-belt and sometimes a phone; frames are blank surfaces
+#    of the muxer size
+# -> drives every stream at the target fps for a while and reports, per N: achieved fps, probe (process_frame)
+#    latency percentiles, RSS growth and thread counts; results are written as JSON to compare releases
+# -> plate recognition needs torch (LPR_QAT); without it run with --anpr OFF (no v_slots -> no violations)
+#
+# usage (from the repository root):
+#   python -m benchmarks.load_scaling --streams 6,8,12,16 --fps 30 --seconds 20 --json load_scaling.json
+import os
+import gc
+import json
+import time
+import random
+import argparse
+import threading
+import tempfile
+
+import numpy as np
+
+import core.detection_object as do
+from core.detection_object import FrameDetections
+from core.replay import create_offline_processor
+from utils.yaml_parser import YamlParser
+from utils.stage_timer import LatencyHistogram
+
+
+# one synthetic vehicle crossing the view from top to bottom
+class SyntheticTrack(object):
+    def __init__(self, track_id, rnd, width, height, fi, opt):
+        self.track_id = track_id
+        self.start = fi
+        self.lifetime = rnd.randint(opt.track_min, opt.track_max)
+        self.w = rnd.uniform(0.2, 0.4) * width
+        self.h = self.w * rnd.uniform(0.7, 1.0)
+        self.x = rnd.uniform(0, width - self.w)
+        self.y0 = -self.h * 0.5
+        self.dy = (height - self.y0) / self.lifetime
+        self.has_plate = rnd.random() < opt.plate_rate
+        self.has_wheel = rnd.random() < opt.wheel_rate
+        self.has_phone = rnd.random() < opt.phone_rate
+        self.belted = rnd.random() > opt.nobelt_rate
+
+    def alive(self, fi):
+        return fi - self.start < self.lifetime
+
+    # rows (id, class, score, left, top, width, height) of the car and the objects inside it
+    def rows(self, fi, rnd, next_id):
+        top = self.y0 + (fi - self.start) * self.dy
+        x, w, h = self.x, self.w, self.h
+        rows = [(self.track_id, do.CAR, rnd.uniform(0.5, 0.99), x, top, w, h)]
+        if self.has_plate:
+            rows.append((next_id(), do.PLATE, rnd.uniform(0.5, 0.99), x + 0.35 * w, top + 0.8 * h, 0.3 * w, 0.08 * h))
+        if self.has_wheel:
+            rows.append((next_id(), do.STEERING_WHEEL, rnd.uniform(0.3, 0.9), x + 0.55 * w, top + 0.3 * h, 0.2 * w, 0.2 * h))
+        if self.has_phone and rnd.random() < 0.5:
+            rows.append((next_id(), do.MOBILE, rnd.uniform(0.1, 0.8), x + 0.6 * w, top + 0.25 * h, 0.05 * w, 0.05 * h))
+        rows.append((next_id(), do.BELT if self.belted else do.NO_BELT, rnd.uniform(0.1, 0.9),
+                     x + 0.5 * w, top + 0.35 * h, 0.15 * w, 0.3 * h))
+        return rows
+
+
+# detections of one synthetic stream, frame by frame
+class SyntheticStream(object):
+    def __init__(self, stream_no, width, height, opt):
+        self.rnd = random.Random(opt.seed + stream_no)
+        self.width, self.height = width, height
+        self.opt = opt
+        self.tracks = []
+        self.ids = 0
+        self.spawn_p = opt.cars_per_min / 60.0 / opt.fps
+
+    def _next_id(self):
+        self.ids += 1
+        return self.ids
+
+    def frame(self, fi):
+        self.tracks = [track for track in self.tracks if track.alive(fi)]
+        if len(self.tracks) < self.opt.max_cars and self.rnd.random() < self.spawn_p:
+            self.tracks.append(SyntheticTrack(self._next_id(), self.rnd, self.width, self.height, fi, self.opt))
+
+        rows = []
+        for track in self.tracks:
+            rows += track.rows(fi, self.rnd, self._next_id)
+        if not rows:
+            rows = np.zeros((0, 7))
+        a = np.asarray(rows, dtype=np.float64)
+        return FrameDetections(a[:, 0].astype(np.uint64), a[:, 1].astype(np.int32), a[:, 2].astype(np.float32),
+                               a[:, 3].astype(np.float32), a[:, 4].astype(np.float32),
+                               a[:, 5].astype(np.float32), a[:, 6].astype(np.float32))
+
+
+def rss_bytes():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def os_threads():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('Threads:'):
+                return int(line.split()[1])
+    return 0
+
+
+def run(num_streams, opt, configs_dir):
+    cfg = YamlParser(config_file=os.path.join(configs_dir, opt.settings))
+    if opt.resolution:
+        cfg.VIDEO_OUTPUT.MUXER.WIDTH, cfg.VIDEO_OUTPUT.MUXER.HEIGHT = [int(v) for v in opt.resolution.split('x')]
+    if opt.frame_buffer:
+        cfg.VIDEO_OUTPUT.FRAME_BUFFER.MODE = opt.frame_buffer
+    if opt.no_events:
+        cfg.VIDEO_OUTPUT.EVENT_RECORDING = False
+    width, height = int(cfg.VIDEO_OUTPUT.MUXER.WIDTH), int(cfg.VIDEO_OUTPUT.MUXER.HEIGHT)
+
+    gc.collect()
+    rss_start = rss_bytes()
+    threads_start = os_threads()
+
+    output_dir = tempfile.mkdtemp(prefix=f'ivms_load{num_streams}_')
+    processor = create_offline_processor(cfg, configs_dir, num_streams, output_dir, opt.anpr)
+    violations = [0]
+    def on_violations(stream_no, frame_number, new_violations):
+        violations[0] += len(new_violations)
+    processor.on_violations = on_violations
+
+    streams = [SyntheticStream(i, width, height, opt) for i in range(num_streams)]
+    surface = np.zeros((height, width, 4), dtype=np.uint8)
+    latency = LatencyHistogram()
+    objects = 0
+
+    # warm up the tracks so that the measured frames start with a populated view
+    for fi in range(opt.warmup):
+        for stream in streams:
+            stream.frame(fi)
+
+    period = 1.0 / opt.fps
+    frames = int(opt.seconds * opt.fps)
+    late_frames = 0
+    t_start = time.perf_counter()
+    for i in range(frames):
+        fi = opt.warmup + i
+        deadline = t_start + i * period
+        now = time.perf_counter()
+        if now < deadline:
+            time.sleep(deadline - now)
+        elif now - deadline > period:
+            late_frames += 1
+        # one batch, a frame of every stream
+        for stream_no, stream in enumerate(streams):
+            detections = stream.frame(fi)
+            objects += len(detections)
+            t0 = time.monotonic_ns()
+            processor.process_frame(stream_no, fi, surface, detections)
+            latency.record(time.monotonic_ns() - t0)
+    wall_s = time.perf_counter() - t_start
+
+    rss_peak = rss_bytes()
+    threads_peak = os_threads()
+    dropped = 0
+    if processor.analytics is not None:
+        dropped = sum(worker.counters()['dropped'] for worker in processor.analytics)
+    processor.stop()
+    if hasattr(processor.recorder.frame_buffer, 'close'):
+        processor.recorder.frame_buffer.close()
+
+    return {
+        'streams': num_streams,
+        'target_fps': opt.fps,
+        'achieved_fps': round(frames / wall_s, 2),
+        'achieved_fps_total': round(frames * num_streams / wall_s, 2),
+        'late_batches': late_frames,
+        'objects_per_frame': round(objects / (frames * num_streams), 1),
+        'probe_ms': {'p50': round(latency.percentile(0.50) / 1e6, 3),
+                     'p95': round(latency.percentile(0.95) / 1e6, 3),
+                     'p99': round(latency.percentile(0.99) / 1e6, 3),
+                     'max': round(latency.max / 1e6, 3)},
+        'rss_growth_mb': round((rss_peak - rss_start) / 2**20, 1),
+        'threads': {'python': threading.active_count(), 'os': threads_peak, 'os_growth': threads_peak - threads_start},
+        'analytics_dropped': dropped,
+        'violations': violations[0],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', type=str, default='6,8,12,16', help='comma separated camera counts (default = 6,8,12,16)')
+    parser.add_argument('--fps', type=float, default=30.0, help='target fps per stream (default = 30)')
+    parser.add_argument('--seconds', type=float, default=10.0, help='measured seconds per camera count (default = 10)')
+    parser.add_argument('--warmup', type=int, default=300, help='frames of track history generated before measuring')
+    parser.add_argument('--settings', type=str, default='app_settings.yaml')
+    parser.add_argument('--resolution', type=str, default='', help='WxH overriding the muxer size, e.g. 1280x720')
+    parser.add_argument('--frame-buffer', type=str, default='', help='FRAME_BUFFER.MODE override (raw, shared, spill, jpeg, png)')
+    parser.add_argument('--no-events', action='store_true', help='EVENT_RECORDING off: only the violation stream is buffered')
+    parser.add_argument('--anpr', type=str, default='MATCH', help='MATCH (default), ON or OFF, see core.replay')
+    parser.add_argument('--cars-per-min', type=float, default=40.0, help='cars entering the view per minute and stream')
+    parser.add_argument('--max-cars', type=int, default=6, help='max cars in view per stream')
+    parser.add_argument('--track-min', type=int, default=45, help='min frames a car stays in view')
+    parser.add_argument('--track-max', type=int, default=240, help='max frames a car stays in view')
+    parser.add_argument('--plate-rate', type=float, default=0.8)
+    parser.add_argument('--wheel-rate', type=float, default=0.7)
+    parser.add_argument('--phone-rate', type=float, default=0.05)
+    parser.add_argument('--nobelt-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', type=str, default='', help='write the results to this JSON file')
+    opt = parser.parse_args()
+
+    configs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+    results = []
+    print(f'{"streams":>8}{"fps":>8}{"total fps":>11}{"late":>6}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}{"rss MB":>9}{"threads":>9}')
+    for num_streams in [int(n) for n in opt.streams.split(',')]:
+        r = run(num_streams, opt, configs_dir)
+        results.append(r)
+        print(f'{r["streams"]:>8}{r["achieved_fps"]:>8.1f}{r["achieved_fps_total"]:>11.1f}{r["late_batches"]:>6}'
+              f'{r["probe_ms"]["p50"]:>9.3f}{r["probe_ms"]["p99"]:>9.3f}{r["probe_ms"]["max"]:>9.3f}'
+              f'{r["rss_growth_mb"]:>9.1f}{r["threads"]["os"]:>9}')
+
+    if opt.json:
+        with open(opt.json, 'w') as f:
+            json.dump({'settings': vars(opt), 'results': results}, f, indent=2)
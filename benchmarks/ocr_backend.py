@@ -0,0 +1,91 @@
+# CPU throughput and decoded labels of the KTC OCR on the PyTorch and the ONNX Runtime backend
+# (DETECTIONS.OCR.BACKEND: torch / onnx)
+# -> both read the same crops with alpr_ktc.process_batch (one forward pass + NMS per batch), in batches of --batch-size
+# -> checks that both give the same decoded label for every crop (the reference set: --images)
+# -> crops: the plate images (*.png / *.jpg) of --images, or random plate sized images
+# -> without --onnx the weights are exported (LPR_QAT.core.onnx_export, --static: fixed input, else dynamic) to a
+#    temporary folder; without --weights (or if the file does not exist) a randomly initialized model of --model-cfg
+#    is used: labels are meaningless, the timings and the check are representative
+#
+# usage (from the repository root):
+#   python -m benchmarks.ocr_backend --images /home/nvidia/ivms/lpr --crops 256 --batch-size 8 --threads 4
+import io
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+
+import torch
+from easydict import EasyDict as edict
+
+from LPR_QAT.core.alpr_ktc import alpr_ktc
+from LPR_QAT.core.object_detector import ObjectDetector
+from LPR_QAT.core.onnx_export import export_onnx
+from LPR_QAT.core.yaml_parser import YamlParser
+from benchmarks.ocr_batch import load_crops, random_weights
+
+
+def read(lpr, crops, batch_size, repeats):
+    # warm up
+    lpr.process_batch(crops[:batch_size])
+
+    t0 = time.perf_counter()
+    for r in range(repeats):
+        results = []
+        for start in range(0, len(crops), batch_size):
+            results += lpr.process_batch(crops[start:start + batch_size])
+    elapsed = time.perf_counter() - t0
+    labels = [result.decoded_label.full_label if result is not None else None for result in results]
+    return labels, len(crops) * repeats / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', type=str, default='LPR_QAT/config/app_settings.yaml')
+    parser.add_argument('--weights', type=str, default='', help='OCR weights (default = DETECTIONS.OCR.WEIGHTS of --settings)')
+    parser.add_argument('--onnx', type=str, default='', help='exported model (default = export of the weights)')
+    parser.add_argument('--static', action='store_true', help='export with a fixed input (--batch-size, 3, img size, img size)')
+    parser.add_argument('--model-cfg', type=str, default='LPR_QAT/models/yolov5s.yaml', help='model used without weights')
+    parser.add_argument('--nc', type=int, default=51, help='classes of the model used without weights')
+    parser.add_argument('--img-size', type=int, default=0, help='detector input size (default = DETECTIONS.OCR.IMG_SIZE)')
+    parser.add_argument('--images', type=str, default='', help='folder with plate crops')
+    parser.add_argument('--crops', type=int, default=64, help='crops per round (default = 64)')
+    parser.add_argument('--repeats', type=int, default=3, help='rounds per backend (default = 3)')
+    parser.add_argument('--batch-size', type=int, default=8, help='crops per forward pass (default = 8)')
+    parser.add_argument('--threads', type=int, default=0, help='torch / ONNX Runtime intra-op threads (default = their default)')
+    opt = parser.parse_args()
+
+    if opt.threads > 0:
+        torch.set_num_threads(opt.threads)
+
+    cfg = YamlParser(config_file=opt.settings)
+    cfg.DETECTIONS.DEVICE = 'cpu'
+    weights = opt.weights or cfg.DETECTIONS.OCR.WEIGHTS
+    if not os.path.exists(weights):
+        print(f'{weights} not found, using a randomly initialized {opt.model_cfg}')
+        weights = random_weights(opt.model_cfg, opt.nc)
+    img_size = opt.img_size or cfg.DETECTIONS.OCR.IMG_SIZE
+    onnx_weights = opt.onnx or export_onnx(weights, os.path.join(tempfile.mkdtemp(prefix='ocr_backend_'), 'ocr.onnx'),
+                                           img_size, opt.batch_size, dynamic=not opt.static)
+
+    crops = load_crops(opt)
+    print(f'{len(crops)} crops, batch size {opt.batch_size}, threads {opt.threads or "default"}')
+
+    rates, labels = {}, {}
+    for backend in ('torch', 'onnx'):
+        cfg.DETECTIONS.OCR = edict(dict(cfg.DETECTIONS.OCR, WEIGHTS=weights, ONNX_WEIGHTS=onnx_weights,
+                                        IMG_SIZE=img_size, BACKEND=backend, ONNX_THREADS=opt.threads))
+        lpr = alpr_ktc(ObjectDetector(cfg, mode='ocr'))
+        # the rejected plates print why
+        with torch.no_grad(), contextlib.redirect_stdout(io.StringIO()):
+            labels[backend], rates[backend] = read(lpr, crops, opt.batch_size, opt.repeats)
+        print(f'{backend:>6}: {rates[backend]:.1f} crops/s, {1000.0 / rates[backend]:.2f} ms/crop')
+
+    differ = [i for i, (a, b) in enumerate(zip(labels['torch'], labels['onnx'])) if a != b]
+    read_count = sum(1 for label in labels['torch'] if label is not None)
+    print(f'{read_count} of {len(crops)} crops read, {len(differ)} labels differ, onnx speedup {rates["onnx"] / rates["torch"]:.2f}')
+    for i in differ[:10]:
+        print(f'  crop {i}: torch {labels["torch"][i]}, onnx {labels["onnx"][i]}')
+    if not opt.static:
+        assert not differ, 'the dynamic ONNX model must decode the same labels as the PyTorch model'
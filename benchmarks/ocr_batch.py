@@ -0,0 +1,105 @@
+# CPU throughput of the KTC OCR detector (LPR_QAT ObjectDetector) per batch size
+# -> batch size 1: detect_objects(crop, 'video') per crop, as alpr_ktc.process does
+# -> batch size N: detect_objects_batch(N crops), one forward pass + NMS per batch, as alpr_ktc.process_batch does
+# -> crops: the plate images (*.png / *.jpg) of --images, or random plate sized images
+# -> without --weights (or if the file does not exist) a randomly initialized model of --model-cfg is used:
+#    detections are meaningless, the timings are representative
+#
+# usage (from the repository root):
+#   python -m benchmarks.ocr_batch --batch-sizes 1,2,4,8,16 --crops 64 --threads 4
+import os
+import glob
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+import torch
+from easydict import EasyDict as edict
+
+from LPR_QAT.core.object_detector import ObjectDetector
+from LPR_QAT.core.yaml_parser import YamlParser
+
+
+def load_crops(opt):
+    if opt.images:
+        paths = sorted(glob.glob(os.path.join(opt.images, '*.png')) + glob.glob(os.path.join(opt.images, '*.jpg')))
+        crops = [img for img in (cv2.imread(path) for path in paths[:opt.crops]) if img is not None]
+        if crops:
+            return crops
+    rnd = np.random.default_rng(0)
+    crops = []
+    for i in range(opt.crops):
+        w = int(rnd.integers(60, 260))
+        h = int(w * rnd.uniform(0.25, 0.5))
+        crops.append(rnd.integers(0, 255, (h, w, 3), dtype=np.uint8))
+    return crops
+
+
+# random initialized checkpoint of the model config, loadable by attempt_load
+def random_weights(model_cfg, nc):
+    from LPR_QAT.models.yolo import Model
+    model = Model(model_cfg, nc=nc)
+    model.names = [str(i) for i in range(nc)]
+    path = os.path.join(tempfile.mkdtemp(prefix='ocr_batch_'), 'random.pt')
+    torch.save({'model': model}, path)
+    return path
+
+
+def run(detector, crops, batch_size, repeats):
+    # warm up
+    if batch_size == 1:
+        detector.detect_objects(crops[0], 'video')
+    else:
+        detector.detect_objects_batch(crops[:batch_size])
+
+    t0 = time.perf_counter()
+    for r in range(repeats):
+        for start in range(0, len(crops), batch_size):
+            batch = crops[start:start + batch_size]
+            if batch_size == 1:
+                detector.detect_objects(batch[0], 'video')
+            else:
+                detector.detect_objects_batch(batch)
+    elapsed = time.perf_counter() - t0
+    return len(crops) * repeats / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--settings', type=str, default='LPR_QAT/config/app_settings.yaml')
+    parser.add_argument('--weights', type=str, default='', help='OCR weights (default = DETECTIONS.OCR.WEIGHTS of --settings)')
+    parser.add_argument('--model-cfg', type=str, default='LPR_QAT/models/yolov5s.yaml', help='model used without weights')
+    parser.add_argument('--nc', type=int, default=51, help='classes of the model used without weights')
+    parser.add_argument('--img-size', type=int, default=0, help='detector input size (default = DETECTIONS.OCR.IMG_SIZE)')
+    parser.add_argument('--images', type=str, default='', help='folder with plate crops')
+    parser.add_argument('--crops', type=int, default=64, help='crops per round (default = 64)')
+    parser.add_argument('--repeats', type=int, default=3, help='rounds per batch size (default = 3)')
+    parser.add_argument('--batch-sizes', type=str, default='1,2,4,8,16', help='comma separated batch sizes')
+    parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads (default = torch default)')
+    opt = parser.parse_args()
+
+    if opt.threads > 0:
+        torch.set_num_threads(opt.threads)
+
+    cfg = YamlParser(config_file=opt.settings)
+    cfg.DETECTIONS.DEVICE = 'cpu'
+    weights = opt.weights or cfg.DETECTIONS.OCR.WEIGHTS
+    if not os.path.exists(weights):
+        print(f'{weights} not found, using a randomly initialized {opt.model_cfg}')
+        weights = random_weights(opt.model_cfg, opt.nc)
+    cfg.DETECTIONS.OCR = edict(dict(cfg.DETECTIONS.OCR, WEIGHTS=weights,
+                                    IMG_SIZE=opt.img_size or cfg.DETECTIONS.OCR.IMG_SIZE))
+
+    detector = ObjectDetector(cfg, mode='ocr')
+    crops = load_crops(opt)
+
+    print(f'{len(crops)} crops, input {detector.img_size}, torch threads {torch.get_num_threads()}')
+    print(f'{"batch":>6}{"crops/s":>10}{"ms/crop":>10}{"speedup":>9}')
+    base = None
+    with torch.no_grad():
+        for batch_size in [int(n) for n in opt.batch_sizes.split(',')]:
+            rate = run(detector, crops, batch_size, opt.repeats)
+            base = base or rate
+            print(f'{batch_size:>6}{rate:>10.1f}{1000.0 / rate:>10.2f}{rate / base:>9.2f}')
@@ -0,0 +1,108 @@
+# Benchmark of the plate to vehicle association of PlateRecognition._link_plates_to_vehicles
+# -> legacy: every plate tested against every car still unmatched (box_contains), first match wins
+# -> vectorized: (cars x plates) containment matrix in one NumPy step + greedy global assignment preferring the
+#    plate at the lower edge of the car (utils.bbox.assign_contained)
+# -> checks that both agree on the non-ambiguous frames (every plate inside at most one car, every car holding
+#    at most one plate) and counts the ambiguous frames where they differ
+#
+# usage (from the repository root):
+#   python -m benchmarks.plate_association --objects 20,50,100 --overlap 0.02
+import time
+import random
+import argparse
+
+import numpy as np
+
+import core.detection_object as do
+from core.detection_object import FrameDetections
+from utils.bbox import box_contains, boxes_contain, assign_contained
+
+
+# random frame: cars on a jittered grid with a plate near their lower edge, other objects inside the cars
+# -> overlap: share of the cars shifted onto a neighbour cell (-> plates inside two cars, ambiguous frames)
+def make_frame(objects, rnd, overlap, width=1920, height=1080):
+    cars = max(1, int(objects / 2.1))
+    cols = int(np.ceil(np.sqrt(cars * width / height)))
+    rows_ = int(np.ceil(cars / cols))
+    cw, ch = width / cols, height / rows_
+    rows = []
+    for cell in rnd.sample(range(cols * rows_), min(cars, cols * rows_)):
+        if len(rows) >= objects:
+            break
+        w, h = cw * rnd.uniform(0.6, 0.9), ch * rnd.uniform(0.6, 0.9)
+        x = (cell % cols) * cw + rnd.uniform(0, cw - w)
+        y = (cell // cols) * ch + rnd.uniform(0, ch - h)
+        if rnd.random() < overlap:
+            x, y = x + cw * 0.5, y + ch * 0.3
+        rows.append((len(rows), do.CAR, rnd.uniform(0.5, 1.0), x, y, w, h))
+        if rnd.random() < 0.8:
+            pw, ph = w * 0.25, h * 0.08
+            rows.append((len(rows), do.PLATE, rnd.uniform(0.5, 1.0), x + (w - pw) * rnd.uniform(0.3, 0.7), y + h - ph * 1.5, pw, ph))
+        if rnd.random() < 0.3:
+            rows.append((len(rows), rnd.choice([do.STEERING_WHEEL, do.BELT, do.MOBILE]), rnd.random(),
+                         x + w * 0.5, y + h * 0.3, w * 0.1, h * 0.1))
+    a = np.asarray(rows[:objects], dtype=np.float64)
+    return FrameDetections(a[:, 0].astype(np.uint64), a[:, 1].astype(np.int32), a[:, 2].astype(np.float32),
+                           a[:, 3].astype(np.float32), a[:, 4].astype(np.float32),
+                           a[:, 5].astype(np.float32), a[:, 6].astype(np.float32))
+
+
+# former implementation
+def link_legacy(detections, cars, plates):
+    plate_bboxes = {}
+    for plate in plates:
+        plate_bbox = detections.bbox(plate)
+        for car in cars:
+            if car in plate_bboxes:
+                continue
+            if box_contains(detections.bbox(car), plate_bbox):
+                plate_bboxes[car] = plate_bbox
+                break
+    return plate_bboxes
+
+
+# same as PlateRecognition._link_plates_to_vehicles
+def link_vectorized(detections, cars, plates):
+    plate_bboxes = {}
+    if len(cars) == 0 or len(plates) == 0:
+        return plate_bboxes
+    boxes = detections.boxes
+    plate_boxes = boxes[plates]
+    for car, plate in assign_contained(boxes[cars], plate_boxes, detections.score[plates]).items():
+        plate_bboxes[cars[car]] = tuple(plate_boxes[plate].tolist())
+    return plate_bboxes
+
+
+def ambiguous(detections, cars, plates):
+    m = boxes_contain(detections.boxes[cars], detections.boxes[plates])
+    return bool((m.sum(axis=0) > 1).any() or (m.sum(axis=1) > 1).any())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=str, default='20,50,100', help='comma separated objects per frame (default = 20,50,100)')
+    parser.add_argument('--frames', type=int, default=500, help='frames per object count (default = 500)')
+    parser.add_argument('--overlap', type=float, default=0.02, help='share of the cars overlapping a neighbour (default = 0.02)')
+    opt = parser.parse_args()
+
+    rnd = random.Random(0)
+    print(f'{"objects":>8}{"legacy [us]":>13}{"vectorized [us]":>17}{"ambiguous":>11}{"agree (non-amb.)":>18}{"differ (amb.)":>15}')
+    for objects in [int(n) for n in opt.objects.split(',')]:
+        frames = [make_frame(objects, rnd, opt.overlap) for i in range(opt.frames)]
+        split = [(f, f.rows(do.CAR), f.rows(do.PLATE)) for f in frames]
+
+        t0 = time.perf_counter()
+        legacy = [link_legacy(f, cars, plates) for f, cars, plates in split]
+        t_legacy = (time.perf_counter() - t0) / opt.frames * 1e6
+
+        t0 = time.perf_counter()
+        vectorized = [link_vectorized(f, cars, plates) for f, cars, plates in split]
+        t_vectorized = (time.perf_counter() - t0) / opt.frames * 1e6
+
+        amb = [ambiguous(f, cars, plates) for f, cars, plates in split]
+        agree = sum(1 for a, l, v in zip(amb, legacy, vectorized) if not a and l == v)
+        differ = sum(1 for a, l, v in zip(amb, legacy, vectorized) if a and l != v)
+        non_amb = amb.count(False)
+        assert agree == non_amb, 'vectorized association differs from the legacy one on a non-ambiguous frame'
+
+        print(f'{objects:>8}{t_legacy:>13.1f}{t_vectorized:>17.1f}{amb.count(True):>11}{f"{agree}/{non_amb}":>18}{differ:>15}')
@@ -0,0 +1,70 @@
+# Benchmark of the vehicle slot record kept by PlateRecognition / MSViolationDetector for every tracked car
+# -> compares the former EasyDict record with the __slots__ based VehicleTrack:
+#    memory per record (tracemalloc) and the attribute accesses done per slot and frame in the probe loop
+#
+# usage (from the repository root):
+#   python -m benchmarks.vehicle_track --tracks 200
+import time
+import argparse
+import tracemalloc
+from easydict import EasyDict as edict
+
+from core.detection_object import VehicleTrack, CAR
+
+
+# former record, as built by the former detection_object.get_detection_from_meta
+def easydict_track(track_id, bbox, class_id, score, maxy):
+    return edict({
+        'id': track_id, 'bbox': bbox, 'class_id': class_id, 'score': score,
+        'fi': None, 'matched': False, 'plate_bbox': None, 'plate_no': None, 'plate_img': None, 'lpr_img': None,
+        'lpr_img_save_count': 0,
+        'lpr_imgs_dict': {'30':0,'40':0,'50':0,'60':0,'65':0,'70':0,'75':0,'80':0,'85':0,'90':0},
+        'violation_fi': None, 'violation_timestamp': None, 'violation_sent': False, 'violation_bbox': None,
+        'maxy': maxy, 'st_wheel': None,
+        'mobile_detected': False, 'mobile_violations': 0, 'mobile_det_timestamp': None, 'mobile_det_fi': None, 'mobile_bbox': None,
+        'nobelt_driver': 0, 'nobelt_driver_fi': None, 'nobelt_bbox': None, 'nobelt_driver_timestamp': None,
+    })
+
+
+# bytes allocated per record
+def bytes_per_record(factory, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = [factory(i, (0, 0, 100, 100), CAR, 0.9, 100) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return (size - records.__sizeof__()) / count
+
+
+# the reads / writes done on every slot of a frame by PlateRecognition.update and MSViolationDetector.detect
+def probe_loop(slots, frames):
+    t0 = time.perf_counter()
+    for fi in range(frames):
+        for slot in slots:
+            if slot.fi is not None and slot.fi + 30 < fi:
+                continue
+            slot.fi = fi
+            slot.bbox = (0, 0, 100, 100 + fi % 7)
+            slot.maxy = slot.bbox[3]
+            if slot.plate_no is None:
+                slot.plate_bbox = None
+            if slot.fi == fi and not slot.violation_sent:
+                slot.st_wheel = None
+                if not slot.mobile_detected and slot.nobelt_driver < 1:
+                    slot.mobile_violations += 0
+    return (time.perf_counter() - t0) / (frames * len(slots)) * 1e9
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=200, help='number of tracked cars (default = 200)')
+    parser.add_argument('--frames', type=int, default=2000)
+    opt = parser.parse_args()
+
+    print(f'{"record":<14}{"bytes/record":>14}{"probe loop [ns/slot]":>22}')
+    for name, factory in [('EasyDict', easydict_track), ('VehicleTrack', VehicleTrack)]:
+        size = bytes_per_record(factory, opt.tracks)
+        slots = [factory(i, (0, 0, 100, 100), CAR, 0.9, 100) for i in range(opt.tracks)]
+        ns = probe_loop(slots, opt.frames)
+        print(f'{name:<14}{size:>14.0f}{ns:>22.1f}')
@@ -0,0 +1,108 @@
+import time
+import logging
+import threading
+from collections import deque
+
+
+# Runs the per frame analytics of one stream (plate recognition, violation detection, recording events)
+# on its own thread, fed by the tiler probe through a bounded queue
+# -> submit() never blocks the GStreamer streaming thread: when the queue is full the overflow policy applies
+#      drop_oldest: the oldest queued frame is dropped
+#      coalesce:    every queued frame is dropped, the worker jumps straight to the newest one
+# -> metrics() reports queue length, dropped frames and how far the worker lags behind the probe
+class AnalyticsWorker(object):
+
+    POLICIES = ('drop_oldest', 'coalesce')
+
+    def __init__(self, stream_no, process_fn, max_size=8, policy='drop_oldest'):
+
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unsupported analytics overflow policy: {policy}, expected one of {list(self.POLICIES)}')
+
+        self.stream_no = stream_no
+        self.process_fn = process_fn  # called as process_fn(*args) for every submitted frame
+        self.max_size = max_size
+        self.policy = policy
+
+        self.queue = deque()   # (fi, enqueue time ns, args)
+        self.cond = threading.Condition()
+        self.running = True
+
+        self.stats_lock = threading.Lock()
+        self.stats = {'submitted': 0, 'processed': 0, 'dropped': 0, 'failed': 0}
+        self.wait_ns = 0       # time spent in the queue by the frames processed since the last metrics() call
+        self.max_wait_ns = 0
+        self.waited = 0
+
+        self.thread = threading.Thread(target=self._run, name=f'analytics-{stream_no}', daemon=True)
+        self.thread.start()
+
+    # queue the analytics of frame fi; returns the number of frames dropped to make room for it
+    def submit(self, fi, *args):
+        dropped = 0
+        with self.cond:
+            if len(self.queue) >= self.max_size:
+                if self.policy == 'drop_oldest':
+                    self.queue.popleft()
+                    dropped = 1
+                else:
+                    dropped = len(self.queue)
+                    self.queue.clear()
+            self.queue.append((fi, time.monotonic_ns(), args))
+            self.cond.notify()
+
+        with self.stats_lock:
+            self.stats['submitted'] += 1
+            self.stats['dropped'] += dropped
+
+        return dropped
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                fi, t_enqueued, args = self.queue.popleft()
+
+            wait_ns = time.monotonic_ns() - t_enqueued
+            try:
+                self.process_fn(*args)
+            except Exception:
+                logging.exception(f"[AnalyticsWorker] Stream {self.stream_no}: analytics of frame {fi} failed")
+                with self.stats_lock:
+                    self.stats['failed'] += 1
+
+            with self.stats_lock:
+                self.stats['processed'] += 1
+                self.wait_ns += wait_ns
+                self.max_wait_ns = max(self.max_wait_ns, wait_ns)
+                self.waited += 1
+
+    # counters since the start, not reset
+    def counters(self):
+        with self.stats_lock:
+            counters = dict(self.stats)
+            counters['queued'] = len(self.queue)
+        return counters
+
+    # lag metrics; the queue wait times are reset by every call
+    #   lag_frames: frames submitted by the probe and neither processed nor dropped yet (queued + in progress)
+    #   wait_ms / max_wait_ms: mean / max time a frame waited in the queue
+    def metrics(self):
+        with self.stats_lock:
+            metrics = dict(self.stats)
+            metrics['queued'] = len(self.queue)
+            metrics['lag_frames'] = self.stats['submitted'] - self.stats['processed'] - self.stats['dropped']
+            metrics['wait_ms'] = round(self.wait_ns / self.waited / 1e6, 2) if self.waited else 0.0
+            metrics['max_wait_ms'] = round(self.max_wait_ns / 1e6, 2)
+            self.wait_ns = self.max_wait_ns = self.waited = 0
+        return metrics
+
+    # process the frames still queued, then stop the thread
+    def stop(self, timeout=None):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout)
@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.draw import write_text
+from utils.draw import draw_box
+
+# Clip writers running in a process pool, so that resizing, drawing and cv2.VideoWriter work of the
+# violation / event recordings never competes with the DeepStream probe for the GIL
+# -> the frames are read straight from the shared memory rings of a SharedFrameBuffer: a job only carries
+#    the segment name, the slot ranges and the frame indices of the window (plus where / how to write it)
+# -> the slots of the window must stay pinned until the job is done (see SharedFrameBuffer.pin)
+
+# shared memory segments already attached by this worker process
+_segments = {}
+
+
+# create the pool of clip writer processes
+# -> 'spawn' because forking a process running GStreamer / CUDA threads is not safe
+def create_clip_writer_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+# the part of a job describing where its frames are: segment, ring shape, slot ranges and frame indices
+def clip_job(buffer, window, **kwargs):
+    job = {
+        'segment': buffer.segment_name(window.stream_no),
+        'ring_shape': buffer.ring_shape(),
+        'slot_ranges': window.slot_ranges(),
+        'indices': [int(index) for index in window.indices],
+    }
+    job.update(kwargs)
+    return job
+
+
+# runs in the worker: attach to a segment created by the main process
+def _attach(name):
+    segment = _segments.get(name)
+    if segment is None:
+        # the segment is owned and unlinked by the main process; spawned workers share its resource tracker,
+        # so attaching here does not register the segment a second time
+        segment = shared_memory.SharedMemory(name=name)
+        _segments[name] = segment
+    return segment
+
+
+# runs in the worker: (image, frame index) of every frame of the job, images are views into the ring
+def _frames(job):
+    ring = np.ndarray(job['ring_shape'], dtype=np.uint8, buffer=_attach(job['segment']).buf)
+    indices = iter(job['indices'])
+    for start, stop in job['slot_ranges']:
+        for img in ring[start:stop]:
+            yield img, next(indices)
+
+
+# runs in the worker: violation video, same output as ViolationRecorder.write_ms_detection
+#   job: path, fourcc, fps, size, violation_fi, violation_bbox
+# -> returns the number of frames written
+def write_violation_video(job):
+    width, height = job['size']
+    out = cv2.VideoWriter(job['path'], job['fourcc'], job['fps'], (width, height))
+    count = 0
+    for img, index in _frames(job):
+        frame_img = cv2.resize(img, (width, height), interpolation = cv2.INTER_LINEAR)
+
+        #DEBUG ONLY!!!
+        # write FRAME INDEX on current frame
+        write_text(frame_img, f"FI: {index}", (30, height - 50), (255,0,0))
+
+        # --- write violation frame multiple times (1 sec)
+        if index == job['violation_fi']:
+            draw_box(frame_img, job['violation_bbox'], label="", color=(50, 50, 220), line_thickness=3)
+            for i in range(int(job['fps'])):
+                out.write(frame_img)
+            count += int(job['fps'])
+        else:
+            out.write(frame_img)
+            count += 1
+    out.release()
+
+    return count
+
+
+# runs in the worker: event video, same output as ViolationRecorder.write_event_recordings
+#   job: path, fourcc, fps, size
+def write_event_video(job):
+    out = cv2.VideoWriter(job['path'], job['fourcc'], job['fps'], tuple(job['size']))
+    count = 0
+    for img, index in _frames(job):
+        out.write(img)
+        count += 1
+    out.release()
+
+    return count
@@ -1,5 +1,4 @@
-from easydict import EasyDict as edict
-from utils.bbox import rect_params_to_box
+import numpy as np
 
 # custom model classes
 BELT = 0
@@ -10,68 +9,161 @@ STEERING_WHEEL = 4
 PHONE_HOLDER = 5
 PLATE = 6
 
-# convert DeepStream metadata to dictionary object 
-#  -> used for plate recognition and violation detection 
-def get_detection_from_meta(obj_meta):
-
-    # also check: obj_meta.detector_bbox_info.org_bbox_coords
-    bbox = rect_params_to_box(obj_meta.rect_params) 
-       
-    if obj_meta.class_id == CAR:   
-        det = edict({
-            'id': obj_meta.object_id,
-            'bbox': bbox,
-            'class_id' : obj_meta.class_id,
-            'score': obj_meta.confidence,
-                        
-            'fi': None,         # is updated if we have a new car detection with the same id, or if id is a new one
-            'matched': False,   # used by plate matching procedure -> set to True if car is matched to a plate
-            'plate_bbox': None, # used for car objects by plate matching procedure
-            'plate_no': None,   # is updated once a plate has been read for an object maintained in car slots list
-            'plate_img': None,  # cropped image of license plate
-            'lpr_img': None,    # lpr frame; it is set by plate recognition module
-            'lpr_img_save_count': 0,
-            
-            'lpr_imgs_dict': {'30':0,'40':0,'50':0,'60':0,'65':0,'70':0,'75':0,'80':0,'85':0,'90':0},
-
-            # -- used by violation detection module --
-            'violation_fi': None,
-            #'violation_img': None,
-            'violation_timestamp': None,
-            'violation_sent': False,
-            'violation_bbox': None,
-           
-
-            'maxy': obj_meta.rect_params.top + obj_meta.rect_params.height,  # used to sort the slots, from closest to furthest
-            'st_wheel': None,                                                # ref to st. wheel object during current frame
-
-            'mobile_detected': False,
-            'mobile_violations': 0,
-            'mobile_det_timestamp': None,
-            'mobile_det_fi': None,
-            'mobile_bbox': None,
-
-            'nobelt_driver': 0,
-            'nobelt_driver_fi': None,
-            #'nobelt_driver_image': None,
-            'nobelt_bbox': None,
-            'nobelt_driver_timestamp': None
-        })
-    elif obj_meta.class_id == STEERING_WHEEL:
-        det = edict({
-            'id': obj_meta.object_id,
-            'bbox': bbox,
-            'class_id' : obj_meta.class_id,
-            'score': obj_meta.confidence,
-            'assigned': False
-        })
-    else:
-        det = edict({
-            'id': obj_meta.object_id,
-            'bbox': bbox,
-            'class_id' : obj_meta.class_id,
-            'score': obj_meta.confidence,
-            'processed': False
-        })
-
-    return det
\ No newline at end of file
+# classes handled by the mobile / seatbelt violation detector
+VIOLATION_CLASSES = (BELT, NO_BELT, MOBILE)
+
+# Long lived record of a tracked car (a 'vehicle slot'), same fields as the EasyDict used so far
+#  -> bbox is a (minx, miny, maxx, maxy) tuple (FrameDetections.bbox)
+# -> __slots__: plain attribute access and no per object __dict__, the slots live as long as the car is tracked
+class VehicleTrack(object):
+    __slots__ = ('id', 'bbox', 'class_id', 'score',
+                 'fi', 'matched', 'plate_bbox', 'plate_no', 'plate_img', 'lpr_img', 'lpr_img_save_count', 'lpr_candidates',
+                 'lpr_done',
+                 'violation_id', 'violation_fi', 'violation_timestamp', 'violation_sent', 'violation_bbox',
+                 'maxy', 'st_wheel',
+                 'mobile_detected', 'mobile_violations', 'mobile_det_timestamp', 'mobile_det_fi', 'mobile_bbox',
+                 'nobelt_driver', 'nobelt_driver_fi', 'nobelt_bbox', 'nobelt_driver_timestamp')
+
+    def __init__(self, track_id, bbox, class_id, score, maxy):
+        self.id = track_id
+        self.bbox = bbox
+        self.class_id = class_id
+        self.score = score
+
+        self.fi = None                # is updated if we have a new car detection with the same id, or if id is a new one
+        self.matched = False          # used by plate matching procedure -> set to True if car is matched to a plate
+        self.plate_bbox = None        # used for car objects by plate matching procedure
+        self.plate_no = None          # is updated once a plate has been read for an object maintained in car slots list
+        self.plate_img = None         # cropped image of license plate
+        self.lpr_img = None           # lpr frame; it is set by plate recognition module
+        self.lpr_img_save_count = 0     # plate crops handed to the OCR pool
+        self.lpr_candidates = None      # best plate crops so far (core.plate_quality.CropCandidates)
+        self.lpr_done = False           # the last of the OCR jobs of the track has been queued (see PlateRecognition)
+
+        # -- used by violation detection module --
+        self.violation_id = None
+        self.violation_fi = None
+        self.violation_timestamp = None
+        self.violation_sent = False
+        self.violation_bbox = None
+
+        self.maxy = maxy              # used to sort the slots, from closest to furthest
+        self.st_wheel = None          # st. wheel during current frame (its row in FrameDetections)
+
+        self.mobile_detected = False
+        self.mobile_violations = 0
+        self.mobile_det_timestamp = None
+        self.mobile_det_fi = None
+        self.mobile_bbox = None
+
+        self.nobelt_driver = 0
+        self.nobelt_driver_fi = None
+        self.nobelt_bbox = None
+        self.nobelt_driver_timestamp = None
+
+    def __repr__(self):
+        return f'VehicleTrack(id={self.id}, fi={self.fi}, plate_no={self.plate_no}, violation_id={self.violation_id})'
+
+
+# Detections of a whole batch stored column-wise in preallocated NumPy arrays
+#  -> filled by Pipeline._probe_fn_wrapper in one pass over the object metadata, no Python object per detection
+#  -> rows of frame i of the batch are [frame_start[i], frame_start[i + 1]), see frame()
+class DetectionArrays(object):
+
+    def __init__(self, capacity=256, max_frames=16):
+        self._allocate(capacity)
+        self.frame_start = np.zeros(max_frames + 1, dtype=np.int64)
+        self.count = 0   # rows filled during the current batch
+        self.frames = 0  # frames closed during the current batch
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.track_id = np.zeros(capacity, dtype=np.uint64)
+        self.class_id = np.zeros(capacity, dtype=np.int32)
+        self.score = np.zeros(capacity, dtype=np.float32)
+        self.left = np.zeros(capacity, dtype=np.float32)
+        self.top = np.zeros(capacity, dtype=np.float32)
+        self.width = np.zeros(capacity, dtype=np.float32)
+        self.height = np.zeros(capacity, dtype=np.float32)
+
+    # more objects than ever before -> double the arrays (rare, keeps the rows already filled)
+    def _grow(self):
+        old = (self.track_id, self.class_id, self.score, self.left, self.top, self.width, self.height)
+        self._allocate(2 * self.capacity)
+        for dst, src in zip((self.track_id, self.class_id, self.score, self.left, self.top, self.width, self.height), old):
+            dst[:len(src)] = src
+
+    def begin_batch(self):
+        self.count = 0
+        self.frames = 0
+
+    def begin_frame(self):
+        if self.frames + 1 >= len(self.frame_start):
+            self.frame_start = np.concatenate([self.frame_start, np.zeros(len(self.frame_start), dtype=np.int64)])
+        self.frame_start[self.frames] = self.count
+
+    def end_frame(self):
+        self.frames += 1
+        self.frame_start[self.frames] = self.count
+
+    # append one NvDsObjectMeta to the current frame
+    def add(self, obj_meta):
+        if self.count == self.capacity:
+            self._grow()
+        i = self.count
+        rect_params = obj_meta.rect_params
+        self.track_id[i] = obj_meta.object_id
+        self.class_id[i] = obj_meta.class_id
+        self.score[i] = obj_meta.confidence
+        self.left[i] = rect_params.left
+        self.top[i] = rect_params.top
+        self.width[i] = rect_params.width
+        self.height[i] = rect_params.height
+        self.count += 1
+
+    # detections of frame i of the batch (views, valid until the next batch)
+    def frame(self, i):
+        start, stop = int(self.frame_start[i]), int(self.frame_start[i + 1])
+        return FrameDetections(self.track_id[start:stop], self.class_id[start:stop], self.score[start:stop],
+                               self.left[start:stop], self.top[start:stop], self.width[start:stop], self.height[start:stop])
+
+
+# Detections of one frame: views into the columns of a DetectionArrays (or a copy of them, see copy())
+class FrameDetections(object):
+
+    def __init__(self, track_id, class_id, score, left, top, width, height):
+        self.track_id = track_id
+        self.class_id = class_id
+        self.score = score
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self._boxes = None
+
+    def __len__(self):
+        return len(self.class_id)
+
+    # detections owning their columns, e.g. to be processed after the next batch has been extracted
+    def copy(self):
+        return FrameDetections(self.track_id.copy(), self.class_id.copy(), self.score.copy(),
+                               self.left.copy(), self.top.copy(), self.width.copy(), self.height.copy())
+
+    # (N, 4) int array of minx, miny, maxx, maxy (same rounding as utils.bbox.rect_params_to_coords)
+    @property
+    def boxes(self):
+        if self._boxes is None:
+            left, top = self.left.astype(np.int64), self.top.astype(np.int64)
+            self._boxes = np.stack([left, top, left + self.width.astype(np.int64), top + self.height.astype(np.int64)], axis=1)
+        return self._boxes
+
+    # (minx, miny, maxx, maxy) tuple of row i
+    def bbox(self, i):
+        minx, miny, maxx, maxy = self.boxes[i].tolist()
+        return (minx, miny, maxx, maxy)
+
+    # row numbers of the detections of the given class(es)
+    def rows(self, *class_ids):
+        if len(class_ids) == 1:
+            return np.flatnonzero(self.class_id == class_ids[0])
+        return np.flatnonzero(np.isin(self.class_id, class_ids))
\ No newline at end of file
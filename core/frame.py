@@ -1,5 +1,31 @@
+import cv2
+
 # simple class that represents a frame saved in frame buffer
 class Frame:
     def __init__(self, img, cnt): 
         self.img = img
-        self.index = cnt
\ No newline at end of file
+        self.index = cnt
+
+# Pixels of a frame handed to the analytics
+#  -> the whole BGR frame when it has been converted anyway (into the frame buffer), otherwise only the regions
+#     the consumers asked for (e.g. plate crops), converted straight from the RGBA surface of the frame
+class FramePixels:
+    def __init__(self, full=None):
+        self.full = full
+        self.regions = {}   # (minx, miny, maxx, maxy) -> BGR crop
+
+    # copy region rect = (minx, miny, maxx, maxy) of src (RGBA surface or BGR frame), return the number of bytes copied
+    def add_crop(self, src, rect):
+        minx, miny, maxx, maxy = rect
+        view = src[miny:maxy, minx:maxx]
+        img = cv2.cvtColor(view, cv2.COLOR_RGBA2BGR) if view.shape[2] == 4 else view.copy()
+        self.regions[rect] = img
+        return img.nbytes
+
+    # BGR image of region rect, or None if neither the region nor the whole frame is available
+    def crop(self, rect):
+        minx, miny, maxx, maxy = [int(v) for v in rect]
+        img = self.regions.get((minx, miny, maxx, maxy))
+        if img is None and self.full is not None:
+            img = self.full[miny:maxy, minx:maxx]
+        return img
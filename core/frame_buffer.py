@@ -1,40 +1,709 @@
+import os
+import time
+import logging
+import threading
+import cv2
+import numpy as np
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
 from core.frame import Frame
 
 # Used to buffer frames from video source (either video or rtsp camera)
+# -> each stream owns ONE preallocated uint8 ring of shape (slots, H, W, 3) plus a parallel int64 array
+#    with the frame index held by every slot, so buffering a frame in steady state allocates nothing
+# -> frames are addressed by a per stream sequence number (seq); the slot of a seq is seq % buffer_size
+# -> frame indices increase within a 'run' of frames; a new run starts when frame_num goes backwards
+#    (e.g. after a source restart), so frame windows are looked up by bisection inside a run
+# -> the frames of a window handed to a writer thread are views into the ring: the window is pinned (see pin) and
+#    a pinned slot is never overwritten, the incoming frame is not buffered instead (counted in stats['pinned_skips'])
+# -> the frames are buffered by the probe thread and the windows are taken by the analytics workers
+#    (ANALYTICS.ASYNC): the ring bookkeeping and the pins are guarded by ring_lock, and the slot the producer is
+#    filling (between next_slot and commit) no longer holds a frame a window can get
 class FrameBuffer(object):
-        
-    def __init__(self, buffer_size, stream_count):
+
+    def __init__(self, buffer_size, stream_count, width, height, channels=3):
 
         self.buffer_size = buffer_size
+        self.shape = (height, width, channels)
 
-        # we create a separate buffer for each stream
-        self.frame_buffer = []
+        # we create a separate ring for each stream
+        self.frames = []   # image ring, one (buffer_size, H, W, C) array per stream
+        self.indices = []  # frame index (frame_num) stored in each slot of the ring
+        self.written = []  # number of frames written so far to each stream
+        self.runs = []     # seq of the first frame of every run still (partly) held by the ring
         for i in range(stream_count):
-            self.frame_buffer.append( list() ) #different object reference each time            
+            self.frames.append(np.empty((buffer_size, height, width, channels), dtype=np.uint8))
+            self.indices.append(np.full(buffer_size, -1, dtype=np.int64))
+            self.written.append(0)
+            self.runs.append(deque([0]))
+
+        self._init_ring_state(stream_count)
+
+    # pins: number of windows being read from each slot of every stream (see pin)
+    def _init_ring_state(self, stream_count):
+        self.pins = [np.zeros(self.buffer_size, dtype=np.int32) for i in range(stream_count)]
+        # frames not buffered because their slot was pinned land here
+        self.scratch = np.empty(self.shape, dtype=np.uint8)
+        self.skipping = [False] * stream_count
+        self.filling = [False] * stream_count  # True between next_slot and commit
+        # the ring is written by the probe thread, windows are taken and pinned by the analytics workers
+        # and released by the writer threads
+        self.ring_lock = threading.Lock()
+        self.stats = {'pinned_skips': 0}
+
+    # True if the slot of the given seq is pinned (the incoming frame must not be buffered there)
+    def _pinned(self, stream_no, seq):
+        if self.pins[stream_no][seq % self.buffer_size] > 0:
+            self.stats['pinned_skips'] += 1
+            return True
+        return False
+
+    # return the slot the next frame of the stream is going to be written to
+    # -> the caller writes the image straight into it (e.g. cv2.cvtColor(..., dst=slot)) and then calls commit()
+    # -> a scratch array if the slot is pinned, the frame is dropped by commit() then
+    def next_slot(self, stream_no):
+        with self.ring_lock:
+            seq = self.written[stream_no]
+            self.skipping[stream_no] = self._pinned(stream_no, seq)
+            self.filling[stream_no] = not self.skipping[stream_no]
+        if self.skipping[stream_no]:
+            return self.scratch
+        return self.frames[stream_no][seq % self.buffer_size]
+
+    # mark the slot returned by next_slot() as holding frame 'index'
+    def commit(self, stream_no, index):
+        with self.ring_lock:
+            self.filling[stream_no] = False
+            if self.skipping[stream_no]:
+                self.skipping[stream_no] = False
+                return
+            self._note_index(stream_no, index)
+            self.indices[stream_no][self.written[stream_no] % self.buffer_size] = index
+            self.written[stream_no] += 1
 
+    # start a new run if frame_num went backwards; forget runs that have left the ring
+    # -> must be called before the index is stored in the ring
+    def _note_index(self, stream_no, index):
+        seq = self.written[stream_no]
+        runs = self.runs[stream_no]
+        if seq > 0 and index <= self.indices[stream_no][(seq - 1) % self.buffer_size]:
+            runs.append(seq)
+
+        first_seq = max(0, seq + 1 - self.buffer_size)
+        while len(runs) > 1 and runs[1] <= first_seq:
+            runs.popleft()
+
+    # append new frame to frame buffer; the oldest frame is overwritten if buffer is already full
     def append(self, img, stream_no, index):
-         # append new frame to frame buffer and remove first one if buffer is already full
-        if len(self.frame_buffer[stream_no]) == self.buffer_size:
-            self.frame_buffer[stream_no].pop(0)
+        slot = self.next_slot(stream_no)
+        if img.shape == slot.shape:
+            np.copyto(slot, img)
+        else:
+            cv2.resize(img, (self.shape[1], self.shape[0]), dst=slot, interpolation=cv2.INTER_LINEAR)
+
+        self.commit(stream_no, index)
 
-        self.frame_buffer[stream_no].append(Frame(img, index))            
+    # we need to return 'length' frames in total, starting from frame no = violation_fi - length / 2
+    # -> the returned FrameWindow holds views into the ring, no image is copied
+    # -> O(log n): the window bounds are found by bisection over the seqs of the run holding violation_fi
+    # -> pin: pin the window (see pin) before the producer can move on, the caller may run on any thread
+    def get_frames(self, stream_no, violation_fi, current_fi, length, pin=False):
+        with self.ring_lock:
+            window = self._get_frames(stream_no, violation_fi, current_fi, length)
+            if pin:
+                self._pin(window)
+        return window
 
-    # we need to return 'length' frames in total, starting from frame no = violation_fi - length / 2 
-    def get_frames(self, stream_no, violation_fi, current_fi, length):
+    def _get_frames(self, stream_no, violation_fi, current_fi, length):
 
-        start_fi = violation_fi - length / 2        
-        first_frame = self.frame_buffer[stream_no][0]
+        start_fi = violation_fi - length / 2
+        lo, hi = self._run_of(stream_no, violation_fi)
 
-        #DEBUG ONLY!!!
-        print(f'[get_frames] Buffer size = {self.buffer_size}, Violation fi = {violation_fi}, current fi = {current_fi}, start fi = {start_fi}, first_frame fi = {first_frame.index}')
+        if lo == hi:
+            return self._window(stream_no, lo, hi)
 
-        if first_frame.index <= start_fi:
-            frames = [frame for frame in self.frame_buffer[stream_no] if frame.index >= violation_fi - length / 2 and frame.index <= violation_fi + length / 2]
+        first_fi = self.indices[stream_no][lo % self.buffer_size]
+        logging.debug(f'[get_frames] Buffer size = {self.buffer_size}, Violation fi = {violation_fi}, current fi = {current_fi}, start fi = {start_fi}, first_frame fi = {first_fi}')
+
+        if first_fi <= start_fi:
+            start = self._bisect_left(stream_no, start_fi, lo, hi)
+            stop = self._bisect_right(stream_no, violation_fi + length / 2, start, hi)
         else:
-            print (f'[get_frames] Not enough frames for violation fi to be in the middle vfi={violation_fi}, sfi={start_fi}, ffi={first_frame.index}')
-            frames = self.frame_buffer[stream_no][:length]
+            print (f'[get_frames] Not enough frames for violation fi to be in the middle vfi={violation_fi}, sfi={start_fi}, ffi={first_fi}')
+            start, stop = lo, min(hi, lo + length)
+
+        return self._window(stream_no, start, stop)
+
+    # return the frame with the given frame index or None if it is not buffered
+    # -> img is a view into the ring, or a copy taken before the producer can reuse the slot if copy is set
+    def get_frame(self, stream_no, index, copy=False):
+        with self.ring_lock:
+            lo, hi = self._run_of(stream_no, index)
+            seq = self._bisect_left(stream_no, index, lo, hi)
+            if seq == hi or self.indices[stream_no][seq % self.buffer_size] != index:
+                return None
+            img = self.load(stream_no, seq)
+            if img is None:
+                return None
+            return Frame(img.copy() if copy else img, index)
 
-        return frames
+    # window made of the frames with seqs [start, stop)
+    def _window(self, stream_no, start, stop):
+        seqs = np.arange(start, stop, dtype=np.int64)
+        return FrameWindow(self, stream_no, seqs, self.indices[stream_no][seqs % self.buffer_size])
+
+    # seq range [lo, hi) of the run the frame index belongs to
+    # -> the newest run whose indices cover it, otherwise the newest run
+    def _run_of(self, stream_no, index):
+        first_seq = self.first_seq(stream_no)
+        hi = self.written[stream_no]
+        runs = list(self.runs[stream_no])
+        for run_start in reversed(runs):
+            lo = max(run_start, first_seq)
+            if lo < hi and self.indices[stream_no][lo % self.buffer_size] <= index <= self.indices[stream_no][(hi - 1) % self.buffer_size]:
+                return lo, hi
+            hi = lo
+
+        return max(runs[-1], first_seq), self.written[stream_no]
+
+    # first seq in [lo, hi) whose frame index is >= value (indices are increasing within a run)
+    def _bisect_left(self, stream_no, value, lo, hi):
+        indices = self.indices[stream_no]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if indices[mid % self.buffer_size] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # first seq in [lo, hi) whose frame index is > value
+    def _bisect_right(self, stream_no, value, lo, hi):
+        indices = self.indices[stream_no]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if value < indices[mid % self.buffer_size]:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    # seq of the oldest frame still held by the ring of the stream
+    # -> while the producer fills a slot the frame it held is gone already
+    def first_seq(self, stream_no):
+        return max(0, self.written[stream_no] + self.filling[stream_no] - self.buffer_size)
+
+    # True if the frame with the given seq has not been overwritten yet
+    def is_valid(self, stream_no, seq):
+        return self.first_seq(stream_no) <= seq < self.written[stream_no]
+
+    # image held by the frame with the given seq (a view into the ring)
+    def load(self, stream_no, seq):
+        return self.frames[stream_no][seq % self.buffer_size]
+
+    # images held by the ring slots [start, stop) (a view into the ring)
+    def load_slots(self, stream_no, start, stop):
+        return self.frames[stream_no][start:stop]
 
     def length(self, stream_no):
-        return len(self.frame_buffer[stream_no])
\ No newline at end of file
+        return min(self.written[stream_no], self.buffer_size)
+
+    # number of frames committed after a frame before the slot returned by next_slot() for it can be reused
+    # -> a consumer holding on to that slot (instead of a copy) must be done within this number of frames
+    def slot_lifetime(self):
+        return self.buffer_size
+
+    # protect the slots of a window from being overwritten until they are released by unpin()
+    # -> the window must not have moved on since get_frames(): called on another thread than the producer,
+    #    use get_frames(..., pin=True); iterating a pinned window releases every frame once it has been consumed
+    def pin(self, window):
+        with self.ring_lock:
+            self._pin(window)
+
+    def _pin(self, window):
+        np.add.at(self.pins[window.stream_no], window.seqs % self.buffer_size, 1)
+        window.pinned = True
+        window.released = 0
+
+    # release the pinned frames of the window up to (excluding) the frame at position stop, all of them by default
+    def unpin(self, window, stop=None):
+        stop = len(window) if stop is None else stop
+        if not window.pinned or stop <= window.released:
+            return
+        slots = window.seqs[window.released:stop] % self.buffer_size
+        with self.ring_lock:
+            np.subtract.at(self.pins[window.stream_no], slots, 1)
+        window.released = stop
+
+    # total number of bytes reserved by the rings of all streams
+    def nbytes(self):
+        return sum(frames.nbytes + indices.nbytes for frames, indices in zip(self.frames, self.indices))
+
+
+# A window of frames returned by FrameBuffer.get_frames
+# -> behaves like the list of Frame objects returned so far (len, indexing, iteration) but every Frame.img
+#    is a view into the ring of the buffer, so it is only valid until the ring wraps around the slot
+# -> pinned (FrameBuffer.pin) its slots are not reused until released: iteration releases every frame as soon as
+#    the consumer asks for the next one, the owner releases the rest with FrameBuffer.unpin
+class FrameWindow(object):
+
+    def __init__(self, buffer, stream_no, seqs, indices):
+        self.buffer = buffer
+        self.stream_no = stream_no
+        self.seqs = seqs
+        self.indices = indices
+        self.pinned = False
+        self.released = 0  # pinned window: the frames before this position have been released
+
+    def __len__(self):
+        return len(self.seqs)
+
+    def __getitem__(self, i):
+        return Frame(self.buffer.load(self.stream_no, self.seqs[i]), int(self.indices[i]))
+
+    def __iter__(self):
+        for i, (seq, index) in enumerate(zip(self.seqs, self.indices)):
+            if not self.buffer.is_valid(self.stream_no, seq):
+                # the producer has already overwritten this slot -> the rest of the window is gone as well
+                if seq < self.buffer.first_seq(self.stream_no):
+                    logging.warning(f'[FrameWindow] Stream {self.stream_no}: frame {index} overwritten before it was consumed')
+                    return
+                # a single frame missing from the buffer (e.g. not spilled to disk in time) -> skip it
+                continue
+            img = self.buffer.load(self.stream_no, seq)
+            if img is None:
+                # lost while it was read (the producer took its slot over before it was spilled) -> skip it
+                continue
+            yield Frame(img, int(index))
+            # the consumer is done with the frame -> the producer may reuse its slot
+            if self.pinned:
+                self.buffer.unpin(self, i + 1)
+
+    # contiguous runs of ring slots covered by the window, as (slot start, slot stop) tuples
+    # -> a window that wraps around the end of the ring is made of two runs
+    def slot_ranges(self):
+        ranges = []
+        slots = self.seqs % self.buffer.buffer_size
+        start = 0
+        for i in range(1, len(slots) + 1):
+            if i == len(slots) or slots[i] != slots[i - 1] + 1:
+                ranges.append((int(slots[start]), int(slots[i - 1]) + 1))
+                start = i
+        return ranges
+
+    # image views of the window, one array per contiguous run of slots (no copy for a raw buffer)
+    def views(self):
+        return [self.buffer.load_slots(self.stream_no, start, stop) for start, stop in self.slot_ranges()]
+
+
+# Frame buffer whose rings live in shared memory (one multiprocessing.shared_memory segment per stream)
+# -> lets clip writers running in other processes read the buffered frames without any copy or pickling
+#    (see core/clip_writer.py); they only get the segment name, the slot ranges and the frame indices
+# -> slots handed to a writer are pinned until the writer process is done with the whole window
+class SharedFrameBuffer(FrameBuffer):
+
+    def __init__(self, buffer_size, stream_count, width, height, channels=3):
+
+        self.buffer_size = buffer_size
+        self.shape = (height, width, channels)
+
+        self.segments = []  # shared memory segment of each stream
+        self.frames = []    # image ring, one (buffer_size, H, W, C) array per stream backed by its segment
+        self.indices = []   # frame index (frame_num) stored in each slot of the ring
+        self.written = []   # number of frames written so far to each stream
+        self.runs = []      # seq of the first frame of every run still (partly) held by the ring
+        for i in range(stream_count):
+            ring_shape = (buffer_size, height, width, channels)
+            segment = shared_memory.SharedMemory(create=True, size=int(np.prod(ring_shape)))
+            self.segments.append(segment)
+            self.frames.append(np.ndarray(ring_shape, dtype=np.uint8, buffer=segment.buf))
+            self.indices.append(np.full(buffer_size, -1, dtype=np.int64))
+            self.written.append(0)
+            self.runs.append(deque([0]))
+
+        self._init_ring_state(stream_count)
+
+    # name of the shared memory segment holding the ring of the stream
+    def segment_name(self, stream_no):
+        return self.segments[stream_no].name
+
+    # shape of the ring of a stream, as needed to map its segment
+    def ring_shape(self):
+        return (self.buffer_size,) + self.shape
+
+    # release the shared memory segments (the rings must not be used afterwards)
+    def close(self):
+        self.frames = []
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
+
+
+# Frame buffer with a second, disk backed tier for long pre / post event windows
+# -> the newest hot_frames frames of a stream stay in a RAM ring (the 'hot' tier); the whole history of
+#    buffer_size frames lives in a memory mapped file per stream under spill_dir (the 'cold' tier, meant for NVMe)
+# -> a background thread copies committed frames from the hot ring to the file in batches of spill_batch
+#    contiguous slots, so the file is written sequentially and the probe never touches the disk
+# -> get_frames works as for FrameBuffer: every frame of a window is read from the hot ring when it is still
+#    there, from the file otherwise
+# -> a frame about to be overwritten in the hot ring before it was spilled is dropped from the cold tier
+#    (stats['spill_drops']); the incoming frame is not buffered if the spill thread is copying that slot right now
+#    (stats['spill_stalls']) or if a pinned frame would be lost (stats['pinned_skips'])
+# -> a frame is read from the hot ring as a copy, validated once taken (the producer may reuse the hot slot meanwhile)
+class SpillFrameBuffer(FrameBuffer):
+
+    def __init__(self, buffer_size, stream_count, width, height, channels=3,
+                 spill_dir='/tmp/ivms_spill', hot_frames=200, spill_batch=32):
+
+        # buffer_size is the total number of frames kept per stream (cold tier); the indices and the
+        # seq -> slot mapping of FrameBuffer refer to it
+        hot_frames = min(hot_frames, buffer_size)
+        self.buffer_size = buffer_size
+        self.hot_size = hot_frames
+        self.spill_batch = max(1, min(spill_batch, hot_frames // 2))
+        self.shape = (height, width, channels)
+
+        os.makedirs(spill_dir, exist_ok=True)
+        self.paths = []       # file backing the cold tier of each stream
+        self.frames = []      # hot ring, one (hot_frames, H, W, C) array per stream
+        self.cold = []        # cold ring, one memory mapped (buffer_size, H, W, C) array per stream
+        self.cold_seqs = []   # seq held by each slot of the cold ring (-1 if none)
+        self.indices = []     # frame index (frame_num) of each seq, slot = seq % buffer_size
+        self.written = []     # number of frames written so far to each stream
+        self.runs = []        # seq of the first frame of every run still (partly) held by the buffer
+        self.spilled = []     # every seq below this one has been copied to the cold tier (or dropped)
+        self.spill_next = []  # first seq not yet claimed by the spill thread
+        for i in range(stream_count):
+            path = os.path.join(spill_dir, f'stream{i}.ring')
+            self.paths.append(path)
+            self.frames.append(np.empty((hot_frames, height, width, channels), dtype=np.uint8))
+            self.cold.append(np.memmap(path, dtype=np.uint8, mode='w+', shape=(buffer_size, height, width, channels)))
+            self.cold_seqs.append(np.full(buffer_size, -1, dtype=np.int64))
+            self.indices.append(np.full(buffer_size, -1, dtype=np.int64))
+            self.written.append(0)
+            self.runs.append(deque([0]))
+            self.spilled.append(0)
+            self.spill_next.append(0)
+
+        # frames not buffered because the spill thread was copying their slot (or they are pinned) land in scratch
+        self._init_ring_state(stream_count)
+
+        self.lock = threading.Lock()  # guards spilled / spill_next between the probe and the spill thread
+        self.wakeup = threading.Event()
+        self.stats = {'spilled': 0, 'spill_ns': 0, 'spill_drops': 0, 'spill_stalls': 0, 'pinned_skips': 0}
+
+        self.running = True
+        self.spill_thread = threading.Thread(target=self._spill_loop, name='frame-spill', daemon=True)
+        self.spill_thread.start()
+
+    def next_slot(self, stream_no):
+        seq = self.written[stream_no]
+        victim = seq - self.hot_size  # frame whose hot slot is about to be overwritten
+        # the cold slot of the incoming frame holds a pinned frame -> do not buffer it (as FrameBuffer)
+        with self.ring_lock:
+            self.skipping[stream_no] = self._pinned(stream_no, seq)
+            self.filling[stream_no] = not self.skipping[stream_no]
+        if self.skipping[stream_no]:
+            return self.scratch
+        with self.lock:
+            if victim >= self.spilled[stream_no]:
+                if victim < self.spill_next[stream_no]:
+                    # being copied to disk right now -> do not buffer the incoming frame
+                    self.skipping[stream_no] = True
+                    self.stats['spill_stalls'] += 1
+                    return self.scratch
+                if self._pinned(stream_no, victim):
+                    # a window is waiting for it -> keep it, do not buffer the incoming frame
+                    self.skipping[stream_no] = True
+                    return self.scratch
+                # never claimed by the spill thread -> it is lost for the cold tier
+                self.stats['spill_drops'] += victim + 1 - self.spill_next[stream_no]
+                self.spilled[stream_no] = self.spill_next[stream_no] = victim + 1
+        return self.frames[stream_no][seq % self.hot_size]
+
+    def commit(self, stream_no, index):
+        if self.skipping[stream_no]:
+            self.skipping[stream_no] = False
+            return
+        super().commit(stream_no, index)
+        if self.written[stream_no] - self.spill_next[stream_no] >= self.spill_batch:
+            self.wakeup.set()
+
+    # spill thread: copy committed frames to the cold tier, one batch of contiguous slots at a time
+    def _spill_loop(self):
+        while self.running:
+            # partial batches are flushed as well when the streams are idle
+            self.wakeup.wait(timeout=0.2)
+            self.wakeup.clear()
+            for stream_no in range(len(self.frames)):
+                while self.running and self._spill_batch(stream_no):
+                    pass
+
+    # copy the next batch of the stream, return True if a full batch was copied
+    def _spill_batch(self, stream_no):
+        with self.lock:
+            start = self.spill_next[stream_no]
+            # a batch never wraps around the hot or the cold ring, so both copies are sequential
+            stop = min(self.written[stream_no], start + self.spill_batch,
+                       start + self.hot_size - start % self.hot_size,
+                       start + self.buffer_size - start % self.buffer_size)
+            if stop <= start:
+                return False
+            self.spill_next[stream_no] = stop
+
+        t0 = time.monotonic_ns()
+        cold_start = start % self.buffer_size
+        cold_stop = cold_start + stop - start
+        self.cold_seqs[stream_no][cold_start:cold_stop] = -1
+        self.cold[stream_no][cold_start:cold_stop] = self.frames[stream_no][start % self.hot_size:start % self.hot_size + stop - start]
+        self.cold_seqs[stream_no][cold_start:cold_stop] = np.arange(start, stop, dtype=np.int64)
+
+        with self.lock:
+            # next_slot may have dropped frames of this batch meanwhile, never move spilled backwards
+            self.spilled[stream_no] = max(self.spilled[stream_no], stop)
+            self.stats['spilled'] += stop - start
+            self.stats['spill_ns'] += time.monotonic_ns() - t0
+
+        return stop - start == self.spill_batch
+
+    # True if the frame with the given seq is held by the hot ring or has been spilled to the cold tier
+    # -> the oldest frame of the hot ring does not count, its slot is the one the producer writes to next
+    def is_valid(self, stream_no, seq):
+        if not self.first_seq(stream_no) <= seq < self.written[stream_no]:
+            return False
+        return seq > self.written[stream_no] - self.hot_size or self.cold_seqs[stream_no][seq % self.buffer_size] == seq
+
+    # image held by the frame with the given seq (a copy of the hot slot or a view into the memory mapped file),
+    # None if neither tier holds it (it left the hot ring before it was spilled)
+    def load(self, stream_no, seq):
+        if seq > self.written[stream_no] - self.hot_size:
+            img = self.frames[stream_no][seq % self.hot_size].copy()
+            # the producer did not get the slot while it was copied -> the copy is not torn
+            if seq > self.written[stream_no] - self.hot_size:
+                return img
+        # the cold slot may still hold a frame of a previous lap of the ring
+        if self.cold_seqs[stream_no][seq % self.buffer_size] != seq:
+            return None
+        return self.cold[stream_no][seq % self.buffer_size]
+
+    # images held by the (cold ring) slots [start, stop), stitched from both tiers; the frames held by neither tier
+    # are left out
+    def load_slots(self, stream_no, start, stop):
+        written = self.written[stream_no]
+        base = written - written % self.buffer_size
+        seqs = [base + slot if base + slot < written else base + slot - self.buffer_size for slot in range(start, stop)]
+        imgs = [img for img in (self.load(stream_no, seq) for seq in seqs) if img is not None]
+        return np.stack(imgs) if imgs else np.empty((0,) + self.shape, dtype=np.uint8)
+
+    def slot_lifetime(self):
+        return self.hot_size
+
+    # number of bytes of RAM reserved by the buffer (the cold tier lives on disk)
+    def nbytes(self):
+        return sum(frames.nbytes + indices.nbytes + cold_seqs.nbytes
+                   for frames, indices, cold_seqs in zip(self.frames, self.indices, self.cold_seqs))
+
+    # number of bytes reserved on disk by the cold tier
+    def disk_nbytes(self):
+        return sum(cold.nbytes for cold in self.cold)
+
+    def close(self):
+        self.running = False
+        self.wakeup.set()
+        self.spill_thread.join()
+        self.cold = []
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Frame buffer that keeps every buffered frame encoded (JPEG or lossless PNG) instead of raw BGR
+# -> frames are encoded on a worker pool, off the GStreamer streaming thread, and only decoded
+#    when a window returned by get_frames is consumed (i.e. for a violation or an event)
+# -> the probe writes into a small ring of raw staging slots; a staging slot is reused as soon as
+#    the encoder is done with it
+# -> the encode backlog is bounded: a frame arriving while its staging slot is still being encoded (or with
+#    max_pending frames waiting for the pool) is not buffered, it is counted in stats['encode_drops']
+# -> the encoded frame of a pinned slot is not replaced, the incoming frame is not buffered instead
+class CompressedFrameBuffer(FrameBuffer):
+
+    CODECS = {
+        'jpeg': '.jpg',
+        'png': '.png',
+    }
+
+    def __init__(self, buffer_size, stream_count, width, height, channels=3,
+                 codec='jpeg', jpeg_quality=90, png_compression=1, workers=2, staging_slots=8, max_pending=None):
+
+        if codec not in self.CODECS:
+            raise ValueError(f'Unsupported frame buffer codec: {codec}, expected one of {list(self.CODECS)}')
+
+        self.buffer_size = buffer_size
+        self.shape = (height, width, channels)
+        self.codec = codec
+        self.ext = self.CODECS[codec]
+        if codec == 'jpeg':
+            self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)]
+        else:
+            self.encode_params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-encoder')
+
+        self.encoded = []        # encoded frame (1-D uint8 array) or pending Future, per slot
+        self.indices = []        # frame index (frame_num) stored in each slot of the ring
+        self.written = []        # number of frames written so far to each stream
+        self.staging = []        # raw staging slots the probe converts the frames into
+        self.staging_jobs = []   # pending encode job of every staging slot
+        self.runs = []           # seq of the first frame of every run still (partly) held by the ring
+        for i in range(stream_count):
+            self.encoded.append([None] * buffer_size)
+            self.indices.append(np.full(buffer_size, -1, dtype=np.int64))
+            self.written.append(0)
+            self.runs.append(deque([0]))
+            self.staging.append(np.empty((staging_slots, height, width, channels), dtype=np.uint8))
+            self.staging_jobs.append([None] * staging_slots)
+
+        # staging slot the next frame of each stream is converted into, None if the frame is dropped
+        self.pending = [None] * stream_count
+
+        # frames queued to the encoder pool and not encoded yet, at most max_pending (one staging ring by default)
+        self.queued = 0
+        self.max_pending = max_pending or staging_slots * stream_count
+
+        self._init_ring_state(stream_count)
+        self.stats_lock = threading.Lock()
+        self.stats = {'encoded': 0, 'encode_ns': 0, 'decoded': 0, 'decode_ns': 0, 'encode_drops': 0, 'pinned_skips': 0}
+
+    def next_slot(self, stream_no):
+        k = self.written[stream_no] % len(self.staging_jobs[stream_no])
+        job = self.staging_jobs[stream_no][k]
+        if job is None or job.done():
+            self.pending[stream_no] = (k, self.staging[stream_no][k])
+            return self.staging[stream_no][k]
+
+        # encoder is lagging behind -> never block the streaming thread nor allocate, drop the frame
+        with self.stats_lock:
+            self.stats['encode_drops'] += 1
+        self.pending[stream_no] = None
+        return self.scratch
+
+    def commit(self, stream_no, index):
+        if self.pending[stream_no] is None:
+            return
+        k, img = self.pending[stream_no]
+        self.pending[stream_no] = None
+        self.staging_jobs[stream_no][k] = self._submit(stream_no, img, index)
+
+    def append(self, img, stream_no, index):
+        self._submit(stream_no, img, index)
+
+    # queue the encoding of img into the next slot of the ring
+    # -> None if the frame is not buffered: its slot is pinned or max_pending frames are waiting for the pool
+    def _submit(self, stream_no, img, index):
+        with self.stats_lock:
+            if self.queued >= self.max_pending:
+                self.stats['encode_drops'] += 1
+                return None
+            self.queued += 1
+
+        with self.ring_lock:
+            if self._pinned(stream_no, self.written[stream_no]):
+                with self.stats_lock:
+                    self.queued -= 1
+                return None
+            self._note_index(stream_no, index)
+            slot = self.written[stream_no] % self.buffer_size
+            job = self.executor.submit(self._encode, img)
+            self.encoded[stream_no][slot] = job
+            self.indices[stream_no][slot] = index
+            self.written[stream_no] += 1
+
+        # swap the future for its result once done, unless the slot has been reused in the meantime
+        def _done(f, stream_no=stream_no, slot=slot):
+            with self.stats_lock:
+                self.queued -= 1
+            if self.encoded[stream_no][slot] is f and f.exception() is None:
+                self.encoded[stream_no][slot] = f.result()
+        job.add_done_callback(_done)
+
+        return job
+
+    # runs on the encoder pool
+    def _encode(self, img):
+        t0 = time.monotonic_ns()
+        if img.shape != self.shape:
+            img = cv2.resize(img, (self.shape[1], self.shape[0]), interpolation=cv2.INTER_LINEAR)
+        ok, buf = cv2.imencode(self.ext, img, self.encode_params)
+        if not ok:
+            raise RuntimeError(f'[CompressedFrameBuffer] Failed to encode frame as {self.codec}')
+        with self.stats_lock:
+            self.stats['encoded'] += 1
+            self.stats['encode_ns'] += time.monotonic_ns() - t0
+        return buf
+
+    # decode the frame with the given seq (a new array)
+    def load(self, stream_no, seq):
+        buf = self.encoded[stream_no][seq % self.buffer_size]
+        if isinstance(buf, Future):
+            buf = buf.result()
+        t0 = time.monotonic_ns()
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        with self.stats_lock:
+            self.stats['decoded'] += 1
+            self.stats['decode_ns'] += time.monotonic_ns() - t0
+        return img
+
+    def load_slots(self, stream_no, start, stop):
+        written = self.written[stream_no]
+        base = written - written % self.buffer_size
+        seqs = [base + slot if base + slot < written else base + slot - self.buffer_size for slot in range(start, stop)]
+        return np.stack([self.load(stream_no, seq) for seq in seqs])
+
+    # total number of bytes held by the encoded frames and the staging slots of all streams
+    def nbytes(self):
+        total = sum(staging.nbytes + indices.nbytes for staging, indices in zip(self.staging, self.indices))
+        for encoded in self.encoded:
+            total += sum(buf.nbytes for buf in encoded if isinstance(buf, np.ndarray))
+        return total
+
+    # staging slots are reused as soon as their frame has been encoded
+    def slot_lifetime(self):
+        return len(self.staging_jobs[0]) if self.staging_jobs else 0
+
+    # mean size of an encoded frame in bytes
+    def bytes_per_frame(self):
+        sizes = [buf.nbytes for encoded in self.encoded for buf in encoded if isinstance(buf, np.ndarray)]
+        return sum(sizes) / len(sizes) if sizes else 0
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+# create the frame buffer configured by the VIDEO_OUTPUT.FRAME_BUFFER section of app_settings.yaml
+#   MODE: raw (default), shared, spill, jpeg or png
+def create_frame_buffer(fb_cfg, buffer_size, stream_count, width, height):
+    fb_cfg = fb_cfg or {}
+    mode = str(fb_cfg.get('MODE', 'raw')).lower()
+
+    if mode == 'raw':
+        return FrameBuffer(buffer_size, stream_count, width, height)
+
+    if mode == 'shared':
+        return SharedFrameBuffer(buffer_size, stream_count, width, height)
+
+    if mode == 'spill':
+        return SpillFrameBuffer(buffer_size, stream_count, width, height,
+                                spill_dir=fb_cfg.get('SPILL_DIR', '/tmp/ivms_spill'),
+                                hot_frames=int(fb_cfg.get('HOT_FRAMES', 200)),
+                                spill_batch=int(fb_cfg.get('SPILL_BATCH', 32)))
+
+    return CompressedFrameBuffer(buffer_size, stream_count, width, height,
+                                 codec=mode,
+                                 jpeg_quality=fb_cfg.get('JPEG_QUALITY', 90),
+                                 png_compression=fb_cfg.get('PNG_COMPRESSION', 1),
+                                 workers=fb_cfg.get('ENCODE_WORKERS', 2),
+                                 staging_slots=fb_cfg.get('STAGING_SLOTS', 8),
+                                 max_pending=fb_cfg.get('MAX_PENDING'))
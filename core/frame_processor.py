@@ -0,0 +1,163 @@
+import time
+import cv2
+
+from core.frame import FramePixels
+from core.analytics_worker import AnalyticsWorker
+
+
+# Per frame work of the tiler probe, kept free of GStreamer / pyds so that it can also be driven by the
+# replay runner (replay_ivms.py) from recorded detections and decoded video frames
+# -> process_frame: buffers the frame, copies the pixels the analytics need and runs (or queues) the analytics
+# -> analyze_frame: plate recognition, mobile / seatbelt violation detection and recording, event recordings
+class FrameProcessor(object):
+
+    MS_VIOLATION_STREAM = 1  # rear center camera: mobile / seatbelt violations are detected on this stream only
+
+    def __init__(self, cfg, num_sources, lpr, ms_viol_detector, recorder, stage_timer, capture=None):
+        self.num_sources = num_sources
+        self.lpr = lpr
+        self.ms_viol_detector = ms_viol_detector
+        self.recorder = recorder
+        self.stage_timer = stage_timer
+        self.capture = capture      # DetectionCapture the detections of every frame are written to (or None)
+        self.on_violations = None   # called as on_violations(stream_no, frame_number, violations) if any
+
+        # per frame analytics run on a worker thread per stream, fed through a bounded queue, unless disabled
+        analytics_cfg = cfg.get('ANALYTICS') or {}
+        self.analytics = None
+        # the analytics get the whole converted frame (the frame buffer slot) if they can hold on to it until they
+        # are done with it, otherwise only the regions plate recognition asks for are copied out of the surface
+        self.analytics_full_frames = True
+        if analytics_cfg.get('ASYNC', False):
+            queue_size = int(analytics_cfg.get('QUEUE_SIZE', 8))
+            overflow = str(analytics_cfg.get('OVERFLOW', 'drop_oldest')).lower()
+            self.analytics = [AnalyticsWorker(i, self.analyze_frame, queue_size, overflow) for i in range(num_sources)]
+            # a slot may be reused before a full queue has been worked off
+            self.analytics_full_frames = self.recorder.buffer_slot_lifetime() > 2 * queue_size
+
+        # pixels are only copied out of the RGBA surface when a consumer needs them, decided for every frame:
+        #  -> frame buffer: streams it serves (every stream when the events are recorded from it, else the violation
+        #     stream only), while the recorder may put the frame in a clip (see ViolationRecorder.needs_frame)
+        #  -> plate recognition: the plate crops of the frame (see PlateRecognition.pixel_demand)
+        #  -> lane detector: would need the whole frame (disabled)
+        self.buffered_streams = [stream_no == self.MS_VIOLATION_STREAM or self.recorder.buffers_event_history()
+                                 for stream_no in range(num_sources)]
+        self.plate_pixels = self.lpr is not None and bool(self.lpr.anpr)
+        # bytes copied out of the surfaces per stream, see pixel_rates
+        self.copied_bytes = [0] * num_sources
+        self.copied_since = time.monotonic()
+
+        self.encoded_recording = self.recorder.encoded_buffer is not None
+
+    # frame: RGBA surface of the frame, detections: FrameDetections of the frame (may be reused after the call),
+    # pts: buffer pts of the frame (only needed when the recorder keeps the history encoded)
+    def process_frame(self, stream_no, frame_number, frame, detections, pts=None):
+        timer = self.stage_timer
+        t0 = timer.now()
+
+        # plates of the frame assigned to the cars, once per frame: the crops are taken here, the assignment goes
+        # to the analytics with the frame
+        plate_bboxes = self.lpr.link_plates(detections) if self.lpr else None
+
+        # convert the RGBA surface straight into the next slot of the frame buffer (a ring slot, or a
+        # staging slot when the buffer is compressed) -> no per-frame allocation
+        # -> only for the frames the buffer needs
+        frame_copy = None
+        # -> every class of the detector is a vehicle or a part of one: a frame with detections holds vehicles
+        if self.buffered_streams[stream_no] and self.recorder.needs_frame(stream_no, frame_number, len(detections) > 0):
+            slot = self.recorder.next_buffer_slot(stream_no)
+            if frame.shape[:2] == slot.shape[:2]:
+                frame_copy = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR, dst=slot)
+                self.recorder.commit_buffer(stream_no, frame_number)
+            else:
+                frame_copy = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+                self.recorder.update_buffer(frame_copy, stream_no, frame_number)
+            self.copied_bytes[stream_no] += frame_copy.nbytes
+        if self.encoded_recording:
+            self.recorder.note_frame_pts(stream_no, frame_number, pts)
+        t0 = timer.lap(stream_no, 'frame_copy', t0)
+
+        if self.capture is not None:
+            self.capture.write(stream_no, frame_number, detections)
+
+        # pixels of the frame the analytics need: the converted frame if there is one and it can be held on to,
+        # otherwise just the plate crops (from the converted frame, or straight from the RGBA surface)
+        pixels = FramePixels(frame_copy if self.analytics_full_frames else None)
+        if self.plate_pixels and pixels.full is None:
+            src = frame_copy if frame_copy is not None else frame
+            for rect in self.lpr.pixel_demand(plate_bboxes):
+                self.copied_bytes[stream_no] += pixels.add_crop(src, rect)
+        t0 = timer.lap(stream_no, 'crops', t0)
+
+        if self.analytics is not None:
+            # the columns are reused by the next batch -> the worker gets its own copy
+            self.analytics[stream_no].submit(frame_number, stream_no, frame_number, detections.copy(), pixels, plate_bboxes)
+            timer.lap(stream_no, 'submit', t0)
+        else:
+            self.analyze_frame(stream_no, frame_number, detections, pixels, plate_bboxes)
+
+    # per frame analytics: plate recognition, mobile / seatbelt violation detection and recording, event recordings
+    # -> called from process_frame, or from the analytics worker of the stream when ANALYTICS.ASYNC is set
+    # -> pixels: FramePixels of the frame, plate_bboxes: the plates assigned to the cars (PlateRecognition.link_plates)
+    # -> the stages are timed on the thread running them: with ANALYTICS.ASYNC the tail latencies show the
+    #    contention of the analytics workers with the probe and the recorder threads
+    def analyze_frame(self, stream_no, frame_number, detections, pixels, plate_bboxes=None):
+        timer = self.stage_timer
+        t0 = timer.now()
+        v_slots = []
+
+        ## TODO Man these loopies are killing me, Take sometime out and fix it
+        # list comprehension is trendy but its a loop, get rid of em
+        if self.lpr:
+             # TODO too many loops fix this for performance this is n^2 at least #
+            v_slots = self.lpr.update(detections, stream_no, frame_number, pixels, plate_bboxes)
+            t0 = timer.lap(stream_no, 'plate_matching', t0)
+
+        if stream_no == self.MS_VIOLATION_STREAM:
+            # perform violation detection using object of current frame
+            violations = self.ms_viol_detector.detect(v_slots, detections, stream_no, frame_number, pixels)
+            t0 = timer.lap(stream_no, 'violation_detection', t0)
+
+            # record violations (if any)
+            self.recorder.record_mobile(violations, stream_no, frame_number)
+            t0 = timer.lap(stream_no, 'violation_recording', t0)
+            '''
+        
+            # TODO: make this executed only if based on udp message received from UI
+            if len(violations) > 0:
+                for v in violations:
+                    if v.mobile_detected:
+                        v.violation_type = 'mobile'
+                    else:
+                        v.violation_type = 'seatbelt'
+                    connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+                    channel = connection.channel()
+                    #channel.queue_declare(queue=queue_name)
+                    channel.basic_publish(exchange='', routing_key='events_queue', body=json.dumps({'event_id': v.violation_id, 'event_violation_type': v.violation_type}))
+                    connection.close()
+            '''
+
+            if violations and self.on_violations is not None:
+                self.on_violations(stream_no, frame_number, violations)
+
+        # Event Recording functions are called here #
+        # make it more elegant?
+        self.recorder.update_recording_events(frame_number)
+        timer.lap(stream_no, 'events', t0)
+
+    # bytes per second copied out of the RGBA surfaces per stream since the last call
+    def pixel_rates(self):
+        now = time.monotonic()
+        elapsed = max(now - self.copied_since, 1e-6)
+        rates = [copied / elapsed for copied in self.copied_bytes]
+        self.copied_bytes = [0] * self.num_sources
+        self.copied_since = now
+        return rates
+
+    # process the frames still queued and stop the analytics workers, then the OCR pool
+    def stop(self, timeout=None):
+        if self.analytics is not None:
+            for worker in self.analytics:
+                worker.stop(timeout)
+        if self.lpr is not None:
+            self.lpr.stop(timeout)
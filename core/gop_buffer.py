@@ -0,0 +1,143 @@
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+
+
+# one encoded access unit (i.e. one encoded frame) as it leaves the parser of the recording encoder
+class AccessUnit(object):
+    __slots__ = ('data', 'pts', 'frame_num', 'keyframe')
+
+    def __init__(self, data, pts, frame_num, keyframe):
+        self.data = data            # byte-stream (Annex B) access unit; keyframes carry VPS/SPS/PPS
+        self.pts = pts              # presentation timestamp (ns), same as the pts of the raw frame
+        self.frame_num = frame_num  # nvstreammux frame_num of the frame
+        self.keyframe = keyframe
+
+
+# Ring of encoded access units per stream, fed by an appsink branch off the raw recording encoder
+# -> the ring always starts with a keyframe: when it grows beyond max_frames the oldest WHOLE GOP is dropped
+# -> every access unit must reach push(), a GOP missing one can not be decoded past it: the appsink branch
+#    feeding the buffer is not leaky, a unit that is lost anyway (drop_gop) discards its whole GOP
+# -> violation / event clips are produced by remuxing the buffered GOPs, no decode or re-encode
+class EncodedFrameBuffer(object):
+
+    def __init__(self, stream_count, max_frames, fps):
+        self.max_frames = max_frames
+        self.fps = fps
+
+        self.units = []       # deque of AccessUnit per stream
+        self.locks = []       # units are pushed from the appsink thread and read from the probe thread,
+                              #   pts_map is filled by the tiler probe thread and read by the appsink thread
+        self.pts_map = []     # pts -> frame_num noted by the tiler probe
+        self.last_fi = []     # frame_num of the last pushed unit
+        self.resync = []      # True while the units up to the next keyframe are discarded (see drop_gop)
+        for i in range(stream_count):
+            self.units.append(deque())
+            self.locks.append(threading.Lock())
+            self.pts_map.append(dict())
+            self.last_fi.append(-1)
+            self.resync.append(False)
+
+        # gops_evicted: oldest GOPs dropped to keep max_frames; gops_dropped: GOPs discarded because a unit was lost
+        self.stats = {'gops_evicted': 0, 'gops_dropped': 0}
+
+    # called by the tiler probe for every frame -> lets us tag the encoded unit with the frame_num of the frame
+    def note_frame(self, stream_no, frame_num, pts):
+        pts_map = self.pts_map[stream_no]
+        with self.locks[stream_no]:
+            pts_map[pts] = frame_num
+            # the encoder never lags this much behind; drop the oldest entries (dicts keep insertion order)
+            while len(pts_map) > 2 * self.fps:
+                del pts_map[next(iter(pts_map))]
+
+    # called from the appsink callback for every encoded access unit
+    def push(self, stream_no, data, pts, keyframe):
+        units = self.units[stream_no]
+        with self.locks[stream_no]:
+            # the unit may reach us before the probe has seen its frame -> continue the numbering
+            frame_num = self.pts_map[stream_no].pop(pts, None)
+            if frame_num is None:
+                frame_num = self.last_fi[stream_no] + 1
+            self.last_fi[stream_no] = frame_num
+
+            # a clip must start at a keyframe, so we never keep the tail of a GOP
+            if keyframe:
+                self.resync[stream_no] = False
+            elif not units or self.resync[stream_no]:
+                return
+            units.append(AccessUnit(data, pts, frame_num, keyframe))
+
+            # drop the oldest GOP(s)
+            while len(units) > self.max_frames:
+                units.popleft()
+                while units and not units[0].keyframe:
+                    units.popleft()
+                self.stats['gops_evicted'] += 1
+
+    # an access unit of the stream has been lost (e.g. its buffer could not be mapped) -> the GOP being received
+    # can not be decoded past it: discard it and the next units up to the next keyframe
+    def drop_gop(self, stream_no):
+        units = self.units[stream_no]
+        with self.locks[stream_no]:
+            if self.resync[stream_no]:
+                return
+            self.resync[stream_no] = True
+            while units and not units[-1].keyframe:
+                units.pop()
+            if units:
+                units.pop()
+            self.stats['gops_dropped'] += 1
+
+    # we need to return the units of frame no = violation_fi - length / 2 up to violation_fi + length / 2,
+    # starting at the keyframe at or before the first of them
+    def get_units(self, stream_no, violation_fi, current_fi, length):
+        start_fi = violation_fi - length / 2
+        end_fi = violation_fi + length / 2
+
+        with self.locks[stream_no]:
+            units = list(self.units[stream_no])
+
+        if not units:
+            return []
+
+        if units[0].frame_num > start_fi:
+            print (f'[get_units] Not enough frames for violation fi to be in the middle vfi={violation_fi}, sfi={start_fi}, ffi={units[0].frame_num}')
+
+        # units are in decoding order and there are no B-frames, so frame_num is increasing within the ring
+        first = 0
+        for i, unit in enumerate(units):
+            if unit.frame_num > start_fi:
+                break
+            if unit.keyframe:
+                first = i
+
+        return [unit for unit in units[first:] if unit.frame_num <= end_fi]
+
+    def length(self, stream_no):
+        return len(self.units[stream_no])
+
+    def nbytes(self):
+        return sum(len(unit.data) for units in self.units for unit in list(units))
+
+
+# the clips of the encoded buffer are remuxed by the ffmpeg binary -> fail at startup, not at the first violation
+def check_ffmpeg():
+    if shutil.which('ffmpeg') is None:
+        raise RuntimeError('ffmpeg not found in PATH, it is needed to remux the clips of FRAME_BUFFER.MODE: gop')
+
+
+# remux encoded access units (H.265 byte-stream) into an MP4 / MKV file without re-encoding
+def remux_clip(units, path, fps, codec='hevc'):
+    if not units:
+        logging.error(f'[remux_clip] No encoded frames to write to {path}')
+        return False
+
+    cmd = ['ffmpeg', '-loglevel', 'error', '-y', '-f', codec, '-framerate', str(fps), '-i', 'pipe:0', '-c', 'copy', path]
+    ret = subprocess.run(cmd, input=b''.join(unit.data for unit in units))
+    if ret.returncode != 0:
+        logging.error(f'[remux_clip] ffmpeg failed to write {path}: {ret.returncode}')
+        return False
+
+    return True
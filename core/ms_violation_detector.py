@@ -3,11 +3,13 @@ import logging
 import cv2
 
 from datetime import datetime
+import numpy as np
 from easydict import EasyDict as edict
 from shapely import geometry
 
 import core.detection_object as do
 from utils.draw import draw_box
+from utils.bbox import box_contains, box_area
 
 class MSViolationDetector(object):
     """Implements mobile / seatbelt violation detections"""
@@ -139,9 +141,17 @@ class MSViolationDetector(object):
     #     return objects, st_wheels
 
     # perform mobile / seatbelt violation detection using the detections object of current frame
-    def detect(self, v_slots, viol_objects, st_wheels, stream_no, fi, frame):
+    # -> detections: FrameDetections of the current frame (columns, see core.detection_object)
+    def detect(self, v_slots, detections, stream_no, fi, frame):
         # get current timestamp formatted as string 
         timestamp = datetime.now().strftime("%Y%m%d.%H%M%S.%f")[:-3]
+
+        # rows of the belt / no belt / mobile and steering wheel detections
+        viol_objects = detections.rows(*do.VIOLATION_CLASSES)
+        st_wheels = detections.rows(do.STEERING_WHEEL)
+        boxes = detections.boxes
+        processed = np.zeros(len(detections), dtype=bool)  # viol. object already examined for some vehicle
+        assigned = np.zeros(len(detections), dtype=bool)   # st. wheel already assigned to some vehicle
       
         # ---- we process all vehicles looking for detections
         # - We consider only vehicles having slots updated during current frame AND not yet returned as violations
@@ -192,36 +202,39 @@ class MSViolationDetector(object):
                 # STEERING WHEEL DETECTION
                 # --- we find the steering wheel of the vehicle (if anyone is detected); 
                 # already assigned steering wheels are skipped
-                for sw in [sw for sw in st_wheels if not sw.assigned]:
+                for sw in st_wheels:
+                    if assigned[sw]:
+                        continue
+                    sw_bbox = boxes[sw]
                     # steering wheel must be completely inside the vehicle
-                    if v_poly.contains(sw.bbox):                        
-                        if not v_slot.st_wheel:
+                    if box_contains(v_poly, sw_bbox):                        
+                        if v_slot.st_wheel is None:
                             # vehicle slot st. wheel is none so far -> add this one
                             v_slot.st_wheel = sw
-                            sw.assigned = True
+                            assigned[sw] = True
                         else:
                             # vehicle slot already contains st. wheel -> find best between matches
-                            vminx, vminy, vmaxx, vmaxy = v_slot.st_wheel.bbox.bounds
-                            dminx, dminy, dmaxx, dmaxy = sw.bbox.bounds
+                            vminx, vminy, vmaxx, vmaxy = boxes[v_slot.st_wheel]
+                            dminx, dminy, dmaxx, dmaxy = sw_bbox
 
                             # take the st. wheel that is on the right side
                             if dminx > vmaxx + 50:
-                                v_slot.st_wheel.assigned = False # un-assign previous st. wheel object
+                                assigned[v_slot.st_wheel] = False # un-assign previous st. wheel object
                                 v_slot.st_wheel = sw 
-                                sw.assigned = True
+                                assigned[sw] = True
                             elif vminx > dmaxx + 50:
                                 continue
                             # we have two st. wheels inside same vehicle; none of them is completely on the right
                             # so we prefer the one with the biggest area (in case his score is bigger than 50%)
-                            elif sw.score > 0.5 and sw.bbox.area > v_slot.st_wheel.bbox.area:
-                                v_slot.st_wheel.assigned = False # un-assign previous st. wheel object
+                            elif detections.score[sw] > 0.5 and box_area(sw_bbox) > box_area(boxes[v_slot.st_wheel]):
+                                assigned[v_slot.st_wheel] = False # un-assign previous st. wheel object
                                 v_slot.st_wheel = sw 
-                                sw.assigned = True
+                                assigned[sw] = True
 
                 # steering wheel has been detected
                 #  -> get coordinates of vehicle's steering wheel bbox    
-                if v_slot.st_wheel:                    
-                    sw_minx, sw_miny, sw_maxx, sw_maxy = v_slot.st_wheel.bbox.bounds    
+                if v_slot.st_wheel is not None:                    
+                    sw_minx, sw_miny, sw_maxx, sw_maxy = boxes[v_slot.st_wheel].tolist()
 
                     # # DEBUG ONLY: draw st. wheel bbox with the related vehicle ID               
                     # if fi % 6 == 0:                                   
@@ -242,7 +255,7 @@ class MSViolationDetector(object):
                 for obj in viol_objects:
                     #print("stage 1 done")
                     # skip viol object if it was processed for some other vehicle
-                    if obj.processed:
+                    if processed[obj]:
                         continue
                     # check if poly is inside the current vehicle
                     #elif obj.bbox.intersection(v_poly).area / obj.bbox.area < 0.9:
@@ -250,18 +263,21 @@ class MSViolationDetector(object):
 
                     #print("stage 2", obj.class_id, obj.score)
                     # set flag so that the same object will not be examined again
-                    obj.processed = True
+                    processed[obj] = True
                     
-                    # get object's bbox coordinates
-                    pminx, pminy, pmaxx, pmaxy = obj.bbox.bounds  
+                    # get object's class, score, bbox coordinates
+                    obj_class_id = detections.class_id[obj]
+                    obj_score = detections.score[obj]
+                    obj_bbox = detections.bbox(obj)
+                    pminx, pminy, pmaxx, pmaxy = obj_bbox
                     
 
-                    if obj.class_id == do.MOBILE and not v_slot.mobile_detected:    
+                    if obj_class_id == do.MOBILE and not v_slot.mobile_detected:    
                         print("mobile phone detected")         
                         # if mobile phone detection is high enough and it's bbox is on the driver's side 
                         #   -> we have detection!
                         # CAUTION: Factor 0.3 may need to be adjusted for different camera angle
-                        if obj.score >= self.MOBILE_CONF_THRES and pmaxx > sw_minx - (sw_maxx - sw_minx) * 0.3:
+                        if obj_score >= self.MOBILE_CONF_THRES and pmaxx > sw_minx - (sw_maxx - sw_minx) * 0.3:
                             v_slot.mobile_violations += 1 
                             print("mobile phone detected on driver side")
 
@@ -270,21 +286,21 @@ class MSViolationDetector(object):
                                 v_slot.mobile_detected = True
                                 v_slot.mobile_det_timestamp = timestamp
                                 v_slot.mobile_det_fi = fi  
-                                v_slot.mobile_bbox = obj.bbox                                          
+                                v_slot.mobile_bbox = obj_bbox                                          
                                 #v_slot.violation_img = frame.copy()
                                 
                                 print(f'[V] Mobile phone detected {timestamp}, VID: {v_slot.id}, Stream: {stream_no}, FI: {fi}')                                  
             
                     # we consider belt / no belt detection only if score is above corresponding threshold
-                    elif (obj.class_id == do.NO_BELT and obj.score >= self.NOBELT_CONF_THRES) or (obj.class_id == do.BELT and obj.score >= self.BELT_CONF_THRES):
+                    elif (obj_class_id == do.NO_BELT and obj_score >= self.NOBELT_CONF_THRES) or (obj_class_id == do.BELT and obj_score >= self.BELT_CONF_THRES):
                         
                         # --> p.class_name in ['no belt', 'belt']
                         # check if object is the driver or not 
                         #   --> construct shapely polygon by extending the bbox to the bottom
-                        obj_poly = geometry.Polygon([(pminx, pmaxy + 20), (pminx, pminy), (pmaxx, pminy), (pmaxx, pmaxy + 20)])
+                        #obj_poly = geometry.Polygon([(pminx, pmaxy + 20), (pminx, pminy), (pmaxx, pminy), (pmaxx, pmaxy + 20)])
                                                
-                        if 1: #obj_poly.intersects(v_slot.st_wheel.bbox):
-                            if obj.class_id == do.NO_BELT:                             
+                        if 1: #obj_poly.intersects(geometry.box(*boxes[v_slot.st_wheel])):
+                            if obj_class_id == do.NO_BELT:                             
                                 v_slot.nobelt_driver += 1
 
                                 print (f'vehile id = {v_slot.id}, v_slot.nobelt_driver = {v_slot.nobelt_driver}', fi)
@@ -292,7 +308,7 @@ class MSViolationDetector(object):
                                 if not v_slot.nobelt_driver_fi:
                                     v_slot.nobelt_driver_fi = fi
                                     v_slot.nobelt_driver_timestamp = timestamp  
-                                    v_slot.nobelt_bbox = obj.bbox                                   
+                                    v_slot.nobelt_bbox = obj_bbox                                   
                                     #v_slot.nobelt_driver_image = frame.copy()
                             else:
                                 v_slot.nobelt_driver -= 1             
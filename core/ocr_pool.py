@@ -0,0 +1,105 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+
+# Fixed size pool of threads running the plate recognition jobs (crop saving / OCR) of every stream,
+# fed by the analytics threads through one bounded queue
+# -> jobs are keyed by (stream, track id): a track with a job still queued is not queued again (deduplicated)
+# -> submit() never blocks: when the queue is full the new job is dropped, the track is submitted again with
+#    one of its next frames
+# -> the jobs return nothing: the vehicle tracks are only ever touched by the analytics thread of their stream
+class OcrPool(object):
+
+    def __init__(self, job_fn, workers=2, max_size=32):
+
+        self.job_fn = job_fn    # called as job_fn(*args) for every job
+        self.max_size = max_size
+
+        self.queue = OrderedDict()   # (stream, track id) -> (enqueue time ns, args)
+        self.cond = threading.Condition()
+        self.running = True
+        self.busy = 0
+
+        self.stats_lock = threading.Lock()
+        self.stats = {'submitted': 0, 'processed': 0, 'deduplicated': 0, 'dropped': 0, 'failed': 0}
+        self.wait_ns = 0
+        self.max_wait_ns = 0
+        self.waited = 0
+
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, name=f'ocr-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    # queue a job for the track; returns True if it has been queued, False if deduplicated or dropped
+    def submit(self, stream_no, track_id, *args):
+        key = (stream_no, track_id)
+        with self.cond:
+            if key in self.queue:
+                stat = 'deduplicated'
+            elif len(self.queue) >= self.max_size:
+                stat = 'dropped'
+            else:
+                self.queue[key] = (time.monotonic_ns(), args)
+                self.cond.notify()
+                stat = 'submitted'
+
+        with self.stats_lock:
+            self.stats[stat] += 1
+
+        return stat == 'submitted'
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                (stream_no, track_id), (t_enqueued, args) = self.queue.popitem(last=False)
+                self.busy += 1
+
+            wait_ns = time.monotonic_ns() - t_enqueued
+            try:
+                self.job_fn(*args)
+            except Exception:
+                logging.exception(f"[OcrPool] Stream {stream_no}: job of track {track_id} failed")
+                with self.stats_lock:
+                    self.stats['failed'] += 1
+
+            with self.cond:
+                self.busy -= 1
+            with self.stats_lock:
+                self.stats['processed'] += 1
+                self.wait_ns += wait_ns
+                self.max_wait_ns = max(self.max_wait_ns, wait_ns)
+                self.waited += 1
+
+    # counters since the start, not reset
+    def counters(self):
+        with self.stats_lock:
+            counters = dict(self.stats)
+        counters['queued'] = len(self.queue)
+        counters['busy'] = self.busy
+        return counters
+
+    # queue metrics; the queue wait times are reset by every call
+    #   wait_ms / max_wait_ms: mean / max time a job waited in the queue
+    def metrics(self):
+        metrics = self.counters()
+        with self.stats_lock:
+            metrics['wait_ms'] = round(self.wait_ns / self.waited / 1e6, 2) if self.waited else 0.0
+            metrics['max_wait_ms'] = round(self.max_wait_ns / 1e6, 2)
+            self.wait_ns = self.max_wait_ns = self.waited = 0
+        return metrics
+
+    # run the jobs still queued, then stop the threads
+    def stop(self, timeout=None):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
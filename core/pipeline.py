@@ -27,6 +27,9 @@ from gi.repository import GObject, GstRtspServer, Gst, GLib
 
 import core.detection_object as do
 from utils.FPS import PERF_DATA
+from utils.stage_timer import create_stage_timer
+from utils.metrics_server import Metric, MetricsServer
+from utils.image_writer import get_image_writer
 from utils.bbox import rect_params_to_coords
 from core.bus_call import bus_call
 from core.uri_bin_callbacks import cb_newpad, decodebin_child_added
@@ -36,6 +39,8 @@ from core.violation_recorder import ViolationRecorder
 from core.ms_violation_detector import MSViolationDetector
 from core.api_interface import APIInterface
 from core.queue_reader import QueueReader
+from core.frame_processor import FrameProcessor
+from core.replay import DetectionCapture
 
 
 
@@ -70,15 +75,21 @@ class Pipeline(object):
         self.source_uris = cfg.VIDEO_SOURCES
         self.is_live = True
         # self.is_live = any("rtsp" in s for s in self.source_uris)  # set to true if a least one of the sources is a live stream
-        self.perf_data = PERF_DATA(self.num_sources)
+        # per stage latency of the probes (no-op unless PERF.STAGE_TIMING is set)
+        self.stage_timer = create_stage_timer(cfg.get('PERF') or {})
+        self.perf_data = PERF_DATA(self.num_sources, self.stage_timer)
         
+        # image writer shared by plate recognition and the recorder
+        self.image_writer = get_image_writer(cfg.VIDEO_OUTPUT.get('IMAGE_WRITER'))
+
         self.lpr = None
 
         api_interface = APIInterface(cfg, configs_dir)
         if options.anpr == 'CAR':
             self.lpr = PlateRecognition(configs_dir, cfg.VIDEO_OUTPUT.LPR_FOLDER,
                                         len(cfg.VIDEO_SOURCES), int(cfg.VIDEO_OUTPUT.MUXER.WIDTH),
-                                        int(cfg.VIDEO_OUTPUT.MUXER.HEIGHT), api_interface, anpr = cfg.ANPR_ENABLE)
+                                        int(cfg.VIDEO_OUTPUT.MUXER.HEIGHT), api_interface, anpr = cfg.ANPR_ENABLE,
+                                        ocr_cfg=cfg.DETECTIONS.OCR)
 
         self.ms_viol_detector = MSViolationDetector()
 
@@ -97,6 +108,18 @@ class Pipeline(object):
         # Initialize API Interface
         
         self.recorder = ViolationRecorder(cfg, len(cfg.VIDEO_SOURCES), api_interface)
+
+        # when the recorder keeps the pre-event history encoded, the encoder of the raw recordings
+        # must run (and feed it) even if recording / streaming is off
+        self.encoded_recording = self.recorder.encoded_buffer is not None
+
+        # per frame work of the tiler probe (frame buffering, pixel copies, analytics)
+        self.capture = None
+        if (cfg.get('PERF') or {}).get('CAPTURE_DETECTIONS'):
+            self.capture = DetectionCapture(cfg.PERF.CAPTURE_DETECTIONS)
+        self.processor = FrameProcessor(cfg, self.num_sources, self.lpr, self.ms_viol_detector, self.recorder,
+                                        self.stage_timer, self.capture)
+        self.analytics = self.processor.analytics
         self.output_video_path_list = []
         self.record_path = []
         output_folder = os.path.join(output_dir, datetime.now().strftime("%Y%m%d"))
@@ -160,6 +183,14 @@ class Pipeline(object):
         events_consumer.recorder = self.recorder
         self.events_consumer_thread = Thread(target=events_consumer.start, daemon=True).start()
 
+        # Prometheus metrics endpoint, if configured
+        perf_cfg = cfg.get('PERF') or {}
+        self.metrics_server = None
+        if int(perf_cfg.get('METRICS_PORT', 0)) > 0:
+            self.metrics_server = MetricsServer(self.collect_metrics, int(perf_cfg.METRICS_PORT),
+                                                str(perf_cfg.get('METRICS_HOST', '127.0.0.1')))
+            self.metrics_server.start()
+
     def _create_elements(self):
         # create all source bins
         for i in range(self.num_sources):
@@ -210,8 +241,8 @@ class Pipeline(object):
         else:
             self.sink_bin = self._create_element("fakesink", "fakesink", "Sink")
 
-        # Create necessary elements for recording and RTSP streaming
-        if self.record or self.to_stream :
+        # Create necessary elements for recording, RTSP streaming and the encoded pre-event buffer
+        if self.record or self.to_stream or self.encoded_recording:
             self.queue7 = self._create_element("queue", "queue7", "Queue 7", add=False)
             self.demuxer = self._create_element("nvstreamdemux", "demuxer", "Demuxer", add=False)
 
@@ -301,6 +332,9 @@ class Pipeline(object):
         encoder = self._create_element("nvv4l2h265enc", "h264encoder", "h264 encoder", add=False)
         bitrate = 4000000
         encoder.set_property('bitrate', bitrate)
+        if self.encoded_recording:
+            # one GOP per second -> violation / event clips can be cut from the encoded buffer with 1 sec granularity
+            encoder.set_property('iframeinterval', self.recorder.fps)
         if is_aarch64():
             encoder.set_property('preset-level', 1)
             encoder.set_property('insert-sps-pps', 1)
@@ -313,7 +347,7 @@ class Pipeline(object):
         h264_sink_bin.add(parser)  
         self._link_sequential([queue_record, nvvidconv3, capsfilter2, encoder, parser])
         
-        if self.record and self.to_stream:
+        if int(self.record) + int(self.to_stream) + int(self.encoded_recording) > 1:
             tee = self._create_element("tee", "recordstreamtee",
                                     "Tee to crate stream and record pipes", add=False)
             h264_sink_bin.add(tee)
@@ -391,8 +425,55 @@ class Pipeline(object):
             self.server.get_mount_points().add_factory(rtsp_mount_point_str, factory)
             print('************')
             print("RTSP: ", rtsp_mount_point_str)
-            
+
+        if self.encoded_recording:
+            # appsink branch feeding the encoded pre-event buffer of the recorder
+            # -> a second parser converts to byte-stream and repeats VPS/SPS/PPS before every keyframe,
+            #    so that every buffered GOP can be remuxed on its own
+            # -> not leaky: a dropped delta unit would corrupt the rest of its GOP; the appsink callback only
+            #    appends to the buffer, which drops whole GOPs itself (EncodedFrameBuffer)
+            queue_gop = self._create_element("queue", "queue-gop", "Queue of encoded buffer", add=False)
+            parser_gop = self._create_element("h265parse", "h265-parse-gop", "Parser of encoded buffer", add=False)
+            parser_gop.set_property("config-interval", -1)
+            caps_gop = self._create_element("capsfilter", "caps-gop", "Caps of encoded buffer", add=False)
+            caps_gop.set_property("caps", Gst.Caps.from_string("video/x-h265, stream-format=byte-stream, alignment=au"))
+            appsink = self._create_element("appsink", "appsink-gop", "Appsink of encoded buffer", add=False)
+            appsink.set_property("emit-signals", True)
+            appsink.set_property("sync", False)
+            appsink.connect("new-sample", self._on_encoded_sample, index)
+
+            h264_sink_bin.add(queue_gop)
+            h264_sink_bin.add(parser_gop)
+            h264_sink_bin.add(caps_gop)
+            h264_sink_bin.add(appsink)
+
+            if tee:
+                self._link_sequential([tee, queue_gop, parser_gop, caps_gop, appsink])
+            else:
+                self._link_sequential([parser, queue_gop, parser_gop, caps_gop, appsink])
+
         return h264_sink_bin
+
+    # appsink callback: push every encoded access unit of the stream into the encoded buffer of the recorder
+    def _on_encoded_sample(self, appsink, stream_no):
+        sample = appsink.emit("pull-sample")
+        if sample is None:
+            return Gst.FlowReturn.OK
+
+        gst_buffer = sample.get_buffer()
+        ok, map_info = gst_buffer.map(Gst.MapFlags.READ)
+        if not ok:
+            logging.error(f"Unable to map encoded buffer of stream {stream_no}, dropping its GOP")
+            self.recorder.drop_encoded_gop(stream_no)
+            return Gst.FlowReturn.OK
+        try:
+            data = bytes(map_info.data)
+        finally:
+            gst_buffer.unmap(map_info)
+
+        keyframe = not gst_buffer.has_flags(Gst.BufferFlags.DELTA_UNIT)
+        self.recorder.update_encoded_buffer(data, stream_no, gst_buffer.pts, keyframe)
+        return Gst.FlowReturn.OK
         
     @staticmethod
     def _link_sequential(elements: list):
@@ -420,7 +501,7 @@ class Pipeline(object):
         # link the rest of the elements
         self._link_sequential(self.elements[self.num_sources:])
                 
-        if self.record == True or self.to_stream == True:
+        if self.record == True or self.to_stream == True or self.encoded_recording:
             for i in range(self.num_sources):
                 # get src pad of demuxer element
                 padname = "src_%u" %i
@@ -449,6 +530,9 @@ class Pipeline(object):
             tiler_sink_pad.add_probe(Gst.PadProbeType.BUFFER, self._wrap_probe(self.tiler_sink_pad_buffer_probe))
             # perf callback function to print fps every 5 sec
             GLib.timeout_add(5000, self.perf_data.perf_print_callback)
+            GLib.timeout_add(5000, self.pixels_print_callback)
+            if self.analytics is not None:
+                GLib.timeout_add(5000, self.analytics_print_callback)
 
     def __str__(self):
         return " -> ".join([elm.name for elm in self.elements])
@@ -724,7 +808,11 @@ class Pipeline(object):
 
         return h264_sink_bin
       
-    def _probe_fn_wrapper(self, _, info, probe_fn, get_frames=False):
+    # dets: DetectionArrays filled with the objects of the batch instead of the per frame lists of NvDsObjectMeta
+    #       (probe functions having a 'dets' parameter)
+    def _probe_fn_wrapper(self, _, info, probe_fn, get_frames=False, dets=None):
+        timer = self.stage_timer
+        t_start = timer.now()
         gst_buffer = info.get_buffer()
         if not gst_buffer:
             logging.error("Unable to get GstBuffer")
@@ -735,6 +823,8 @@ class Pipeline(object):
         ll_obj_meta = []
         batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
         l_frame = batch_meta.frame_meta_list
+        if dets is not None:
+            dets.begin_batch()
         while l_frame is not None:
             try:
                 frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
@@ -747,6 +837,8 @@ class Pipeline(object):
 
             l_frame_meta.append(frame_meta)
             l_obj_meta = []
+            if dets is not None:
+                dets.begin_frame()
 
             l_obj = frame_meta.obj_meta_list
             while l_obj is not None:
@@ -755,30 +847,43 @@ class Pipeline(object):
                 except StopIteration:
                     break
 
-                l_obj_meta.append(obj_meta)
+                if dets is not None:
+                    dets.add(obj_meta)
+                else:
+                    l_obj_meta.append(obj_meta)
 
                 try:
                     l_obj = l_obj.next
                 except StopIteration:
                     break
 
-            ll_obj_meta.append(l_obj_meta)
+            if dets is not None:
+                dets.end_frame()
+            else:
+                ll_obj_meta.append(l_obj_meta)
 
             try:
                 l_frame = l_frame.next
             except StopIteration:
                 break
 
+        objs = dets if dets is not None else ll_obj_meta
+        t0 = timer.lap('batch', 'metadata', t_start)
         if get_frames:
-            probe_fn(frames, batch_meta, l_frame_meta, ll_obj_meta)
+            probe_fn(frames, batch_meta, l_frame_meta, objs)
         else:
-            probe_fn(batch_meta, l_frame_meta, ll_obj_meta)
+            probe_fn(batch_meta, l_frame_meta, objs)
+        timer.lap('batch', probe_fn.__name__, t0)
+        timer.lap('batch', 'total', t_start)
 
         return Gst.PadProbeReturn.OK
 
     def _wrap_probe(self, probe_fn):
-        get_frames = "frames" in signature(probe_fn).parameters # True if frames is included in the signature of the probe function
-        return partial(self._probe_fn_wrapper, probe_fn=probe_fn, get_frames=get_frames)
+        params = signature(probe_fn).parameters
+        get_frames = "frames" in params # True if frames is included in the signature of the probe function
+        # probe functions with a 'dets' parameter get the detections as columns (one DetectionArrays per probe)
+        dets = do.DetectionArrays() if "dets" in params else None
+        return partial(self._probe_fn_wrapper, probe_fn=probe_fn, get_frames=get_frames, dets=dets)
 
     # we use this probe to filter out bboxes placed on the top 1/3 of the viewport
     def tracker_sink_pad_buffer_probe(self, batch_meta, l_frame_meta: List, ll_obj_meta: List[List]):
@@ -794,9 +899,9 @@ class Pipeline(object):
                     pyds.nvds_remove_obj_meta_from_frame(frame_meta, obj_meta)
 
     
-    def tiler_sink_pad_buffer_probe(self, frames, batch_meta, l_frame_meta: List, ll_obj_meta: List[List]):
+    def tiler_sink_pad_buffer_probe(self, frames, batch_meta, l_frame_meta: List, dets):
         #return
-        for frame_meta, frame, l_obj_meta in zip(l_frame_meta, frames, ll_obj_meta):
+        for frame_idx, (frame_meta, frame) in enumerate(zip(l_frame_meta, frames)):
             # peformance data for FPS
             stream_no = frame_meta.pad_index
             stream_index = "stream{0}".format(stream_no)
@@ -811,63 +916,13 @@ class Pipeline(object):
             #TODO ======================================================================
 
 
-            #TODO find a better way to do this, i.e. record previous frames
-            frame_copy = np.array(frame, copy=True, order='C')
-            frame_copy = cv2.cvtColor(frame_copy, cv2.COLOR_RGBA2BGR)
+            # detections of the frame as columns (views into the DetectionArrays of the batch)
+            # -> buffering, pixel copies and analytics, see FrameProcessor
+            self.processor.process_frame(stream_no, frame_number, frame, dets.frame(frame_idx), frame_meta.buf_pts)
             # if frame_number % 30 == 0:
             #     timestamp = datetime.now().strftime("%Y%m%d.%H%M%S.%f")
             #     img_filename = os.path.join('save_img', timestamp + '.png')
             #     cv2.imwrite(img_filename, frame_copy)
-            self.recorder.update_buffer(frame_copy, stream_no, frame_number)
-            #TODO ==========================================================
-
-            detections = []
-            for obj_meta in l_obj_meta:
-                minx, miny, maxx, maxy = rect_params_to_coords(obj_meta.rect_params)
-                #if obj_meta.class_id != do.PLATE:
-                #   pyds.nvds_remove_obj_meta_from_frame(frame_meta, obj_meta)
-                #else:
-                detections.append(do.get_detection_from_meta(obj_meta))
-                
-                #if maxy < self.cfg.VIDEO_OUTPUT.MUXER.HEIGHT / 3: # TODO:instead of this hardcoded, draw zones and use it                              
-                #    # https://forums.developer.nvidia.com/t/function-nvds-remove-obj-meta-from-frame-in-python/111512
-                #    pyds.nvds_remove_obj_meta_from_frame(frame_meta, obj_meta) 
-                #    pass
-                #else:
-                #    detections.append(do.get_detection_from_meta(obj_meta))
-               
-            ## TODO Man these loopies are killing me, Take sometime out and fix it
-            # list comprehension is trendy but its a loop, get rid of em
-            if self.lpr:   
-                 # TODO too many loops fix this for performance this is n^2 at least #
-                v_slots = self.lpr.update(detections, stream_no, frame_number, frame_copy)
-            
-            if stream_no == 1: # rear center camera
-                # perform violation detection using object of current frame
-                viol_objs = [v for v in detections if v.class_id in [do.BELT, do.NO_BELT, do.MOBILE]]
-                st_wheels = [stw for stw in detections if stw.class_id == do.STEERING_WHEEL]
-                violations = self.ms_viol_detector.detect(v_slots, viol_objs, st_wheels, stream_no, frame_number, frame_copy)
-            
-                # record violations (if any)
-                self.recorder.record_mobile(violations, stream_no, frame_number)
-                '''
-            
-                # TODO: make this executed only if based on udp message received from UI
-                if len(violations) > 0:
-                    for v in violations:
-                        if v.mobile_detected:
-                            v.violation_type = 'mobile'
-                        else:
-                            v.violation_type = 'seatbelt'
-                        connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
-                        channel = connection.channel()
-                        #channel.queue_declare(queue=queue_name)
-                        channel.basic_publish(exchange='', routing_key='events_queue', body=json.dumps({'event_id': v.violation_id, 'event_violation_type': v.violation_type}))
-                        connection.close()
-                '''
-            # Event Recording functions are called here #
-            # make it more elegant?
-            self.recorder.update_recording_events(frame_number)
             # TODO ==========================================================================================================
 
             '''
@@ -910,6 +965,97 @@ class Pipeline(object):
 
         return Gst.PadProbeReturn.OK 
 
+    # print the lag metrics of the analytics workers (called every 5 sec, next to the FPS)
+    def analytics_print_callback(self):
+        print ("\n**ANALYTICS: ", {f"stream{worker.stream_no}": worker.metrics() for worker in self.analytics}, "\n")
+        if self.lpr is not None and self.lpr.pool is not None:
+            print ("\n**OCR POOL: ", self.lpr.pool.metrics(), "\n")
+        print ("\n**IMAGE WRITER: ", self.image_writer.metrics(), "\n")
+        return True
+
+    # metrics served by the metrics endpoint (called on its thread for every scrape)
+    # -> FPS and stage latencies are the last values printed by PERF_DATA.perf_print_callback (every 5 sec)
+    def collect_metrics(self):
+        fps = Metric('ivms_stream_fps', 'gauge', 'Frames per second of the stream over the last 5 sec')
+        for stream_index, value in dict(self.perf_data.perf_dict).items():
+            fps.add(value, stream=stream_index)
+
+        latency = Metric('ivms_stage_latency_seconds', 'gauge', 'Probe stage latency quantiles over the last 5 sec')
+        latency_max = Metric('ivms_stage_latency_max_seconds', 'gauge', 'Max probe stage latency over the last 5 sec')
+        for stream_index, stages in dict(self.perf_data.latency_dict).items():
+            for stage, h in stages.items():
+                for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+                    latency.add(h[key] / 1e3, stream=stream_index, stage=stage, quantile=quantile)
+                latency_max.add(h['max'] / 1e3, stream=stream_index, stage=stage)
+
+        rec = self.recorder.metrics()
+        buffer_frames = Metric('ivms_frame_buffer_frames', 'gauge', 'Frames held by the frame buffer')
+        for stream_no, frames in enumerate(rec['buffer_frames']):
+            buffer_frames.add(frames, stream=f"stream{stream_no}")
+        pending_violations = Metric('ivms_pending_violations', 'gauge', 'Violations waiting for their recording')
+        for stream_no, pending in enumerate(rec['pending_violations']):
+            pending_violations.add(pending, stream=f"stream{stream_no}")
+        buffer_bytes = Metric('ivms_frame_buffer_bytes', 'gauge', 'Bytes held by the frame buffers').add(rec['buffer_bytes'], tier='ram')
+        if 'buffer_disk_bytes' in rec:
+            buffer_bytes.add(rec['buffer_disk_bytes'], tier='disk')
+        if 'encoded_buffer_bytes' in rec:
+            buffer_bytes.add(rec['encoded_buffer_bytes'], tier='encoded')
+        buffer_events = Metric('ivms_frame_buffer_events_total', 'counter', 'Frame buffer counters (encodes, spills, drops, ...)')
+        for name, value in rec['buffer_stats'].items():
+            buffer_events.add(value, event=name)
+        for name, value in rec.get('encoded_buffer_stats', {}).items():
+            buffer_events.add(value, event=name)
+
+        metrics = [
+            fps, latency, latency_max, buffer_frames,
+            Metric('ivms_frame_buffer_capacity_frames', 'gauge', 'Frames the frame buffer holds per stream').add(rec['buffer_capacity']),
+            buffer_bytes, buffer_events, pending_violations,
+            Metric('ivms_pending_events', 'gauge', 'Received events waiting for their recording').add(rec['pending_events']),
+            Metric('ivms_recorder_writers', 'gauge', 'Recording writer threads running').add(rec['writers_pending']),
+            Metric('ivms_recorder_writers_total', 'counter', 'Recording writer threads started').add(rec['writers_started']),
+            Metric('ivms_rabbitmq_publish_failures_total', 'counter', 'Failed RabbitMQ publishes').add(rec['publish_failures']),
+        ]
+
+        # the write latencies are reset by the analytics print, only the counters / backlog are served
+        images = self.image_writer.counters()
+        metrics.append(Metric('ivms_image_writer_queued', 'gauge', 'Images queued for the image writer').add(images['queued']))
+        writes = Metric('ivms_image_writes_total', 'counter', 'Image writer counters (written, failed, waits)')
+        for name in ('written', 'failed', 'waits'):
+            writes.add(images[name], event=name)
+        metrics.append(writes)
+        metrics.append(Metric('ivms_image_written_bytes_total', 'counter', 'Bytes written by the image writer').add(images['bytes']))
+
+        if self.lpr is not None:
+            with self.lpr.stats_lock:
+                ocr = dict(self.lpr.stats)
+            metrics.append(Metric('ivms_lpr_tracks_total', 'counter', 'Tracks whose best plate crops have been handed to OCR').add(ocr['lpr_tracks']))
+            metrics.append(Metric('ivms_lpr_crops_total', 'counter', 'Plate crops handed to OCR').add(ocr['lpr_crops']))
+            metrics.append(Metric('ivms_lpr_dropped_tracks_total', 'counter', 'Tracks that left the view with plate crops the OCR pool did not take').add(ocr['lpr_dropped']))
+            if self.lpr.pool is not None:
+                pool = self.lpr.pool.counters()
+                metrics.append(Metric('ivms_ocr_queued_jobs', 'gauge', 'Plate recognition jobs queued for the OCR pool').add(pool['queued']))
+                jobs = Metric('ivms_ocr_jobs_total', 'counter', 'OCR pool job counters (submitted, deduplicated, dropped, ...)')
+                for name in ('submitted', 'processed', 'deduplicated', 'dropped', 'failed'):
+                    jobs.add(pool[name], event=name)
+                metrics.append(jobs)
+
+        if self.analytics is not None:
+            queued = Metric('ivms_analytics_queued_frames', 'gauge', 'Frames queued for the analytics worker')
+            dropped = Metric('ivms_analytics_dropped_frames_total', 'counter', 'Frames dropped by the analytics queue')
+            for worker in self.analytics:
+                counters = worker.counters()
+                queued.add(counters['queued'], stream=f"stream{worker.stream_no}")
+                dropped.add(counters['dropped'], stream=f"stream{worker.stream_no}")
+            metrics += [queued, dropped]
+
+        return metrics
+
+    # print the bytes per second copied out of the RGBA surfaces by the tiler probe (called every 5 sec)
+    def pixels_print_callback(self):
+        rates = {f"stream{i}": f"{rate / 1e6:.1f} MB/s" for i, rate in enumerate(self.processor.pixel_rates())}
+        print ("\n**PIXELS: ", rates, "\n")
+        return True
+
     def run(self):
         # Create an event loop and feed gstreamer bus messages to it
         loop = GObject.MainLoop()
@@ -932,3 +1078,5 @@ class Pipeline(object):
         print(f"Message: {msg}")
 
         self.pipeline.set_state(Gst.State.NULL)
+        if self.capture is not None:
+            self.capture.close()
@@ -0,0 +1,123 @@
+import heapq
+import itertools
+
+import cv2
+import numpy as np
+
+
+# Cheap quality score of a plate crop, used to keep the best crops of every track for OCR
+# -> product of (all in 0..1):
+#      width:      plate width in pixels, saturating at FULL_WIDTH (larger plates -> more pixels per character)
+#      aspect:     1 inside the aspect ratios of the plates we read, falling off outside (partial / skewed boxes)
+#      sharpness:  variance of the Laplacian of the grey crop (motion blur, out of focus), saturating
+#      clipping:   CLIPPED_FACTOR if the plate box touches the frame border (plate probably cut)
+#      confidence: detector / tracker confidence of the car, weighted CONFIDENCE_WEIGHT
+FULL_WIDTH = 120.0          # px
+ASPECT_MIN = 1.6            # square-ish (two line) plates
+ASPECT_MAX = 5.5            # long (one line) plates
+SHARPNESS_HALF = 150.0      # Laplacian variance scoring 0.5
+CLIPPED_FACTOR = 0.5
+BORDER = 2                  # px from the frame border counted as touching it
+CONFIDENCE_WEIGHT = 0.5
+
+
+def sharpness(img):
+    grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return float(cv2.Laplacian(grey, cv2.CV_32F).var())
+
+
+# plate_img: BGR crop of the plate (with the offset of PlateRecognition._plate_crop_rect),
+# plate_bbox: (minx, miny, maxx, maxy) of the detected plate, width / height: frame size, confidence: 0..1
+def plate_quality(plate_img, plate_bbox, width, height, confidence):
+    minx, miny, maxx, maxy = plate_bbox
+    plate_w, plate_h = maxx - minx, maxy - miny
+    if plate_w <= 0 or plate_h <= 0 or plate_img is None or plate_img.size == 0:
+        return 0.0
+
+    width_score = min(plate_w / FULL_WIDTH, 1.0)
+
+    aspect = plate_w / plate_h
+    if aspect < ASPECT_MIN:
+        aspect_score = aspect / ASPECT_MIN
+    elif aspect > ASPECT_MAX:
+        aspect_score = ASPECT_MAX / aspect
+    else:
+        aspect_score = 1.0
+
+    sharp = sharpness(plate_img)
+    sharp_score = sharp / (sharp + SHARPNESS_HALF)
+
+    clipped = minx <= BORDER or miny <= BORDER or maxx >= width - BORDER or maxy >= height - BORDER
+    clip_score = CLIPPED_FACTOR if clipped else 1.0
+
+    confidence_score = 1.0 - CONFIDENCE_WEIGHT + CONFIDENCE_WEIGHT * float(np.clip(confidence, 0.0, 1.0))
+
+    return width_score * aspect_score * sharp_score * clip_score * confidence_score
+
+
+# K best crops of a track: min-heap of (quality, seq, crop), the worst kept crop on top
+# -> push is O(log K); a crop worse than the K kept ones is not stored at all
+# -> best_quality / best_fi: best quality so far and the frame it was seen, used to detect a plateau
+# -> take() hands the kept crops over (taken: how many times); from then on only crops better than the best one
+#    taken are kept (floor), so that a track read again is read on better evidence
+class CropCandidates(object):
+    __slots__ = ('k', 'heap', 'best_quality', 'best_fi', 'floor', 'taken')
+
+    _seq = itertools.count()
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.best_quality = 0.0
+        self.best_fi = None
+        self.floor = None
+        self.taken = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    # True if a crop of this quality would be kept (-> only then is it worth copying)
+    def accepts(self, quality):
+        if self.floor is not None and quality <= self.floor:
+            return False
+        return len(self.heap) < self.k or quality > self.heap[0][0]
+
+    # crop: any payload (e.g. (plate_img, plate_width)); returns True if it has been kept
+    def push(self, quality, crop, fi):
+        self.seen(quality, fi)
+        if self.floor is not None and quality <= self.floor:
+            return False
+        entry = (quality, next(self._seq), crop)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+            return True
+        if quality > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+            return True
+        return False
+
+    # note the quality of a crop seen in frame fi (kept or not)
+    def seen(self, quality, fi):
+        if self.best_fi is None or quality > self.best_quality:
+            self.best_quality = quality
+            self.best_fi = fi
+
+    # frames since the best crop has been seen
+    def stale_for(self, fi):
+        return 0 if self.best_fi is None else fi - self.best_fi
+
+    # kept crops, best first, as (quality, crop)
+    def best(self):
+        return [(quality, crop) for quality, seq, crop in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+
+    # kept crops, best first, removed from the candidates; the next ones must be better than the best of them
+    def take(self):
+        crops = self.best()
+        if crops:
+            self.floor = crops[0][0]
+            self.taken += 1
+        self.heap = []
+        return crops
+
+    def clear(self):
+        self.heap = []
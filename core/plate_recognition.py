@@ -10,6 +10,11 @@ from typing import List
 from easydict import EasyDict as edict
 
 from utils.draw import draw_box
+from utils.bbox import assign_contained
+from utils.image_writer import get_image_writer
+import core.detection_object as do
+from core.ocr_pool import OcrPool
+from core.plate_quality import plate_quality, CropCandidates
 
 from LPR_QAT.core.object_detector import ObjectDetector
 from LPR_QAT.core.yaml_parser import YamlParser
@@ -17,7 +22,8 @@ from LPR_QAT.core.yaml_parser import YamlParser
 from LPR_QAT.core.alpr_ktc import alpr_ktc
 
 from simple_detect_lpr_streamai import PlateRecognitionTechnoStreamAI
-from collections import deque
+import heapq
+import logging
 import threading
 
 #from PIL import Image
@@ -45,7 +51,8 @@ class PlateRecognition(object):
         , width: int
         , height: int
         , api_interface
-        , anpr=False):
+        , anpr=False
+        , ocr_cfg=None):
         
         self.lpr_dir = lpr_dir
         self.width = width
@@ -56,16 +63,17 @@ class PlateRecognition(object):
         #self.lpr = alpr.carrida.LPR(os.path.join(configs_dir,"lpr.ini"), None)
         #self.lpr = alpr_ktc()
 
-        # we create a list of lists to hold the plates separately for each stream
-        self.plates = deque(maxlen=100) #list()
-        #for i in range(0, stream_count):
-        #    self.plates.append( list() ) #different object reference each time
+        ocr_cfg = ocr_cfg or {}
 
-        # list of list of dicts with info of vehicles inside vehicle area
-        # -> one list per stream
+        # vehicles inside vehicle area: {track id: VehicleTrack}
+        # -> one dict per stream, plus a min-heap of (last seen fi, track id) per stream used to expire them
+        #    (entries are pushed when a track is added and re-pushed on pop if it has been seen since; a track
+        #    seen with a lower fi, i.e. after a frame number restart, gets an extra entry)
         self.v_slots = list()
+        self.v_expiry = list()
         for i in range(0, stream_count):
-            self.v_slots.append( list() ) #different object reference each time
+            self.v_slots.append( dict() ) #different object reference each time
+            self.v_expiry.append( list() )
         
         # KTC OCR inits
         # Read YAML config file using YamlParser class 
@@ -74,6 +82,7 @@ class PlateRecognition(object):
         # configure application logging
         # configure_logging(cfg, src='lpr')
 
+        # the plate crops saved by the OCR pool are read (in batches, across the streams) by anpr_ivms.py
         #ocr_detector = ObjectDetector(cfg, mode='ocr')
 
         #self.lpr = alpr_ktc(ocr_detector)
@@ -81,10 +90,30 @@ class PlateRecognition(object):
         
         self.api_interface = api_interface
 
+        # tracks / crops handed to the OCR pool, tracks whose crops were dropped (see metrics endpoint); the plates
+        # are read by the anpr_ivms process, which serves the OCR metrics itself
+        self.stats_lock = threading.Lock()
+        self.stats = {'lpr_tracks': 0, 'lpr_crops': 0, 'lpr_dropped': 0}
+
+        # best crop selection per track, see _detect
+        self.best_crops = int(ocr_cfg.get('BEST_CROPS', 3))
+        self.plateau_frames = int(ocr_cfg.get('PLATEAU_FRAMES', 15))
+        self.attempts = max(int(ocr_cfg.get('ATTEMPTS', 2)), 1)
+
+        # plate crops are written by the shared image writer (encoding, folders, atomic rename off the OCR threads)
+        self.image_writer = get_image_writer()
+
+        # lpr jobs (crop saving / OCR) of all the streams run on a fixed pool of threads, see core.ocr_pool
+        self.pool = None
+        if self.anpr:
+            self.pool = OcrPool(self._lpr_job, int(ocr_cfg.get('WORKERS', 2)), int(ocr_cfg.get('QUEUE_SIZE', 32)))
+
 
     # maintain one list with tracked vehicles per stream; use tracking in order to avoid
     # doing lpr for the same vehicle many times
-    def update(self, detections: List, stream_no: int, fi: int, frame):
+    # detections: FrameDetections of the current frame (columns, see core.detection_object)
+    # plate_bboxes: link_plates of the frame, if the probe has already assigned its plates
+    def update(self, detections, stream_no: int, fi: int, frame, plate_bboxes=None):
         #for plate in detections:
         #    if plate.class_id > 4 :
         #        print(plate.class_id, plate.score)
@@ -93,12 +122,13 @@ class PlateRecognition(object):
         ret = []             
 
         # we only care about plates with score >= 85%
-        #plates = [plate for plate in detections if plate.class_id == self.PLATE and plate.score >= 0.5]
-        plates = [plate for plate in detections if plate.class_id == self.PLATE]
+        plates = detections.rows(self.PLATE)
+        #plates = plates[detections.score[plates] >= 0.5]
         # we filter out cars with score < 50%
-        #cars = [car for car in detections if car.class_id == self.CAR and car.score >= 0.5]
-        cars = [car for car in detections if car.class_id == self.CAR]
-        self._link_plates_to_vehicles(cars, plates)
+        cars = detections.rows(self.CAR)
+        #cars = cars[detections.score[cars] >= 0.5]
+        if plate_bboxes is None:
+            plate_bboxes = self._link_plates_to_vehicles(detections, cars, plates)
         
         #print(len(plates), len(cars))
 
@@ -106,310 +136,329 @@ class PlateRecognition(object):
         v_slots = self.v_slots[stream_no]
 
         # --- CLEAR slots that have not been updated since configured number of frames
-        # see https://stackoverflow.com/questions/1207406/how-to-remove-items-from-a-list-while-iterating
-        v_slots[:] = [slt for slt in v_slots if slt.fi + self.REMOVE_SLOT_AFTER_FRAMES >= fi]
+        self._expire_slots(stream_no, fi)
+
+        # slots updated with the cars of the current frame
+        updated = {}
 
         # update v_slots using car data of current frame        
         # -> we want to do lpr on slots with plate updated AND plate not yet recognised
-        for slot in cars:
+        for row in cars:
+            track_id = int(detections.track_id[row])
+            bbox = detections.bbox(row)
+            plate_bbox = plate_bboxes.get(row)
+
             # check if vehicle is already contained in a slot
-            v_slot = next((v_slot for v_slot in v_slots if v_slot.id == slot.id), None)
+            v_slot = v_slots.get(track_id)
             
             # id has not yet been added to a slot
             # -> add it now
             if v_slot is None:  
+                slot = do.VehicleTrack(track_id, bbox, self.CAR, float(detections.score[row]), bbox[3])
+                slot.matched = plate_bbox is not None
+                slot.plate_bbox = plate_bbox
                 slot.fi = fi
-                v_slots.append(slot)
+                v_slots[track_id] = slot
+                heapq.heappush(self.v_expiry[stream_no], (fi, track_id))
+                updated[track_id] = slot
             # id is already contained in slot list:             
             else:
-                # -> update its bbox, fi
+                # -> update its bbox, fi, score
+                if fi < v_slot.fi:
+                    heapq.heappush(self.v_expiry[stream_no], (fi, track_id))
                 v_slot.fi = fi
-                v_slot.bbox = slot.bbox
+                v_slot.bbox = bbox
+                v_slot.score = float(detections.score[row])
 
                 # -> update maxy property
-                min, miny, maxx, maxy = slot.bbox.bounds
-                v_slot.maxy = maxy
+                v_slot.maxy = bbox[3]
 
                 # -> update plate_bbox only if plate has not been yet recognized                
                 if v_slot.plate_no is None:                     
-                    v_slot.plate_bbox = slot.plate_bbox
+                    v_slot.plate_bbox = plate_bbox
                 # -> otherwise set plate_bbox to None so that no lpr is performed anymore
                 else:
                     v_slot.plate_bbox = None
+                updated[track_id] = v_slot
 
         # perform lpr for all slots updated with new plate data
         # -> fields plate_no, plate_img are possibly updated
-        cars = [v for v in v_slots if v.fi == fi and v.plate_bbox is not None]
+        cars = [v for v in updated.values() if v.plate_bbox is not None]
         if self.anpr:
-           workThread = threading.Thread(target=self._detect, args=(cars, stream_no, frame), daemon=True)
-           workThread.start()
-           #self._detect(cars, stream_no, frame)
-
-        return v_slots
+           self._detect(cars, stream_no, frame, fi)
+
+        # list view of the slots (consumed by MSViolationDetector.detect)
+        return list(v_slots.values())
+
+    # save the crops of the cars still in view, run the lpr jobs still queued and stop the OCR pool
+    # -> called once the analytics threads are done
+    def stop(self, timeout=None):
+        if self.pool is not None:
+            for stream_no, v_slots in enumerate(self.v_slots):
+                for slot in v_slots.values():
+                    if not slot.lpr_done and not self._flush_candidates(stream_no, slot):
+                        self._drop_candidates(stream_no, slot)
+            self.pool.stop(timeout)
+
+    # remove the slots of the stream not updated during the last REMOVE_SLOT_AFTER_FRAMES frames
+    # -> amortized O(1) per slot: a heap entry is popped once it is old enough and re-pushed with the last
+    #    seen fi if the track has been updated since
+    def _expire_slots(self, stream_no, fi):
+        v_slots = self.v_slots[stream_no]
+        expiry = self.v_expiry[stream_no]
+        while expiry and expiry[0][0] + self.REMOVE_SLOT_AFTER_FRAMES < fi:
+            seen_fi, track_id = heapq.heappop(expiry)
+            slot = v_slots.get(track_id)
+            if slot is None:
+                continue
+            if slot.fi + self.REMOVE_SLOT_AFTER_FRAMES >= fi:
+                heapq.heappush(expiry, (slot.fi, track_id))
+            else:
+                # the car has left the view: read the best crops collected so far (last chance)
+                if self.anpr and not slot.lpr_done and not self._flush_candidates(stream_no, slot):
+                    self._drop_candidates(stream_no, slot)
+                del v_slots[track_id]
 
     # implement simple algorith to match plates to cars
-    def _link_plates_to_vehicles(self, cars, plates):
-        for plate in plates:
-            # check if current plate is completely inside a vehicle bbox
-            for car in [car for car in cars if not car.matched]: 
-                # we check if plate_box is located on the lower part of the vehicle box
-                if car.bbox.contains(plate.bbox):
-                    car.matched = True
-                    car.plate_bbox = plate.bbox
-                    break
-
-    # do lpr for vehicles 
-    def _detect(self, vehicles, stream_no: int, frame):
-        # calculate dir, create it if it doesn't yet exist
-        folder = os.path.join(self.lpr_dir, datetime.now().strftime("%Y%m%d"), str(stream_no))
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-
-        # get current timestamp -> use it in vehicle, cropped img filenames
-        tstamp = datetime.now().strftime("%H_%M_%S_%f")
-
+    # -> returns {car row: plate bbox} for the rows of the matched cars
+    # -> a plate can only go to a car whose bbox completely contains it; the (car, plate) candidates of the frame
+    #    are built in one vectorized step and assigned globally, preferring the plate closest to the lower edge
+    #    of the car (see utils.bbox.assign_contained) -> overlapping cars no longer take each other's plates
+    def _link_plates_to_vehicles(self, detections, cars, plates):
+        plate_bboxes = {}
+        if len(cars) == 0 or len(plates) == 0:
+            return plate_bboxes
+
+        boxes = detections.boxes
+        plate_boxes = boxes[plates]
+        for car, plate in assign_contained(boxes[cars], plate_boxes, detections.score[plates]).items():
+            plate_bboxes[cars[car]] = tuple(plate_boxes[plate].tolist())
+        return plate_bboxes
+
+    # region of the frame cropped for a plate: plate bbox plus an offset, clipped to the frame
+    # -> None if the plate is too small to be read
+    def _plate_crop_rect(self, plate_bbox):
+        plate_minx, plate_miny, plate_maxx, plate_maxy = plate_bbox
+        #print("width of plate", (plate_maxx-plate_minx))
+        with_offset = True
+        x_offset = 10
+        y_offset = 5
+        plate_width = plate_maxx-plate_minx
+        if with_offset:
+            plate_minx = plate_minx - x_offset if plate_minx - x_offset > 0 else 0
+            plate_miny = plate_miny - y_offset if plate_miny - y_offset > 0 else 0
+            plate_maxx = plate_maxx + x_offset if plate_maxx + x_offset < self.width else self.width
+            plate_maxy = plate_maxy + y_offset if plate_maxy + y_offset < self.height else self.height
+            #print("width of plate", (plate_maxx-plate_minx))
+            if ((plate_maxx-plate_minx) < 50):
+                return None
+        elif(plate_width < 30):
+            return None
+
+        return int(plate_minx), int(plate_miny), int(plate_maxx), int(plate_maxy)
+
+    # plates of the frame assigned to the cars: {car row: plate bbox}
+    # -> done once per frame by the tiler probe (FrameProcessor), which hands the assignment to update with the frame
+    def link_plates(self, detections):
+        return self._link_plates_to_vehicles(detections, detections.rows(self.CAR), detections.rows(self.PLATE))
+
+    # regions of the current frame plate recognition needs: the crop of every plate linked to a car (plate_bboxes:
+    # link_plates of the frame)
+    # -> called by the tiler probe, which copies just these regions instead of the whole frame
+    def pixel_demand(self, plate_bboxes):
+        if not self.anpr:
+            return []
+        rects = []
+        for plate_bbox in plate_bboxes.values():
+            rect = self._plate_crop_rect(plate_bbox)
+            if rect is not None:
+                rects.append(rect)
+        return rects
+
+    # collect the plate crops of the vehicles (analytics thread of the stream)
+    # -> frame: FramePixels of the current frame
+    # -> every crop is scored (see core.plate_quality) and the BEST_CROPS best ones of the track are kept; they
+    #    are handed to the OCR pool once the best score has not improved for PLATEAU_FRAMES frames, or when the
+    #    track leaves the view (_expire_slots) -> one lpr job per track on its best evidence, and up to ATTEMPTS
+    #    if better crops show up later (see _flush_candidates)
+    # -> the kept crops are copies, the frame (buffer slot) may be reused before the job runs
+    def _detect(self, vehicles, stream_no: int, frame, fi: int):
         for car in vehicles:
         
-            #if car.lpr_img is not None:
-            if car.lpr_img_save_count >= 12:
+            if car.lpr_done:
                 continue
-            '''
-            # if not yet set, then save img used for lpr frame
-            # -> this image will be overriden in case plate is read
-            if car.lpr_img is None:
-                pass
-                # get vehicle image
-                #cminx, cminy, cmaxx, cmaxy = car.bbox.bounds
-                #car_img = frame[int(cminy):int(cmaxy), int(cminx):int(cmaxx)]
-            
-                #plate_minx, plate_miny, plate_maxx, plate_maxy = car.plate_bbox.bounds
-                #plate_img = frame[int(plate_miny):int(plate_maxy), int(plate_minx):int(plate_maxx)]     
-            
-                #fname = os.path.join(folder, f'{tstamp}-1.png') 
-                #cropped_fname = os.path.join(folder, f'{tstamp}-2.png')
-                #frame_fname = os.path.join(folder, f'{tstamp}-3.png')
-                #cv2.imwrite(fname, car_img)
-                #cv2.imwrite(cropped_fname, plate_img)
-                #cv2.imwrite(frame_fname, frame)
             
-                #car.lpr_img = frame.copy()
-                #continue
-                #draw_box(car.lpr_img, car.bbox, color=(50, 50, 220), line_thickness=3)
-                #draw_box(car.lpr_img, car.plate_bbox, color=(50, 50, 220), line_thickness=3)
-            else:
-                continue
-            '''
             # extract plate image from frame using coords from our custom plate detection model (Yolo V5)
             # -> after increasing the plate bbox
-            plate_minx, plate_miny, plate_maxx, plate_maxy = car.plate_bbox.bounds
-            #print("width of plate", (plate_maxx-plate_minx))
-            #plate_minx, plate_miny, plate_maxx, plate_maxy = car.bbox.bounds
-            with_offset = True
-            x_offset = 10
-            y_offset = 5
-            plate_width = plate_maxx-plate_minx
-            if with_offset:
-                plate_minx = plate_minx - x_offset if plate_minx - x_offset > 0 else 0
-                plate_miny = plate_miny - y_offset if plate_miny - y_offset > 0 else 0
-                plate_maxx = plate_maxx + x_offset if plate_maxx + x_offset < self.width else self.width
-                plate_maxy = plate_maxy + y_offset if plate_maxy + y_offset < self.height else self.height
-                #print("width of plate", (plate_maxx-plate_minx))
-                if ((plate_maxx-plate_minx) < 50):
-                    continue
-            elif(plate_width < 30):
-                #print("width of plate", (plate_maxx-plate_minx))
-                continue
-            
-            plate_img = frame[int(plate_miny):int(plate_maxy), int(plate_minx):int(plate_maxx)]
-            
-            ##########################################
-            # Save images to folder
-            ##########################################  
-            
-            # get vehicle image
-            cminx, cminy, cmaxx, cmaxy = car.bbox.bounds
-            car_img = frame[int(cminy):int(cmaxy), int(cminx):int(cmaxx)]
-            
-            save_img = False
+            plate_rect = self._plate_crop_rect(car.plate_bbox)
+            if plate_rect is not None:
+                # frame is a FramePixels: the crop has been taken by the probe (see pixel_demand)
+                plate_img = frame.crop(plate_rect)
+                if plate_img is not None:
+                    if car.lpr_candidates is None:
+                        car.lpr_candidates = CropCandidates(self.best_crops)
+                    quality = plate_quality(plate_img, car.plate_bbox, self.width, self.height, car.score)
+                    if car.lpr_candidates.accepts(quality):
+                        if frame.full is not None:
+                            plate_img = plate_img.copy()
+                        plate_width = car.plate_bbox[2] - car.plate_bbox[0]
+                        car.lpr_candidates.push(quality, (plate_img, plate_width), fi)
+                    else:
+                        car.lpr_candidates.seen(quality, fi)
+
+            if car.lpr_candidates is not None and car.lpr_candidates.stale_for(fi) >= self.plateau_frames:
+                self._flush_candidates(stream_no, car)
+
+    # hand the kept crops of the car to the OCR pool
+    # -> the read happens in anpr_ivms.py, its outcome is not known here: a car gets up to ATTEMPTS jobs, every
+    #    one after the first with crops better than all the ones already handed (see CropCandidates.take); the
+    #    car is done once its last job has been queued
+    # -> returns False if the job has been rejected (deduplicated / pool queue full): the crops are kept and
+    #    handed again with the next frame, or dropped if the car has left the view (_drop_candidates)
+    def _flush_candidates(self, stream_no, car):
+        candidates = car.lpr_candidates
+        if candidates is None or len(candidates) == 0:
+            return True
+        crops = candidates.best()
+        if not self.pool.submit(stream_no, car.id, stream_no, car.id, crops):
+            return False
+        candidates.take()
+        car.lpr_done = candidates.taken >= self.attempts
+        car.lpr_img_save_count += len(crops)
+        with self.stats_lock:
+            self.stats['lpr_tracks'] += 1
+            self.stats['lpr_crops'] += len(crops)
+        return True
+
+    # the crops of a car that left the view could not be handed to the OCR pool: its plate is not read
+    def _drop_candidates(self, stream_no, car):
+        with self.stats_lock:
+            self.stats['lpr_dropped'] += 1
+        logging.warning(f"[PlateRecognition] Stream {stream_no}: track {car.id} left the view, its "
+                        f"{len(car.lpr_candidates)} plate crops were not taken by the OCR pool and are dropped")
+        car.lpr_candidates.clear()
+
+    # lpr job of one car (OCR pool thread): saves the best plate crops of the track, they are read by anpr_ivms.py
+    # -> crops: [(quality, (plate_img, plate_width))], best first
+    def _lpr_job(self, stream_no, track_id, crops):
+        for quality, (plate_img, plate_width) in crops:
+            self._save_crop(stream_no, track_id, plate_img, plate_width)
+
+    # save a plate crop
+    def _save_crop(self, stream_no, track_id, plate_img, plate_width):
+
+        # calculate dir (created by the image writer)
+        folder = os.path.join(self.lpr_dir, datetime.now().strftime("%Y%m%d"), str(stream_no))
+
+        # get current timestamp -> use it in vehicle, cropped img filenames
+        tstamp = datetime.now().strftime("%H_%M_%S_%f")
+
+        ##########################################
+        # Save images to folder
+        ##########################################  
+        fname = os.path.join(folder, f'{track_id}_{tstamp}_{int(plate_width)}.png')
+        self.image_writer.write(fname, plate_img)
+        
+        #img = cv2.cvtColor(plate_img, cv2.COLOR_BGR2RGB)
+        #im_pil = Image.fromarray(img)
+        #metadata = PngInfo()
+        #metadata.add_text("OCR_Results", json.dumps())
+        #image.save("1.png", pnginfo=metadata)
+
+        '''
+        # ---------------------------------
+        # HACK: Save cropped image for testing purposes only
+
+        #if plate_img is not None:
+            # save vehicle, cropped plate images
+            #fname = os.path.join(folder, f'{tstamp}-{track_id}.jpg') 
+            #cropped_fname = os.path.join(folder, f'{tstamp}-{track_id}-pl.jpg')                             
+            #cv2.imwrite(fname, plate_img)
+            #cv2.imwrite(cropped_fname, plate_img)
             
-            if ((plate_width >= 30) and (plate_width <= 40) and (car.lpr_imgs_dict['30'] == 0 )):
-                car.lpr_imgs_dict['30']+=1
-                save_img = True
-            elif ((plate_width > 40) and (plate_width <= 50) and (car.lpr_imgs_dict['40'] == 0 )):
-                car.lpr_imgs_dict['40']+=1
-                save_img = True
-            elif ((plate_width > 50) and (plate_width <= 60) and (car.lpr_imgs_dict['50'] == 0 )):
-                car.lpr_imgs_dict['50']+=1
-                save_img = True
-            elif ((plate_width > 60) and (plate_width <= 65) and (car.lpr_imgs_dict['60'] == 0 )):
-                car.lpr_imgs_dict['60']+=1
-                save_img = True
-            elif ((plate_width > 65) and (plate_width <= 70) and (car.lpr_imgs_dict['65'] == 0 )):
-                car.lpr_imgs_dict['65']+=1
-                save_img = True
-            elif ((plate_width > 70) and (plate_width <= 75) and (car.lpr_imgs_dict['70'] == 0 )):
-                car.lpr_imgs_dict['70']+=1
-                save_img = True
-            elif ((plate_width > 75) and (plate_width <= 80) and (car.lpr_imgs_dict['75'] == 0 )):
-                car.lpr_imgs_dict['75']+=1
-                save_img = True
-            elif ((plate_width > 80) and (plate_width <= 85) and (car.lpr_imgs_dict['80'] == 0 )):
-                car.lpr_imgs_dict['80']+=1
-                save_img = True
-            elif ((plate_width > 85) and (plate_width <= 90) and (car.lpr_imgs_dict['85'] == 0 )):
-                car.lpr_imgs_dict['85']+=1
-                save_img = True
-            elif ((plate_width > 90) and (car.lpr_imgs_dict['90'] < 3 )): # only in this case, high resolution, we capture 3 frames
-                car.lpr_imgs_dict['90']+=1
-                save_img = True
+        #     car.plate_img = plate_img
+
+        # HACK end -------------------------------
+
+        ##########################################
+        # TechnoStream / KTC Custom OCR / CARRIDA
+        ##########################################
+        # convert img to form suitable for Carrida detection
+        #plate_img_grey = cv2.cvtColor(plate_img, cv2.COLOR_BGRA2GRAY)
+        #plate_img_grey = np.stack((plate_img_grey,)*3, axis=-1)
+        #lpr_img = alpr.svcapture.Image()
+        #lpr_img.set(img)
+        #lpr_img = img
+
+        # do alpr                    
+        #result, lpr_results = self.lpr.process(lpr_img)
+        #lpr_results = self.lpr.process(plate_img)
+        lpr_results = self.lpr.simpleDetect(plate_img)
+        
+        #print(lpr_results.decoded_label.full_label)   
+        
+        #if plate_img is not None:
+            # save vehicle, cropped plate images
+            #fname = os.path.join(folder, f'{tstamp}-{track_id}.jpg') 
+            #cropped_fname = os.path.join(folder, f'{tstamp}-{track_id}-pl-{lpr_results.decoded_label.full_label}.jpg')                             
+            #cv2.imwrite(fname, plate_img)
+            #cv2.imwrite(cropped_fname, plate_img)
+        
+        if ((lpr_results is not None)):    
+            plate = plate_img
+            plate_num = f'{lpr_results["PlateText"]}'.strip()
+            #plate_prefix = lpr_results.decoded_label.prefix_label.strip()
+            plate_type = self.PLATE_TYPE_PRIVATE
+            plate_state = f'{lpr_results["StateLong"]}'.strip()
+            plate_country = f'{lpr_results["CountryLong"]}'.strip()
+            plate_no = f'{plate_state} {plate_country} {plate_num}'.strip()
             
-            if save_img:
-                fname = os.path.join(folder, f'{car.id}_{tstamp}_{int(plate_width)}.png')
-                cv2.imwrite(fname, plate_img)
+            if ((plate_num is not None) and (plate_num != "None") and (plate_no not in self.plates)):
+                
                 
-                #img = cv2.cvtColor(plate_img, cv2.COLOR_BGR2RGB)
-                #im_pil = Image.fromarray(img)
-                #metadata = PngInfo()
-                #metadata.add_text("OCR_Results", json.dumps())
-                #image.save("1.png", pnginfo=metadata)
-
-                car.lpr_img_save_count+=1
-            '''
-            if((plate_maxx-plate_minx) > 80):
-                car.lpr_img_save_count += 3
-            elif((plate_maxx-plate_minx) > 50):
-                car.lpr_img_save_count += 2
-            else:
-                car.lpr_img_save_count += 1
-            '''
-
-            '''
-            # ---------------------------------
-            # HACK: Save cropped image for testing purposes only
-
-            #if car.plate_img is None:
                 # save vehicle, cropped plate images
-                #fname = os.path.join(folder, f'{tstamp}-{car.id}.jpg') 
-                #cropped_fname = os.path.join(folder, f'{tstamp}-{car.id}-pl.jpg')                             
-                #cv2.imwrite(fname, car_img)
+                fname = os.path.join(folder, f'{tstamp}-{plate_no}.jpg') 
+                #cropped_fname = os.path.join(folder, f'{tstamp}-{plate_no}-pl.jpg')                             
+                cv2.imwrite(fname, plate_img)
                 #cv2.imwrite(cropped_fname, plate_img)
                 
-            #     car.plate_img = plate_img
-
-            # HACK end -------------------------------
-
-            ##########################################
-            # TechnoStream / KTC Custom OCR / CARRIDA
-            ##########################################
-            # convert img to form suitable for Carrida detection
-            #plate_img_grey = cv2.cvtColor(plate_img, cv2.COLOR_BGRA2GRAY)
-            #plate_img_grey = np.stack((plate_img_grey,)*3, axis=-1)
-            #lpr_img = alpr.svcapture.Image()
-            #lpr_img.set(img)
-            #lpr_img = img
-
-            # do alpr                    
-            #result, lpr_results = self.lpr.process(lpr_img)
-            #lpr_results = self.lpr.process(plate_img)
-            lpr_results = self.lpr.simpleDetect(car_img)
+                # update car slot with plate_no, plate_img data
+                result = edict(plate_no=plate_no, plate_img=plate_img, lpr_img=plate_img)
+
+                # append new plate no to list of already recognized plates
+                self.plates.append(plate_no)
+                #draw_box(car.lpr_img, car.bbox, color=(50, 50, 220), line_thickness=3)
+                #draw_box(car.lpr_img, car.plate_bbox, color=(50, 50, 220), line_thickness=3)                    
+
+                #print (f'[PlateRecognition] Wrote image for plate {plate_no} to {cropped_fname}')
+                #self.api_interface.update_plate_event(cropped_fname, plate_num, plate_type, plate_state, plate_country)
+            elif (plate_no not in self.plates):
+                fname = os.path.join(folder, f'{tstamp}-{plate_no}-failed.jpg') 
+                cv2.imwrite(fname, plate_img)
+        '''        
+        '''
+        if lpr_results  and lpr_results.decoded_label.platenum_label and lpr_results.decoded_label.state_label:
+            plate = plate_img
+            plate_num = f'{lpr_results.decoded_label.platenum_label}'.strip()
+            plate_prefix = f'{lpr_results.decoded_label.prefix_label}'.strip()
+            plate_type = self.PLATE_TYPE_PRIVATE
+            plate_state = f'{self._city_code(lpr_results.decoded_label.state_label)}'.strip()
+            plate_country = f'{self._city_code(lpr_results.decoded_label.state_label)}'.strip()
             
-            #print(lpr_results.decoded_label.full_label)   
+            plate_no = f'{self._city_code(lpr_results.decoded_label.state_label)} {lpr_results.decoded_label.prefix_label} {lpr_results.decoded_label.platenum_label}'.strip()
             
-            #if plate_img is not None:
-                # save vehicle, cropped plate images
-                #fname = os.path.join(folder, f'{tstamp}-{car.id}.jpg') 
-                #cropped_fname = os.path.join(folder, f'{tstamp}-{car.id}-pl-{lpr_results.decoded_label.full_label}.jpg')                             
-                #cv2.imwrite(fname, car_img)
-                #cv2.imwrite(cropped_fname, plate_img)
+            # if plate no is NEW then save img to disk
+            if plate_no not in self.plates:
             
-            if ((lpr_results is not None)):    
-                plate = plate_img
-                plate_num = f'{lpr_results["PlateText"]}'.strip()
-                #plate_prefix = lpr_results.decoded_label["prefix_label"].strip()
-                plate_type = self.PLATE_TYPE_PRIVATE
-                plate_state = f'{lpr_results["StateLong"]}'.strip()
-                plate_country = f'{lpr_results["CountryLong"]}'.strip()
-                plate_no = f'{plate_state} {plate_country} {plate_num}'.strip()
+                # save vehicle, cropped plate images
+                fname = os.path.join(folder, f'{tstamp}-{plate_no}.jpg') 
+                cropped_fname = os.path.join(folder, f'{tstamp}-{plate_no}-pl.jpg')                             
+                cv2.imwrite(fname, plate_img)
+                cv2.imwrite(cropped_fname, plate_img)
+                if lpr_results.decoded_label.state_label:
                 
-                if ((plate_num is not None) and (plate_num != "None") and (plate_no not in self.plates)):
-                    
-                    
-                    # save vehicle, cropped plate images
-                    fname = os.path.join(folder, f'{tstamp}-{plate_no}.jpg') 
-                    #cropped_fname = os.path.join(folder, f'{tstamp}-{plate_no}-pl.jpg')                             
-                    cv2.imwrite(fname, car_img)
-                    #cv2.imwrite(cropped_fname, plate_img)
-                    
-                    # update car slot with plate_no, plate_img data
-                    car.plate_no = plate_no
-                    car.plate_img = plate_img
-
-                    # save img used for lpr frame
-                    car.lpr_img = frame.copy()
-                    #draw_box(car.lpr_img, car.bbox, color=(50, 50, 220), line_thickness=3)
-                    #draw_box(car.lpr_img, car.plate_bbox, color=(50, 50, 220), line_thickness=3)                    
-
-                    #print (f'[PlateRecognition] Wrote image for plate {plate_no} to {cropped_fname}')
                     # append new plate no to list of already recognized plates
                     self.plates.append(plate_no)
-                    #self.api_interface.update_plate_event(cropped_fname, plate_num, plate_type, plate_state, plate_country)
-                elif (plate_no not in self.plates):
-                    fname = os.path.join(folder, f'{tstamp}-{plate_no}-failed.jpg') 
-                    cv2.imwrite(fname, car_img)
-            '''        
-            '''
-            if lpr_results  and lpr_results.decoded_label["platenum_label"] and lpr_results.decoded_label["state_label"]:
-                plate = plate_img
-                plate_num = f'{lpr_results.decoded_label["platenum_label"]}'.strip()
-                plate_prefix = f'{lpr_results.decoded_label["prefix_label"]}'.strip()
-                plate_type = self.PLATE_TYPE_PRIVATE
-                plate_state = f'{self._city_code(lpr_results.decoded_label["state_label"])}'.strip()
-                plate_country = f'{self._city_code(lpr_results.decoded_label["state_label"])}'.strip()
-                
-                plate_no = f'{self._city_code(lpr_results.decoded_label["state_label"])} {lpr_results.decoded_label["prefix_label"]} {lpr_results.decoded_label["platenum_label"]}'.strip()
-                
-                # if plate no is NEW then save img to disk
-                if plate_no not in self.plates:
-                
-                    # save vehicle, cropped plate images
-                    fname = os.path.join(folder, f'{tstamp}-{plate_no}.jpg') 
-                    cropped_fname = os.path.join(folder, f'{tstamp}-{plate_no}-pl.jpg')                             
-                    cv2.imwrite(fname, car_img)
-                    cv2.imwrite(cropped_fname, plate_img)
-                    if lpr_results.decoded_label["state_label"]:
-                    
-                        # append new plate no to list of already recognized plates
-                        self.plates.append(plate_no)
-
-                        # update car slot with plate_no, plate_img data
-                        car.plate_no = plate_no
-                        car.plate_img = plate_img
-
-                        # save img used for lpr frame
-                        car.lpr_img = frame.copy()
-                        draw_box(car.lpr_img, car.bbox, color=(50, 50, 220), line_thickness=3)
-                        draw_box(car.lpr_img, car.plate_bbox, color=(50, 50, 220), line_thickness=3)
-                    
-                    print (f'[PlateRecognition] Wrote image for plate {plate_no} to {cropped_fname}')
-                    self.api_interface.update_plate_event(cropped_fname, plate_num, plate_type, plate_state, plate_country)
-            '''        
-            '''
-            if len(lpr_results) > 0 and len(lpr_results[0].plates) > 0:
-                # get plate no
-                plate = lpr_results[0].plates[0]
-                plate_no = f'{self._city_code(plate.state_string)} {plate.value_unicode}'.strip()
-
-                # if plate no is NEW then save img to disk
-                if plate_no not in self.plates[stream_no]:
-
-                    # save vehicle, cropped plate images
-                    fname = os.path.join(folder, f'{tstamp}-{plate_no}.jpg') 
-                    cropped_fname = os.path.join(folder, f'{tstamp}-{plate_no}-pl.jpg')                             
-                    cv2.imwrite(fname, car_img)
-                    cv2.imwrite(cropped_fname, plate_img)
-                    
-                    # append new plate no to list of already recognized plates
-                    self.plates[stream_no].append(plate_no)
 
                     # update car slot with plate_no, plate_img data
                     car.plate_no = plate_no
@@ -419,17 +468,48 @@ class PlateRecognition(object):
                     car.lpr_img = frame.copy()
                     draw_box(car.lpr_img, car.bbox, color=(50, 50, 220), line_thickness=3)
                     draw_box(car.lpr_img, car.plate_bbox, color=(50, 50, 220), line_thickness=3)
-                    
-                    print (f'[PlateRecognition] Wrote image for plate {plate_no} to {cropped_fname}')
-
-                # DEBUG ONLY
-                if len(lpr_results) > 1 and len(lpr_results[1].plates) > 0:
-                    print ('$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-                    plate = lpr_results[1].plates[0]
-                    print (f'Plate No: {plate_no}, Plate No 2: {self._city_code(plate.state_string)} {plate.value_unicode}'.strip())
-                elif len(lpr_results[0].plates) > 1:
-                    print ('******************************************')
-            '''
+                
+                print (f'[PlateRecognition] Wrote image for plate {plate_no} to {cropped_fname}')
+                self.api_interface.update_plate_event(cropped_fname, plate_num, plate_type, plate_state, plate_country)
+        '''        
+        '''
+        if len(lpr_results) > 0 and len(lpr_results[0].plates) > 0:
+            # get plate no
+            plate = lpr_results[0].plates[0]
+            plate_no = f'{self._city_code(plate.state_string)} {plate.value_unicode}'.strip()
+
+            # if plate no is NEW then save img to disk
+            if plate_no not in self.plates[stream_no]:
+
+                # save vehicle, cropped plate images
+                fname = os.path.join(folder, f'{tstamp}-{plate_no}.jpg') 
+                cropped_fname = os.path.join(folder, f'{tstamp}-{plate_no}-pl.jpg')                             
+                cv2.imwrite(fname, plate_img)
+                cv2.imwrite(cropped_fname, plate_img)
+                
+                # append new plate no to list of already recognized plates
+                self.plates[stream_no].append(plate_no)
+
+                # update car slot with plate_no, plate_img data
+                car.plate_no = plate_no
+                car.plate_img = plate_img
+
+                # save img used for lpr frame
+                car.lpr_img = frame.copy()
+                draw_box(car.lpr_img, car.bbox, color=(50, 50, 220), line_thickness=3)
+                draw_box(car.lpr_img, car.plate_bbox, color=(50, 50, 220), line_thickness=3)
+                
+                print (f'[PlateRecognition] Wrote image for plate {plate_no} to {cropped_fname}')
+
+            # DEBUG ONLY
+            if len(lpr_results) > 1 and len(lpr_results[1].plates) > 0:
+                print ('$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+                plate = lpr_results[1].plates[0]
+                print (f'Plate No: {plate_no}, Plate No 2: {self._city_code(plate.state_string)} {plate.value_unicode}'.strip())
+            elif len(lpr_results[0].plates) > 1:
+                print ('******************************************')
+        '''
+
     # # ------------------------
     # # send plate image to Carrida alpr module
     # def update(self, plate_rect_params, stream_no: int, frame):
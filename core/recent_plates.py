@@ -0,0 +1,56 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+# Plates recognized recently, used to publish a plate once per time window (anpr_ivms.py, see TrackReader)
+# -> dict of {(scope, plate_no): expiry time} kept in least recently used order: lookups are O(1), expired
+#    entries are dropped from the old end, and at most max_size plates are kept (the least recently seen go first)
+# -> scope: the stream of the plate (per_stream) or one scope for all the streams (a car passing several cameras)
+# -> thread-safe, add() checks and inserts under one lock
+class RecentPlates(object):
+
+    def __init__(self, window_s=60.0, max_size=1000, per_stream=True):
+
+        self.window_s = window_s
+        self.max_size = max_size
+        self.per_stream = per_stream
+
+        self.plates = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _key(self, stream_no, plate_no):
+        return (stream_no if self.per_stream else None, plate_no)
+
+    # drop the expired plates from the old end (every add refreshes its plate, so that is where they are)
+    # -> a plate added with a longer ttl than a newer one is dropped when it reaches the old end
+    def _expire(self, now):
+        while self.plates:
+            key, expiry = next(iter(self.plates.items()))
+            if expiry > now:
+                break
+            del self.plates[key]
+
+    # True if the plate has not been seen within its window (-> it is new and has been added), False otherwise;
+    # either way the plate is refreshed: seen again now, it expires ttl_s (default window_s) from now
+    def add(self, stream_no, plate_no, ttl_s=None):
+        now = time.monotonic()
+        key = self._key(stream_no, plate_no)
+        with self.lock:
+            self._expire(now)
+            expiry = self.plates.pop(key, None)
+            new = expiry is None or expiry <= now
+            self.plates[key] = now + (self.window_s if ttl_s is None else ttl_s)
+            while len(self.plates) > self.max_size:
+                self.plates.popitem(last=False)
+        return new
+
+    # True if the plate has been seen within its window (does not refresh it)
+    def __contains__(self, key):
+        stream_no, plate_no = key
+        with self.lock:
+            expiry = self.plates.get(self._key(stream_no, plate_no))
+        return expiry is not None and expiry > time.monotonic()
+
+    def __len__(self):
+        return len(self.plates)
@@ -0,0 +1,131 @@
+import os
+import numpy as np
+
+from core.detection_object import FrameDetections
+from core.frame_processor import FrameProcessor
+from core.ms_violation_detector import MSViolationDetector
+from core.violation_recorder import ViolationRecorder
+from utils.stage_timer import create_stage_timer
+from utils.image_writer import get_image_writer
+
+# Capture / replay of the per frame detections of the tiler probe
+# -> a capture file is a magic header followed by one fixed size record per object (DETECTION_DTYPE);
+#    frames without objects are not stored
+# -> written by the pipeline when PERF.CAPTURE_DETECTIONS is set, read back by replay_ivms.py which drives
+#    FrameProcessor with them and the frames of a local video, without DeepStream
+
+CAPTURE_MAGIC = b'IVMSDET1'
+
+DETECTION_DTYPE = np.dtype([
+    ('stream', '<u2'),
+    ('frame_num', '<u4'),
+    ('class_id', '<i2'),
+    ('track_id', '<u8'),
+    ('score', '<f4'),
+    ('left', '<f4'),
+    ('top', '<f4'),
+    ('width', '<f4'),
+    ('height', '<f4'),
+])
+
+
+# appends the detections of every frame to a capture file
+# -> records go through the file object buffer, flush() / close() push them to disk
+class DetectionCapture(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(CAPTURE_MAGIC)
+        self.records = 0
+
+    def write(self, stream_no, frame_number, detections):
+        count = len(detections)
+        if count == 0:
+            return
+        records = np.empty(count, dtype=DETECTION_DTYPE)
+        records['stream'] = stream_no
+        records['frame_num'] = frame_number
+        records['class_id'] = detections.class_id
+        records['track_id'] = detections.track_id
+        records['score'] = detections.score
+        records['left'] = detections.left
+        records['top'] = detections.top
+        records['width'] = detections.width
+        records['height'] = detections.height
+        self.file.write(records.tobytes())
+        self.records += count
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# read a capture file -> {stream: {frame_num: FrameDetections}}
+def load_detections(path):
+    with open(path, 'rb') as f:
+        magic = f.read(len(CAPTURE_MAGIC))
+        if magic != CAPTURE_MAGIC:
+            raise ValueError(f'{path} is not a detection capture file')
+        data = f.read()
+    # a capture cut short (pipeline killed while writing) ends with a partial record -> dropped
+    partial = len(data) % DETECTION_DTYPE.itemsize
+    if partial:
+        print(f'{path}: partial last record ({partial} bytes) ignored')
+        data = data[:len(data) - partial]
+    records = np.frombuffer(data, dtype=DETECTION_DTYPE)
+
+    detections = {}
+    if len(records) == 0:
+        return detections
+
+    # records of a frame are contiguous -> split at every change of (stream, frame_num)
+    key = records['stream'].astype(np.int64) << 32 | records['frame_num'].astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    stops = np.r_[starts[1:], len(records)]
+    for start, stop in zip(starts, stops):
+        rec = records[start:stop]
+        frames = detections.setdefault(int(rec['stream'][0]), {})
+        frames[int(rec['frame_num'][0])] = FrameDetections(
+            rec['track_id'].astype(np.uint64), rec['class_id'].astype(np.int32), rec['score'].copy(),
+            rec['left'].copy(), rec['top'].copy(), rec['width'].copy(), rec['height'].copy())
+    return detections
+
+
+# detections of a frame without objects
+def empty_detections():
+    return FrameDetections(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int32),
+                           *[np.zeros(0, dtype=np.float32) for i in range(5)])
+
+
+# FrameProcessor with its analytics, for running without DeepStream (replay_ivms.py, benchmarks)
+# -> everything the recorder / plate recognition write goes below output_dir, no RabbitMQ / API connection
+# -> anpr: MATCH plate matching only, no OCR; ON with OCR (if ANPR_ENABLE); OFF no plate recognition
+def create_offline_processor(cfg, configs_dir, num_sources, output_dir, anpr='MATCH'):
+    os.makedirs(output_dir, exist_ok=True)
+    cfg.VIDEO_OUTPUT.VIOLATION_FOLDER = os.path.join(output_dir, 'violations')
+    cfg.VIDEO_OUTPUT.EVENT_RECORDING_FOLDER = os.path.join(output_dir, 'event_recordings')
+    cfg.VIDEO_OUTPUT.LPR_FOLDER = os.path.join(output_dir, 'lpr')
+    fb_cfg = cfg.VIDEO_OUTPUT.get('FRAME_BUFFER') or {}
+    if str(fb_cfg.get('MODE', 'raw')).lower() == 'gop':
+        # no encoder to feed the encoded buffer without the pipeline
+        print('FRAME_BUFFER.MODE gop needs the recording encoder, using raw')
+        fb_cfg.MODE = 'raw'
+    if 'SPILL_DIR' in fb_cfg:
+        fb_cfg.SPILL_DIR = os.path.join(output_dir, 'spill')
+
+    width, height = int(cfg.VIDEO_OUTPUT.MUXER.WIDTH), int(cfg.VIDEO_OUTPUT.MUXER.HEIGHT)
+    # image writer shared by plate recognition and the recorder
+    get_image_writer(cfg.VIDEO_OUTPUT.get('IMAGE_WRITER'))
+    lpr = None
+    if anpr != 'OFF':
+        # plate recognition needs torch (LPR_QAT)
+        from core.plate_recognition import PlateRecognition
+        lpr = PlateRecognition(configs_dir, cfg.VIDEO_OUTPUT.LPR_FOLDER, num_sources, width, height, None,
+                               anpr=bool(cfg.ANPR_ENABLE) and anpr == 'ON', ocr_cfg=cfg.DETECTIONS.OCR)
+
+    recorder = ViolationRecorder(cfg, num_sources, None, connect_queue=False)
+    stage_timer = create_stage_timer(cfg.get('PERF') or {})
+    return FrameProcessor(cfg, num_sources, lpr, MSViolationDetector(), recorder, stage_timer)
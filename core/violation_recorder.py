@@ -8,10 +8,13 @@ from lxml import etree
 from easydict import EasyDict as edict
 from datetime import datetime
 
-from core.frame_buffer import FrameBuffer
+from core.frame_buffer import FrameBuffer, SharedFrameBuffer, create_frame_buffer
+from core.gop_buffer import EncodedFrameBuffer, check_ffmpeg, remux_clip
+from core.clip_writer import create_clip_writer_pool, clip_job, write_violation_video, write_event_video
 from utils.draw import write_text
 from utils.draw import draw_box
 from utils.create_directories import create_directories
+from utils.image_writer import get_image_writer
 
 import pika
 import json
@@ -24,7 +27,8 @@ class ViolationRecorder(object):
     LABEL_FONT = cv2.FONT_HERSHEY_COMPLEX_SMALL # Font of text written on the label
     FONT_SCALE = 0.74
 
-    def __init__(self, cfg, stream_count, api_interface):
+    # connect_queue: False to run without a RabbitMQ broker (replay), event video paths are not published then
+    def __init__(self, cfg, stream_count, api_interface, connect_queue=True):
         
         self.api_interface = api_interface
         self.fps = 30  # hardcoded! TODO: get it from DeepStream nvstreamux?
@@ -33,6 +37,14 @@ class ViolationRecorder(object):
         # we write the accumulated frames to file, all of this is governed by fps and
         # length of the recording in the app_setings.yaml
         self.received_events = [] # events from rabbitmq are accumulated here
+        # received events are added by the queue reader thread and updated by the analytics of every stream
+        self.events_lock = threading.Lock()
+        # event recordings record every stream -> every stream's frames must be buffered (see buffers_event_history)
+        self.event_recording = bool(cfg.VIDEO_OUTPUT.get('EVENT_RECORDING', True))
+
+        # writer threads started and not finished yet, failed RabbitMQ publishes (see metrics)
+        self.stats_lock = threading.Lock()
+        self.stats = {'writers_pending': 0, 'writers_started': 0, 'publish_failures': 0}
 
         self.codec = cv2.VideoWriter_fourcc(*cfg.VIDEO_OUTPUT.FORMAT)    
         self.ext = '.mp4' if 'MP4V' in cfg.VIDEO_OUTPUT.FORMAT else '.avi'
@@ -53,7 +65,34 @@ class ViolationRecorder(object):
         
         # save all incoming frames to this buffer; we add 100 frames more because some times the 
         # lpr frame comes BEFORE that 1st frame of the video 
-        self.frame_buffer = FrameBuffer(2 * self.FRAME_RECORDING_THRESH + 100, stream_count)       
+        # -> frames are kept raw or encoded depending on VIDEO_OUTPUT.FRAME_BUFFER.MODE
+        fb_cfg = cfg.VIDEO_OUTPUT.get('FRAME_BUFFER') or {}
+        self.encoded_buffer = None
+        self.event_ext = '.avi'
+        if str(fb_cfg.get('MODE', 'raw')).lower() == 'gop':
+            # the history is kept as the H.265 access units of the raw recording encoder (one GOP per second),
+            # clips are remuxed from them; the raw ring only keeps the last frames the violation image is taken from
+            check_ffmpeg()
+            self.encoded_buffer = EncodedFrameBuffer(stream_count, 2 * self.FRAME_RECORDING_THRESH + 100 + self.fps, self.fps)
+            self.clip_ext = '.' + str(fb_cfg.get('CLIP_CONTAINER', 'mp4')).lower()
+            self.event_ext = self.clip_ext
+            self.frame_buffer = FrameBuffer(int(fb_cfg.get('EVIDENCE_FRAMES', 64)), stream_count, self.output_width, self.output_height)
+        else:
+            self.frame_buffer = create_frame_buffer(fb_cfg, 2 * self.FRAME_RECORDING_THRESH + 100,
+                                                    stream_count, self.output_width, self.output_height)
+
+        # the frames of a stream are only buffered while they may end up in a clip (see needs_frame), unless
+        # BUFFER_IDLE is set: every frame of the streams the buffer serves is buffered then
+        self.buffer_idle = bool(fb_cfg.get('BUFFER_IDLE', False))
+        # frames a stream stays buffered after its last frame with vehicles: the pre-roll of a violation detected
+        # late (analytics queue) or of an event received after the vehicles left
+        self.activity_hold = 2 * self.FRAME_RECORDING_THRESH
+        self.active_fi = [None] * stream_count  # last frame of the stream with vehicles
+
+        # shared memory buffer -> the videos are written by a pool of processes reading the rings directly
+        self.clip_writers = None
+        if isinstance(self.frame_buffer, SharedFrameBuffer):
+            self.clip_writers = create_clip_writer_pool(int(fb_cfg.get('CLIP_WORKERS', 2)))
 
         # --- image label parameters
         self.sitecode = cfg.LABEL.SITECODE
@@ -71,7 +110,12 @@ class ViolationRecorder(object):
         for i in range(0, stream_count):
             self.detections.append( list() ) #different object reference each time
             
-        self.init_rabbitmq()
+        # lpr / overview images are encoded and written by the shared image writer, the xml is written once they are
+        self.image_writer = get_image_writer(cfg.VIDEO_OUTPUT.get('IMAGE_WRITER'))
+
+        self.channel = None
+        if connect_queue:
+            self.init_rabbitmq()
 
     def init_rabbitmq(self):
         # get this from config file
@@ -87,7 +131,85 @@ class ViolationRecorder(object):
     # update buffer with specified frame, frame number
     def update_buffer(self, img, stream_no, index):
         self.frame_buffer.append(img, stream_no, index)       
+
+    # get the buffer slot the next frame of the stream must be written to (see FrameBuffer.next_slot)
+    def next_buffer_slot(self, stream_no):
+        return self.frame_buffer.next_slot(stream_no)
+
+    # mark the slot returned by next_buffer_slot as holding frame 'index'
+    def commit_buffer(self, stream_no, index):
+        self.frame_buffer.commit(stream_no, index)
+
+    # number of frames a slot returned by next_buffer_slot stays untouched once committed
+    def buffer_slot_lifetime(self):
+        return self.frame_buffer.slot_lifetime()
+
+    # True if the raw frame buffer must hold the frames of every stream (event recordings), False if it only
+    # needs those of the streams violations are detected on
+    def buffers_event_history(self):
+        return self.event_recording and self.encoded_buffer is None
+
+    # True if the frame buffer needs frame fi of the stream (called by the probe for every frame of the streams it
+    # serves, before the frame is converted); active: the frame holds vehicles (cars, plates, violation objects)
+    # -> a violation clip of the stream or an event clip (every stream) is still collecting its frames
+    # -> the pre-roll must be kept: the stream had vehicles during the last activity_hold frames
+    # -> the detections / events are updated by the analytics (maybe on another thread): a violation or an event
+    #    is seen here a few frames late, activity_hold covers that
+    def needs_frame(self, stream_no, fi, active):
+        if self.buffer_idle:
+            return True
+        last = self.active_fi[stream_no]
+        if active or (last is not None and fi < last):  # frame_num restart -> the hold starts over
+            last = self.active_fi[stream_no] = fi if active else None
+        if self.detections[stream_no] or self.received_events:
+            return True
+        return last is not None and fi - last <= self.activity_hold
+
+    # encoded buffer only: tag the encoded access unit having this pts with frame 'index'
+    def note_frame_pts(self, stream_no, index, pts):
+        self.encoded_buffer.note_frame(stream_no, index, pts)
+
+    # encoded buffer only: append encoded access unit (called from the appsink of the recording encoder)
+    def update_encoded_buffer(self, data, stream_no, pts, keyframe):
+        self.encoded_buffer.push(stream_no, data, pts, keyframe)
+
+    # encoded buffer only: an access unit of the stream was lost, discard its GOP
+    def drop_encoded_gop(self, stream_no):
+        self.encoded_buffer.drop_gop(stream_no)
     
+    # thread writing a violation / event recording, counted in stats['writers_pending'] until it returns
+    def _writer_thread(self, target, args):
+        with self.stats_lock:
+            self.stats['writers_pending'] += 1
+            self.stats['writers_started'] += 1
+        return threading.Thread(target=self._run_writer, args=(target, args), daemon=True)
+
+    def _run_writer(self, target, args):
+        try:
+            target(*args)
+        finally:
+            with self.stats_lock:
+                self.stats['writers_pending'] -= 1
+
+    # recorder state for the metrics endpoint: buffer occupancy / bytes, pending violations and events, writers
+    def metrics(self):
+        with self.stats_lock:
+            metrics = dict(self.stats)
+        with self.events_lock:
+            metrics['pending_events'] = len(self.received_events)
+        metrics['pending_violations'] = [len(detections) for detections in self.detections]
+        metrics['buffer_frames'] = [self.frame_buffer.length(i) for i in range(self.stream_count)]
+        metrics['buffer_capacity'] = self.frame_buffer.buffer_size
+        metrics['buffer_bytes'] = self.frame_buffer.nbytes()
+        if hasattr(self.frame_buffer, 'disk_nbytes'):
+            metrics['buffer_disk_bytes'] = self.frame_buffer.disk_nbytes()
+        metrics['buffer_stats'] = dict(getattr(self.frame_buffer, 'stats', {}))
+        if self.encoded_buffer is not None:
+            metrics['encoded_buffer_units'] = [self.encoded_buffer.length(i) for i in range(self.stream_count)]
+            metrics['encoded_buffer_bytes'] = self.encoded_buffer.nbytes()
+            metrics['encoded_buffer_stats'] = dict(self.encoded_buffer.stats)
+        return metrics
+
     # ---- mobile & seatbelt violation recording ----------
     def record_mobile(self, violations, stream_no, fi):
      
@@ -104,9 +226,18 @@ class ViolationRecorder(object):
                     'lpr_img': v.lpr_img,               
                     'timestamp': v.violation_timestamp,
                     'frames_elapsed': fi - v.violation_fi - 1,
+                    'violation_img': None,
                     'sent': False
                 })
 
+                # the raw ring of an encoded buffer is short -> keep a copy of the violation frame right now
+                if self.encoded_buffer is not None:
+                    frame = self.frame_buffer.get_frame(stream_no, v.violation_fi, copy=True)
+                    if frame is not None:
+                        detection.violation_img = frame.img
+                    else:
+                        logging.warning(f'[ViolationRecorder] Violation frame {v.violation_fi} of stream {stream_no} is no longer buffered')
+
                 # we might have a double detecion 
                 # TODO: handle both detections
                 if v.mobile_detected:
@@ -126,9 +257,15 @@ class ViolationRecorder(object):
 
                 if det.frames_elapsed >= self.FRAME_RECORDING_THRESH:
                     det.sent = True
-                    frames_to_write = self.frame_buffer.get_frames(stream_no, det.violation_fi, fi, 2 * self.FRAME_RECORDING_THRESH)
-                                       
-                    workThread = threading.Thread(target=self.write_ms_detection, args=(frames_to_write, det), daemon=True)
+                    if self.encoded_buffer is not None:
+                        units = self.encoded_buffer.get_units(stream_no, det.violation_fi, fi, 2 * self.FRAME_RECORDING_THRESH)
+                        workThread = self._writer_thread(self.write_ms_detection_clip, (units, det))
+                    else:
+                        # the window holds views into the ring -> pinned as it is taken, before the probe buffers the
+                        # next frame (we may run on the analytics worker); the writer releases the frames as it consumes them
+                        frames_to_write = self.frame_buffer.get_frames(stream_no, det.violation_fi, fi, 2 * self.FRAME_RECORDING_THRESH, pin=True)
+                        writer = self.write_ms_detection_shared if self.clip_writers is not None else self.write_ms_detection
+                        workThread = self._writer_thread(writer, (frames_to_write, det))
                     workThread.start()                        
           
             # clear detections sent in the loop above
@@ -139,6 +276,7 @@ class ViolationRecorder(object):
 
 
     # write images / video of a mobile phone usage detection to output folder, then send message to rabittMQ broker
+    # -> frames is a pinned window of the frame buffer, it is unpinned here
     def write_ms_detection(self, frames, det):       
 
         try:
@@ -149,27 +287,14 @@ class ViolationRecorder(object):
 
 
             case_index = det.id
-
-            # datetime folder to store the detection files
-            dest_folder = self.output_folder + '/' + det.timestamp[0:8]
-
-            # create datetime folder if it doesn't exist
-            if not os.path.exists(dest_folder):
-                os.mkdir(dest_folder)
-
-            # create incident subfolder
-            dest_folder += '/' + det.timestamp
-            if not os.path.exists(dest_folder):
-                os.mkdir(dest_folder)
-
-            # compute filename
-            dest_filename = self.device_id + '-' + det.timestamp + f'{case_index:08}'  # see https://stackoverflow.com/questions/339007/how-to-pad-zeroes-to-a-string           
+            dest_folder, dest_filename = self._violation_paths(det)
 
             # write lpr image
             lprframe_fname = ''
+            images = []
             if det.lpr_img is not None:
                 lprframe_fname = dest_filename + '-2.png'
-                cv2.imwrite(dest_folder + '/' + lprframe_fname, det.lpr_img)        
+                images.append(self.image_writer.write(dest_folder + '/' + lprframe_fname, det.lpr_img))        
 
             # write video 
             print (f'[ViolationRecorder] Writing video .... No. of frames: {len(frames)}, Dimensions: {(self.output_width, self.output_height)}')
@@ -205,7 +330,7 @@ class ViolationRecorder(object):
             print ('Writing overview frame ....')
             self.write_label(violation_img, det.timestamp, None, det.violation_type)
             overview_fname = dest_filename + '-1.png'
-            cv2.imwrite(dest_folder + '/' + overview_fname, violation_img)
+            images.append(self.image_writer.write(dest_folder + '/' + overview_fname, violation_img))
             
             #DEBUG ONLY
             print(f'Wrote overview frame {overview_fname}')
@@ -215,12 +340,131 @@ class ViolationRecorder(object):
             os.system(f'ffmpeg -i {dest_folder}/{video_fname} -c:v h264_nvmpi -c:a copy {dest_folder}/{dest_filename}.mp4')
             self._remove_file(f'{dest_folder}/{video_fname}')
             
-            # get xml and write it to disk
+            # get xml and write it to disk (after the images it references)
+            self._wait_images(images)
             xml = self.create_xml(det.timestamp, case_index, video_fname, overview_fname, lprframe_fname, det.violation_type)
             xml.write(dest_folder + '/' + dest_filename + '.xml', pretty_print=True)
 
         except Exception:
             logging.exception("[ViolationRecorder] write_mobile_detection function failed") 
+        finally:
+            # frames not consumed (e.g. the writer failed)
+            self.frame_buffer.unpin(frames)
+
+    # same as write_ms_detection, but the video is written by the clip writer pool straight from the shared memory ring
+    # -> frames is a pinned window of the SharedFrameBuffer, it is unpinned here
+    def write_ms_detection_shared(self, frames, det):
+
+        try:
+            case_index = det.id
+            try:
+                dest_folder, dest_filename = self._violation_paths(det)
+
+                # write lpr image
+                lprframe_fname = ''
+                images = []
+                if det.lpr_img is not None:
+                    lprframe_fname = dest_filename + '-2.png'
+                    images.append(self.image_writer.write(dest_folder + '/' + lprframe_fname, det.lpr_img))
+
+                # write video
+                print (f'[ViolationRecorder] Writing video .... No. of frames: {len(frames)}, Dimensions: {(self.output_width, self.output_height)}')
+                video_fname = dest_filename + f'.{self.ext}'
+                job = clip_job(self.frame_buffer, frames, path=dest_folder + '/' + video_fname, fourcc=self.codec, fps=self.fps,
+                               size=(self.output_width, self.output_height),
+                               violation_fi=det.violation_fi, violation_bbox=det.violation_bbox)
+                self.clip_writers.submit(write_violation_video, job).result()
+
+                # overview image, taken from the (still pinned) ring
+                violation_img = None
+                frame = next((frame for frame in frames if frame.index == det.violation_fi), None)
+                if frame is not None:
+                    violation_img = cv2.resize(frame.img, (self.output_width, self.output_height), interpolation = cv2.INTER_LINEAR)
+            finally:
+                self.frame_buffer.unpin(frames)
+
+            print ('Writing overview frame ....')
+            overview_fname = ''
+            if violation_img is not None:
+                write_text(violation_img, f"FI: {det.violation_fi}", (30, self.output_height - 50), (255,0,0))
+                draw_box(violation_img, det.violation_bbox, label="", color=(50, 50, 220), line_thickness=3)
+                self.write_label(violation_img, det.timestamp, None, det.violation_type)
+                overview_fname = dest_filename + '-1.png'
+                images.append(self.image_writer.write(dest_folder + '/' + overview_fname, violation_img))
+
+            # --- transcode file from XVID -> x264 using ffmpeg
+            time.sleep(5) # Sleep for 5 seconds
+            os.system(f'ffmpeg -i {dest_folder}/{video_fname} -c:v h264_nvmpi -c:a copy {dest_folder}/{dest_filename}.mp4')
+            self._remove_file(f'{dest_folder}/{video_fname}')
+
+            # get xml and write it to disk (after the images it references)
+            self._wait_images(images)
+            xml = self.create_xml(det.timestamp, case_index, video_fname, overview_fname, lprframe_fname, det.violation_type)
+            xml.write(dest_folder + '/' + dest_filename + '.xml', pretty_print=True)
+
+        except Exception:
+            logging.exception("[ViolationRecorder] write_ms_detection_shared function failed")
+
+    # same as write_ms_detection, but the video is remuxed from the encoded buffer (no decode / re-encode);
+    # only the annotated violation frame is encoded
+    def write_ms_detection_clip(self, units, det):
+
+        try:
+            case_index = det.id
+            dest_folder, dest_filename = self._violation_paths(det)
+
+            # write lpr image
+            lprframe_fname = ''
+            images = []
+            if det.lpr_img is not None:
+                lprframe_fname = dest_filename + '-2.png'
+                images.append(self.image_writer.write(dest_folder + '/' + lprframe_fname, det.lpr_img))
+
+            # write video
+            print (f'[ViolationRecorder] Remuxing video .... No. of frames: {len(units)}')
+            video_fname = dest_filename + self.clip_ext
+            remux_clip(units, dest_folder + '/' + video_fname, self.fps)
+
+            # write overview image
+            overview_fname = ''
+            if det.violation_img is not None:
+                violation_img = cv2.resize(det.violation_img, (self.output_width, self.output_height), interpolation = cv2.INTER_LINEAR)
+                draw_box(violation_img, det.violation_bbox, label="", color=(50, 50, 220), line_thickness=3)
+                self.write_label(violation_img, det.timestamp, None, det.violation_type)
+                overview_fname = dest_filename + '-1.png'
+                images.append(self.image_writer.write(dest_folder + '/' + overview_fname, violation_img))
+
+            # get xml and write it to disk (after the images it references)
+            self._wait_images(images)
+            xml = self.create_xml(det.timestamp, case_index, video_fname, overview_fname, lprframe_fname, det.violation_type)
+            xml.write(dest_folder + '/' + dest_filename + '.xml', pretty_print=True)
+
+        except Exception:
+            logging.exception("[ViolationRecorder] write_ms_detection_clip function failed")
+
+    # wait for the images queued to the image writer (Events returned by ImageWriter.write)
+    def _wait_images(self, images):
+        for done in images:
+            done.wait()
+
+    # create the folders of a violation, return folder and base filename of the violation files
+    def _violation_paths(self, det):
+        # datetime folder to store the detection files
+        dest_folder = self.output_folder + '/' + det.timestamp[0:8]
+
+        # create datetime folder if it doesn't exist
+        if not os.path.exists(dest_folder):
+            os.mkdir(dest_folder)
+
+        # create incident subfolder
+        dest_folder += '/' + det.timestamp
+        if not os.path.exists(dest_folder):
+            os.mkdir(dest_folder)
+
+        # compute filename
+        dest_filename = self.device_id + '-' + det.timestamp + f'{det.id:08}'  # see https://stackoverflow.com/questions/339007/how-to-pad-zeroes-to-a-string
+
+        return dest_folder, dest_filename
 
     # create violation xml file
     def create_xml(self, timestamp, case_index, video_fname, overview_fname, videoframe_fname, v_type):
@@ -366,6 +610,9 @@ class ViolationRecorder(object):
 
     # This is called inside Queue Reader Thread
     def create_recording_event(self, payload):
+        if not self.event_recording:
+            print(f"Event recording disabled, event {payload['event_id']} ignored")
+            return
         event = {
             "event_id": payload['event_id'],
             'event_violation_type': payload['event_violation_type'],
@@ -376,19 +623,26 @@ class ViolationRecorder(object):
             "stream_id": int(payload['stream_id'])-1
         }
         print(event)
-        self.received_events.append(event)
-        video_file_path = f"event_recordings/{datetime.now().strftime('%Y%m%d.%H%M%S.%f')[:-3][0:8]}/{payload['event_id']}/{int(payload['stream_id'])-1}.avi"
+        with self.events_lock:
+            self.received_events.append(event)
+        video_file_path = f"event_recordings/{datetime.now().strftime('%Y%m%d.%H%M%S.%f')[:-3][0:8]}/{payload['event_id']}/{int(payload['stream_id'])-1}{self.event_ext}"
         message = {'event_id': int(payload['event_id']), "event_videos_path": video_file_path, "gps_coordinates": "None"}
         
         try:
             self.channel.basic_publish(exchange='', routing_key='event_video', body=json.dumps(message))
         except:
+            with self.stats_lock:
+                self.stats['publish_failures'] += 1
             self.init_rabbitmq()
             # retry
             self.channel.basic_publish(exchange='', routing_key='event_video', body=json.dumps(message))
     
-    # Called at every iteration inside tiler probe, 
+    # Called at every iteration inside tiler probe (or by the analytics worker of every stream)
     def update_recording_events(self, frame_index):
+        with self.events_lock:
+            self._update_recording_events(frame_index)
+
+    def _update_recording_events(self, frame_index):
         for event in self.received_events:
             # Set frame index when event is received
             if not event['fi_set']:
@@ -403,10 +657,16 @@ class ViolationRecorder(object):
                 # These will be raw recordings
                 print("Record it")
                 for stream_no in range(self.stream_count):
-                    frames_to_write = self.frame_buffer.get_frames(stream_no, event['frame_index'], 
-                                                                   frame_index, 2 * self.FRAME_RECORDING_THRESH)
-                    
-                    workThread = threading.Thread(target=self.write_event_recordings, args=(frames_to_write, stream_no, dest_folder), daemon=True)
+                    if self.encoded_buffer is not None:
+                        units = self.encoded_buffer.get_units(stream_no, event['frame_index'],
+                                                              frame_index, 2 * self.FRAME_RECORDING_THRESH)
+                        workThread = self._writer_thread(self.write_event_clip, (units, stream_no, dest_folder))
+                    else:
+                        # pinned as the violation windows, released by the writer
+                        frames_to_write = self.frame_buffer.get_frames(stream_no, event['frame_index'],
+                                                                       frame_index, 2 * self.FRAME_RECORDING_THRESH, pin=True)
+                        writer = self.write_event_recordings_shared if self.clip_writers is not None else self.write_event_recordings
+                        workThread = self._writer_thread(writer, (frames_to_write, stream_no, dest_folder))
                     workThread.start()
                 event['recorded'] = True        
                 #self.api_interface.update_event(event['event_id'], dest_folder, event['event_violation_type'])
@@ -427,6 +687,7 @@ class ViolationRecorder(object):
         # # clear detections sent in the loop above
         # self.detections[stream_no][:] = [det for det in self.detections[stream_no] if not det.sent]
         
+    # frames is a pinned window of the frame buffer, it is unpinned here
     def write_event_recordings(self, frames, stream_no, dest_folder):
         # TODO Write file path to API
         # timestamp = datetime.now().strftime("%Y%m%d.%H%M%S.%f")[:-3]
@@ -434,11 +695,31 @@ class ViolationRecorder(object):
         # create_directories(dest_folder)
         video_fname = str(stream_no) + self.ext 
         print(os.path.join(dest_folder, video_fname))
-        out = cv2.VideoWriter(os.path.join(dest_folder, video_fname), self.codec, self.fps,
-                               (self.output_width, self.output_height))
-        for frame in frames:
-            frame_img = frame.img
-            out.write(frame_img)
-        out.release()
+        try:
+            out = cv2.VideoWriter(os.path.join(dest_folder, video_fname), self.codec, self.fps,
+                                   (self.output_width, self.output_height))
+            for frame in frames:
+                frame_img = frame.img
+                out.write(frame_img)
+            out.release()
+        finally:
+            self.frame_buffer.unpin(frames)
 
+    # same as write_event_recordings, but the video is written by the clip writer pool (frames is a pinned window)
+    def write_event_recordings_shared(self, frames, stream_no, dest_folder):
+        video_fname = str(stream_no) + self.ext
+        print(os.path.join(dest_folder, video_fname))
+        try:
+            job = clip_job(self.frame_buffer, frames, path=os.path.join(dest_folder, video_fname), fourcc=self.codec, fps=self.fps,
+                           size=(self.output_width, self.output_height))
+            self.clip_writers.submit(write_event_video, job).result()
+        except Exception:
+            logging.exception("[ViolationRecorder] write_event_recordings_shared function failed")
+        finally:
+            self.frame_buffer.unpin(frames)
 
+    # same as write_event_recordings, but the video is remuxed from the encoded buffer
+    def write_event_clip(self, units, stream_no, dest_folder):
+        video_fname = str(stream_no) + self.event_ext
+        print(os.path.join(dest_folder, video_fname))
+        remux_clip(units, os.path.join(dest_folder, video_fname), self.fps)
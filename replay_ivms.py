@@ -0,0 +1,149 @@
+# Replay runner: drives the per frame analytics of the tiler probe (FrameProcessor -> PlateRecognition,
+# MSViolationDetector, ViolationRecorder) on a CPU-only box, without DeepStream / pyds / cameras
+# -> detections come from a capture file written by the pipeline (PERF.CAPTURE_DETECTIONS in app_settings.yaml)
+# -> frames come from local videos (one per stream, decoded with OpenCV and scaled to the muxer size), or are
+#    blank if a stream has no video
+# -> reports the processing fps per stream and the violations emitted, optionally as JSON (CI)
+#
+# usage (from the repository root):
+#   python replay_ivms.py --detections capture.dets --video 1:rear_center.mp4 --json replay.json
+import os
+import json
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from utils.yaml_parser import YamlParser
+from utils.configure_logging import configure_logging
+from core.replay import load_detections, empty_detections, create_offline_processor
+
+
+def run_replay(opt):
+
+    PATH = os.path.dirname(os.path.abspath(__file__))
+    CONFIGS_DIR = os.path.join(PATH, "config")
+
+    cfg = YamlParser(config_file=os.path.join(CONFIGS_DIR, opt.settings))
+    configure_logging(cfg.LOG_LEVEL)
+
+    detections = load_detections(opt.detections)
+    videos = {}
+    for spec in opt.video:
+        stream_no, path = spec.split(':', 1)
+        videos[int(stream_no)] = path
+
+    num_sources = opt.streams if opt.streams > 0 else len(cfg.VIDEO_SOURCES)
+    width, height = int(cfg.VIDEO_OUTPUT.MUXER.WIDTH), int(cfg.VIDEO_OUTPUT.MUXER.HEIGHT)
+
+    processor = create_offline_processor(cfg, CONFIGS_DIR, num_sources, opt.output_dir, opt.anpr)
+    recorder = processor.recorder
+    stage_timer = processor.stage_timer
+
+    violations = []
+    def on_violations(stream_no, frame_number, new_violations):
+        for v in new_violations:
+            violations.append({'stream': stream_no, 'frame': frame_number, 'violation_id': v.violation_id,
+                               'violation_fi': v.violation_fi, 'track_id': v.id,
+                               'type': 'mobile' if v.mobile_detected else 'seatbelt'})
+    processor.on_violations = on_violations
+
+    # frame sources: video capture, or a blank surface up to the last frame with detections
+    captures = {stream_no: cv2.VideoCapture(path) for stream_no, path in videos.items()}
+    last_frame = {stream_no: max(frames) for stream_no, frames in detections.items()}
+    blank = np.zeros((height, width, 4), dtype=np.uint8)
+    streams = sorted(set(captures) | set(last_frame))
+    streams = [stream_no for stream_no in streams if stream_no < num_sources]
+
+    frames_done = {stream_no: 0 for stream_no in streams}
+    busy_s = {stream_no: 0.0 for stream_no in streams}
+    no_detections = empty_detections()
+    t_start = time.perf_counter()
+    frame_number = 0
+    while streams and (opt.max_frames <= 0 or frame_number < opt.max_frames):
+        active = False
+        # one batch: a frame of every stream, as nvstreammux does
+        for stream_no in streams:
+            if stream_no in captures:
+                ok, img = captures[stream_no].read()
+                if not ok:
+                    continue
+                if img.shape[:2] != (height, width):
+                    img = cv2.resize(img, (width, height), interpolation=cv2.INTER_LINEAR)
+                surface = cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
+            elif frame_number <= last_frame[stream_no]:
+                surface = blank
+            else:
+                continue
+            active = True
+
+            dets = detections.get(stream_no, {}).get(frame_number, no_detections)
+            t0 = time.perf_counter()
+            processor.process_frame(stream_no, frame_number, surface, dets)
+            busy_s[stream_no] += time.perf_counter() - t0
+            frames_done[stream_no] += 1
+        if not active:
+            break
+        frame_number += 1
+
+    processor.stop()
+    wall_s = time.perf_counter() - t_start
+
+    # let the violation / event writers finish
+    deadline = time.monotonic() + opt.writers_timeout
+    while recorder.metrics()['writers_pending'] > 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    report = {
+        'frames': frames_done,
+        'fps': {f"stream{s}": round(frames_done[s] / busy_s[s], 2) if busy_s[s] else 0.0 for s in streams},
+        'wall_fps': round(sum(frames_done.values()) / wall_s, 2) if wall_s else 0.0,
+        'violations': violations,
+        'latency_ms': stage_timer.report(),
+        'writers_pending': recorder.metrics()['writers_pending'],
+    }
+    if processor.lpr is not None:
+        # plate crops handed to OCR per track (see PlateRecognition._detect)
+        with processor.lpr.stats_lock:
+            report['lpr'] = dict(processor.lpr.stats)
+
+    print(f'{"stream":<10}{"frames":>8}{"fps":>10}')
+    for s in streams:
+        print(f'{"stream" + str(s):<10}{frames_done[s]:>8}{report["fps"]["stream" + str(s)]:>10.1f}')
+    print(f'wall fps (all streams): {report["wall_fps"]}')
+    if 'lpr' in report and report['lpr']['lpr_tracks']:
+        print(f'plate crops read: {report["lpr"]["lpr_crops"]} for {report["lpr"]["lpr_tracks"]} tracks')
+    print(f'violations: {len(violations)}')
+    for v in violations:
+        print(f'  stream {v["stream"]} frame {v["frame"]}: {v["type"]} violation {v["violation_id"]} '
+              f'(track {v["track_id"]}, FI {v["violation_fi"]})')
+
+    if opt.json:
+        with open(opt.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--settings', type=str, default='app_settings.yaml',
+                        help='application settings file name (default = app_settings.yaml)')
+    parser.add_argument('--detections', type=str, required=True,
+                        help='detection capture file written by the pipeline (PERF.CAPTURE_DETECTIONS)')
+    parser.add_argument('--video', type=str, action='append', default=[],
+                        help='STREAM:PATH of the video replayed as that stream, may be repeated')
+    parser.add_argument('--streams', type=int, default=0,
+                        help='number of streams (default = number of VIDEO_SOURCES)')
+    parser.add_argument('--anpr', type=str, default='MATCH',
+                        help='MATCH: plate matching only, no OCR (default), ON: with OCR (ANPR_ENABLE), OFF: no plate recognition')
+    parser.add_argument('--output-dir', type=str, default='/tmp/ivms_replay',
+                        help='folder the violations / event recordings / plates are written to')
+    parser.add_argument('--max-frames', type=int, default=0, help='stop after this number of frames per stream')
+    parser.add_argument('--writers-timeout', type=float, default=0.0,
+                        help='seconds to wait for the violation writers at the end (default = 0)')
+    parser.add_argument('--json', type=str, default='', help='write the report to this JSON file')
+
+    opt = parser.parse_args()
+    run_replay(opt)
@@ -33,10 +33,10 @@ def detect():
         if result is not None:        
             print(result.decoded_label.full_label)
         
-        for idx, ocr_poly in enumerate(result.info_ocr.char_poly):
-            #print(idx, result.info_ocr.char_id[idx])
+        for idx, ocr_poly in enumerate(result.ocr.char_poly):
+            #print(idx, result.ocr.char_id[idx])
             #print(idx, ocr_poly)
-            draw_box(img, ocr_poly, color=(0,0,128), label=str(result.info_ocr.char_id[idx]), line_thickness=1, text_outside_box=True)
+            draw_box(img, ocr_poly, color=(0,0,128), label=str(result.ocr.char_id[idx]), line_thickness=1, text_outside_box=True)
         cv2.imshow("", img)
         cv2.waitKey(2000)
 
@@ -48,18 +48,18 @@ def simpleDetect(img, displayDetections=False):
 
         if result is not None:
             if displayDetections:
-                #for idx, ocr_poly in enumerate(result.info_ocr.char_poly):
-                #    draw_box(img, ocr_poly, color=(0,0,128), label=str(result.info_ocr.char_id[idx]), line_thickness=1, text_outside_box=True)
-                draw_box(img, result.info_platenum.polygon, color=(0,0,128), line_thickness=1, text_outside_box=True)
-                draw_box(img, result.info_prefix.polygon, color=(0,0,128), line_thickness=1, text_outside_box=True)
-                for idx, ocr_poly in enumerate(result.info_ocr.char_poly):
-                    #print(idx, result.info_ocr.char_id[idx])
+                #for idx, ocr_poly in enumerate(result.ocr.char_poly):
+                #    draw_box(img, ocr_poly, color=(0,0,128), label=str(result.ocr.char_id[idx]), line_thickness=1, text_outside_box=True)
+                draw_box(img, result.platenum.polygon, color=(0,0,128), line_thickness=1, text_outside_box=True)
+                draw_box(img, result.prefix.polygon, color=(0,0,128), line_thickness=1, text_outside_box=True)
+                for idx, ocr_poly in enumerate(result.ocr.char_poly):
+                    #print(idx, result.ocr.char_id[idx])
                     #print(idx, ocr_poly)
                     draw_box(img, ocr_poly, color=(0,0,128), line_thickness=1, text_outside_box=True)
                 
                 print(result.decoded_label.full_label)
             else:
-                print(result.decoded_label.full_label, result.decoded_label["platenum_label"], result.info_platenum)
+                print(result.decoded_label.full_label, result.decoded_label.platenum_label, result.platenum)
         if displayDetections:
             #cv2.imshow("", img)
             #cv2.waitKey(1)
@@ -0,0 +1,114 @@
+import io
+import os
+import json
+import contextlib
+import unittest
+from importlib.util import find_spec
+
+import numpy as np
+
+# alpr_ktc needs torch (ObjectDetector) and matplotlib (PreprocessVehicleLicensePlate)
+DEPENDENCIES = all(find_spec(module) is not None for module in ('torch', 'matplotlib'))
+
+# OCR detections of plates with the results of the alpr_ktc post-processing before it worked on arrays (shapely
+# polygons, Python loops), frozen: named cases (duplicate chars, equal minx, rotated plates, stray chars, missing
+# fields...) and random plates of benchmarks.alpr_postprocess.make_plate
+# -> pred: the detections (x1, y1, x2, y2, conf, cls) as returned by ObjectDetector, null if none
+# -> result: null if the plate was not read, else the labels, states, fields and chars with their scores and boxes
+PLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'alpr_ktc_plates.json')
+
+
+# OCR detector returning fixed detections: one per plate image, in the order the images are given
+class FixedDetector(object):
+
+    def __init__(self):
+        self.preds = []
+
+    def detect_objects(self, frame, mode):
+        return self.preds.pop(0)
+
+    def detect_objects_batch(self, frames):
+        preds, self.preds = self.preds[:len(frames)], self.preds[len(frames):]
+        return preds
+
+
+# a CustomANPRResult in the form of the frozen results
+def summary(result):
+    if result is None:
+        return None
+    boxes = lambda boxes: [[float(v) for v in box] for box in boxes.tolist()]
+    field = lambda field: {'char': list(field.char), 'char_score': field.char_score.tolist(),
+                           'char_box': boxes(field.char_box), 'score': float(field.score),
+                           'box': boxes(field.box[None])[0] if field.box is not None else None}
+    return {'decoded_label': result.decoded_label._asdict(),
+            'state': {'data_str': list(result.state.data_str), 'score': result.state.score.tolist(),
+                      'box': boxes(result.state.box)},
+            'prefix': field(result.prefix), 'platenum': field(result.platenum),
+            'ocr': {'char_id': result.ocr.char_id.tolist(), 'char_score': result.ocr.char_score.tolist(),
+                    'char_box': boxes(result.ocr.char_box)}}
+
+
+@unittest.skipUnless(DEPENDENCIES, 'torch and matplotlib are needed')
+class AlprKtcTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from LPR_QAT.core.alpr_ktc import alpr_ktc
+        with open(PLATES) as f:
+            cls.plates = json.load(f)['plates']
+        cls.detector = FixedDetector()
+        cls.lpr = alpr_ktc(cls.detector)
+        cls.img = np.zeros((32, 128, 3), dtype=np.uint8)
+
+    def pred(self, plate):
+        return None if plate['pred'] is None else np.array(plate['pred'], dtype=np.float32).reshape(-1, 6)
+
+    def assertSameResult(self, plate, result):
+        expected = plate['result']
+        self.assertEqual(summary(result), expected, plate['case'])
+
+    def test_fixtures(self):
+        cases = {plate['case'] for plate in self.plates}
+        for case in ('duplicate_char_same_class', 'duplicate_char_other_class_equal_minx', 'equal_minx_distinct_chars',
+                     'rotated_plate', 'highly_rotated_plate', 'stray_chars', 'no_detections'):
+            self.assertIn(case, cases)
+        read = [plate for plate in self.plates if plate['result'] is not None]
+        self.assertTrue(0 < len(read) < len(self.plates))
+
+    def test_process(self):
+        # the rejected plates print why
+        with contextlib.redirect_stdout(io.StringIO()):
+            for plate in self.plates:
+                self.detector.preds = [self.pred(plate)]
+                self.assertSameResult(plate, self.lpr.process(self.img))
+
+    def test_process_batch(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for start in range(0, len(self.plates), 8):
+                batch = self.plates[start:start + 8]
+                self.detector.preds = [self.pred(plate) for plate in batch]
+                results = self.lpr.process_batch([self.img] * len(batch))
+                self.assertEqual(len(results), len(batch))
+                for plate, result in zip(batch, results):
+                    self.assertSameResult(plate, result)
+
+    def test_plate_too_narrow(self):
+        self.detector.preds = [self.pred(self.plates[0])]
+        self.assertIsNone(self.lpr.process(np.zeros((32, 4, 3), dtype=np.uint8)))
+        # not given to the detector
+        self.assertEqual(len(self.detector.preds), 1)
+        self.detector.preds = [self.pred(self.plates[0])]
+        results = self.lpr.process_batch([np.zeros((32, 4, 3), dtype=np.uint8), self.img])
+        self.assertIsNone(results[0])
+        self.assertSameResult(self.plates[0], results[1])
+
+    def test_results_are_read_only(self):
+        self.detector.preds = [self.pred(self.plates[0])]
+        result = self.lpr.process(self.img)
+        self.assertIsNotNone(result)
+        with self.assertRaises(ValueError):
+            result.platenum.char_score[0] = 0
+
+
+if __name__ == '__main__':
+    unittest.main()
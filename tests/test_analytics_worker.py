@@ -0,0 +1,80 @@
+import threading
+import unittest
+
+from core.analytics_worker import AnalyticsWorker
+
+
+class AnalyticsWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.processed = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    # process_fn blocking on the first frame until release is set, so that the queue fills up behind it
+    def process(self, fi):
+        self.started.set()
+        self.release.wait()
+        self.processed.append(fi)
+
+    def make_worker(self, policy, max_size=3):
+        worker = AnalyticsWorker(0, self.process, max_size=max_size, policy=policy)
+        self.addCleanup(worker.stop, 5)
+        self.addCleanup(self.release.set)
+        worker.submit(0, 0)
+        self.assertTrue(self.started.wait(5))
+        return worker
+
+    def test_frames_are_processed_in_order(self):
+        self.release.set()
+        worker = AnalyticsWorker(0, self.process, max_size=8)
+        for fi in range(5):
+            worker.submit(fi, fi)
+        worker.stop(5)
+        self.assertEqual(self.processed, list(range(5)))
+        self.assertEqual(worker.counters()['processed'], 5)
+
+    def test_drop_oldest(self):
+        worker = self.make_worker('drop_oldest')
+        dropped = [worker.submit(fi, fi) for fi in range(1, 6)]
+        self.assertEqual(dropped, [0, 0, 0, 1, 1])
+        self.release.set()
+        worker.stop(5)
+        self.assertEqual(self.processed, [0, 3, 4, 5])
+        counters = worker.counters()
+        self.assertEqual((counters['submitted'], counters['processed'], counters['dropped']), (6, 4, 2))
+
+    def test_coalesce(self):
+        worker = self.make_worker('coalesce')
+        dropped = [worker.submit(fi, fi) for fi in range(1, 6)]
+        self.assertEqual(dropped, [0, 0, 0, 3, 0])
+        self.release.set()
+        worker.stop(5)
+        self.assertEqual(self.processed, [0, 4, 5])
+        self.assertEqual(worker.counters()['dropped'], 3)
+
+    def test_lag_metrics(self):
+        worker = self.make_worker('drop_oldest')
+        worker.submit(1, 1)
+        worker.submit(2, 2)
+        metrics = worker.metrics()
+        # frame 0 in progress, 1 and 2 queued
+        self.assertEqual((metrics['queued'], metrics['lag_frames']), (2, 3))
+
+    def test_failures_are_counted(self):
+        def fail(fi):
+            raise RuntimeError('analytics failed')
+        worker = AnalyticsWorker(0, fail)
+        with self.assertLogs(level='ERROR'):
+            worker.submit(0, 0)
+            worker.stop(5)
+        self.assertEqual(worker.counters()['failed'], 1)
+        self.assertEqual(worker.counters()['processed'], 1)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            AnalyticsWorker(0, self.process, policy='block')
+
+
+if __name__ == '__main__':
+    unittest.main()
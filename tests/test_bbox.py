@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+from shapely.geometry import box
+
+from utils.bbox import assign_contained, boxes_contain, box_contains
+
+
+class BoxesContainTest(unittest.TestCase):
+
+    def test_matches_shapely(self):
+        rng = np.random.default_rng(0)
+        xy = rng.integers(0, 100, size=(60, 2))
+        wh = rng.integers(1, 60, size=(60, 2))
+        boxes = np.hstack([xy, xy + wh])
+        outer, inner = boxes[:20], boxes[20:]
+
+        m = boxes_contain(outer, inner)
+        self.assertEqual(m.shape, (20, 40))
+        for i, o in enumerate(outer):
+            for j, b in enumerate(inner):
+                self.assertEqual(bool(m[i, j]), box(*o).contains(box(*b)))
+                self.assertEqual(bool(m[i, j]), box_contains(o, b))
+
+    def test_shared_edges_are_contained(self):
+        self.assertTrue(boxes_contain([0, 0, 10, 10], [0, 5, 10, 10])[0, 0])
+        self.assertFalse(boxes_contain([0, 0, 10, 10], [0, 5, 11, 10])[0, 0])
+
+
+class AssignContainedTest(unittest.TestCase):
+
+    def test_nothing_contained(self):
+        self.assertEqual(assign_contained([[0, 0, 10, 10]], [[20, 20, 30, 30]], [0.9]), {})
+        self.assertEqual(assign_contained(np.zeros((0, 4)), [[0, 0, 1, 1]], [0.9]), {})
+
+    def test_plate_goes_to_the_car_with_the_nearest_lower_edge(self):
+        # the plate is inside both cars, at the bottom of the front one (overlapping the back one)
+        cars = [[0, 0, 100, 200], [0, 50, 100, 120]]
+        plates = [[40, 100, 60, 115]]
+        self.assertEqual(assign_contained(cars, plates, [0.9]), {1: 0})
+
+    def test_overlapping_cars_keep_their_own_plates(self):
+        # car 0 contains both plates; its own plate (plate 1, at its bottom) must not go to car 1
+        cars = [[0, 0, 200, 200], [100, 20, 200, 100]]
+        plates = [[130, 80, 170, 95], [40, 180, 80, 195]]
+        self.assertEqual(assign_contained(cars, plates, [0.9, 0.9]), {0: 1, 1: 0})
+
+    def test_each_plate_and_car_used_once(self):
+        cars = [[0, 0, 100, 100], [0, 0, 100, 100]]
+        plates = [[10, 80, 30, 90], [60, 80, 80, 90], [40, 10, 50, 20]]
+        assigned = assign_contained(cars, plates, [0.5, 0.8, 0.9])
+        self.assertEqual(len(assigned), 2)
+        self.assertEqual(len(set(assigned.values())), 2)
+        # both plates at the same gap: the higher scored one goes first, the high plate is never used
+        self.assertEqual(sorted(assigned.values()), [0, 1])
+        self.assertEqual(assigned[0], 1)
+
+    def test_score_breaks_ties(self):
+        cars = [[0, 0, 100, 100]]
+        plates = [[10, 80, 30, 90], [60, 80, 80, 90]]
+        self.assertEqual(assign_contained(cars, plates, [0.5, 0.8]), {0: 1})
+        self.assertEqual(assign_contained(cars, plates, [0.8, 0.5]), {0: 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+
+import core.detection_object as do
+
+
+class RectParams(object):
+    def __init__(self, left, top, width, height):
+        self.left, self.top, self.width, self.height = left, top, width, height
+
+
+# stand-in for NvDsObjectMeta: the attributes read by DetectionArrays.add
+class ObjectMeta(object):
+    def __init__(self, object_id, class_id, confidence, left, top, width, height):
+        self.object_id, self.class_id, self.confidence = object_id, class_id, confidence
+        self.rect_params = RectParams(left, top, width, height)
+
+
+# fill dets with a batch: one list of ObjectMeta per frame
+def fill(dets, batch):
+    dets.begin_batch()
+    for objs in batch:
+        dets.begin_frame()
+        for obj_meta in objs:
+            dets.add(obj_meta)
+        dets.end_frame()
+
+
+class DetectionArraysTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batch = [[ObjectMeta(7, do.CAR, 0.9, 100.6, 200.2, 300.9, 150.5),
+                       ObjectMeta(8, do.PLATE, 0.8, 150.0, 300.0, 60.0, 20.0),
+                       ObjectMeta(7, do.NO_BELT, 0.7, 120.0, 210.0, 40.0, 50.0),
+                       ObjectMeta(9, do.MOBILE, 0.6, 130.0, 220.0, 10.0, 20.0)],
+                      [],
+                      [ObjectMeta(3, do.STEERING_WHEEL, 0.5, 10.0, 20.0, 30.0, 40.0)]]
+
+    def test_frames_of_the_batch(self):
+        dets = do.DetectionArrays()
+        fill(dets, self.batch)
+        self.assertEqual([len(dets.frame(i)) for i in range(3)], [4, 0, 1])
+        first = dets.frame(0)
+        self.assertEqual(first.track_id.tolist(), [7, 8, 7, 9])
+        self.assertEqual(first.class_id.tolist(), [do.CAR, do.PLATE, do.NO_BELT, do.MOBILE])
+        np.testing.assert_allclose(first.score, [0.9, 0.8, 0.7, 0.6], rtol=1e-6)
+        self.assertEqual(dets.frame(2).track_id.tolist(), [3])
+
+    def test_rows(self):
+        dets = do.DetectionArrays()
+        fill(dets, self.batch)
+        detections = dets.frame(0)
+        self.assertEqual(detections.rows(do.PLATE).tolist(), [1])
+        self.assertEqual(detections.rows(*do.VIOLATION_CLASSES).tolist(), [2, 3])
+        self.assertEqual(detections.rows(do.STEERING_WHEEL).tolist(), [])
+
+    def test_boxes(self):
+        dets = do.DetectionArrays()
+        fill(dets, self.batch)
+        detections = dets.frame(0)
+        # same rounding as utils.bbox.rect_params_to_coords: every field truncated, then added
+        self.assertEqual(detections.boxes[0].tolist(), [100, 200, 400, 350])
+        self.assertEqual(detections.bbox(1), (150, 300, 210, 320))
+        self.assertIsInstance(detections.bbox(1)[0], int)
+
+    def test_empty_frame(self):
+        dets = do.DetectionArrays()
+        fill(dets, self.batch)
+        detections = dets.frame(1)
+        self.assertEqual(len(detections), 0)
+        self.assertEqual(detections.boxes.shape, (0, 4))
+        self.assertEqual(detections.rows(do.CAR).tolist(), [])
+        self.assertEqual(len(detections.copy()), 0)
+
+    def test_copy_is_independent_of_the_next_batch(self):
+        dets = do.DetectionArrays()
+        fill(dets, self.batch)
+        view, copy = dets.frame(0), dets.frame(0).copy()
+        # the next batch is extracted into the same columns
+        fill(dets, [[ObjectMeta(1, do.BELT, 0.1, 1.0, 2.0, 3.0, 4.0)] * 4])
+        self.assertEqual(view.track_id.tolist(), [1, 1, 1, 1])
+        self.assertEqual(copy.track_id.tolist(), [7, 8, 7, 9])
+        self.assertEqual(copy.class_id.tolist(), [do.CAR, do.PLATE, do.NO_BELT, do.MOBILE])
+        self.assertEqual(copy.bbox(0), (100, 200, 400, 350))
+
+    def test_growth_keeps_the_rows(self):
+        dets = do.DetectionArrays(capacity=2, max_frames=1)
+        batch = [[ObjectMeta(i, do.CAR, 0.5, float(i), 0.0, 10.0, 10.0) for i in range(3)],
+                 [ObjectMeta(i, do.PLATE, 0.5, float(i), 0.0, 10.0, 10.0) for i in range(3, 5)]]
+        fill(dets, batch)
+        self.assertGreaterEqual(dets.capacity, 5)
+        self.assertEqual(dets.frame(0).track_id.tolist(), [0, 1, 2])
+        self.assertEqual(dets.frame(1).track_id.tolist(), [3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,359 @@
+import time
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from core.frame_buffer import FrameBuffer, SharedFrameBuffer, SpillFrameBuffer, CompressedFrameBuffer
+from core.clip_writer import clip_job, _frames
+
+
+# tiny frames whose pixels all hold (index % 256), so a frame can be checked against its index
+def fill(buffer, stream_no, first, count):
+    for index in range(first, first + count):
+        slot = buffer.next_slot(stream_no)
+        slot[:] = index % 256
+        buffer.commit(stream_no, index)
+
+
+def check_window(test, window):
+    for frame in window:
+        test.assertTrue((frame.img == frame.index % 256).all(), f'frame {frame.index} holds another image')
+
+
+class FrameBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = FrameBuffer(10, 2, width=4, height=2)
+
+    def test_window_before_wrap(self):
+        fill(self.buffer, 0, 0, 7)
+        window = self.buffer.get_frames(0, violation_fi=3, current_fi=6, length=4)
+        self.assertEqual([frame.index for frame in window], [1, 2, 3, 4, 5])
+        check_window(self, window)
+
+    def test_wrap_keeps_newest_frames(self):
+        fill(self.buffer, 0, 0, 25)
+        self.assertEqual(self.buffer.length(0), 10)
+        self.assertEqual(self.buffer.first_seq(0), 15)
+        window = self.buffer.get_frames(0, violation_fi=20, current_fi=24, length=6)
+        self.assertEqual([frame.index for frame in window], list(range(17, 24)))
+        check_window(self, window)
+        # the window wraps around the end of the ring
+        self.assertEqual(window.slot_ranges(), [(7, 10), (0, 4)])
+
+    def test_streams_are_independent(self):
+        fill(self.buffer, 0, 0, 12)
+        fill(self.buffer, 1, 100, 3)
+        self.assertEqual(self.buffer.length(0), 10)
+        self.assertEqual(self.buffer.length(1), 3)
+        self.assertEqual([frame.index for frame in self.buffer.get_frames(1, 101, 102, 2)], [100, 101, 102])
+
+    def test_get_frame(self):
+        fill(self.buffer, 0, 0, 15)
+        self.assertIsNone(self.buffer.get_frame(0, 4))
+        frame = self.buffer.get_frame(0, 9)
+        self.assertEqual(frame.index, 9)
+        self.assertTrue((frame.img == 9).all())
+
+    def test_not_enough_frames_before_violation(self):
+        fill(self.buffer, 0, 0, 20)
+        window = self.buffer.get_frames(0, violation_fi=11, current_fi=19, length=8)
+        # frames 7 .. 9 are gone, the window starts at the oldest frame held
+        self.assertEqual([frame.index for frame in window], list(range(10, 18)))
+
+    def test_new_run_after_restart(self):
+        fill(self.buffer, 0, 50, 6)
+        fill(self.buffer, 0, 0, 4)   # frame_num went backwards
+        self.assertEqual([frame.index for frame in self.buffer.get_frames(0, 2, 3, 2)], [1, 2, 3])
+        self.assertEqual([frame.index for frame in self.buffer.get_frames(0, 53, 3, 2)], [52, 53, 54])
+
+    def test_unpinned_window_stops_at_overwritten_frame(self):
+        fill(self.buffer, 0, 0, 10)
+        window = self.buffer.get_frames(0, violation_fi=4, current_fi=9, length=8)
+        fill(self.buffer, 0, 10, 3)
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual([frame.index for frame in window], [])
+
+    def test_pinned_window_is_not_overwritten(self):
+        fill(self.buffer, 0, 0, 10)
+        window = self.buffer.get_frames(0, violation_fi=4, current_fi=9, length=6)
+        self.buffer.pin(window)
+        # the producer laps the ring up to the first pinned slot, the next frames are not buffered
+        fill(self.buffer, 0, 10, 10)
+        self.assertEqual(self.buffer.stats['pinned_skips'], 9)
+        self.assertEqual(self.buffer.get_frame(0, 10).index, 10)
+        self.assertIsNone(self.buffer.get_frame(0, 11))
+        self.assertEqual([frame.index for frame in window], list(range(1, 8)))
+        check_window(self, window)
+        # consumed -> released, the producer goes on
+        fill(self.buffer, 0, 20, 3)
+        self.assertEqual([self.buffer.get_frame(0, index).index for index in (20, 21, 22)], [20, 21, 22])
+
+    def test_slow_writer_gets_whole_frames(self):
+        buffer = FrameBuffer(20, 1, width=64, height=48)
+        fill(buffer, 0, 0, 20)
+        window = buffer.get_frames(0, violation_fi=10, current_fi=19, length=14)
+        buffer.pin(window)
+
+        # the producer keeps lapping the ring while the writer is slower than the frame rate
+        running = True
+        def produce():
+            index = 20
+            while running:
+                fill(buffer, 0, index, 1)
+                index += 1
+        producer = threading.Thread(target=produce)
+        producer.start()
+        try:
+            indices = []
+            for frame in window:
+                time.sleep(0.005)
+                self.assertTrue((frame.img == frame.index % 256).all(), f'frame {frame.index} torn')
+                indices.append(frame.index)
+        finally:
+            running = False
+            producer.join()
+        self.assertEqual(indices, list(range(3, 18)))
+
+    def test_slot_being_filled_is_not_in_windows(self):
+        fill(self.buffer, 0, 0, 10)
+        slot = self.buffer.next_slot(0)
+        # the producer is converting frame 10 into the slot of frame 0
+        window = self.buffer.get_frames(0, violation_fi=2, current_fi=9, length=4, pin=True)
+        self.assertEqual([int(index) for index in window.indices], list(range(1, 5)))
+        self.assertIsNone(self.buffer.get_frame(0, 0))
+        slot[:] = 10
+        self.buffer.commit(0, 10)
+        check_window(self, window)
+
+    def test_windows_taken_on_another_thread(self):
+        buffer = FrameBuffer(30, 1, width=64, height=48)
+        fill(buffer, 0, 0, 30)
+
+        # the analytics worker takes and pins windows while the probe keeps buffering frames
+        running = True
+        failures = []
+        def worker():
+            while running:
+                current = buffer.written[0] - 1
+                window = buffer.get_frames(0, violation_fi=current - 10, current_fi=current, length=16, pin=True)
+                for frame in window:
+                    if not (frame.img == frame.index % 256).all():
+                        failures.append(frame.index)
+                buffer.unpin(window)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        try:
+            fill(buffer, 0, 30, 3000)
+        finally:
+            running = False
+            thread.join()
+        self.assertEqual(failures, [])
+        self.assertFalse(buffer.pins[0].any())
+
+    def test_iteration_releases_consumed_frames(self):
+        fill(self.buffer, 0, 0, 10)
+        window = self.buffer.get_frames(0, violation_fi=4, current_fi=9, length=6)
+        self.buffer.pin(window)
+        frames = iter(window)
+        next(frames)
+        next(frames)
+        # the first frame has been consumed, the second one is still in use
+        self.assertEqual(self.buffer.pins[0][1], 0)
+        self.assertEqual(self.buffer.pins[0][2], 1)
+        self.buffer.unpin(window)
+        self.assertFalse(self.buffer.pins[0].any())
+        # releasing twice does nothing
+        self.buffer.unpin(window)
+        self.assertFalse(self.buffer.pins[0].any())
+
+    def test_overlapping_windows(self):
+        fill(self.buffer, 0, 0, 10)
+        first = self.buffer.get_frames(0, violation_fi=4, current_fi=9, length=4)
+        second = self.buffer.get_frames(0, violation_fi=6, current_fi=9, length=4)
+        self.buffer.pin(first)
+        self.buffer.pin(second)
+        self.buffer.unpin(first)
+        self.assertEqual(self.buffer.pins[0][4:9].tolist(), [1, 1, 1, 1, 1])
+        self.buffer.unpin(second)
+        self.assertFalse(self.buffer.pins[0].any())
+
+
+class SharedFrameBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = SharedFrameBuffer(10, 2, width=4, height=2)
+
+    def tearDown(self):
+        self.buffer.close()
+
+    def test_ring_lives_in_shared_memory(self):
+        fill(self.buffer, 1, 0, 3)
+        self.assertEqual(self.buffer.ring_shape(), (10, 2, 4, 3))
+        self.assertEqual(len(self.buffer.segments[1].buf), 10 * 2 * 4 * 3)
+        self.assertTrue((self.buffer.frames[1][2] == 2).all())
+
+    def test_clip_job_reads_wrapped_window(self):
+        fill(self.buffer, 0, 0, 25)
+        window = self.buffer.get_frames(0, violation_fi=20, current_fi=24, length=6)
+        self.buffer.pin(window)
+        job = clip_job(self.buffer, window, path='clip.avi')
+        self.assertEqual(job['slot_ranges'], [(7, 10), (0, 4)])
+        # what a clip writer process maps from the segment
+        frames = list(_frames(job))
+        self.assertEqual([index for img, index in frames], list(range(17, 24)))
+        self.assertTrue(all((img == index % 256).all() for img, index in frames))
+        self.buffer.unpin(window)
+
+    def test_pinned_slots_are_not_overwritten(self):
+        fill(self.buffer, 0, 0, 10)
+        window = self.buffer.get_frames(0, violation_fi=1, current_fi=9, length=2)
+        self.buffer.pin(window)
+        fill(self.buffer, 0, 10, 3)
+        self.assertEqual(self.buffer.stats['pinned_skips'], 3)
+        self.assertEqual([frame.index for frame in window], [0, 1, 2])
+        check_window(self, window)
+        self.buffer.unpin(window)
+        fill(self.buffer, 0, 13, 3)
+        self.assertEqual(self.buffer.get_frame(0, 15).index, 15)
+
+
+class SpillFrameBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spill_dir = tempfile.TemporaryDirectory()
+        self.buffer = SpillFrameBuffer(30, 1, width=4, height=2, spill_dir=self.spill_dir.name, hot_frames=8, spill_batch=4)
+
+    def tearDown(self):
+        self.buffer.close()
+        self.spill_dir.cleanup()
+
+    # fill the buffer at a pace the spill thread keeps up with, then wait until everything has been spilled
+    def fill_spilled(self, first, count):
+        for index in range(first, first + count):
+            fill(self.buffer, 0, index, 1)
+            if index % 4 == 3:
+                self.wait_spilled()
+        self.wait_spilled()
+
+    def wait_spilled(self):
+        self.buffer.wakeup.set()
+        deadline = time.monotonic() + 5
+        while self.buffer.spilled[0] < self.buffer.written[0] and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def test_window_across_both_tiers(self):
+        self.fill_spilled(0, 40)
+        self.assertEqual(self.buffer.stats['spill_drops'], 0)
+        window = self.buffer.get_frames(0, violation_fi=30, current_fi=39, length=20)
+        # frames 20 .. 31 come from the file, 32 .. 39 from the hot ring
+        self.assertEqual([frame.index for frame in window], list(range(20, 40)))
+        check_window(self, window)
+
+    def test_unspilled_frames_are_dropped(self):
+        # spill thread stopped: the frames leaving the hot ring are lost for the cold tier
+        self.buffer.running = False
+        self.buffer.wakeup.set()
+        self.buffer.spill_thread.join()
+        fill(self.buffer, 0, 0, 20)
+        self.assertEqual(self.buffer.stats['spill_drops'], 12)
+        window = self.buffer.get_frames(0, violation_fi=10, current_fi=19, length=20)
+        # the missing frames are skipped, the hot ones are still there
+        self.assertEqual([frame.index for frame in window], list(range(13, 20)))
+        check_window(self, window)
+
+    def test_dropped_frame_is_not_loaded_from_a_previous_lap(self):
+        # a whole lap spilled, then the spill thread stops: the cold slots of the dropped frames hold the last lap
+        self.fill_spilled(0, 30)
+        self.buffer.running = False
+        self.buffer.wakeup.set()
+        self.buffer.spill_thread.join()
+        fill(self.buffer, 0, 30, 20)
+        self.assertEqual(self.buffer.stats['spill_drops'], 12)
+        self.assertIsNone(self.buffer.load(0, 35))
+        self.assertIsNone(self.buffer.get_frame(0, 35))
+        # slots 0 .. 15: seqs 30 .. 45, only 43 .. 45 (hot) are left
+        self.assertEqual([img[0, 0, 0] for img in self.buffer.load_slots(0, 0, 16)], [43, 44, 45])
+
+    def test_hot_slot_taken_over_while_copied(self):
+        self.buffer.running = False
+        self.buffer.wakeup.set()
+        self.buffer.spill_thread.join()
+        fill(self.buffer, 0, 0, 6)
+        window = self.buffer.get_frames(0, violation_fi=3, current_fi=5, length=4)
+        buffer, hot = self.buffer, self.buffer.frames[0]
+
+        # the producer writes a whole hot ring while frame 2 is copied: its copy may be torn, it was never spilled
+        class Overtaken(object):
+            def __getitem__(self, slot):
+                if slot == 2:
+                    buffer.written[0] += buffer.hot_size
+                return hot[slot]
+
+        self.buffer.frames[0] = Overtaken()
+        try:
+            self.assertIsNone(self.buffer.load(0, 2))
+        finally:
+            self.buffer.frames[0] = hot
+            self.buffer.written[0] -= self.buffer.hot_size
+        # the window goes on without it
+        self.buffer.frames[0] = Overtaken()
+        try:
+            indices = [frame.index for frame in window]
+        finally:
+            self.buffer.frames[0] = hot
+        self.assertNotIn(2, indices)
+
+    def test_pinned_window_is_not_overwritten(self):
+        self.fill_spilled(0, 30)
+        window = self.buffer.get_frames(0, violation_fi=15, current_fi=29, length=20)
+        self.buffer.pin(window)
+        self.fill_spilled(30, 40)
+        self.assertGreater(self.buffer.stats['pinned_skips'], 0)
+        self.assertEqual([frame.index for frame in window], list(range(5, 26)))
+        check_window(self, window)
+
+
+class CompressedFrameBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = CompressedFrameBuffer(10, 1, width=8, height=4, codec='png', workers=1, staging_slots=16)
+
+    def tearDown(self):
+        self.buffer.close()
+
+    def test_lossless_round_trip(self):
+        fill(self.buffer, 0, 0, 14)
+        window = self.buffer.get_frames(0, violation_fi=9, current_fi=13, length=6)
+        self.assertEqual([frame.index for frame in window], list(range(6, 13)))
+        check_window(self, window)
+        self.assertEqual(self.buffer.stats['encode_drops'], 0)
+
+    def test_backlog_is_bounded(self):
+        # the encoder pool is stuck: the staging slots fill up, the next frames are dropped without allocating
+        self.buffer.close()
+        self.buffer = CompressedFrameBuffer(10, 1, width=8, height=4, codec='png', workers=1, staging_slots=2)
+        release = threading.Event()
+        encode = self.buffer._encode
+        self.buffer._encode = lambda img: release.wait() and encode(img)
+        try:
+            fill(self.buffer, 0, 0, 2)
+            for index in range(2, 6):
+                self.assertIs(self.buffer.next_slot(0), self.buffer.scratch)
+                self.buffer.commit(0, index)
+            self.assertEqual(self.buffer.written[0], 2)
+            self.assertEqual(self.buffer.stats['encode_drops'], 4)
+            # append (no staging slot) is bounded by max_pending as well
+            self.buffer.append(np.zeros((4, 8, 3), dtype=np.uint8), 0, 6)
+            self.assertEqual(self.buffer.stats['encode_drops'], 5)
+        finally:
+            release.set()
+        self.buffer.close()
+        self.assertEqual(self.buffer.queued, 0)
+        self.assertEqual([frame.index for frame in self.buffer.get_frames(0, 1, 1, 2)], [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import tempfile
+import unittest
+
+import numpy as np
+from easydict import EasyDict as edict
+
+import core.detection_object as do
+from core.frame_processor import FrameProcessor
+from core.ms_violation_detector import MSViolationDetector
+from core.violation_recorder import ViolationRecorder
+from utils.stage_timer import NullStageTimer
+
+
+# detections of a frame: rows of (track id, class id, minx, miny, maxx, maxy)
+def frame_detections(rows=()):
+    a = np.array([list(row) for row in rows], dtype=np.float64).reshape(-1, 6)
+    return do.FrameDetections(a[:, 0].astype(np.uint64), a[:, 1].astype(np.int32), np.full(len(a), 0.9, dtype=np.float32),
+                              a[:, 2].astype(np.float32), a[:, 3].astype(np.float32),
+                              (a[:, 4] - a[:, 2]).astype(np.float32), (a[:, 5] - a[:, 3]).astype(np.float32))
+
+
+# plate recognition of the probe and the analytics, recording the plate assignments it is given
+class FakeLpr(object):
+
+    def __init__(self):
+        self.anpr = True
+        self.links = 0
+        self.updates = []
+
+    def link_plates(self, detections):
+        self.links += 1
+        return {0: (2, 2, 6, 4)} if len(detections.rows(do.PLATE)) else {}
+
+    def pixel_demand(self, plate_bboxes):
+        return list(plate_bboxes.values())
+
+    def update(self, detections, stream_no, fi, frame, plate_bboxes=None):
+        self.updates.append((fi, plate_bboxes, frame.crop((2, 2, 6, 4))))
+        return []
+
+    def stop(self, timeout=None):
+        pass
+
+
+class FrameProcessorTest(unittest.TestCase):
+
+    CAR = (7, do.CAR, 0, 0, 8, 4)
+    PLATE = (8, do.PLATE, 2, 2, 6, 4)
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.surface = np.zeros((4, 8, 4), dtype=np.uint8)
+
+    # processor of 2 streams of 8 x 4 frames, 2 s clips (FRAME_RECORDING_THRESH: 15 frames, activity hold: 30)
+    def make_processor(self, lpr=None, event_recording=False, **frame_buffer):
+        cfg = edict({'VIDEO_OUTPUT': {'FORMAT': 'XVID', 'VIOLATION_FOLDER': self.folder.name,
+                                      'EVENT_RECORDING_FOLDER': self.folder.name, 'EVENT_RECORDING': event_recording,
+                                      'DURATION': 2, 'MUXER': {'WIDTH': 8, 'HEIGHT': 4}, 'FRAME_BUFFER': frame_buffer},
+                     'LABEL': {'SITECODE': '', 'RADAR_ID': '', 'PLACE': '', 'DEVICE_ID': '', 'NAME': '', 'HEIGHT': 2}})
+        recorder = ViolationRecorder(cfg, 2, None, connect_queue=False)
+        return FrameProcessor(cfg, 2, lpr, MSViolationDetector(), recorder, NullStageTimer())
+
+    def run_frames(self, processor, stream_no, first, count, rows=()):
+        for fi in range(first, first + count):
+            processor.process_frame(stream_no, fi, self.surface, frame_detections(rows))
+
+    def buffered(self, processor, stream_no):
+        return processor.recorder.frame_buffer.written[stream_no]
+
+    def test_idle_frames_are_not_buffered(self):
+        processor = self.make_processor()
+        # a car in view for 10 frames, then an empty road: buffered until the hold is over
+        self.run_frames(processor, 1, 0, 10, [self.CAR])
+        self.run_frames(processor, 1, 10, 60)
+        self.assertEqual(self.buffered(processor, 1), 10 + 30)
+        # without event recording only the violation stream is buffered
+        self.run_frames(processor, 0, 0, 10, [self.CAR])
+        self.assertEqual(self.buffered(processor, 0), 0)
+
+    def test_open_clips_keep_buffering(self):
+        processor = self.make_processor(event_recording=True)
+        self.run_frames(processor, 0, 0, 40)
+        self.assertEqual(self.buffered(processor, 0), 0)
+        # a violation of the stream collecting its frames
+        processor.recorder.detections[0].append(edict({'sent': False}))
+        self.run_frames(processor, 0, 40, 5)
+        self.assertEqual(self.buffered(processor, 0), 5)
+        processor.recorder.detections[0].clear()
+        # an event records every stream
+        processor.recorder.received_events.append({'event_id': 1, 'event_violation_type': 1, 'elapsed_frames': 0,
+                                                   'fi_set': False, 'frame_index': 0, 'recorded': False, 'stream_id': 0})
+        self.run_frames(processor, 1, 0, 5)
+        self.assertEqual(self.buffered(processor, 1), 5)
+
+    def test_frame_number_restart(self):
+        processor = self.make_processor()
+        self.run_frames(processor, 1, 100, 1, [self.CAR])
+        # the stream restarts: the hold of the last car does not carry over
+        self.run_frames(processor, 1, 0, 5)
+        self.assertEqual(self.buffered(processor, 1), 1)
+
+    def test_buffer_idle(self):
+        processor = self.make_processor(BUFFER_IDLE=True)
+        self.run_frames(processor, 1, 0, 50)
+        self.assertEqual(self.buffered(processor, 1), 50)
+
+    def test_plates_are_assigned_once_per_frame(self):
+        lpr = FakeLpr()
+        processor = self.make_processor(lpr=lpr)
+        self.surface[2:4, 2:6] = (10, 20, 30, 255)
+        self.run_frames(processor, 0, 0, 3, [self.CAR, self.PLATE])
+        self.assertEqual(lpr.links, 3)
+        self.assertEqual([(fi, plates) for fi, plates, crop in lpr.updates], [(fi, {0: (2, 2, 6, 4)}) for fi in range(3)])
+        # stream 0 is not buffered: the crop of the plate has been copied (RGBA -> BGR) by the probe
+        crop = lpr.updates[0][2]
+        self.assertEqual(crop.shape, (2, 4, 3))
+        self.assertTrue((crop == (30, 20, 10)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
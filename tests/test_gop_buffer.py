@@ -0,0 +1,93 @@
+import threading
+import unittest
+from unittest import mock
+
+from core.gop_buffer import EncodedFrameBuffer, check_ffmpeg
+
+
+# push GOPs of gop_size units (the first one a keyframe), pts = frame_num * 10, return the next frame_num
+def push_gops(buffer, stream_no, first, gops, gop_size):
+    frame_num = first
+    for g in range(gops):
+        for i in range(gop_size):
+            buffer.note_frame(stream_no, frame_num, frame_num * 10)
+            buffer.push(stream_no, b'unit', frame_num * 10, keyframe=(i == 0))
+            frame_num += 1
+    return frame_num
+
+
+class EncodedFrameBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = EncodedFrameBuffer(2, max_frames=10, fps=5)
+
+    def frame_nums(self, stream_no=0):
+        return [unit.frame_num for unit in self.buffer.units[stream_no]]
+
+    def test_ring_starts_with_keyframe(self):
+        # a stream joined in the middle of a GOP
+        self.buffer.push(0, b'unit', 0, keyframe=False)
+        self.assertEqual(self.buffer.length(0), 0)
+        push_gops(self.buffer, 0, 1, 1, 3)
+        self.assertTrue(self.buffer.units[0][0].keyframe)
+
+    def test_oldest_whole_gop_is_evicted(self):
+        push_gops(self.buffer, 0, 0, 4, 3)
+        # 12 units > 10: the first GOP goes as a whole
+        self.assertEqual(self.frame_nums(), list(range(3, 12)))
+        self.assertEqual(self.buffer.stats['gops_evicted'], 1)
+
+    def test_units_get_the_frame_num_of_their_pts(self):
+        self.buffer.note_frame(0, 100, 7)
+        self.buffer.note_frame(0, 101, 9)
+        self.buffer.push(0, b'unit', 7, keyframe=True)
+        self.buffer.push(0, b'unit', 9, keyframe=False)
+        # not noted yet -> numbering continues
+        self.buffer.push(0, b'unit', 11, keyframe=False)
+        self.assertEqual(self.frame_nums(), [100, 101, 102])
+
+    def test_lost_unit_drops_its_gop(self):
+        next_fi = push_gops(self.buffer, 0, 0, 2, 3)
+        self.buffer.push(0, b'unit', next_fi * 10, keyframe=True)
+        self.buffer.drop_gop(0)
+        # the rest of the broken GOP is not buffered either
+        self.buffer.push(0, b'unit', (next_fi + 2) * 10, keyframe=False)
+        self.assertEqual(self.frame_nums(), list(range(6)))
+        self.assertEqual(self.buffer.stats['gops_dropped'], 1)
+        push_gops(self.buffer, 0, next_fi + 3, 1, 3)
+        self.assertEqual(self.frame_nums(), list(range(6)) + [9, 10, 11])
+
+    def test_get_units_starts_at_keyframe(self):
+        push_gops(self.buffer, 0, 0, 3, 3)
+        units = self.buffer.get_units(0, violation_fi=5, current_fi=8, length=2)
+        self.assertEqual([unit.frame_num for unit in units], [3, 4, 5, 6])
+        self.assertTrue(units[0].keyframe)
+
+    def test_concurrent_note_frame_and_push(self):
+        buffer = EncodedFrameBuffer(1, max_frames=1000, fps=30)
+        frames = 5000
+        def probe():
+            for fi in range(frames):
+                buffer.note_frame(0, fi, fi)
+        thread = threading.Thread(target=probe)
+        thread.start()
+        for fi in range(frames):
+            buffer.push(0, b'unit', fi, keyframe=(fi % 30 == 0))
+        thread.join()
+        self.assertLessEqual(len(buffer.pts_map[0]), 60)
+
+
+class CheckFfmpegTest(unittest.TestCase):
+
+    def test_missing_ffmpeg(self):
+        with mock.patch('shutil.which', return_value=None):
+            with self.assertRaises(RuntimeError):
+                check_ffmpeg()
+
+    def test_ffmpeg_found(self):
+        with mock.patch('shutil.which', return_value='/usr/bin/ffmpeg'):
+            check_ffmpeg()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+from utils.image_writer import ImageWriter
+
+
+# encode_fn blocking until the test releases it: holds a writer thread on an image
+class Gate(object):
+    def __init__(self, data=b'gated'):
+        self.data = data
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.entered.set()
+        self.release.wait(10)
+        return self.data
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class ImageWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def path(self, *parts):
+        return os.path.join(self.folder.name, *parts)
+
+    def make_writer(self, workers=1, max_size=256):
+        writer = ImageWriter(workers, max_size)
+        self.addCleanup(writer.stop, 5)
+        return writer
+
+    def test_writes_images(self):
+        writer = self.make_writer()
+        img = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+        path = self.path('plates', '20261018', 'crop.png')
+        self.assertTrue(writer.write(path, img).wait(5))
+        np.testing.assert_array_equal(cv2.imread(path), img)
+        self.assertEqual(os.listdir(self.path('plates', '20261018')), ['crop.png'])
+        counters = writer.counters()
+        self.assertEqual((counters['written'], counters['failed'], counters['queued'], counters['pending']), (1, 0, 0, 0))
+        self.assertEqual(writer.metrics()['write_ms'].keys(), {'p50', 'p99', 'max'})
+
+    def test_file_appears_complete(self):
+        writer = self.make_writer()
+        gate = Gate()
+        path = self.path('evidence.jpg')
+        done = writer.write(path, encode_fn=gate)
+        self.assertTrue(gate.entered.wait(5))
+        # queued or being written: exists() already says so, the file is not there yet
+        self.assertTrue(writer.exists(path))
+        self.assertFalse(os.path.exists(path))
+        gate.release.set()
+        self.assertTrue(done.wait(5))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'gated')
+        # renamed into place: no temporary file left behind
+        self.assertEqual(os.listdir(self.folder.name), ['evidence.jpg'])
+        self.assertTrue(writer.exists(path))
+        self.assertFalse(writer.exists(self.path('other.jpg')))
+
+    def test_failed_write_removes_the_temporary_file(self):
+        writer = self.make_writer()
+        path = self.path('broken.png')
+        # the temporary file is created, writing the encoded data fails
+        with self.assertLogs(level='ERROR'):
+            self.assertTrue(writer.write(path, encode_fn=lambda: 12345).wait(5))
+        self.assertEqual(os.listdir(self.folder.name), [])
+        self.assertFalse(writer.exists(path))
+        self.assertEqual(writer.counters()['failed'], 1)
+        # an image that cannot be encoded
+        with self.assertLogs(level='ERROR'):
+            self.assertTrue(writer.write(self.path('broken.xyz'), np.zeros((2, 2, 3), np.uint8)).wait(5))
+        self.assertEqual(os.listdir(self.folder.name), [])
+        self.assertEqual(writer.counters()['failed'], 2)
+
+    def test_full_queue_waits(self):
+        writer = self.make_writer(workers=1, max_size=1)
+        gate = Gate()
+        writer.write(self.path('0.bin'), encode_fn=gate)
+        self.assertTrue(gate.entered.wait(5))
+        writer.write(self.path('1.bin'), encode_fn=lambda: b'1')
+        # the queue is full: the third write waits for room instead of dropping an image
+        third = threading.Thread(target=writer.write, args=(self.path('2.bin'),), kwargs={'encode_fn': lambda: b'2'})
+        third.start()
+        self.assertTrue(wait_for(lambda: writer.counters()['waits'] == 1))
+        self.assertTrue(third.is_alive())
+        gate.release.set()
+        third.join(5)
+        self.assertFalse(third.is_alive())
+        self.assertTrue(wait_for(lambda: writer.counters()['written'] == 3))
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ['0.bin', '1.bin', '2.bin'])
+
+    def test_stop_drains_the_queue(self):
+        writer = self.make_writer(workers=1)
+        gate = Gate()
+        writer.write(self.path('0.bin'), encode_fn=gate)
+        self.assertTrue(gate.entered.wait(5))
+        for i in range(1, 6):
+            writer.write(self.path(f'{i}.bin'), encode_fn=lambda i=i: bytes([i]))
+        stopping = threading.Thread(target=writer.stop)
+        stopping.start()
+        self.assertTrue(wait_for(lambda: not writer.running))
+        gate.release.set()
+        stopping.join(5)
+        self.assertFalse(stopping.is_alive())
+        self.assertEqual(sorted(os.listdir(self.folder.name)), [f'{i}.bin' for i in range(6)])
+        self.assertEqual(writer.counters()['written'], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
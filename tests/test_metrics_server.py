@@ -0,0 +1,72 @@
+import contextlib
+import io
+import unittest
+import urllib.error
+import urllib.request
+
+from utils.metrics_server import Metric, MetricsServer, format_metrics
+
+
+class FormatMetricsTest(unittest.TestCase):
+
+    def test_families(self):
+        text = format_metrics([Metric('ivms_frames_total', 'counter', 'Frames processed').add(12, stream='0').add(7, stream='1'),
+                               Metric('ivms_queue_depth', 'gauge', 'Frames queued').add(3)])
+        self.assertEqual(text.splitlines(), ['# HELP ivms_frames_total Frames processed',
+                                             '# TYPE ivms_frames_total counter',
+                                             'ivms_frames_total{stream="0"} 12.0',
+                                             'ivms_frames_total{stream="1"} 7.0',
+                                             '# HELP ivms_queue_depth Frames queued',
+                                             '# TYPE ivms_queue_depth gauge',
+                                             'ivms_queue_depth 3.0'])
+        self.assertTrue(text.endswith('\n'))
+
+    def test_label_escaping(self):
+        text = format_metrics([Metric('ivms_errors_total', 'counter', 'Errors').add(1, stage='a"b\\c\nd')])
+        self.assertEqual(text.splitlines()[-1], 'ivms_errors_total{stage="a\\"b\\\\c\\nd"} 1.0')
+
+    def test_several_labels(self):
+        text = format_metrics([Metric('ivms_latency_ms', 'gauge', 'Latency').add(1.5, stream=0, stage='crops', q='p99')])
+        self.assertEqual(text.splitlines()[-1], 'ivms_latency_ms{stream="0",stage="crops",q="p99"} 1.5')
+
+    def test_family_without_samples(self):
+        self.assertEqual(format_metrics([Metric('ivms_idle', 'gauge', 'Nothing yet')]),
+                         '# HELP ivms_idle Nothing yet\n# TYPE ivms_idle gauge\n')
+
+
+class MetricsServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collected = 0
+        self.server = MetricsServer(self.collect, port=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.server.start()
+        self.addCleanup(self.server.stop)
+        self.url = f'http://127.0.0.1:{self.server.server.server_address[1]}'
+        # straight to the local server, whatever proxy the environment sets
+        self.opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    def collect(self):
+        self.collected += 1
+        return [Metric('ivms_scrapes_total', 'counter', 'Scrapes').add(self.collected)]
+
+    def test_metrics(self):
+        with self.opener.open(self.url + '/metrics', timeout=5) as response:
+            self.assertEqual(response.status, 200)
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+            body = response.read().decode('utf-8')
+        self.assertIn('ivms_scrapes_total 1.0\n', body)
+        # collected again on every scrape
+        with self.opener.open(self.url + '/metrics?x=1', timeout=5) as response:
+            self.assertIn('ivms_scrapes_total 2.0\n', response.read().decode('utf-8'))
+
+    def test_other_paths(self):
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.opener.open(self.url + '/health', timeout=5)
+        self.assertEqual(ctx.exception.code, 404)
+        ctx.exception.close()
+        self.assertEqual(self.collected, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import threading
+import unittest
+
+from core.ocr_pool import OcrPool
+
+
+class OcrPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    # job blocking until release is set, so that the queue fills up behind the first one
+    def job(self, track_id):
+        self.started.set()
+        self.release.wait()
+        self.jobs.append(track_id)
+
+    def make_pool(self, max_size):
+        pool = OcrPool(self.job, workers=1, max_size=max_size)
+        self.addCleanup(pool.stop, 5)
+        self.addCleanup(self.release.set)
+        self.assertTrue(pool.submit(0, 0, 0))
+        self.assertTrue(self.started.wait(5))
+        return pool
+
+    def test_rejected_jobs_are_counted(self):
+        pool = self.make_pool(max_size=2)
+        self.assertTrue(pool.submit(0, 1, 1))
+        # a track with a job still queued
+        self.assertFalse(pool.submit(0, 1, 1))
+        self.assertTrue(pool.submit(1, 1, 2))
+        # queue full
+        self.assertFalse(pool.submit(1, 2, 3))
+
+        counters = pool.counters()
+        self.assertEqual((counters['submitted'], counters['deduplicated'], counters['dropped']), (3, 1, 1))
+        self.assertEqual((counters['queued'], counters['busy']), (2, 1))
+
+        self.release.set()
+        pool.stop(5)
+        self.assertEqual(self.jobs, [0, 1, 2])
+        self.assertEqual(pool.counters()['processed'], 3)
+
+    def test_failed_job_does_not_stop_the_pool(self):
+        def job(track_id):
+            if track_id == 0:
+                raise ValueError('bad crop')
+            self.jobs.append(track_id)
+
+        pool = OcrPool(job, workers=1)
+        with self.assertLogs(level='ERROR'):
+            pool.submit(0, 0, 0)
+            pool.submit(0, 1, 1)
+            pool.stop(5)
+        self.assertEqual(self.jobs, [1])
+        self.assertEqual(pool.counters()['failed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from importlib.util import find_spec
+
+import numpy as np
+from easydict import EasyDict as edict
+
+# the backends are optional: torch (attempt_load), onnx (export) and onnxruntime (BACKEND: onnx)
+BACKENDS = all(find_spec(module) is not None for module in ('torch', 'onnx', 'onnxruntime'))
+
+
+@unittest.skipUnless(BACKENDS, 'torch, onnx and onnxruntime are needed')
+class OnnxBackendTest(unittest.TestCase):
+    """
+        The OCR detector (ObjectDetector mode 'ocr') on a randomly initialized YOLOv5s exported with a dynamic input:
+        the ONNX Runtime backend must detect the same objects as the PyTorch one. The detections of a random model
+        are meaningless; its Detect biases are spread so that it has plenty of them above CONF_THRES (the initial
+        ones score every anchor about 0).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        import torch
+        from LPR_QAT.core.onnx_export import export_onnx
+        from LPR_QAT.core.object_detector import ObjectDetector
+        from LPR_QAT.models.yolo import Model
+
+        cls.folder = tempfile.mkdtemp(prefix='test_onnx_backend_')
+        torch.manual_seed(0)
+        model = Model('LPR_QAT/models/yolov5s.yaml', nc=51)
+        model.names = [str(i) for i in range(51)]
+        with torch.no_grad():
+            for conv in model.model[-1].m:
+                conv.bias.normal_(0, 2)
+        weights = os.path.join(cls.folder, 'random.pt')
+        torch.save({'model': model}, weights)
+        onnx_weights = export_onnx(weights, os.path.join(cls.folder, 'random.onnx'), 128, 1, dynamic=True)
+
+        cls.detectors = {}
+        for backend in ('torch', 'onnx'):
+            cfg = edict({'DETECTIONS': {'DEVICE': 'cpu', 'CONF_THRES': 0.3, 'IOU_THRES': 0.45,
+                                        'OCR': {'IMG_SIZE': 128, 'WEIGHTS': weights, 'ONNX_WEIGHTS': onnx_weights,
+                                                'BACKEND': backend, 'ONNX_THREADS': 1}}})
+            cls.detectors[backend] = ObjectDetector(cfg, mode='ocr')
+
+        # fixed plate sized crops
+        rnd = np.random.default_rng(0)
+        cls.crops = [rnd.integers(0, 256, (h, w, 3), dtype=np.uint8) for w, h in ((200, 60), (120, 50), (90, 40))]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    # (classes, boxes, scores) of the detections of a crop, by class and score (NMS orders them by score only:
+    # nearly equal scores of different classes may come in either order)
+    def detections(self, det):
+        self.assertIsNotNone(det)
+        det = det.cpu().numpy()
+        det = det[np.lexsort((-det[:, 4], det[:, 5]))]
+        return det[:, 5].astype(int), det[:, :4], det[:, 4]
+
+    def assertSameDetections(self, expected, det):
+        classes, boxes, scores = self.detections(expected)
+        onnx_classes, onnx_boxes, onnx_scores = self.detections(det)
+        self.assertEqual(onnx_classes.tolist(), classes.tolist())
+        # the boxes are rounded to pixels: float differences of the backends may round a coordinate the other way
+        np.testing.assert_allclose(onnx_boxes, boxes, atol=1)
+        np.testing.assert_allclose(onnx_scores, scores, atol=1e-3)
+
+    def test_onnx_detects_as_torch(self):
+        import torch
+        with torch.no_grad():
+            for crop in self.crops:
+                self.assertSameDetections(self.detectors['torch'].detect_objects(crop, 'video'),
+                                          self.detectors['onnx'].detect_objects(crop, 'video'))
+            for expected, det in zip(self.detectors['torch'].detect_objects_batch(self.crops),
+                                     self.detectors['onnx'].detect_objects_batch(self.crops)):
+                self.assertSameDetections(expected, det)
+
+    def test_concurrent_calls_do_not_share_buffers(self):
+        # the crops of every thread in turn, in parallel: each thread letterboxes into its own buffers
+        import torch
+        detector = self.detectors['onnx']
+        with torch.no_grad():
+            expected = [detector.detect_objects(crop, 'video') for crop in self.crops]
+        dets, errors = {}, []
+        barrier = threading.Barrier(len(self.crops))
+
+        def detect(i):
+            try:
+                barrier.wait()
+                with torch.no_grad():
+                    dets[i] = [detector.detect_objects(self.crops[(i + k) % len(self.crops)], 'video') for k in range(20)]
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=detect, args=(i,)) for i in range(len(self.crops))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(dets), len(self.crops))
+        for i, thread_dets in dets.items():
+            for k, det in enumerate(thread_dets):
+                self.assertSameDetections(expected[(i + k) % len(self.crops)], det)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+import numpy as np
+
+from LPR_QAT.core.custom_anpr_result import CustomANPRResult, DecodedLabel, PlateField, PlateStates
+from LPR_QAT.core.plate_consensus import PlateConsensus, SingleRead
+
+
+# alpr_ktc result of a plate read; char_scores default to score for every char
+def plate_result(state, prefix, platenum, score=0.9, char_scores=None):
+    def field(chars):
+        scores = char_scores if (char_scores is not None and chars == platenum) else [score] * len(chars)
+        return PlateField(char=tuple(chars), char_score=np.array(scores, dtype=np.float64))
+    return CustomANPRResult(decoded_label=DecodedLabel(','.join(l for l in (state, prefix, platenum) if l), state, prefix, platenum),
+                            state=PlateStates(data_str=(state,) if state else (), score=np.array([score] if state else [])),
+                            prefix=field(prefix), platenum=field(platenum))
+
+
+class PlateConsensusTest(unittest.TestCase):
+
+    def test_no_plate_read(self):
+        consensus = PlateConsensus()
+        consensus.add(None)
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', ''))
+        self.assertEqual(consensus.reads, 2)
+        self.assertIsNone(consensus.plate())
+        self.assertIsNone(consensus.result())
+        self.assertFalse(consensus.confident())
+
+    def test_one_read_is_not_enough(self):
+        consensus = PlateConsensus(0.75)
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12345', score=1.0))
+        plate = consensus.plate()
+        self.assertEqual((plate.state_label, plate.prefix_label, plate.platenum_label), ('STATE-DXB-ENGLISH', 'A', '12345'))
+        # 1.0 / (1.0 + PRIOR)
+        self.assertAlmostEqual(plate.confidence, 1 / 1.5)
+        self.assertFalse(consensus.confident())
+
+    def test_agreeing_reads_become_confident(self):
+        consensus = PlateConsensus(0.75)
+        for i in range(2):
+            consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12345'))
+        self.assertAlmostEqual(consensus.plate().confidence, 1.8 / 2.3)
+        self.assertTrue(consensus.confident())
+        self.assertEqual(consensus.result().decoded_label,
+                         DecodedLabel('STATE-DXB-ENGLISH,A,12345', 'STATE-DXB-ENGLISH', 'A', '12345'))
+
+    def test_chars_are_voted_by_position(self):
+        consensus = PlateConsensus(0.75)
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12345', char_scores=[0.9, 0.9, 0.4, 0.9, 0.9]))
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12845', char_scores=[0.9, 0.9, 0.3, 0.9, 0.9]))
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12845', char_scores=[0.9, 0.9, 0.3, 0.9, 0.9]))
+        plate = consensus.plate()
+        self.assertEqual(plate.platenum_label, '12845')
+        # the contested position: 0.6 of 1.0 votes
+        self.assertAlmostEqual(plate.confidence, 0.6 / 1.5)
+        self.assertFalse(consensus.confident())
+
+    def test_length_is_voted_first(self):
+        consensus = PlateConsensus()
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12345'))
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12345'))
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '1234'))
+        self.assertEqual(consensus.plate().platenum_label, '12345')
+
+    def test_chars_are_case_insensitive(self):
+        consensus = PlateConsensus()
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'a', '12345'))
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12345'))
+        self.assertEqual(consensus.plate().prefix_label, 'A')
+
+    def test_labels_of_one_state_vote_together(self):
+        consensus = PlateConsensus()
+        consensus.add(plate_result('STATE-DXB-ENGLISH', 'A', '12345', score=0.5))
+        consensus.add(plate_result('STATE-DXB-ARABIC', 'A', '12345', score=0.6))
+        consensus.add(plate_result('STATE-SHJ-ENGLISH', 'A', '12345', score=0.9))
+        # DXB: 1.1 against SHJ: 0.9, the best scored DXB label
+        self.assertEqual(consensus.plate().state_label, 'STATE-DXB-ARABIC')
+
+    def test_field_not_read_does_not_lower_the_confidence(self):
+        consensus = PlateConsensus(0.75)
+        for i in range(2):
+            consensus.add(plate_result('', '', '12345'))
+        plate = consensus.plate()
+        self.assertEqual((plate.state_label, plate.prefix_label), ('', ''))
+        self.assertTrue(consensus.confident())
+        self.assertEqual(consensus.result().decoded_label.full_label, '12345')
+
+
+class SingleReadTest(unittest.TestCase):
+
+    def test_first_plate_read_settles(self):
+        read = SingleRead(0.75)
+        self.assertFalse(read.confident())
+        read.add(None)
+        self.assertFalse(read.confident())
+        read.add({'PlateText': 'A 12345'})
+        read.add({'PlateText': 'A 12845'})
+        self.assertTrue(read.confident())
+        self.assertEqual(read.result(), {'PlateText': 'A 12345'})
+        self.assertEqual(read.reads, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
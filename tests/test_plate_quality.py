@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+from core.plate_quality import CropCandidates, plate_quality
+
+
+class CropCandidatesTest(unittest.TestCase):
+
+    def test_keeps_the_k_best(self):
+        candidates = CropCandidates(3)
+        for fi, quality in enumerate([0.2, 0.5, 0.1, 0.7, 0.4, 0.6]):
+            if candidates.accepts(quality):
+                candidates.push(quality, f'crop{fi}', fi)
+            else:
+                candidates.seen(quality, fi)
+
+        self.assertEqual(len(candidates), 3)
+        self.assertEqual(candidates.best(), [(0.7, 'crop3'), (0.6, 'crop5'), (0.5, 'crop1')])
+        # the worst kept one is the bar
+        self.assertFalse(candidates.accepts(0.5))
+        self.assertTrue(candidates.accepts(0.55))
+        self.assertFalse(candidates.push(0.3, 'crop6', 6))
+
+    def test_equal_qualities_keep_their_order(self):
+        candidates = CropCandidates(2)
+        for fi in range(3):
+            candidates.push(0.5, f'crop{fi}', fi)
+        self.assertEqual([crop for quality, crop in candidates.best()], ['crop1', 'crop0'])
+
+    def test_plateau(self):
+        candidates = CropCandidates(2)
+        self.assertEqual(candidates.stale_for(10), 0)
+        candidates.push(0.5, 'crop0', 10)
+        candidates.seen(0.4, 12)
+        self.assertEqual(candidates.stale_for(20), 10)
+        candidates.seen(0.6, 20)
+        self.assertEqual(candidates.stale_for(25), 5)
+
+    def test_take_raises_the_floor(self):
+        candidates = CropCandidates(3)
+        candidates.push(0.5, 'crop0', 0)
+        candidates.push(0.3, 'crop1', 1)
+
+        self.assertEqual(candidates.take(), [(0.5, 'crop0'), (0.3, 'crop1')])
+        self.assertEqual((len(candidates), candidates.taken), (0, 1))
+        # only crops better than the best one taken are kept from now on
+        self.assertFalse(candidates.accepts(0.5))
+        self.assertFalse(candidates.push(0.4, 'crop2', 2))
+        self.assertTrue(candidates.push(0.6, 'crop3', 3))
+        self.assertEqual(candidates.take(), [(0.6, 'crop3')])
+        self.assertEqual(candidates.taken, 2)
+
+        # nothing to take
+        self.assertEqual(candidates.take(), [])
+        self.assertEqual(candidates.taken, 2)
+
+
+class PlateQualityTest(unittest.TestCase):
+
+    def test_sharp_wide_plate_scores_higher(self):
+        rng = np.random.default_rng(0)
+        sharp = rng.integers(0, 256, size=(30, 110, 3), dtype=np.uint8)
+        flat = np.full((30, 110, 3), 128, dtype=np.uint8)
+        bbox = (100, 100, 200, 130)
+
+        self.assertGreater(plate_quality(sharp, bbox, 1920, 1080, 0.9), plate_quality(flat, bbox, 1920, 1080, 0.9))
+        self.assertGreater(plate_quality(sharp, bbox, 1920, 1080, 0.9), plate_quality(sharp[:, :60], (100, 100, 150, 130), 1920, 1080, 0.9))
+        # touching the frame border
+        self.assertGreater(plate_quality(sharp, bbox, 1920, 1080, 0.9), plate_quality(sharp, (0, 100, 100, 130), 1920, 1080, 0.9))
+        self.assertEqual(plate_quality(sharp, (100, 100, 100, 130), 1920, 1080, 0.9), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import tempfile
+import unittest
+from importlib.util import find_spec
+
+import numpy as np
+
+import core.detection_object as do
+
+# plate recognition needs torch (LPR_QAT)
+TORCH = find_spec('torch') is not None
+
+
+# detections of a frame: one car per track id
+def cars(*track_ids):
+    n = len(track_ids)
+    return do.FrameDetections(np.array(track_ids, dtype=np.uint64), np.full(n, do.CAR, dtype=np.int32),
+                              np.full(n, 0.9, dtype=np.float32), np.full(n, 10, dtype=np.float32),
+                              np.full(n, 10, dtype=np.float32), np.full(n, 100, dtype=np.float32),
+                              np.full(n, 80, dtype=np.float32))
+
+
+@unittest.skipUnless(TORCH, 'plate recognition needs torch')
+class ExpireSlotsTest(unittest.TestCase):
+    """
+        The vehicle slots of a stream are dropped REMOVE_SLOT_AFTER_FRAMES frames after the track was last seen,
+        through a min-heap of (last seen fi, track id) entries that are re-pushed when the track was seen since.
+    """
+
+    def setUp(self):
+        from core.plate_recognition import PlateRecognition
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.lpr = PlateRecognition('config', self.folder.name, 2, 1920, 1080, None, anpr=False)
+        self.timeout = self.lpr.REMOVE_SLOT_AFTER_FRAMES
+
+    def update(self, stream_no, fi, *track_ids):
+        self.lpr.update(cars(*track_ids), stream_no, fi, None)
+        return sorted(self.lpr.v_slots[stream_no])
+
+    def test_track_expires_after_its_timeout(self):
+        self.assertEqual(self.update(0, 0, 7, 8), [7, 8])
+        self.assertEqual(self.update(0, self.timeout), [7, 8])
+        self.assertEqual(self.update(0, self.timeout + 1), [])
+        self.assertEqual(self.lpr.v_expiry[0], [])
+
+    def test_refreshed_track_is_kept(self):
+        self.update(0, 0, 7, 8)
+        self.update(0, 20, 7)
+        # the heap entry of 7 (fi 0) is stale: it is popped and re-pushed with fi 20, 8 expires
+        self.assertEqual(self.update(0, self.timeout + 10), [7])
+        self.assertEqual(self.lpr.v_expiry[0], [(20, 7)])
+        self.assertEqual(self.lpr.v_slots[0][7].fi, 20)
+        self.assertEqual(self.update(0, 20 + self.timeout), [7])
+        self.assertEqual(self.update(0, 20 + self.timeout + 1), [])
+
+    def test_refreshes_do_not_grow_the_heap(self):
+        # a track seen on every frame keeps a single entry, re-pushed once it is old enough
+        for fi in range(200):
+            self.update(0, fi, 7)
+            self.assertEqual(len(self.lpr.v_expiry[0]), 1)
+        self.assertEqual(self.update(0, 199 + self.timeout), [7])
+        self.assertEqual(self.update(0, 200 + self.timeout), [])
+
+    def test_frame_number_restart(self):
+        self.update(0, 100, 7)
+        # the stream restarted: the track expires on the new frame numbers, not 100 frames later
+        self.update(0, 5, 7)
+        self.assertEqual(self.update(0, 5 + self.timeout), [7])
+        self.assertEqual(self.update(0, 5 + self.timeout + 1), [])
+
+    def test_streams_are_independent(self):
+        self.update(0, 0, 7)
+        self.update(1, 0, 7, 9)
+        # the frames of stream 1 move on: its tracks expire, the ones of stream 0 do not
+        self.assertEqual(self.update(1, 100, 9), [9])
+        self.assertEqual(sorted(self.lpr.v_slots[0]), [7])
+        self.assertEqual(self.update(0, self.timeout), [7])
+        self.assertEqual(self.update(0, self.timeout + 1), [])
+        self.assertEqual(sorted(self.lpr.v_slots[1]), [9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import threading
+import unittest
+from unittest import mock
+
+from core.recent_plates import RecentPlates
+
+
+class RecentPlatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('core.recent_plates.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_plate_is_new_once_per_window(self):
+        plates = RecentPlates(window_s=60)
+        self.assertTrue(plates.add(0, 'DXB A 12345'))
+        self.now += 30
+        self.assertFalse(plates.add(0, 'DXB A 12345'))
+        self.assertIn((0, 'DXB A 12345'), plates)
+
+    def test_window_is_refreshed_by_every_read(self):
+        plates = RecentPlates(window_s=60)
+        plates.add(0, 'DXB A 12345')
+        # read every 40 s: never 60 s since the last read
+        for i in range(5):
+            self.now += 40
+            self.assertFalse(plates.add(0, 'DXB A 12345'))
+        self.now += 61
+        self.assertNotIn((0, 'DXB A 12345'), plates)
+        self.assertTrue(plates.add(0, 'DXB A 12345'))
+
+    def test_expired_plates_are_dropped(self):
+        plates = RecentPlates(window_s=60)
+        plates.add(0, 'DXB A 1')
+        self.now += 30
+        plates.add(0, 'DXB A 2')
+        self.now += 31
+        plates.add(0, 'DXB A 3')
+        self.assertEqual(len(plates), 2)
+        self.assertNotIn((0, 'DXB A 1'), plates)
+
+    def test_least_recently_read_plate_goes_first(self):
+        plates = RecentPlates(window_s=60, max_size=2)
+        plates.add(0, 'DXB A 1')
+        plates.add(0, 'DXB A 2')
+        plates.add(0, 'DXB A 1')
+        plates.add(0, 'DXB A 3')
+        self.assertEqual(len(plates), 2)
+        self.assertIn((0, 'DXB A 1'), plates)
+        self.assertNotIn((0, 'DXB A 2'), plates)
+        self.assertTrue(plates.add(0, 'DXB A 2'))
+
+    def test_ttl(self):
+        plates = RecentPlates(window_s=60)
+        plates.add(0, 'DXB A 1', ttl_s=5)
+        self.now += 6
+        self.assertTrue(plates.add(0, 'DXB A 1'))
+
+    def test_scope(self):
+        per_stream = RecentPlates(window_s=60)
+        per_stream.add(0, 'DXB A 12345')
+        self.assertTrue(per_stream.add(1, 'DXB A 12345'))
+
+        shared = RecentPlates(window_s=60, per_stream=False)
+        shared.add(0, 'DXB A 12345')
+        self.assertFalse(shared.add(1, 'DXB A 12345'))
+        self.assertIn((1, 'DXB A 12345'), shared)
+
+    def test_one_thread_sees_a_plate_new(self):
+        plates = RecentPlates(window_s=60)
+        new = []
+        barrier = threading.Barrier(8)
+
+        def add():
+            barrier.wait()
+            new.append(plates.add(0, 'DXB A 12345'))
+
+        threads = [threading.Thread(target=add) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sorted(new), [False] * 7 + [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from easydict import EasyDict as edict
+
+import core.detection_object as do
+from core.replay import (CAPTURE_MAGIC, DETECTION_DTYPE, DetectionCapture, create_offline_processor,
+                         empty_detections, load_detections)
+
+
+# detections of a frame: rows of (track id, class id, score, left, top, width, height)
+def frame_detections(rows):
+    a = np.array(rows, dtype=np.float64).reshape(-1, 7)
+    return do.FrameDetections(a[:, 0].astype(np.uint64), a[:, 1].astype(np.int32),
+                              *[a[:, i].astype(np.float32) for i in range(2, 7)])
+
+
+class ReplayTest(unittest.TestCase):
+
+    # (stream, frame, rows) in the order the probe sees them; frame 1 of stream 0 has no objects
+    FRAMES = [(0, 0, [(7, do.CAR, 0.9, 100.6, 200.2, 300.9, 150.5), (8, do.PLATE, 0.8, 150.0, 300.0, 60.0, 20.0)]),
+              (1, 0, [(2**40 + 3, do.MOBILE, 0.6, 1.0, 2.0, 3.0, 4.0)]),
+              (0, 1, []),
+              (1, 1, [(3, do.NO_BELT, 0.5, 10.0, 20.0, 30.0, 40.0)]),
+              (0, 2, [(7, do.CAR, 0.95, 101.0, 201.0, 300.0, 150.0)]),
+              (0, 70000, [(9, do.CAR, 0.7, 0.0, 0.0, 8.0, 4.0)])]
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, 'capture.dets')
+
+    def write_capture(self):
+        capture = DetectionCapture(self.path)
+        for stream_no, fi, rows in self.FRAMES:
+            capture.write(stream_no, fi, frame_detections(rows))
+        capture.close()
+        return capture
+
+    def assertSameDetections(self, loaded, expected):
+        for field in ('track_id', 'class_id', 'score', 'left', 'top', 'width', 'height'):
+            np.testing.assert_array_equal(getattr(loaded, field), getattr(expected, field), field)
+            self.assertEqual(getattr(loaded, field).dtype, getattr(expected, field).dtype, field)
+        self.assertEqual(loaded.boxes.tolist(), expected.boxes.tolist())
+
+    def test_round_trip(self):
+        capture = self.write_capture()
+        self.assertEqual(capture.records, 6)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(len(CAPTURE_MAGIC)), CAPTURE_MAGIC)
+        self.assertEqual(os.path.getsize(self.path), len(CAPTURE_MAGIC) + 6 * DETECTION_DTYPE.itemsize)
+
+        detections = load_detections(self.path)
+        # frames without objects are not stored: the replay uses empty_detections() for them
+        self.assertEqual({s: sorted(frames) for s, frames in detections.items()}, {0: [0, 2, 70000], 1: [0, 1]})
+        for stream_no, fi, rows in self.FRAMES:
+            if rows:
+                self.assertSameDetections(detections[stream_no][fi], frame_detections(rows))
+        self.assertEqual(detections[0][0].rows(do.PLATE).tolist(), [1])
+        self.assertEqual(detections[1][0].track_id.tolist(), [2**40 + 3])
+
+    def test_empty_capture(self):
+        DetectionCapture(self.path).close()
+        self.assertEqual(load_detections(self.path), {})
+        self.assertEqual(len(empty_detections()), 0)
+        self.assertEqual(empty_detections().boxes.shape, (0, 4))
+
+    def test_not_a_capture(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'IVMSDET0' + bytes(DETECTION_DTYPE.itemsize))
+        with self.assertRaises(ValueError):
+            load_detections(self.path)
+        # cut inside the header
+        with open(self.path, 'wb') as f:
+            f.write(CAPTURE_MAGIC[:4])
+        with self.assertRaises(ValueError):
+            load_detections(self.path)
+
+    def test_truncated_capture(self):
+        self.write_capture()
+        # the pipeline was killed in the middle of the last record: the complete ones are kept
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 5)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            detections = load_detections(self.path)
+        self.assertIn('partial last record', out.getvalue())
+        self.assertEqual({s: sorted(frames) for s, frames in detections.items()}, {0: [0, 2], 1: [0, 1]})
+        self.assertSameDetections(detections[0][2], frame_detections(self.FRAMES[4][2]))
+
+    def test_replay_of_a_probe_capture(self):
+        # the probe captures the detections it processes, the replay processor gets them back
+        cfg = edict({'VIDEO_OUTPUT': {'FORMAT': 'XVID', 'EVENT_RECORDING': False, 'DURATION': 2,
+                                      'MUXER': {'WIDTH': 8, 'HEIGHT': 4}, 'FRAME_BUFFER': {}, 'IMAGE_WRITER': {}},
+                     'LABEL': {'SITECODE': '', 'RADAR_ID': '', 'PLACE': '', 'DEVICE_ID': '', 'NAME': '', 'HEIGHT': 2}})
+        processor = create_offline_processor(cfg, None, 2, os.path.join(self.folder.name, 'out'), anpr='OFF')
+        self.addCleanup(processor.stop)
+        processor.capture = DetectionCapture(self.path)
+        surface = np.zeros((4, 8, 4), dtype=np.uint8)
+        for stream_no, fi, rows in self.FRAMES[:5]:
+            processor.process_frame(stream_no, fi, surface, frame_detections(rows))
+        processor.capture.close()
+
+        detections = load_detections(self.path)
+        self.assertEqual({s: sorted(frames) for s, frames in detections.items()}, {0: [0, 2], 1: [0, 1]})
+        for stream_no, fi, rows in self.FRAMES[:5]:
+            if rows:
+                self.assertSameDetections(detections[stream_no][fi], frame_detections(rows))
+        # replayed as replay_ivms.py does: frames of the violation stream with vehicles are buffered
+        replay = create_offline_processor(cfg, None, 2, os.path.join(self.folder.name, 'replay'), anpr='OFF')
+        self.addCleanup(replay.stop)
+        for fi in range(3):
+            for stream_no in range(2):
+                replay.process_frame(stream_no, fi, surface, detections.get(stream_no, {}).get(fi, empty_detections()))
+        self.assertEqual(replay.recorder.frame_buffer.written, [0, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+
+from utils.stage_timer import LatencyHistogram, NullStageTimer, StageTimer
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_small_values_are_exact(self):
+        # below 32 every value has a bucket of its own
+        for value in range(32):
+            self.assertEqual(LatencyHistogram._index(value), value)
+            self.assertEqual(LatencyHistogram._value(value), value)
+
+    def test_boundary(self):
+        # 32 and 33 share the first 2 wide bucket, right after the one of 31
+        self.assertEqual(LatencyHistogram._index(31), 31)
+        self.assertEqual(LatencyHistogram._index(32), 32)
+        self.assertEqual(LatencyHistogram._index(33), 32)
+        self.assertEqual(LatencyHistogram._index(34), 33)
+        self.assertEqual(LatencyHistogram._value(32), 33)
+
+    def test_bucket_precision(self):
+        # the value of a bucket is within ~6% of every value it holds, and the indices grow with the values
+        rnd = np.random.default_rng(0)
+        values = np.unique(np.concatenate([np.arange(1, 4096), rnd.integers(1, 1 << 40, 10000)]))
+        indices = [LatencyHistogram._index(int(v)) for v in values]
+        self.assertEqual(indices, sorted(indices))
+        for value, index in zip(values.tolist(), indices):
+            self.assertLessEqual(abs(LatencyHistogram._value(index) - value), 0.0625 * value, value)
+
+    def test_empty(self):
+        h = LatencyHistogram()
+        self.assertEqual(h.percentile(0.5), 0)
+        self.assertEqual(h.percentile(0.99), 0)
+        self.assertEqual(h.count, 0)
+
+    def test_negative_values_count_as_zero(self):
+        h = LatencyHistogram()
+        h.record(-5)
+        self.assertEqual((h.count, h.max, h.percentile(1.0)), (1, 0, 0))
+
+    def test_percentiles_match_numpy(self):
+        # stage latencies: log-normal around 2 ms
+        rnd = np.random.default_rng(1)
+        values = rnd.lognormal(np.log(2e6), 0.8, 20000).astype(np.int64)
+        h = LatencyHistogram()
+        for value in values.tolist():
+            h.record(value)
+        self.assertEqual(h.count, len(values))
+        self.assertEqual(h.max, values.max())
+        for q in (0.5, 0.9, 0.95, 0.99, 0.999):
+            expected = np.percentile(values, 100 * q, method='inverted_cdf')
+            self.assertAlmostEqual(h.percentile(q) / expected, 1, delta=0.0625, msg=q)
+        self.assertEqual(h.percentile(1.0), values.max())
+
+    def test_percentile_does_not_exceed_the_max(self):
+        h = LatencyHistogram()
+        for value in (1000, 1000, 1001):
+            h.record(value)
+        self.assertLessEqual(h.percentile(0.99), 1001)
+
+
+class StageTimerTest(unittest.TestCase):
+
+    def test_report_resets_the_histograms(self):
+        timer = StageTimer()
+        t0 = timer.now()
+        t1 = timer.lap(0, 'convert', t0)
+        timer.lap(0, 'crops', t1)
+        timer.lap('analytics', 'convert', t0)
+        report = timer.report()
+        self.assertEqual(set(report), {'stream0', 'analytics'})
+        self.assertEqual(set(report['stream0']), {'convert', 'crops'})
+        self.assertEqual(set(report['stream0']['convert']), {'n', 'p50', 'p95', 'p99', 'max'})
+        self.assertEqual(report['stream0']['convert']['n'], 1)
+        self.assertGreaterEqual(t1, t0)
+        # the next report starts from new histograms
+        self.assertEqual(timer.report(), {})
+        timer.lap(0, 'convert', timer.now())
+        self.assertEqual(timer.report()['stream0']['convert']['n'], 1)
+
+    def test_null_timer(self):
+        timer = NullStageTimer()
+        self.assertEqual(timer.lap(0, 'convert', timer.now()), 0)
+        self.assertEqual(timer.report(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from core.recent_plates import RecentPlates
+from LPR_QAT.core.custom_anpr_result import CustomANPRResult, DecodedLabel, PlateField, PlateStates
+from LPR_QAT.core.track_reader import TrackReader
+
+
+# alpr_ktc result of a plate read with the same score for every field and char
+def plate_result(state, prefix, platenum, score=0.9):
+    field = lambda chars: PlateField(char=tuple(chars), char_score=np.full(len(chars), score))
+    return CustomANPRResult(decoded_label=DecodedLabel(f'{state},{prefix},{platenum}', state, prefix, platenum),
+                            state=PlateStates(data_str=(state,), score=np.array([score])),
+                            prefix=field(prefix), platenum=field(platenum))
+
+
+# track reader over in-memory crops: {img path: result}, a path missing from imgs can not be loaded
+class FakeReader(TrackReader):
+
+    def __init__(self, imgs, batch_size=4, consensus_threshold=0.75, plates=None, fuse=True):
+        super().__init__(batch_size, consensus_threshold, plates, fuse)
+        self.imgs = imgs
+        self.batches = []       # img paths of every read_batch call
+        self.published = []     # (fused platenum, img paths read, img paths not read) per track
+        self.discarded = []     # same, the tracks whose plate had already been published
+        self.fail = False
+
+    def load_image(self, img_path):
+        return img_path if img_path in self.imgs else None
+
+    def read_batch(self, imgs):
+        self.batches.append(list(imgs))
+        if self.fail:
+            raise RuntimeError('inference failed')
+        return [self.imgs[img] for img in imgs]
+
+    def publish_track(self, consensus, reads, unread):
+        self.published.append(self.track(consensus, reads, unread))
+
+    def discard_track(self, consensus, reads, unread):
+        self.discarded.append(self.track(consensus, reads, unread))
+
+    def track(self, consensus, reads, unread):
+        result = consensus.result()
+        return (result.decoded_label.platenum_label if result is not None else None,
+                [img_path for img_path, img in reads], list(unread))
+
+
+class TrackReaderTest(unittest.TestCase):
+
+    def test_abstract_methods(self):
+        with self.assertRaises(TypeError):
+            TrackReader()
+
+        # a reader that can not publish its tracks
+        class Unpublished(TrackReader):
+            load_image = FakeReader.load_image
+            read_batch = FakeReader.read_batch
+
+        with self.assertRaises(TypeError):
+            Unpublished()
+        self.assertEqual(TrackReader.__abstractmethods__, {'load_image', 'read_batch', 'publish_track', 'discard_track'})
+
+    def test_group_by_track(self):
+        tracks = TrackReader.group_by_track(['/lpr/1/7_b.png', '/lpr/0/7_a.png', '/lpr/1/7_a.png', '/lpr/1/x.png'])
+        self.assertEqual(tracks, {('/lpr/0', '7'): ['/lpr/0/7_a.png'],
+                                  ('/lpr/1', '7'): ['/lpr/1/7_a.png', '/lpr/1/7_b.png'],
+                                  '/lpr/1/x.png': ['/lpr/1/x.png']})
+
+    def test_crops_of_all_the_tracks_are_batched(self):
+        # 10 tracks (of 2 streams) with 2 crops each: 2 rounds of 10 crops, batches of 4, 4, 2
+        imgs = {f'/lpr/{t % 2}/{t}_{c}.png': plate_result('STATE-DXB-ENGLISH', 'A', f'{t}00{c}') for t in range(10) for c in range(2)}
+        reader = FakeReader(imgs)
+        reader.process_tracks(list(imgs))
+
+        self.assertEqual([len(batch) for batch in reader.batches], [4, 4, 2, 4, 4, 2])
+        # every round reads the next crop of the tracks
+        self.assertTrue(all(img.endswith('_0.png') for batch in reader.batches[:3] for img in batch))
+        self.assertEqual(reader.stats['batches'], 6)
+        self.assertEqual(reader.stats['crops'], 20)
+        self.assertEqual(reader.batch_sizes, [0, 0, 2, 0, 4])
+        self.assertEqual(len(reader.published), 10)
+
+    def test_confident_track_stops_reading(self):
+        # 2 agreeing reads reach the threshold, the crops left are not read
+        imgs = {f'/lpr/0/5_{c}.png': plate_result('STATE-DXB-ENGLISH', 'A', '12345') for c in range(4)}
+        reader = FakeReader(imgs)
+        reader.process_tracks(list(imgs))
+
+        self.assertEqual(reader.stats['crops'], 2)
+        self.assertEqual(reader.published, [('12345', ['/lpr/0/5_0.png', '/lpr/0/5_1.png'],
+                                             ['/lpr/0/5_2.png', '/lpr/0/5_3.png'])])
+
+    def test_track_is_published_once_all_its_crops_are_read(self):
+        # conflicting reads never become confident
+        imgs = {'/lpr/0/5_0.png': plate_result('STATE-DXB-ENGLISH', 'A', '12345'),
+                '/lpr/0/5_1.png': plate_result('STATE-DXB-ENGLISH', 'A', '12845', score=0.6),
+                '/lpr/0/5_2.png': None}
+        reader = FakeReader(imgs)
+        reader.process_tracks(list(imgs) + ['/lpr/0/5_3.png'])
+
+        # the crop that can not be loaded is not read
+        self.assertEqual(reader.stats['crops'], 3)
+        self.assertEqual(reader.published, [('12345', ['/lpr/0/5_0.png', '/lpr/0/5_1.png', '/lpr/0/5_2.png'], [])])
+
+    def test_failed_batch_reads_nothing(self):
+        imgs = {'/lpr/0/5_0.png': plate_result('STATE-DXB-ENGLISH', 'A', '12345')}
+        reader = FakeReader(imgs)
+        reader.fail = True
+        reader.process_tracks(list(imgs))
+
+        self.assertEqual(reader.stats['failures'], 1)
+        self.assertEqual(reader.published, [(None, ['/lpr/0/5_0.png'], [])])
+
+    def test_reads_not_fused_settle_on_the_first_plate(self):
+        # TechnoStream reads: the first crop read with a plate is published
+        imgs = {'/lpr/0/5_0.png': None, '/lpr/0/5_1.png': plate_result('STATE-DXB-ENGLISH', 'A', '12345'),
+                '/lpr/0/5_2.png': plate_result('STATE-DXB-ENGLISH', 'A', '12845')}
+        reader = FakeReader(imgs, fuse=False)
+        reader.process_tracks(list(imgs))
+
+        self.assertEqual(reader.stats['crops'], 2)
+        self.assertEqual(reader.published, [('12345', ['/lpr/0/5_0.png', '/lpr/0/5_1.png'], ['/lpr/0/5_2.png'])])
+
+    def test_repeated_plate_is_suppressed_within_the_window(self):
+        now = [1000.0]
+        patcher = mock.patch('core.recent_plates.time.monotonic', lambda: now[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        plate = plate_result('STATE-DXB-ENGLISH', 'A', '12345')
+        imgs = {path: plate for path in ('/lpr/0/5_0.png', '/lpr/0/9_0.png', '/lpr/1/3_0.png', '/lpr/0/11_0.png')}
+        unread = plate_result('STATE-DXB-ENGLISH', 'A', '')
+        imgs.update({'/lpr/0/12_0.png': unread, '/lpr/0/13_0.png': unread})
+        reader = FakeReader(imgs, plates=RecentPlates(window_s=60))
+
+        reader.process_tracks(['/lpr/0/5_0.png'])
+        # the same plate read again (another job of the car), on the same camera
+        now[0] += 20
+        reader.process_tracks(['/lpr/0/9_0.png'])
+        # on another camera (DEDUPE_SCOPE: stream)
+        reader.process_tracks(['/lpr/1/3_0.png'])
+        # a plate not read is never deduplicated
+        reader.process_tracks(['/lpr/0/12_0.png'])
+        reader.process_tracks(['/lpr/0/13_0.png'])
+        # the window is over
+        now[0] += 61
+        reader.process_tracks(['/lpr/0/11_0.png'])
+
+        self.assertEqual([track[1] for track in reader.published],
+                         [['/lpr/0/5_0.png'], ['/lpr/1/3_0.png'], ['/lpr/0/12_0.png'], ['/lpr/0/13_0.png'],
+                          ['/lpr/0/11_0.png']])
+        self.assertEqual(reader.discarded, [('12345', ['/lpr/0/9_0.png'], [])])
+        self.assertEqual((reader.stats['tracks'], reader.stats['duplicates']), (6, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -55,8 +55,11 @@ class GETFPS:
         print('start_time=',self.start_time)
 
 class PERF_DATA:
-    def __init__(self, num_streams=1):
+    # stage_timer: StageTimer whose latency histograms are printed with the FPS (see utils/stage_timer.py)
+    def __init__(self, num_streams=1, stage_timer=None):
         self.perf_dict = {}
+        self.stage_timer = stage_timer
+        self.latency_dict = {}   # last latency report of the stage timer
         self.all_stream_fps = {}
         self.error_count = 0
         for i in range(num_streams):
@@ -79,6 +82,9 @@ class PERF_DATA:
             print("EXITING. Feed stopped")
             os._exit(1)
         print ("\n**PERF: ", self.perf_dict, "\n")
+        if self.stage_timer is not None and self.stage_timer.enabled:
+            self.latency_dict = self.stage_timer.report()
+            print ("\n**LATENCY [ms]: ", self.latency_dict, "\n")
         return True
     
     def update_fps(self, stream_index):
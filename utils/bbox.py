@@ -1,3 +1,4 @@
+import numpy as np
 from shapely.geometry import box
 
 def rect_params_to_coords(rect_params):
@@ -16,4 +17,46 @@ def rect_params_to_coords(rect_params):
 def rect_params_to_box(rect_params):
     minx, miny, maxx, maxy = rect_params_to_coords(rect_params)
     bbox = box(minx, miny, maxx, maxy)
-    return bbox
\ No newline at end of file
+    return bbox
+
+# True if the (minx, miny, maxx, maxy) box 'outer' completely contains box 'inner'
+# -> same result as shapely box(...).contains(box(...)) for non-degenerate boxes
+def box_contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+def box_area(bbox):
+    return (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+
+# containment matrix of two sets of (minx, miny, maxx, maxy) boxes, given as (N, 4) arrays
+# -> m[i, j] is True if outer[i] completely contains inner[j] (same rule as box_contains)
+def boxes_contain(outer, inner):
+    outer = np.asarray(outer).reshape(-1, 4)
+    inner = np.asarray(inner).reshape(-1, 4)
+    o = outer[:, None, :]
+    i = inner[None, :, :]
+    return (o[..., 0] <= i[..., 0]) & (o[..., 1] <= i[..., 1]) & (i[..., 2] <= o[..., 2]) & (i[..., 3] <= o[..., 3])
+
+# assign inner boxes (e.g. plates) to the outer boxes (e.g. cars) completely containing them, each box used once
+# -> candidate pairs are ranked by the gap between the lower edges of the inner and the outer box relative to the
+#    outer box height (smallest first), then by inner score (highest first), and taken greedily
+# -> returns {outer index: inner index}
+def assign_contained(outer, inner, inner_scores):
+    assigned = {}
+    outer = np.asarray(outer).reshape(-1, 4)
+    inner = np.asarray(inner).reshape(-1, 4)
+    oi, ii = np.nonzero(boxes_contain(outer, inner))
+    if len(oi) == 0:
+        return assigned
+
+    outer_h = np.maximum(outer[oi, 3] - outer[oi, 1], 1)
+    gap = (outer[oi, 3] - inner[ii, 3]) / outer_h
+    order = np.lexsort((-np.asarray(inner_scores)[ii], gap))
+
+    used = set()
+    for k in order.tolist():
+        o, i = int(oi[k]), int(ii[k])
+        if o in assigned or i in used:
+            continue
+        assigned[o] = i
+        used.add(i)
+    return assigned
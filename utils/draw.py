@@ -1,10 +1,10 @@
 import cv2
 
-# --- draw shapely Polygon object (obj_poly)
+# --- draw shapely Polygon object (obj_poly) or (minx, miny, maxx, maxy) tuple
 def draw_box(img, obj_poly, color = (128, 128, 128), line_thickness = 2, label = None):
     tl = line_thickness or round(0.002 * (img.shape[0] + img.shape[1]) / 2) + 1  # line/font thickness
 
-    minx, miny, maxx, maxy = obj_poly.bounds
+    minx, miny, maxx, maxy = obj_poly.bounds if hasattr(obj_poly, 'bounds') else obj_poly
     c1, c2 = (int(minx), int(maxy)), (int(maxx), int(miny))
     cv2.rectangle(img, c1, c2, color, thickness=tl, lineType=cv2.LINE_AA)        
     
@@ -0,0 +1,155 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+
+import cv2
+
+from utils.stage_timer import LatencyHistogram
+
+
+# Image persistence off the calling threads (plate crops, violation evidence, ANPR results)
+# -> write() queues the image and returns at once: the encoding (PNG / JPEG by extension, or a custom encoder)
+#    and the file write run on a pool of writer threads
+# -> the queue is bounded: when it is full write() waits for room (the images are evidence, never dropped)
+# -> files are written to a hidden temporary file in the destination folder and renamed when complete, so the
+#    readers of the folders (anpr_ivms.py polls the plate folders) never see a partial image
+# -> created folders are cached, no exists / makedirs per image
+# -> metrics(): backlog, counters and the latency from write() to the renamed file (p50/p99/max)
+class ImageWriter(object):
+
+    def __init__(self, workers=2, max_size=256):
+
+        self.max_size = max_size
+
+        self.queue = deque()    # (path, img, params, encode_fn, done event, enqueue time ns)
+        self.cond = threading.Condition()
+        self.running = True
+        self.pending = set()    # paths queued or being written
+        self.folders = set()    # folders known to exist
+
+        self.stats_lock = threading.Lock()
+        self.stats = {'written': 0, 'failed': 0, 'bytes': 0, 'waits': 0}
+        self.latency = LatencyHistogram()
+
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, name=f'image-writer-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    # queue img (BGR ndarray, not modified by the caller afterwards) to be written to path
+    # -> encoded by the extension of path with cv2.imencode(ext, img, params), or by encode_fn() -> bytes
+    # -> returns an Event set once the file has been written (or the write failed)
+    def write(self, path, img=None, params=None, encode_fn=None):
+        done = threading.Event()
+        with self.cond:
+            if len(self.queue) >= self.max_size:
+                with self.stats_lock:
+                    self.stats['waits'] += 1
+                while self.running and len(self.queue) >= self.max_size:
+                    self.cond.wait()
+            self.queue.append((path, img, params, encode_fn, done, time.monotonic_ns()))
+            self.pending.add(path)
+            self.cond.notify_all()
+        return done
+
+    # True if path exists or is queued / being written
+    def exists(self, path):
+        with self.cond:
+            if path in self.pending:
+                return True
+        return os.path.exists(path)
+
+    def _folder(self, folder):
+        if folder and folder not in self.folders:
+            os.makedirs(folder, exist_ok=True)
+            self.folders.add(folder)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                path, img, params, encode_fn, done, t_enqueued = self.queue.popleft()
+                self.cond.notify_all()
+
+            tmp = None
+            try:
+                if encode_fn is not None:
+                    data = encode_fn()
+                else:
+                    ok, data = cv2.imencode(os.path.splitext(path)[1], img, params or [])
+                    if not ok:
+                        raise ValueError(f'cannot encode {path}')
+
+                folder, name = os.path.split(path)
+                self._folder(folder)
+                tmp = os.path.join(folder, f'.{name}.{threading.get_ident()}.tmp')
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                tmp = None
+
+                with self.stats_lock:
+                    self.stats['written'] += 1
+                    self.stats['bytes'] += len(data)
+                    self.latency.record(time.monotonic_ns() - t_enqueued)
+            except Exception:
+                logging.exception(f"[ImageWriter] writing {path} failed")
+                with self.stats_lock:
+                    self.stats['failed'] += 1
+                if tmp is not None and os.path.exists(tmp):
+                    os.remove(tmp)
+            finally:
+                with self.cond:
+                    self.pending.discard(path)
+                done.set()
+
+    # counters since the start and the backlog
+    def counters(self):
+        with self.stats_lock:
+            counters = dict(self.stats)
+        with self.cond:
+            counters['queued'] = len(self.queue)
+            counters['pending'] = len(self.pending)
+        return counters
+
+    # counters plus the write latencies since the last call
+    def metrics(self):
+        with self.stats_lock:
+            latency, self.latency = self.latency, LatencyHistogram()
+        metrics = self.counters()
+        metrics['write_ms'] = {'p50': round(latency.percentile(0.50) / 1e6, 2),
+                               'p99': round(latency.percentile(0.99) / 1e6, 2),
+                               'max': round(latency.max / 1e6, 2)}
+        return metrics
+
+    # write the images still queued, then stop the threads
+    def stop(self, timeout=None):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+
+# one writer per process, shared by plate recognition, the violation recorder and the ANPR sidecar
+# -> the first call creates it (IMAGE_WRITER settings: WORKERS, QUEUE_SIZE), later calls return it
+# -> the images still queued are written at interpreter exit
+_shared_writer = None
+_shared_lock = threading.Lock()
+
+
+def get_image_writer(writer_cfg=None):
+    global _shared_writer
+    with _shared_lock:
+        if _shared_writer is None:
+            writer_cfg = writer_cfg or {}
+            _shared_writer = ImageWriter(int(writer_cfg.get('WORKERS', 2)), int(writer_cfg.get('QUEUE_SIZE', 256)))
+            atexit.register(_shared_writer.stop)
+        return _shared_writer
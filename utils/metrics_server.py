@@ -0,0 +1,84 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# One metric family of the Prometheus text exposition format
+#   kind:    gauge or counter
+#   samples: list of (labels dict, value)
+class Metric(object):
+    def __init__(self, name, kind, help_text, samples=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.samples = samples if samples is not None else []
+
+    def add(self, value, **labels):
+        self.samples.append((labels, value))
+        return self
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# render metric families as Prometheus text (version 0.0.4)
+def format_metrics(metrics):
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for labels, value in metric.samples:
+            label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            name = f'{metric.name}{{{label_str}}}' if label_str else metric.name
+            lines.append(f'{name} {float(value)!r}')
+    return '\n'.join(lines) + '\n'
+
+
+# Local HTTP endpoint serving GET /metrics in Prometheus text format from a daemon thread
+# -> collect_fn() returns the list of Metric objects; it is called on every scrape, on the server thread,
+#    so it must only read state (no locks held by the probe for long, no blocking calls)
+class MetricsServer(object):
+
+    def __init__(self, collect_fn, port=9108, host='127.0.0.1'):
+        self.collect_fn = collect_fn
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        collect_fn = self.collect_fn
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                try:
+                    body = format_metrics(collect_fn()).encode('utf-8')
+                except Exception:
+                    logging.exception("[MetricsServer] collecting metrics failed")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # scrapes every few seconds would flood stderr
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+        print(f'Metrics endpoint: http://{self.host}:{self.server.server_address[1]}/metrics')
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,112 @@
+import time
+from threading import Lock
+
+
+# Latency histogram with HDR-style log-linear buckets: values (ns) below 32 get a bucket each, above that every
+# power of 2 is split into 16 buckets -> ~6% precision from ns up to minutes in 1024 counters, O(1) record
+class LatencyHistogram:
+    SUB_BUCKETS = 16
+    BUCKETS = 64 * SUB_BUCKETS
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value):
+        shift = value.bit_length() - 5
+        if shift <= 0:
+            return value
+        return min(shift * cls.SUB_BUCKETS + (value >> shift), cls.BUCKETS - 1)
+
+    # representative value of a bucket: the middle of the range it covers
+    @classmethod
+    def _value(cls, index):
+        shift = max(0, index // cls.SUB_BUCKETS - 1)
+        return ((index - shift * cls.SUB_BUCKETS) << shift) + ((1 << shift) >> 1)
+
+    def record(self, value):
+        value = max(0, value)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    # value below which fraction q (0..1) of the recorded values are
+    def percentile(self, q):
+        if self.count == 0:
+            return 0
+        target = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value(index), self.max)
+        return self.max
+
+
+# Per-stream latency histograms of the stages of the tiler probe
+# -> lap() records the time since t0 (a now() or a previous lap()) and returns the new start time, so stages
+#    are timed back to back:
+#        t0 = timer.now()
+#        ...convert...
+#        t0 = timer.lap(stream_no, 'convert', t0)
+# -> report() returns p50/p95/p99/max [ms] per stream and stage and starts new histograms
+class StageTimer:
+    enabled = True
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {}   # stream key -> stage -> LatencyHistogram
+
+    def now(self):
+        return time.monotonic_ns()
+
+    def lap(self, stream, stage, t0):
+        now = time.monotonic_ns()
+        with self.lock:
+            stages = self.histograms.get(stream)
+            if stages is None:
+                stages = self.histograms[stream] = {}
+            histogram = stages.get(stage)
+            if histogram is None:
+                histogram = stages[stage] = LatencyHistogram()
+            histogram.record(now - t0)
+        return now
+
+    def report(self):
+        with self.lock:
+            histograms, self.histograms = self.histograms, {}
+
+        report = {}
+        for stream, stages in histograms.items():
+            key = f"stream{stream}" if isinstance(stream, int) else str(stream)
+            report[key] = {stage: {'n': h.count,
+                                   'p50': round(h.percentile(0.50) / 1e6, 3),
+                                   'p95': round(h.percentile(0.95) / 1e6, 3),
+                                   'p99': round(h.percentile(0.99) / 1e6, 3),
+                                   'max': round(h.max / 1e6, 3)}
+                           for stage, h in stages.items()}
+        return report
+
+
+# Stand-in used when stage timing is off: no clock reads, no locking
+class NullStageTimer:
+    enabled = False
+
+    def now(self):
+        return 0
+
+    def lap(self, stream, stage, t0):
+        return 0
+
+    def report(self):
+        return {}
+
+
+# stage timer configured by the PERF section of app_settings.yaml
+def create_stage_timer(perf_cfg):
+    if perf_cfg.get('STAGE_TIMING', False):
+        return StageTimer()
+    return NullStageTimer()